@@ -0,0 +1,140 @@
+# -*- coding: UTF-8 -*-
+"""
+Compares the Flask and ASGI versions of the API while the broker is slow.
+
+The broker is replaced with a stand-in that takes ``delay`` seconds to accept
+each task. ``clients`` clients each send their share of the requests, one
+after another. Half of the requests send a task (GET /api/2/inf/dns), and half
+only look up the state of a task (GET /api/2/inf/dns/task/<id>).
+
+The Flask app can only handle ``workers`` requests at a time, like a uwsgi
+server; the ASGI app handles every request on one event loop. For each, the
+throughput and the latency of the lookups (which never touch the broker) are
+reported. A latency includes the time spent waiting for a free worker.
+
+Usage::
+
+    python benchmarks/asgi_frontend.py [requests] [broker delay] [flask workers] [clients]
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from flask import Flask
+from vlab_api_common.http_auth import generate_v2_test_token
+
+from vlab_dns_api.lib import asgi
+from vlab_dns_api.lib.views import DnsView
+
+TOKEN = generate_v2_test_token(username='bob')
+
+
+def slow_celery(delay):
+    """Make a stand-in for Celery whose broker takes ``delay`` seconds per task"""
+    celery_app = MagicMock()
+    task = MagicMock()
+    task.id = 'asdf-asdf-asdf'
+
+    def send_task(*args, **kwargs):
+        time.sleep(delay)
+        return task
+    celery_app.send_task.side_effect = send_task
+    celery_app.AsyncResult.return_value.status = 'PENDING'
+    return celery_app
+
+
+def paths(count, clients):
+    """The requests each client sends; every other one sends a task"""
+    every_path = ['/api/2/inf/dns' if idx % 2 else '/api/2/inf/dns/task/asdf-asdf-asdf' for idx in range(count)]
+    return [every_path[idx::clients] for idx in range(clients)]
+
+
+def run_flask(count, delay, workers, clients):
+    """Send the requests to the Flask app
+
+    :Returns: Tuple (Float, List) - Seconds taken, and the latency of each lookup
+    """
+    app = Flask(__name__)
+    DnsView.register(app)
+    app.celery_app = slow_celery(delay)
+    client = app.test_client()
+    free_workers = threading.Semaphore(workers)
+
+    def one_client(my_paths):
+        latencies = []
+        for path in my_paths:
+            sent_at = time.perf_counter()
+            with free_workers:
+                client.get(path, headers={'X-Auth': TOKEN})
+            if '/task/' in path:
+                latencies.append(time.perf_counter() - sent_at)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(one_client, paths(count, clients)))
+    elapsed = time.perf_counter() - started
+    return elapsed, [latency for latencies in results for latency in latencies]
+
+
+def run_asgi(count, delay, clients):
+    """Send the requests to the ASGI app
+
+    :Returns: Tuple (Float, List) - Seconds taken, and the latency of each lookup
+    """
+    app = asgi.DnsApp(slow_celery(delay))
+    headers = [(b'x-auth', TOKEN)]
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    async def one_client(my_paths):
+        latencies = []
+        for path in my_paths:
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                     'headers': headers, 'client': ('127.0.0.1', 5000)}
+            sent_at = time.perf_counter()
+            await app(scope, receive, send)
+            if '/task/' in path:
+                latencies.append(time.perf_counter() - sent_at)
+        return latencies
+
+    async def every_client():
+        return await asyncio.gather(*[one_client(x) for x in paths(count, clients)])
+
+    started = time.perf_counter()
+    results = asyncio.run(every_client())
+    elapsed = time.perf_counter() - started
+    app.publisher.close()
+    return elapsed, [latency for latencies in results for latency in latencies]
+
+
+def report(name, count, elapsed, latencies):
+    """Print the throughput and lookup latency of one run"""
+    latencies = sorted(latencies)
+    print('{}:'.format(name))
+    print('  requests/sec:       {:.0f}'.format(count / elapsed))
+    print('  lookup latency p50: {:.1f} ms'.format(latencies[len(latencies) // 2] * 1000))
+    print('  lookup latency p99: {:.1f} ms'.format(latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+def main(count=2000, delay=0.05, workers=16, clients=200):
+    logging.disable(logging.INFO) # the access logs would drown out the results
+    print('requests: {}, broker delay: {} seconds, flask workers: {}, clients: {}'.format(count, delay, workers, clients))
+    report('flask', count, *run_flask(count, delay, workers, clients))
+    report('asgi', count, *run_asgi(count, delay, clients))
+
+
+if __name__ == '__main__':
+    args = [int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+            float(sys.argv[2]) if len(sys.argv) > 2 else 0.05,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 16,
+            int(sys.argv[4]) if len(sys.argv) > 4 else 200]
+    main(*args)
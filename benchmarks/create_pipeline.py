@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+"""
+Shows how much the stages of ``create_dns`` overlap, and what that saves.
+
+vCenter, the OVA and the guest are replaced with stand-ins that sleep for how
+long each step takes (the defaults are typical times, in seconds, divided by
+``scale``). The create is run for real against the stand-ins; its per-stage
+timings are printed next to what the same steps cost when run one after
+another, plus the steps the pipeline no longer does (reconfiguring the new VM
+to set its meta data, and waiting on VMware Tools to report the IP).
+
+Usage::
+
+    python benchmarks/create_pipeline.py [scale]
+"""
+import sys
+import time
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import vmware
+
+# Typical seconds each step takes
+STEPS = {'login': 1.5,
+         'open-image': 1.0,
+         'preflight': 0.05,
+         'deploy': 60.0,
+         'set-meta': 1.0,
+         'waiting-for-tools': 20.0,
+         'configuring-ip': 8.0,
+         'configuring-bind': 6.0,
+         'snapshotting': 5.0,
+         'get-info': 1.5,
+         'ensure-ip': 10.0}
+# What the pipeline doesn't do anymore
+REMOVED = ('set-meta', 'ensure-ip')
+
+
+def stand_in(seconds, returns=None):
+    """Make a function that takes ``seconds`` to return ``returns``"""
+    def func(*args, **kwargs):
+        time.sleep(seconds)
+        return returns
+    return func
+
+
+@contextmanager
+def no_claim(*args, **kwargs):
+    """Stands in for ``_claim_create``"""
+    yield
+
+
+def main(scale=20.0):
+    """Run a create against the stand-ins, and print its stage timings"""
+    steps = {k: v / scale for k, v in STEPS.items()}
+    the_vm = MagicMock()
+    the_vm.name = 'myDns'
+    session = MagicMock()
+    session.__enter__.return_value = MagicMock()
+    ova = MagicMock()
+    ova.networks = ['lab']
+    recorded = {}
+    with patch.object(vmware, '_claim_create', no_claim), \
+         patch.object(vmware, '_connect', stand_in(steps['login'], session)), \
+         patch.object(vmware, 'Ova', stand_in(steps['open-image'], ova)), \
+         patch.object(vmware.preflight, 'check', stand_in(steps['preflight'], vmware.vim.Network(moId='1'))), \
+         patch.object(vmware, '_deploy', stand_in(steps['deploy'], (the_vm, {}))), \
+         patch.object(vmware, '_wait_for_tools', stand_in(steps['waiting-for-tools'])), \
+         patch.object(vmware.virtual_machine, 'config_static_ip', stand_in(steps['configuring-ip'])), \
+         patch.object(vmware, '_finish_bind_config', stand_in(steps['configuring-bind'])), \
+         patch.object(vmware, '_take_snapshot', stand_in(steps['snapshotting'])), \
+         patch.object(vmware.virtual_machine, 'get_info', stand_in(steps['get-info'], {'ips': []})), \
+         patch.object(vmware.metrics, 'gauge', lambda name, value: recorded.update(value)):
+        vmware.create_dns('alice', 'myDns', 'bind9', 'lab', '192.168.1.2', '192.168.1.1', '255.255.255.0',
+                          ['192.168.1.1'], MagicMock())
+    sequential = sum(steps.values())
+    print('stage               one-by-one   pipelined')
+    for name in STEPS:
+        print('{:<20}{:>9.2f}s {:>10}'.format(name, steps[name],
+                                             '{:.2f}s'.format(recorded[name]) if name in recorded else 'skipped'))
+    print('{:<20}{:>9.2f}s {:>9.2f}s'.format('end to end', sequential, recorded['total']))
+    print('saved: {:.2f}s ({:.0f}%), of which {:.2f}s overlapped'.format(sequential - recorded['total'],
+                                                                      100 * (sequential - recorded['total']) / sequential,
+                                                                      recorded['overlapped']))
+
+
+if __name__ == '__main__':
+    main(*[float(x) for x in sys.argv[1:2]])
@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+"""
+Compares configuring a Windows Dns one ``netsh`` at a time with running one
+PowerShell script.
+
+The guest operations of vCenter are replaced with a stand-in. Every call (each
+one authenticates in the guest) takes ``latency`` seconds, and a guest process
+runs for as long as ``PROGRAM_SECONDS`` says. ``run_command`` checks on a
+process once a second, like it does against vCenter. Every time is divided by
+``scale``. The stand-in only configures the NIC and DNS client for the
+``netsh`` path, because that path doesn't set up the DNS server role.
+
+Usage::
+
+    python benchmarks/windows_config.py [latency] [scale]
+"""
+import sys
+import time
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import vmware
+
+# Typical seconds a process runs for inside the guest
+PROGRAM_SECONDS = {'netsh.exe': 1.5, 'powershell.exe': 4.0}
+DNS = ['192.168.1.1', '8.8.8.8']
+# run_command's polling is sped up by patching time.sleep, which the stand-in must not be
+REAL_SLEEP = time.sleep
+
+
+class StandInGuest(object):
+    """Stands in for the guest operations of vCenter, and counts the calls"""
+    def __init__(self, latency, scale):
+        self.latency = latency / scale
+        self.scale = scale
+        self.calls = 0
+        self.processes = {}
+
+    def _call(self):
+        self.calls += 1
+        REAL_SLEEP(self.latency)
+
+    def StartProgramInGuest(self, vm, auth, spec):
+        self._call()
+        pid = len(self.processes) + 1
+        program = spec.programPath.replace('\\', '/').split('/')[-1]
+        self.processes[pid] = time.time() + PROGRAM_SECONDS[program] / self.scale
+        return pid
+
+    def ListProcessesInGuest(self, vm, auth, pids):
+        self._call()
+        ends = self.processes[pids[0]]
+        return [MagicMock(exitCode=0, endTime=ends if time.time() >= ends else None)]
+
+    def InitiateFileTransferToGuest(self, **kwargs):
+        self._call()
+        return 'https://esx/upload'
+
+    def InitiateFileTransferFromGuest(self, **kwargs):
+        self._call()
+        return MagicMock(url='https://esx/download')
+
+
+def run(batched, latency, scale):
+    """Configure the stand-in guest one way
+
+    :Returns: Tuple (Float, Integer) - seconds taken, and how many guest operations were called
+    """
+    guest = StandInGuest(latency, scale)
+    vcenter = MagicMock()
+    vcenter.content.guestOperationsManager.processManager = guest
+    vcenter.content.guestOperationsManager.fileManager = guest
+    report = '{"nic": {"ok": true, "seconds": 2}, "dns-client": {"ok": true, "seconds": 0.5}, "dns-server": {"ok": true, "seconds": 3}}'
+    with patch.object(vmware.virtual_machine.time, 'sleep', lambda seconds: REAL_SLEEP(seconds / scale)), \
+         patch.object(vmware.requests, 'put'), \
+         patch.object(vmware.requests, 'get', return_value=MagicMock(text=report)), \
+         patch.object(vmware.metrics, 'gauge'):
+        started = time.time()
+        if batched:
+            vmware._configure_windows(vcenter, MagicMock(), '192.168.1.2', '192.168.1.1', '255.255.255.0', DNS,
+                                      MagicMock())
+        else:
+            vmware.virtual_machine.config_static_ip(vcenter, MagicMock(), '192.168.1.2', '192.168.1.1',
+                                                    '255.255.255.0', DNS, 'Administrator', 'a', MagicMock(),
+                                                    os='windows')
+        elapsed = time.time() - started
+    return elapsed * scale, guest.calls
+
+
+def main(latency=0.3, scale=10.0):
+    print('latency per guest operation: {} seconds (times are unscaled)'.format(latency))
+    print('path                         seconds  guest operations')
+    for name, batched in (('netsh, one step at a time', False), ('one PowerShell script', True)):
+        elapsed, calls = run(batched, latency, scale)
+        print('{:<28}{:>8.1f}  {:>16}'.format(name, elapsed, calls))
+
+
+if __name__ == '__main__':
+    main(*[float(x) for x in sys.argv[1:3]])
@@ -0,0 +1,157 @@
+# -*- coding: UTF-8 -*-
+"""
+Compares the memory each concurrent ``create_dns`` costs with the prefork pool,
+and with many tasks sharing one worker process (the threads or gevent pool).
+
+vCenter, the OVA and the guest are replaced with stand-ins, and every create
+is held in the middle of its deploy while the memory is measured. A session is
+a real (but unconnected) pyVmomi stub, so it costs what a session object does.
+
+With prefork, every concurrent task is a process forked from the worker. Its
+cost is reported two ways: the memory the child has written to after running
+a task, and the whole size of a worker process, which is what a child grows to
+as copy-on-write pages get touched over its life.
+
+With one process, the cost is how much the process grew while ``count`` creates
+were in flight, divided by ``count``. The creates share one vCenter session
+(``VLAB_DNS_SHARE_SESSIONS``). Threads are used, since gevent isn't always
+installed; a greenlet costs less than a thread.
+
+Usage::
+
+    python benchmarks/worker_memory.py [concurrent tasks]
+"""
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+os.environ.setdefault('VLAB_DNS_STATE_DIR', tempfile.mkdtemp())
+
+from pyVmomi import SoapStubAdapter, vim
+
+from vlab_dns_api.lib.worker import tasks, vmware
+
+
+def private_kb():
+    """The memory this process has written to, and doesn't share, in KB"""
+    total = 0
+    with open('/proc/self/smaps_rollup') as the_file:
+        for line in the_file:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total
+
+
+def rss_kb():
+    """The resident memory of this process, in KB"""
+    with open('/proc/self/status') as the_file:
+        for line in the_file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+class StandInVCenter(object):
+    """A vCenter object whose session is a real, unconnected, pyVmomi stub"""
+    def __init__(self, host, user, password):
+        self._conn = vim.ServiceInstance('ServiceInstance', SoapStubAdapter(host=host, port=443))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def stand_ins(in_deploy, release):
+    """Replace vCenter, the OVA and the guest; a deploy waits until ``release`` is set"""
+    def deploy(*args, **kwargs):
+        in_deploy.wait()
+        release.wait()
+        the_vm = MagicMock()
+        the_vm.name = 'myDns'
+        return the_vm, {}
+
+    @contextmanager
+    def no_claim(*args, **kwargs):
+        yield
+
+    ova = MagicMock()
+    ova.networks = ['lab']
+    with patch.object(vmware, 'vCenter', StandInVCenter), \
+         patch.object(vmware, '_claim_create', no_claim), \
+         patch.object(vmware, 'Ova', return_value=ova), \
+         patch.object(vmware.lookup, 'folder'), \
+         patch.object(vmware.preflight, 'check', return_value=vim.Network(moId='1')), \
+         patch.object(vmware, '_deploy', deploy), \
+         patch.object(vmware, '_configure', return_value={}), \
+         patch.object(vmware.metrics, 'gauge'):
+        yield
+
+
+def create(number):
+    """Run one create against the stand-ins"""
+    vmware.create_dns('alice', 'myDns{}'.format(number), 'bind9', 'lab', '192.168.1.2', '192.168.1.1',
+                      '255.255.255.0', ['192.168.1.1'], MagicMock())
+
+
+def run_creates(count):
+    """Start ``count`` creates, and measure the memory while they're all deploying
+
+    :Returns: Integer - the growth of the process's private memory, in KB
+    """
+    in_deploy = threading.Barrier(count + 1)
+    release = threading.Event()
+    with stand_ins(in_deploy, release):
+        before = private_kb()
+        threads = [threading.Thread(target=create, args=(x,)) for x in range(count)]
+        for thread in threads:
+            thread.start()
+        in_deploy.wait()
+        during = private_kb()
+        release.set()
+        for thread in threads:
+            thread.join()
+    return during - before
+
+
+def prefork_child_kb():
+    """Fork a child, like the prefork pool does, run one create in it, and report its private memory"""
+    reader, writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(reader)
+        run_creates(1)
+        os.write(writer, str(private_kb()).encode())
+        os._exit(0)
+    os.close(writer)
+    with os.fdopen(reader) as the_pipe:
+        answer = int(the_pipe.read())
+    os.waitpid(pid, 0)
+    return answer
+
+
+def main(count=200):
+    # Load everything the way a worker does, then warm up the lazy imports and caches
+    tasks.app.loader.import_default_modules()
+    run_creates(1)
+    child = prefork_child_kb()
+    worker = rss_kb()
+    with patch.object(vmware, 'const', vmware.const._replace(VLAB_DNS_SHARE_SESSIONS=True)):
+        grew = run_creates(count)
+    print('concurrent tasks: {}'.format(count))
+    print('prefork, per task (forked child, after one create):  {:>8.0f} KB'.format(child))
+    print('prefork, per task (whole worker process):            {:>8.0f} KB'.format(worker))
+    print('one process, per task:                               {:>8.0f} KB'.format(grew / count))
+    print('prefork total for {} tasks: {:.0f} - {:.0f} MB; one process: {:.0f} MB'.format(
+          count, (worker + child * count) / 1024, worker * count / 1024, (worker + grew) / 1024))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
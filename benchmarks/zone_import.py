@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+"""
+Measures how many records/sec a bulk zone import can process.
+
+Covers everything the import does on the API and worker side for a 10k record
+import: serializing the records through the broker, validating the records,
+building the new zone file (with its bumped serial) and encoding the single
+file transfer. The guest operations are excluded; a bulk import always costs
+two downloads, one upload and one command (``named-checkzone``, copy and
+``rndc reload``) no matter how many records are in the zone.
+
+Usage::
+
+    python benchmarks/zone_import.py [record count] [rounds]
+"""
+import sys
+import time
+
+import ujson
+
+from vlab_dns_api.lib.worker import zones
+
+CURRENT_ZONE = """$TTL 86400
+@   IN  SOA     ns1.vlab.local. root.vlab.local. ( 4 3600 1800 604800 86400 )
+@       IN  NS          ns1.vlab.local.
+ns1     IN  A           192.168.1.2
+"""
+
+
+def make_records(count):
+    """Generate a list of unique A records in the API's JSON format"""
+    return [{'name': 'host{}'.format(idx),
+             'type': 'A',
+             'value': '10.{}.{}.{}'.format(idx // 65536 % 256, idx // 256 % 256, idx % 256)}
+            for idx in range(count)]
+
+
+def import_once(records):
+    """Run the CPU bound part of an import one time"""
+    payload = ujson.loads(ujson.dumps(records))
+    text, _ = zones.build_zone_file('vlab.local', CURRENT_ZONE, records=payload)
+    return len(text.encode())
+
+
+def main(count=10000, rounds=5):
+    records = make_records(count)
+    import_once(records[:10]) # warm up
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = import_once(records)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print('records:        {}'.format(count))
+    print('zone file size: {} bytes'.format(size))
+    print('best of {}:      {:.3f} seconds'.format(rounds, best))
+    print('records/sec:    {:.0f}'.format(count / best))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
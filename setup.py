@@ -15,5 +15,6 @@ setup(name="vlab-dns-api",
       package_files={'vlab_dns_api' : ['app.ini']},
       description="dns",
       install_requires=['flask', 'ldap3', 'pyjwt', 'uwsgi', 'vlab-api-common',
-                        'ujson', 'cryptography', 'vlab-inf-common', 'celery']
+                        'ujson', 'cryptography', 'vlab-inf-common', 'celery',
+                        'dnspython', 'requests']
       )
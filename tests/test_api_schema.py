@@ -32,6 +32,16 @@ class TestDnsViewSchema(unittest.TestCase):
 
         self.assertTrue(schema_valid)
 
+    def test_get_args_schema(self):
+        """The schema defined for the GET query params is valid"""
+        try:
+            Draft4Validator.check_schema(dns.DnsView.GET_ARGS_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
     def test_delete_schema(self):
         """The schema defined for DELETE on is valid"""
         try:
@@ -53,5 +63,46 @@ class TestDnsViewSchema(unittest.TestCase):
         self.assertTrue(schema_valid)
 
 
+    def test_network_batch_schema(self):
+        """The schema defined for PUT on /network/batch is valid"""
+        try:
+            Draft4Validator.check_schema(dns.DnsView.NETWORK_BATCH_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_reset_schema(self):
+        """The schema defined for POST on /reset is valid"""
+        try:
+            Draft4Validator.check_schema(dns.DnsView.RESET_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_zone_import_schema(self):
+        """The schema defined for POST on /zone is valid"""
+        try:
+            Draft4Validator.check_schema(dns.DnsView.ZONE_IMPORT_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_zone_export_args(self):
+        """The schema defined for GET on /zone is valid"""
+        try:
+            Draft4Validator.check_schema(dns.DnsView.ZONE_EXPORT_ARGS)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,363 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the ASGI version of the API
+"""
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import ujson
+from vlab_api_common.http_auth import generate_test_token, generate_v2_test_token
+
+from vlab_dns_api.lib import asgi
+
+
+def call(app, method, path, headers=None, body=None, query_string=b''):
+    """Send one HTTP request through an ASGI app
+
+    :Returns: Tuple (Integer, Dictionary, Bytes) - The status, headers and body
+    """
+    raw_headers = [(k.lower().encode(), v if isinstance(v, bytes) else v.encode()) for k, v in (headers or {}).items()]
+    scope = {'type': 'http',
+             'method': method,
+             'path': path,
+             'query_string': query_string,
+             'headers': raw_headers,
+             'client': ('127.0.0.1', 5000)}
+    body = ujson.dumps(body).encode() if body is not None else b''
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    status = sent[0]['status']
+    response_headers = {}
+    for key, value in sent[0]['headers']:
+        response_headers.setdefault(key.decode(), []).append(value.decode())
+    return status, response_headers, b''.join(x.get('body', b'') for x in sent[1:])
+
+
+class TestDnsApp(unittest.TestCase):
+    """A set of test cases for the DnsApp object"""
+    @classmethod
+    def setUpClass(cls):
+        """Runs once for the whole test suite"""
+        cls.token = generate_v2_test_token(username='bob')
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.celery_app = MagicMock()
+        self.fake_task = MagicMock()
+        self.fake_task.id = 'asdf-asdf-asdf'
+        self.celery_app.send_task.return_value = self.fake_task
+        self.app = asgi.DnsApp(self.celery_app, publishers=2, publish_timeout=1)
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        fake_const.VLAB_DNS_IDEMPOTENCY_TTL = 3600
+        patcher = patch.object(asgi.idempotency, 'const', fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        owners_patcher = patch.object(asgi.owners, 'const', fake_const)
+        owners_patcher.start()
+        self.addCleanup(owners_patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.app.publisher.close()
+        shutil.rmtree(self.state_dir)
+
+    def test_get_task(self):
+        """DnsApp - GET on /api/2/inf/dns returns a task-id"""
+        status, _, body = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 202)
+        self.assertEqual(ujson.loads(body)['content'], {'task-id': 'asdf-asdf-asdf'})
+
+    def test_get_envelope(self):
+        """DnsApp - responses have the same body as the Flask app"""
+        _, _, body = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': self.token},
+                          query_string=b'fields=state')
+
+        expected = {'error': None, 'content': {'task-id': 'asdf-asdf-asdf'}, 'params': {'fields': 'state'}}
+
+        self.assertEqual(ujson.loads(body), expected)
+
+    def test_get_links(self):
+        """DnsApp - GET on /api/2/inf/dns sets the status and help Link headers"""
+        _, headers, _ = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': self.token})
+
+        expected = ['<https://localhost/api/2/inf/dns/task/asdf-asdf-asdf>; rel=status',
+                    '<https://localhost/api/2/inf/dns?describe=true>; rel=help']
+
+        self.assertEqual(headers['link'], expected)
+
+    def test_get_fields(self):
+        """DnsApp - GET on /api/2/inf/dns passes the requested fields to the worker"""
+        call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': self.token}, query_string=b'fields=state,ips')
+
+        the_kwargs = self.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'fields': ['state', 'ips']}
+
+        self.assertEqual(the_kwargs, expected)
+
+    @patch.object(asgi.inventory, 'etag')
+    def test_get_not_modified(self, fake_etag):
+        """DnsApp - GET on /api/2/inf/dns returns 304 when the inventory hasn't changed"""
+        fake_etag.return_value = 'abc123'
+        status, headers, _ = call(self.app, 'GET', '/api/2/inf/dns',
+                                  headers={'X-Auth': self.token, 'If-None-Match': 'W/"abc123"'})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(headers['etag'], ['"abc123"'])
+        self.assertFalse(self.celery_app.send_task.called)
+
+    def test_no_token(self):
+        """DnsApp - a request without an auth token gets an HTTP 401"""
+        status, headers, _ = call(self.app, 'GET', '/api/2/inf/dns')
+
+        self.assertEqual(status, 401)
+        self.assertIn('<https://localhost/api/1/auth>; rel=authorization', headers['link'])
+
+    def test_wrong_client(self):
+        """DnsApp - a token used from a different IP gets an HTTP 401"""
+        status, _, _ = call(self.app, 'GET', '/api/2/inf/dns',
+                            headers={'X-Auth': self.token, 'X-Forwarded-For': '10.1.1.1'})
+
+        self.assertEqual(status, 401)
+
+    def test_expired_token(self):
+        """DnsApp - an expired auth token gets an HTTP 401, like the Flask app"""
+        token = generate_v2_test_token(username='bob', expires_at=1)
+
+        status, _, body = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': token})
+
+        self.assertEqual(status, 401)
+        self.assertEqual(ujson.loads(body)['error'], 'No Valid Session Found')
+
+    def test_old_token(self):
+        """DnsApp - a version 1 auth token gets an HTTP 403, like the Flask app"""
+        token = generate_test_token(username='bob')
+
+        status, _, body = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': token})
+
+        self.assertEqual(status, 403)
+        self.assertEqual(ujson.loads(body)['error'], 'user bob does not have access')
+
+    def test_not_found(self):
+        """DnsApp - an unknown path gets an HTTP 404"""
+        status, _, _ = call(self.app, 'GET', '/api/2/inf/nope', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 404)
+
+    def test_wrong_method(self):
+        """DnsApp - an unsupported method gets an HTTP 405"""
+        status, _, _ = call(self.app, 'PATCH', '/api/2/inf/dns', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 405)
+
+    def test_describe(self):
+        """DnsApp - GET on /api/2/inf/dns?describe=true returns the schemas"""
+        status, _, body = call(self.app, 'GET', '/api/2/inf/dns', query_string=b'describe=true',
+                               headers={'X-Auth': self.token})
+
+        content = ujson.loads(body)['content']
+
+        self.assertEqual(status, 200)
+        self.assertEqual(content['post']['body'], asgi.DnsView.POST_SCHEMA)
+
+    def test_post(self):
+        """DnsApp - POST on /api/2/inf/dns sends the same task as the Flask app"""
+        status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers={'X-Auth': self.token},
+                            body={'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion",
+                                  'static-ip': '192.168.1.2'})
+
+        args = self.celery_app.send_task.call_args[0]
+        expected = ('dns.create', ['bob', 'myDnsBox', 'someVersion', 'bob_someLAN', '192.168.1.2',
+                                   '192.168.1.1', '255.255.255.0', ['192.168.1.1'], 'noId'])
+
+        self.assertEqual(status, 202)
+        self.assertEqual(args, expected)
+
+    def test_post_profile(self):
+        """DnsApp - POST on /api/2/inf/dns asks the worker to profile the task when the X-Profile header is set"""
+        call(self.app, 'POST', '/api/2/inf/dns', headers={'X-Auth': self.token, 'X-Profile': 'true'},
+             body={'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion", 'static-ip': '192.168.1.2'})
+
+        the_kwargs = self.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'profile': True}
+
+        self.assertEqual(the_kwargs, expected)
+
+    def test_post_bad_body(self):
+        """DnsApp - POST on /api/2/inf/dns returns 400 when the body doesn't match the schema"""
+        status, _, body = call(self.app, 'POST', '/api/2/inf/dns', headers={'X-Auth': self.token},
+                               body={'name': "myDnsBox"})
+
+        self.assertEqual(status, 400)
+        self.assertTrue(ujson.loads(body)['error'].startswith('Input does not match schema'))
+
+    def test_post_idempotent(self):
+        """DnsApp - retrying a POST with the same Idempotency-Key returns the original task"""
+        # Like Celery, the task has the id it was sent with
+        self.celery_app.send_task.side_effect = lambda *args, **kwargs: MagicMock(id=kwargs['task_id'])
+        headers = {'X-Auth': self.token, 'Idempotency-Key': 'abc'}
+        body = {'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion", 'static-ip': '192.168.1.2'}
+        _, _, first = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+        _, _, second = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+
+        self.assertEqual(ujson.loads(first)['content'], ujson.loads(second)['content'])
+        self.assertEqual(self.celery_app.send_task.call_count, 1)
+
+    def test_post_timeout_keeps_key(self):
+        """DnsApp - a POST that timed out keeps its Idempotency-Key, since the create might still be sent"""
+        def slow_send(*args, **kwargs):
+            time.sleep(0.2)
+            return MagicMock(id=kwargs['task_id'])
+        self.celery_app.send_task.side_effect = slow_send
+        self.app.publisher.timeout = 0.05
+        headers = {'X-Auth': self.token, 'Idempotency-Key': 'abc'}
+        body = {'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion", 'static-ip': '192.168.1.2'}
+        first_status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+        time.sleep(0.3)
+
+        status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+
+        self.assertEqual((first_status, status), (503, 202))
+        self.assertEqual(self.celery_app.send_task.call_count, 1)
+
+    def test_post_failed_send_releases_key(self):
+        """DnsApp - a POST whose send failed lets the client retry with the same Idempotency-Key"""
+        self.celery_app.send_task.side_effect = [RuntimeError('testing'), self.fake_task]
+        headers = {'X-Auth': self.token, 'Idempotency-Key': 'abc'}
+        body = {'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion", 'static-ip': '192.168.1.2'}
+        first_status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+
+        status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+
+        self.assertEqual((first_status, status), (500, 202))
+        self.assertEqual(self.celery_app.send_task.call_count, 2)
+
+    def test_post_late_failure_releases_key(self):
+        """DnsApp - a POST that timed out lets go of its Idempotency-Key once the send fails"""
+        def slow_fail(*args, **kwargs):
+            if self.celery_app.send_task.call_count > 1:
+                return self.fake_task
+            time.sleep(0.2)
+            raise RuntimeError('testing')
+        self.celery_app.send_task.side_effect = slow_fail
+        self.app.publisher.timeout = 0.05
+        headers = {'X-Auth': self.token, 'Idempotency-Key': 'abc'}
+        body = {'network': "someLAN", 'name': "myDnsBox", 'image': "someVersion", 'static-ip': '192.168.1.2'}
+        call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+        time.sleep(0.3)
+
+        status, _, _ = call(self.app, 'POST', '/api/2/inf/dns', headers=headers, body=body)
+
+        self.assertEqual(status, 202)
+        self.assertEqual(self.celery_app.send_task.call_count, 2)
+
+    def test_slow_broker(self):
+        """DnsApp - returns an HTTP 503 when the broker is too slow to take the task"""
+        def slow_send(*args, **kwargs):
+            time.sleep(0.3)
+            return self.fake_task
+        self.celery_app.send_task.side_effect = slow_send
+        self.app.publisher.timeout = 0.05
+
+        status, headers, _ = call(self.app, 'GET', '/api/2/inf/dns', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], ['5'])
+
+    def test_task_success(self):
+        """DnsApp - GET on /api/2/inf/dns/task/<id> returns the result of a finished task"""
+        result = MagicMock()
+        result.status = 'SUCCESS'
+        result.result = {'content': {'myDns': {}}, 'error': None, 'params': {}}
+        self.celery_app.AsyncResult.return_value = result
+
+        status, _, body = call(self.app, 'GET', '/api/2/inf/dns/task/asdf-asdf-asdf', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(ujson.loads(body)['content'], {'myDns': {}})
+
+    def test_task_pending(self):
+        """DnsApp - GET on /api/2/inf/dns/task/<id> returns 202 while the task runs"""
+        self.celery_app.AsyncResult.return_value.status = 'PENDING'
+
+        status, _, _ = call(self.app, 'GET', '/api/2/inf/dns/task/asdf-asdf-asdf', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 202)
+
+    def test_task_no_id(self):
+        """DnsApp - GET on /api/2/inf/dns/task without a task id returns 400"""
+        status, _, _ = call(self.app, 'GET', '/api/2/inf/dns/task', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 400)
+
+    def test_cancel(self):
+        """DnsApp - DELETE on /api/2/inf/dns/task/<id> revokes the task, and tells the workers to stop it"""
+        asgi.owners.record('asdf-asdf-asdf', 'bob')
+        self.celery_app.AsyncResult.return_value.status = 'PROGRESS'
+
+        status, _, body = call(self.app, 'DELETE', '/api/2/inf/dns/task/asdf-asdf-asdf', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 202)
+        self.assertEqual(ujson.loads(body)['content'], {'task-id': 'asdf-asdf-asdf', 'status': 'PROGRESS'})
+        self.celery_app.control.broadcast.assert_called_with('dns_cancel', arguments={'task_id': 'asdf-asdf-asdf'})
+
+    def test_cancel_other_user(self):
+        """DnsApp - DELETE on /api/2/inf/dns/task/<id> returns 404 for the task of another user"""
+        asgi.owners.record('asdf-asdf-asdf', 'alice')
+
+        status, _, _ = call(self.app, 'DELETE', '/api/2/inf/dns/task/asdf-asdf-asdf', headers={'X-Auth': self.token})
+
+        self.assertEqual(status, 404)
+        self.assertFalse(self.celery_app.control.revoke.called)
+        self.assertFalse(self.celery_app.control.broadcast.called)
+
+    def test_send_records_owner(self):
+        """DnsApp - Sending a task records who started it"""
+        call(self.app, 'GET', '/api/2/inf/dns/image', headers={'X-Auth': self.token})
+        task_id = self.celery_app.send_task.call_args[1]['task_id']
+
+        self.assertEqual(asgi.owners.owner(task_id), 'bob')
+
+    @patch.object(asgi.asyncio, 'sleep', new_callable=AsyncMock)
+    def test_task_events(self, fake_sleep):
+        """DnsApp - GET on /api/2/inf/dns/task/<id>/events streams progress, then the result"""
+        running = MagicMock()
+        running.status = 'PROGRESS'
+        running.info = {'phase': 'deploying', 'percent': 50}
+        done = MagicMock()
+        done.status = 'SUCCESS'
+        done.result = {'content': {'myDns': {}}, 'error': None, 'params': {}}
+        self.celery_app.AsyncResult.side_effect = [running, running, done]
+
+        status, headers, body = call(self.app, 'GET', '/api/2/inf/dns/task/asdf-asdf-asdf/events',
+                                     headers={'X-Auth': self.token})
+        events = [x for x in body.decode().split('\n\n') if x]
+
+        self.assertEqual(headers['content-type'], ['text/event-stream'])
+        self.assertEqual(len(events), 2)
+        self.assertEqual(ujson.loads(events[1].split('data: ')[1])['content'], {'myDns': {}})
+
+    def test_healthcheck(self):
+        """DnsApp - GET on /api/1/inf/dns/healthcheck doesn't need a token"""
+        status, _, body = call(self.app, 'GET', '/api/1/inf/dns/healthcheck')
+
+        self.assertEqual(status, 200)
+        self.assertIn('version', ujson.loads(body))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the TTLCache object
+"""
+import unittest
+from unittest.mock import patch
+
+from vlab_dns_api.lib import cache
+
+
+class TestTTLCache(unittest.TestCase):
+    """A set of test cases for the TTLCache object"""
+
+    def test_get(self):
+        """TTLCache - ``get`` returns the cached value"""
+        the_cache = cache.TTLCache(ttl=60)
+        the_cache.set('foo', 'bar')
+
+        self.assertEqual(the_cache.get('foo'), 'bar')
+
+    def test_get_default(self):
+        """TTLCache - ``get`` returns the default when there's no entry"""
+        the_cache = cache.TTLCache(ttl=60)
+
+        self.assertEqual(the_cache.get('foo', 'baz'), 'baz')
+
+    @patch.object(cache.time, 'monotonic')
+    def test_expires(self, fake_monotonic):
+        """TTLCache - entries expire after the TTL"""
+        fake_monotonic.side_effect = [100, 161]
+        the_cache = cache.TTLCache(ttl=60)
+        the_cache.set('foo', 'bar')
+
+        self.assertEqual(the_cache.get('foo'), None)
+
+    def test_max_size(self):
+        """TTLCache - the oldest entry is evicted when the cache is full"""
+        the_cache = cache.TTLCache(ttl=60, max_size=2)
+        the_cache.set('one', 1)
+        the_cache.set('two', 2)
+        the_cache.set('three', 3)
+
+        self.assertEqual(the_cache.get('one'), None)
+        self.assertEqual(len(the_cache), 2)
+
+    def test_setdefault(self):
+        """TTLCache - ``setdefault`` returns the existing entry instead of replacing it"""
+        the_cache = cache.TTLCache(ttl=60)
+        the_cache.setdefault('foo', 'bar')
+
+        self.assertEqual(the_cache.setdefault('foo', 'baz'), 'bar')
+
+    def test_pop(self):
+        """TTLCache - ``pop`` removes the entry"""
+        the_cache = cache.TTLCache(ttl=60)
+        the_cache.set('foo', 'bar')
+
+        self.assertEqual(the_cache.pop('foo'), 'bar')
+        self.assertEqual(the_cache.get('foo'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the cancel.py module
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import cancel
+
+
+class TestCancel(unittest.TestCase):
+    """A set of test cases for cancel.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        patcher = patch.object(cancel, 'const', fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_requested(self):
+        """``requested`` is True once a task is cancelled"""
+        cancel.request('asdf-asdf')
+
+        self.assertTrue(cancel.requested('asdf-asdf'))
+
+    def test_requested_not(self):
+        """``requested`` is False for a task that wasn't cancelled"""
+        cancel.request('asdf-asdf')
+
+        self.assertFalse(cancel.requested('other-task'))
+
+    def test_requested_no_id(self):
+        """``requested`` is False when there's no task id, like when a task is called directly"""
+        self.assertFalse(cancel.requested(None))
+
+    def test_check(self):
+        """``check`` raises Cancelled with the phase the task was about to start"""
+        cancel.request('asdf-asdf')
+
+        with self.assertRaises(cancel.Cancelled) as caught:
+            cancel.check('asdf-asdf', 'deploying', {'percent': 10})
+
+        self.assertEqual(caught.exception.phase, 'deploying')
+        self.assertEqual(caught.exception.details, {'percent': 10})
+
+    def test_cancelled_is_value_error(self):
+        """Cancelled is a ValueError, so every task reports it as an error"""
+        self.assertTrue(issubclass(cancel.Cancelled, ValueError))
+
+    def test_clear(self):
+        """``clear`` forgets a cancel"""
+        cancel.request('asdf-asdf')
+        cancel.clear('asdf-asdf')
+
+        self.assertFalse(cancel.requested('asdf-asdf'))
+
+    def test_request_expires(self):
+        """``request`` removes cancels that are too old to matter"""
+        cancel.request('old-task')
+        old_file = os.path.join(self.state_dir, 'cancel', cancel._safe('old-task'))
+        os.utime(old_file, (0, 0))
+
+        cancel.request('new-task')
+
+        self.assertFalse(cancel.requested('old-task'))
+
+    def test_safe(self):
+        """``_safe`` keeps odd characters out of the file path"""
+        self.assertEqual(cancel._safe('../../etc'), 'task-etc')
+
+
+if __name__ == '__main__':
+    unittest.main()
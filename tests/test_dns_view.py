@@ -2,6 +2,8 @@
 """
 A suite of tests for the dns object
 """
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
@@ -33,6 +35,20 @@ class TestDnsView(unittest.TestCase):
         cls.fake_task = MagicMock()
         cls.fake_task.id = 'asdf-asdf-asdf'
         app.celery_app.send_task.return_value = cls.fake_task
+        cls.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = cls.state_dir
+        fake_const.VLAB_DNS_IDEMPOTENCY_TTL = 3600
+        cls.const_patcher = patch.object(dns.idempotency, 'const', fake_const)
+        cls.const_patcher.start()
+        cls.owners_patcher = patch.object(dns.owners, 'const', fake_const)
+        cls.owners_patcher.start()
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.const_patcher.stop()
+        self.owners_patcher.stop()
+        shutil.rmtree(self.state_dir)
 
     def test_v1_deprecated(self):
         """DnsView - GET on /api/1/inf/dns returns an HTTP 404"""
@@ -64,6 +80,146 @@ class TestDnsView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    def test_get_fields(self):
+        """DnsView - GET on /api/2/inf/dns passes the requested fields to the worker"""
+        self.app.get('/api/2/inf/dns?fields=state,ips',
+                     headers={'X-Auth': self.token})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'fields': ['state', 'ips']}
+
+        self.assertEqual(the_kwargs, expected)
+
+    def test_get_paging(self):
+        """DnsView - GET on /api/2/inf/dns passes paging params to the worker"""
+        self.app.get('/api/2/inf/dns?page=2',
+                     headers={'X-Auth': self.token})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'page': 2, 'per_page': 25}
+
+        self.assertEqual(the_kwargs, expected)
+
+    def test_get_no_args(self):
+        """DnsView - GET on /api/2/inf/dns without query params sends no kwargs to the worker"""
+        self.app.get('/api/2/inf/dns',
+                     headers={'X-Auth': self.token})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+
+        self.assertTrue(the_kwargs is None)
+
+    def test_get_bad_fields(self):
+        """DnsView - GET on /api/2/inf/dns returns 400 for unknown fields"""
+        resp = self.app.get('/api/2/inf/dns?fields=state,password',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_bad_page(self):
+        """DnsView - GET on /api/2/inf/dns returns 400 for invalid paging params"""
+        resp = self.app.get('/api/2/inf/dns?page=0&per-page=abc',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 400)
+
+    @patch.object(dns.inventory, 'etag')
+    def test_get_task_no_etag(self, fake_etag):
+        """DnsView - GET on /api/2/inf/dns doesn't put an ETag on the task it returns"""
+        fake_etag.return_value = 'abc123'
+        resp = self.app.get('/api/2/inf/dns',
+                            headers={'X-Auth': self.token})
+
+        self.assertTrue('ETag' not in resp.headers)
+
+    @patch.object(dns.inventory, 'version')
+    @patch.object(dns.inventory, 'etag')
+    def test_get_etag_current(self, fake_etag, fake_version):
+        """DnsView - GET on /api/2/inf/dns checks the ETag against the current inventory and listing params"""
+        fake_version.return_value = 'v2'
+        self.app.get('/api/2/inf/dns?page=2',
+                     headers={'X-Auth': self.token, 'If-None-Match': '"abc123"'})
+
+        the_args, _ = fake_etag.call_args
+        expected = ('bob', 'v2', {'page': 2, 'per_page': 25})
+
+        self.assertEqual(the_args, expected)
+
+    @patch.object(dns.inventory, 'etag')
+    def test_get_not_modified(self, fake_etag):
+        """DnsView - GET on /api/2/inf/dns returns 304 when the listing has not changed"""
+        fake_etag.return_value = 'abc123'
+        resp = self.app.get('/api/2/inf/dns',
+                            headers={'X-Auth': self.token, 'If-None-Match': '"abc123"'})
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
+    @patch.object(dns.inventory, 'etag')
+    def test_get_modified(self, fake_etag):
+        """DnsView - GET on /api/2/inf/dns creates a task when the listing has changed"""
+        fake_etag.return_value = 'def456'
+        resp = self.app.get('/api/2/inf/dns',
+                            headers={'X-Auth': self.token, 'If-None-Match': '"abc123"'})
+
+        self.assertEqual(resp.status_code, 202)
+
+    @patch.object(dns.inventory, 'etag')
+    def test_get_etag_disabled(self, fake_etag):
+        """DnsView - GET on /api/2/inf/dns does not set an ETag when they are disabled"""
+        fake_etag.return_value = None
+        resp = self.app.get('/api/2/inf/dns',
+                            headers={'X-Auth': self.token, 'If-None-Match': '*'})
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertTrue('ETag' not in resp.headers)
+
+    def test_get_profile(self):
+        """DnsView - GET on /api/2/inf/dns asks the worker to profile the task when the X-Profile header is set"""
+        self.app.get('/api/2/inf/dns',
+                     headers={'X-Auth': self.token, 'X-Profile': 'true'})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'profile': True}
+
+        self.assertEqual(the_kwargs, expected)
+
+    @patch.object(dns.inventory, 'etag')
+    def test_get_profile_not_cached(self, fake_etag):
+        """DnsView - GET on /api/2/inf/dns makes a task to profile, even when the listing has not changed"""
+        fake_etag.return_value = 'abc123'
+        resp = self.app.get('/api/2/inf/dns',
+                            headers={'X-Auth': self.token, 'If-None-Match': '"abc123"', 'X-Profile': '1'})
+
+        self.assertEqual(resp.status_code, 202)
+
+    def test_post_profile(self):
+        """DnsView - POST on /api/2/inf/dns asks the worker to profile the task when the X-Profile header is set"""
+        self.app.post('/api/2/inf/dns',
+                      headers={'X-Auth': self.token, 'X-Profile': 'true'},
+                      json={'network': "someLAN",
+                            'name': "myDnsBox",
+                            'image': "someVersion",
+                            'static-ip': '192.168.1.2'})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'profile': True}
+
+        self.assertEqual(the_kwargs, expected)
+
+    def test_post_no_profile(self):
+        """DnsView - POST on /api/2/inf/dns sends no kwargs to the worker without the X-Profile header"""
+        self.app.post('/api/2/inf/dns',
+                      headers={'X-Auth': self.token},
+                      json={'network': "someLAN",
+                            'name': "myDnsBox",
+                            'image': "someVersion",
+                            'static-ip': '192.168.1.2'})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+
+        self.assertTrue(the_kwargs is None)
+
     def test_post_task(self):
         """DnsView - POST on /api/2/inf/dns returns a task-id"""
         resp = self.app.post('/api/2/inf/dns',
@@ -108,6 +264,179 @@ class TestDnsView(unittest.TestCase):
 
         self.assertEqual(status, expected)
 
+    def test_post_bad_dns(self):
+        """DnsView - POST on /api/2/inf/dns returns HTTP 400 when a DNS server isn't an IPv4 address"""
+        resp = self.app.post('/api/2/inf/dns',
+                             headers={'X-Auth': self.token},
+                             json={'network': "someLAN",
+                                   'name': "myDnsBox",
+                                   'image': "someVersion",
+                                   'static-ip': '192.168.1.2',
+                                   'dns': ['not-an-ip']})
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
+    def test_post_bad_name(self):
+        """DnsView - POST on /api/2/inf/dns returns HTTP 400 when the name isn't a valid hostname"""
+        resp = self.app.post('/api/2/inf/dns',
+                             headers={'X-Auth': self.token},
+                             json={'network': "someLAN",
+                                   'name': "my_DnsBox",
+                                   'image': "someVersion",
+                                   'static-ip': '192.168.1.2'})
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
+    def test_network_batch(self):
+        """DnsView - PUT on /api/2/inf/dns/network/batch sends the networks with the username prefix"""
+        self.app.put('/api/2/inf/dns/network/batch',
+                     headers={'X-Auth': self.token},
+                     json={'changes': [{'name': 'dns1', 'new_network': 'lab2'},
+                                       {'name': 'dns2', 'new_network': 'lab3'}]})
+
+        the_args = self.app.application.celery_app.send_task.call_args[0][1]
+        expected = ['bob', {'dns1': 'bob_lab2', 'dns2': 'bob_lab3'}, 'noId']
+
+        self.assertEqual(the_args, expected)
+
+    def test_network_batch_empty(self):
+        """DnsView - PUT on /api/2/inf/dns/network/batch returns 400 when there are no changes"""
+        resp = self.app.put('/api/2/inf/dns/network/batch',
+                            headers={'X-Auth': self.token},
+                            json={'changes': []})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_reset(self):
+        """DnsView - POST on /api/2/inf/dns/reset returns a task-id"""
+        resp = self.app.post('/api/2/inf/dns/reset',
+                             headers={'X-Auth': self.token},
+                             json={'name' : 'myDnsBox'})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    @patch.object(dns.time, 'sleep')
+    def test_task_events(self, fake_sleep):
+        """DnsView - GET on /api/2/inf/dns/task/<id>/events streams progress, then the result"""
+        running = MagicMock()
+        running.status = 'PROGRESS'
+        running.info = {'phase': 'deploying', 'percent': 50}
+        done = MagicMock()
+        done.status = 'SUCCESS'
+        done.result = {'content': {'myDns': {}}, 'error': None, 'params': {}}
+        self.app.application.celery_app.AsyncResult.side_effect = [running, running, done]
+
+        resp = self.app.get('/api/2/inf/dns/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        events = [x for x in resp.get_data(as_text=True).split('\n\n') if x]
+
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        self.assertEqual(len(events), 2) # an unchanged state isn't sent again
+        self.assertTrue(events[0].startswith('event: progress\ndata: '))
+        self.assertEqual(ujson.loads(events[1].split('data: ')[1])['content'], {'myDns': {}})
+
+    @patch.object(dns.time, 'sleep')
+    def test_task_events_failure(self, fake_sleep):
+        """DnsView - GET on /api/2/inf/dns/task/<id>/events ends with the error of a failed task"""
+        failed = MagicMock()
+        failed.status = 'FAILURE'
+        failed.result = RuntimeError('doh')
+        self.app.application.celery_app.AsyncResult.return_value = failed
+
+        resp = self.app.get('/api/2/inf/dns/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        data = ujson.loads(resp.get_data(as_text=True).split('data: ')[1])
+
+        self.assertEqual(data['error'], 'doh')
+
+    def test_task_events_timeout(self):
+        """``_task_events`` stops streaming once the timeout is reached"""
+        fake_celery = MagicMock()
+
+        events = list(dns._task_events(fake_celery, 'asdf', timeout=0))
+
+        self.assertTrue(events[0].startswith('event: timeout'))
+
+    def test_cancel(self):
+        """DnsView - DELETE on /api/2/inf/dns/task/<id> revokes the task, and tells the workers to stop it"""
+        dns.owners.record('asdf-asdf-asdf', 'bob')
+        self.app.application.celery_app.AsyncResult.return_value.status = 'PROGRESS'
+        resp = self.app.delete('/api/2/inf/dns/task/asdf-asdf-asdf',
+                               headers={'X-Auth': self.token})
+        control = self.app.application.celery_app.control
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json['content'], {'task-id': 'asdf-asdf-asdf', 'status': 'PROGRESS'})
+        control.revoke.assert_called_with('asdf-asdf-asdf')
+        control.broadcast.assert_called_with('dns_cancel', arguments={'task_id': 'asdf-asdf-asdf'})
+
+    def test_cancel_other_user(self):
+        """DnsView - DELETE on /api/2/inf/dns/task/<id> returns 404 for the task of another user"""
+        dns.owners.record('asdf-asdf-asdf', 'alice')
+        resp = self.app.delete('/api/2/inf/dns/task/asdf-asdf-asdf',
+                               headers={'X-Auth': self.token})
+        control = self.app.application.celery_app.control
+
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(control.revoke.called)
+        self.assertFalse(control.broadcast.called)
+
+    def test_cancel_own_task(self):
+        """DnsView - A user can cancel the task that they just started"""
+        self.app.application.celery_app.AsyncResult.return_value.status = 'PENDING'
+        resp = self.app.get('/api/2/inf/dns/image',
+                            headers={'X-Auth': self.token})
+        task_id = self.app.application.celery_app.send_task.call_args[1]['task_id']
+
+        resp = self.app.delete('/api/2/inf/dns/task/{}'.format(task_id),
+                               headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 202)
+
+    def test_modify_network(self):
+        """DnsView - PUT on /api/2/inf/dns/network records who started the task"""
+        self.app.put('/api/2/inf/dns/network',
+                     headers={'X-Auth': self.token},
+                     json={'name': 'myDns', 'new_network': 'lab2'})
+        the_args = self.app.application.celery_app.send_task.call_args
+
+        self.assertEqual(the_args[0], ('dns.modify_network', ['bob', 'myDns', 'bob_lab2', 'noId']))
+        self.assertEqual(dns.owners.owner(the_args[1]['task_id']), 'bob')
+
+    def test_metrics(self):
+        """DnsView - GET on /api/2/inf/dns/metrics returns a task-id"""
+        resp = self.app.get('/api/2/inf/dns/metrics',
+                            headers={'X-Auth': self.token})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_reset_bad_body(self):
+        """DnsView - POST on /api/2/inf/dns/reset returns 400 without a name"""
+        resp = self.app.post('/api/2/inf/dns/reset',
+                             headers={'X-Auth': self.token},
+                             json={})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_delete_async(self):
+        """DnsView - DELETE on /api/2/inf/dns with async tells the worker to destroy it in the background"""
+        self.app.delete('/api/2/inf/dns',
+                        headers={'X-Auth': self.token},
+                        json={'name' : 'myDnsBox', 'async': True})
+
+        the_kwargs = self.app.application.celery_app.send_task.call_args[1]['kwargs']
+        expected = {'async_delete': True}
+
+        self.assertEqual(the_kwargs, expected)
+
     def test_delete_task(self):
         """DnsView - DELETE on /api/2/inf/dns returns a task-id"""
         resp = self.app.delete('/api/2/inf/dns',
@@ -151,5 +480,93 @@ class TestDnsView(unittest.TestCase):
         self.assertEqual(task_id, expected)
 
 
+    def test_zone_import(self):
+        """DnsView - POST on the ./zone end point returns a task-id"""
+        resp = self.app.post('/api/2/inf/dns/zone',
+                             headers={'X-Auth': self.token},
+                             json={'name': 'myDnsBox',
+                                   'records': [{'name': 'www', 'type': 'A', 'value': '192.168.1.10'}]})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_zone_import_records_and_file(self):
+        """DnsView - POST on the ./zone end point with records and a zone file returns HTTP 400"""
+        resp = self.app.post('/api/2/inf/dns/zone',
+                             headers={'X-Auth': self.token},
+                             json={'name': 'myDnsBox',
+                                   'records': [],
+                                   'zone-file': '@ IN SOA ns1 root 1 2 3 4 5'})
+
+        status = resp.status_code
+        expected = 400
+
+        self.assertEqual(status, expected)
+
+    def test_zone_export(self):
+        """DnsView - GET on the ./zone end point sets the Link header"""
+        resp = self.app.get('/api/2/inf/dns/zone?name=myDnsBox',
+                            headers={'X-Auth': self.token})
+
+        task_id = resp.headers['Link']
+        expected = '<https://localhost/api/2/inf/dns/task/asdf-asdf-asdf>; rel=status'
+
+        self.assertEqual(task_id, expected)
+
+    def test_zone_export_no_name(self):
+        """DnsView - GET on the ./zone end point without a name returns HTTP 400"""
+        resp = self.app.get('/api/2/inf/dns/zone',
+                            headers={'X-Auth': self.token})
+
+        status = resp.status_code
+        expected = 400
+
+        self.assertEqual(status, expected)
+
+
+    def test_post_idempotent(self):
+        """DnsView - POST on /api/2/inf/dns with a reused X-REQUEST-ID does not create a 2nd task"""
+        # Like Celery, the task has the id it was sent with
+        self.app.application.celery_app.send_task.side_effect = lambda *args, **kwargs: MagicMock(id=kwargs['task_id'])
+        task_ids = []
+        for _ in range(2):
+            resp = self.app.post('/api/2/inf/dns',
+                                 headers={'X-Auth': self.token, 'X-REQUEST-ID': 'someId'},
+                                 json={'network': "someLAN",
+                                       'name': "myDnsBox",
+                                       'image': "someVersion",
+                                       'static-ip': '192.168.1.2'})
+            task_ids.append(resp.json['content']['task-id'])
+
+        self.assertEqual(task_ids[0], task_ids[1])
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 1)
+
+    def test_post_idempotency_key(self):
+        """DnsView - POST on /api/2/inf/dns honors the Idempotency-Key header"""
+        for request_id in ('someId', 'someOtherId'):
+            self.app.post('/api/2/inf/dns',
+                          headers={'X-Auth': self.token, 'X-REQUEST-ID': request_id, 'Idempotency-Key': 'aa'},
+                          json={'network': "someLAN",
+                                'name': "myDnsBox",
+                                'image': "someVersion",
+                                'static-ip': '192.168.1.2'})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 1)
+
+    def test_post_no_id(self):
+        """DnsView - POST on /api/2/inf/dns without a request id always creates a task"""
+        for _ in range(2):
+            self.app.post('/api/2/inf/dns',
+                          headers={'X-Auth': self.token},
+                          json={'network': "someLAN",
+                                'name': "myDnsBox",
+                                'image': "someVersion",
+                                'static-ip': '192.168.1.2'})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
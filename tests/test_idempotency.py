@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the idempotency.py module
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib import idempotency
+
+
+class TestIdempotency(unittest.TestCase):
+    """A set of test cases for idempotency.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        self.fake_const.VLAB_DNS_IDEMPOTENCY_TTL = 3600
+        patcher = patch.object(idempotency, 'const', self.fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_claim(self):
+        """``claim`` returns the new task-id when the key hasn't been used"""
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+
+        self.assertEqual(output, 'task-1')
+
+    def test_claim_retry(self):
+        """``claim`` returns the original task-id when a create is retried"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-2')
+
+        self.assertEqual(output, 'task-1')
+
+    def test_claim_other_machine(self):
+        """``claim`` keeps the keys of different creates apart"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+
+        output = idempotency.claim('bob', 'myOtherDns', 'someKey', 'task-2')
+
+        self.assertEqual(output, 'task-2')
+
+    def test_claim_expired(self):
+        """``claim`` lets a new create have a key that expired"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+        self.fake_const.VLAB_DNS_IDEMPOTENCY_TTL = 0
+
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-2')
+
+        self.assertEqual(output, 'task-2')
+
+    def test_claim_no_staged_files(self):
+        """``claim`` leaves only the key behind"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-2')
+
+        output = os.listdir(os.path.join(self.state_dir, 'idempotency'))
+
+        self.assertEqual(len(output), 1)
+
+    def test_claim_unwritable(self):
+        """``claim`` doesn't block the create when the key can't be recorded"""
+        self.fake_const.VLAB_DNS_STATE_DIR = os.path.join(self.state_dir, 'file')
+        with open(self.fake_const.VLAB_DNS_STATE_DIR, 'w') as the_file:
+            the_file.write('not a directory')
+
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+
+        self.assertEqual(output, 'task-1')
+
+    def test_release(self):
+        """``release`` lets the client retry a create whose task never started"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+        idempotency.release('bob', 'myDns', 'someKey', 'task-1')
+
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-2')
+
+        self.assertEqual(output, 'task-2')
+
+    def test_release_other_task(self):
+        """``release`` doesn't forget a key another task holds"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+        idempotency.release('bob', 'myDns', 'someKey', 'task-2')
+
+        output = idempotency.claim('bob', 'myDns', 'someKey', 'task-3')
+
+        self.assertEqual(output, 'task-1')
+
+    @patch.object(idempotency, '_LAST_SWEEP', 0)
+    def test_sweep(self):
+        """``claim`` removes the keys that expired"""
+        idempotency.claim('bob', 'myDns', 'someKey', 'task-1')
+        key_dir = os.path.join(self.state_dir, 'idempotency')
+        for entry in os.scandir(key_dir):
+            os.utime(entry.path, (time.time() - 7200, time.time() - 7200))
+        idempotency._LAST_SWEEP = 0
+
+        idempotency.claim('bob', 'myOtherDns', 'someKey', 'task-2')
+
+        self.assertEqual(len(os.listdir(key_dir)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
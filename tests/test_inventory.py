@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the inventory.py module
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib import inventory
+
+
+class TestInventory(unittest.TestCase):
+    """A set of test cases for inventory.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        self.fake_const.VLAB_DNS_ETAGS = True
+        self.fake_const.VLAB_DNS_ETAG_TTL = 60
+        patcher = patch.object(inventory, 'const', self.fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Keeps every test inside a single ETag window
+        self.fake_time = MagicMock()
+        self.fake_time.time.return_value = 1000.0
+        time_patcher = patch.object(inventory, 'time', self.fake_time)
+        time_patcher.start()
+        self.addCleanup(time_patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_version_default(self):
+        """``version`` returns '0' when the inventory has never changed"""
+        self.assertEqual(inventory.version('bob'), '0')
+
+    def test_bump(self):
+        """``bump`` changes the version of the user's inventory"""
+        new_version = inventory.bump('bob')
+
+        self.assertEqual(inventory.version('bob'), new_version)
+
+    def test_bump_other_users(self):
+        """``bump`` does not change the version of other users"""
+        inventory.bump('bob')
+
+        self.assertEqual(inventory.version('alice'), '0')
+
+    def test_bump_error(self):
+        """``bump`` returns None when the change cannot be recorded"""
+        self.fake_const.VLAB_DNS_STATE_DIR = '/dev/null/nope'
+
+        self.assertTrue(inventory.bump('bob') is None)
+
+    def test_etag(self):
+        """``etag`` is the same while nothing changes"""
+        first = inventory.etag('bob', inventory.version('bob'), {'page': 1, 'per_page': 25})
+        second = inventory.etag('bob', inventory.version('bob'), {'page': 1, 'per_page': 25})
+
+        self.assertEqual(first, second)
+
+    def test_etag_bump(self):
+        """``etag`` changes when the inventory changes"""
+        before = inventory.etag('bob', inventory.version('bob'), {})
+        inventory.bump('bob')
+
+        self.assertNotEqual(before, inventory.etag('bob', inventory.version('bob'), {}))
+
+    def test_etag_query(self):
+        """``etag`` depends on what the listing was limited to"""
+        first = inventory.etag('bob', '0', {'page': 1, 'per_page': 25})
+        second = inventory.etag('bob', '0', {'page': 2, 'per_page': 25})
+
+        self.assertNotEqual(first, second)
+
+    def test_etag_show_kwargs(self):
+        """``etag`` is the same for the kwargs the API sends, and the args the worker gets"""
+        from_api = inventory.etag('bob', '0', {'fields': ['state'], 'profile': True})
+        from_worker = inventory.etag('bob', '0', {'fields': ['state'], 'page': None, 'per_page': None})
+
+        self.assertEqual(from_api, from_worker)
+
+    def test_etag_expires(self):
+        """``etag`` changes once VLAB_DNS_ETAG_TTL has passed, so outside changes are seen"""
+        before = inventory.etag('bob', '0', {})
+        self.fake_time.time.return_value = 1060.0
+
+        self.assertNotEqual(before, inventory.etag('bob', '0', {}))
+
+    def test_etag_window(self):
+        """``etag`` is the same within one VLAB_DNS_ETAG_TTL window"""
+        before = inventory.etag('bob', '0', {})
+        self.fake_time.time.return_value = 1019.0
+
+        self.assertEqual(before, inventory.etag('bob', '0', {}))
+
+    def test_etag_disabled(self):
+        """``etag`` returns None when VLAB_DNS_ETAGS is false"""
+        self.fake_const.VLAB_DNS_ETAGS = False
+
+        self.assertTrue(inventory.etag('bob', '0', {}) is None)
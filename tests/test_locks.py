@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the locks.py module
+"""
+import time
+import fcntl
+import shutil
+import os.path
+import tempfile
+import unittest
+import threading
+
+from vlab_dns_api.lib.worker import locks
+
+
+class TestLocks(unittest.TestCase):
+    """A set of test cases for locks.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        self.lock_file = os.path.join(self.state_dir, 'lock')
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_held_threads(self):
+        """``held`` lets only one thread of a process hold the lock at a time"""
+        holding = []
+        peak = []
+
+        def worker():
+            with locks.held(self.lock_file):
+                holding.append(1)
+                peak.append(len(holding))
+                time.sleep(0.01)
+                holding.pop()
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 1)
+
+    def test_held_forgets(self):
+        """``held`` doesn't keep the in-process lock once nobody wants it"""
+        with locks.held(self.lock_file):
+            pass
+
+        self.assertNotIn(self.lock_file, locks._LOCKS)
+
+    def test_held_released_on_error(self):
+        """``held`` releases the lock when the block raises"""
+        with self.assertRaises(RuntimeError):
+            with locks.held(self.lock_file):
+                raise RuntimeError('testing')
+
+        with locks.held(self.lock_file):
+            pass
+
+    def test_attempt(self):
+        """``attempt`` holds the lock when nobody else does"""
+        with locks.attempt(self.lock_file) as locked:
+            self.assertTrue(locked)
+
+        self.assertNotIn(self.lock_file, locks._LOCKS)
+
+    def test_attempt_held(self):
+        """``attempt`` doesn't wait on a lock another thread holds"""
+        holding = threading.Event()
+        done = threading.Event()
+
+        def holder():
+            with locks.held(self.lock_file):
+                holding.set()
+                done.wait()
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        holding.wait()
+        with locks.attempt(self.lock_file) as locked:
+            output = locked
+        done.set()
+        thread.join()
+
+        self.assertFalse(output)
+
+    def test_attempt_other_process(self):
+        """``attempt`` doesn't wait on a lock another process holds"""
+        with open(self.lock_file, 'w') as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            with locks.attempt(self.lock_file) as locked:
+                output = locked
+
+        self.assertFalse(output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the lookup.py module
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import lookup
+
+
+def _deleted(the_object):
+    """Mimics reading a property of an object that no longer exists"""
+    raise lookup.vmodl.fault.ManagedObjectNotFound()
+
+
+class TestLookup(unittest.TestCase):
+    """A set of test cases for lookup.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        lookup.clear()
+        self.vcenter = MagicMock()
+        self.folder = lookup.vim.Folder('group-v1')
+        self.vcenter.get_by_name.return_value = self.folder
+
+    def test_folder(self):
+        """``folder`` searches vCenter when the folder is not cached"""
+        output = lookup.folder(self.vcenter, 'bob')
+
+        self.assertTrue(output is self.folder)
+
+    @patch.object(lookup.vim.Folder, 'name', new='bob')
+    def test_folder_cached(self):
+        """``folder`` binds the cached moref to the current session instead of searching vCenter"""
+        lookup.folder(self.vcenter, 'bob')
+        self.vcenter.get_by_name.reset_mock()
+
+        output = lookup.folder(self.vcenter, 'bob')
+
+        self.assertEqual(output._moId, 'group-v1')
+        self.assertTrue(output._stub is self.vcenter._conn._stub)
+        self.assertFalse(self.vcenter.get_by_name.called)
+
+    @patch.object(lookup.vim.Folder, 'name', new='alice')
+    def test_folder_renamed(self):
+        """``folder`` searches vCenter when the cached object has been renamed"""
+        lookup.folder(self.vcenter, 'bob')
+        self.vcenter.get_by_name.reset_mock()
+
+        lookup.folder(self.vcenter, 'bob')
+
+        self.assertTrue(self.vcenter.get_by_name.called)
+
+    def test_folder_deleted(self):
+        """``folder`` searches vCenter when the cached object no longer exists"""
+        lookup.folder(self.vcenter, 'bob')
+        self.vcenter.get_by_name.reset_mock()
+        with patch.object(lookup.vim.Folder, 'name', new=property(_deleted)):
+            lookup.folder(self.vcenter, 'bob')
+
+        self.assertTrue(self.vcenter.get_by_name.called)
+
+    @patch.object(lookup.vim.Folder, 'name', new='bob')
+    def test_per_vcenter(self):
+        """``folder`` doesn't use a moref cached for a different vCenter"""
+        lookup.folder(self.vcenter, 'bob')
+        other_vcenter = MagicMock()
+        other_vcenter.get_by_name.return_value = lookup.vim.Folder('group-v2')
+
+        output = lookup.folder(other_vcenter, 'bob')
+
+        self.assertEqual(output._moId, 'group-v2')
+
+    @patch.object(lookup.vim.Network, 'name', new='lab2')
+    def test_network_caches_all(self):
+        """``network`` caches every network found by one search"""
+        self.vcenter.networks = {'lab1': lookup.vim.Network('network-1'),
+                                 'lab2': lookup.vim.Network('network-2')}
+
+        lookup.network(self.vcenter, 'lab1')
+        self.vcenter.networks = {}
+        output = lookup.network(self.vcenter, 'lab2')
+
+        self.assertEqual(output._moId, 'network-2')
+
+    def test_network_missing(self):
+        """``network`` raises KeyError when there's no such network"""
+        self.vcenter.networks = {}
+
+        with self.assertRaises(KeyError):
+            lookup.network(self.vcenter, 'lab1')
+
+    @patch.object(lookup.vim.ResourcePool, 'name', new='Resources')
+    def test_resource_pool_cluster(self):
+        """``resource_pool`` caches the pool of a compute cluster, even though it's named differently"""
+        self.vcenter.resource_pools = {'cluster1': lookup.vim.ResourcePool('resgroup-1')}
+
+        lookup.resource_pool(self.vcenter, 'cluster1')
+        self.vcenter.resource_pools = {}
+        output = lookup.resource_pool(self.vcenter, 'cluster1')
+
+        self.assertEqual(output._moId, 'resgroup-1')
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the metrics.py module
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """A set of test cases for metrics.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        patcher = patch.object(metrics, 'const', fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_snapshot_empty(self):
+        """``snapshot`` works before anything has been recorded"""
+        output = metrics.snapshot()
+
+        self.assertEqual(output['counters'], {})
+        self.assertEqual(output['gauges'], {})
+
+    def test_incr(self):
+        """``incr`` adds to a counter"""
+        metrics.incr('vcenter.retries')
+        metrics.incr('vcenter.retries', amount=2)
+
+        output = metrics.snapshot()['counters']['vcenter.retries']
+
+        self.assertEqual(output, 3)
+
+    def test_gauge(self):
+        """``gauge`` replaces the value of a gauge"""
+        metrics.gauge('breaker.state', 'open')
+        metrics.gauge('breaker.state', 'closed')
+
+        output = metrics.snapshot()['gauges']['breaker.state']
+
+        self.assertEqual(output, 'closed')
+
+    def test_snapshot_time(self):
+        """``snapshot`` records when it was taken"""
+        output = metrics.snapshot()
+
+        self.assertTrue(isinstance(output['time'], float))
+
+    def test_observe(self):
+        """``observe`` counts a measurement in the smallest bucket that holds it"""
+        metrics.observe('tools.seconds', 4.2)
+        metrics.observe('tools.seconds', 5)
+        metrics.observe('tools.seconds', 9000)
+
+        output = metrics.snapshot()['histograms']['tools.seconds']
+        expected = {'buckets': {'5': 2, '+Inf': 1}, 'count': 3, 'sum': 9009.2, 'max': 9000}
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the owners.py module
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib import owners
+
+
+class TestOwners(unittest.TestCase):
+    """A set of test cases for owners.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        patcher = patch.object(owners, 'const', fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_owner(self):
+        """``owner`` returns who recorded the task"""
+        owners.record('task-1', 'bob')
+
+        self.assertEqual(owners.owner('task-1'), 'bob')
+
+    def test_owner_unknown(self):
+        """``owner`` returns None for a task nobody recorded"""
+        self.assertTrue(owners.owner('task-1') is None)
+
+    @patch.object(owners, 'OWNER_TTL', 0)
+    def test_owner_expired(self):
+        """``owner`` forgets who started a task once OWNER_TTL has passed"""
+        owners.record('task-1', 'bob')
+
+        self.assertTrue(owners.owner('task-1') is None)
+
+    def test_owner_odd_task_id(self):
+        """``owner`` keeps odd characters in a task-id out of the file path"""
+        owners.record('../../task-1', 'bob')
+
+        self.assertEqual(owners.owner('../../task-1'), 'bob')
+        self.assertEqual(os.listdir(self.state_dir), ['owners'])
+
+    @patch.object(owners.os, 'makedirs')
+    def test_record_error(self, fake_makedirs):
+        """``record`` does not raise when the owner can't be saved"""
+        fake_makedirs.side_effect = PermissionError('testing')
+
+        owners.record('task-1', 'bob')
+
+
+if __name__ == '__main__':
+    unittest.main()
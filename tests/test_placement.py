@@ -0,0 +1,195 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the placement.py module
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import placement
+
+
+def make_datastore(name, free_gb, accessible=True):
+    """Create a mock datastore"""
+    datastore = MagicMock()
+    datastore.name = name
+    datastore.summary.freeSpace = free_gb * placement.GB
+    datastore.summary.accessible = accessible
+    datastore.summary.maintenanceMode = 'normal'
+    return datastore
+
+
+def make_host(name, datastores, maintenance=False):
+    """Create a mock ESXi host"""
+    host = MagicMock()
+    host.name = name
+    host.datastore = datastores
+    host.runtime.inMaintenanceMode = maintenance
+    host.runtime.connectionState = 'connected'
+    host.summary.hardware.memorySize = 256 * placement.GB
+    host.summary.quickStats.overallMemoryUsage = 1024
+    return host
+
+
+class TestPlacement(unittest.TestCase):
+    """A set of test cases for placement.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        placement.lookup.clear()
+        self.state_dir = tempfile.mkdtemp()
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        self.fake_const.VLAB_DNS_DATASTORES = 'ds1,ds2'
+        self.fake_const.VLAB_DNS_MIN_FREE_GB = 20
+        patcher = patch.object(placement, 'const', self.fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ds1 = make_datastore('ds1', 500)
+        self.ds2 = make_datastore('ds2', 400)
+        self.vcenter = MagicMock()
+        self.vcenter._conn._stub.host = 'vcenter1'
+        self.vcenter.datastores = {}
+        self.vcenter.get_by_type.return_value = [self.ds1, self.ds2]
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_score_inflight(self):
+        """``score`` prefers hardware with fewer deploys in flight"""
+        self.assertTrue(placement.score(100, 0, None) > placement.score(100, 1, None))
+
+    def test_score_latency(self):
+        """``score`` prefers hardware with faster deploys"""
+        self.assertTrue(placement.score(100, 0, 10) > placement.score(100, 0, 100))
+
+    def test_choose_datastore(self):
+        """``choose_datastore`` picks the datastore with the most free space"""
+        self.assertTrue(placement.choose_datastore(self.vcenter) is self.ds1)
+
+    def test_choose_datastore_cluster(self):
+        """``choose_datastore`` picks from the datastores of a datastore cluster"""
+        self.fake_const.VLAB_DNS_DATASTORES = 'cluster1'
+        self.vcenter.datastores = {'cluster1': MagicMock(childEntity=[self.ds2])}
+
+        self.assertTrue(placement.choose_datastore(self.vcenter) is self.ds2)
+
+    def test_choose_datastore_missing(self):
+        """``choose_datastore`` raises ValueError when a configured datastore does not exist"""
+        self.fake_const.VLAB_DNS_DATASTORES = 'ds3'
+
+        with self.assertRaises(ValueError):
+            placement.choose_datastore(self.vcenter)
+
+    def test_choose_datastore_full(self):
+        """``choose_datastore`` raises ValueError when no datastore has enough free space"""
+        self.ds1.summary.freeSpace = 0
+        self.ds2.summary.freeSpace = 0
+
+        with self.assertRaises(ValueError):
+            placement.choose_datastore(self.vcenter)
+
+    def test_choose_datastore_spreads(self):
+        """``choose_datastore`` avoids a datastore that already has deploys in flight"""
+        placement._reserve('vcenter1', placement.DATASTORE, 'ds1')
+
+        self.assertTrue(placement.choose_datastore(self.vcenter) is self.ds2)
+
+    def test_choose_datastore_latency(self):
+        """``choose_datastore`` avoids a datastore with slow deploys"""
+        placement.record_latency('vcenter1', placement.DATASTORE, 'ds1', 600)
+
+        self.assertTrue(placement.choose_datastore(self.vcenter) is self.ds2)
+
+    def test_free_space(self):
+        """``free_space`` reports the free bytes of every usable datastore"""
+        self.ds2.summary.accessible = False
+
+        output = placement.free_space(self.vcenter)
+        expected = {'ds1': 500 * placement.GB}
+
+        self.assertEqual(output, expected)
+
+    def test_choose_host(self):
+        """``choose_host`` only picks hosts that can access the datastore"""
+        host1 = make_host('esx1', [self.ds2])
+        host2 = make_host('esx2', [self.ds1])
+        resource_pool = MagicMock()
+        resource_pool.owner.host = [host1, host2]
+
+        self.assertTrue(placement.choose_host(self.vcenter, resource_pool, self.ds1) is host2)
+
+    def test_choose_host_maintenance(self):
+        """``choose_host`` raises ValueError when every host is in maintenance mode"""
+        resource_pool = MagicMock()
+        resource_pool.owner.host = [make_host('esx1', [self.ds1], maintenance=True)]
+
+        with self.assertRaises(ValueError):
+            placement.choose_host(self.vcenter, resource_pool, self.ds1)
+
+    def test_place(self):
+        """``place`` reserves the hardware until the deploy is done"""
+        resource_pool = MagicMock()
+        resource_pool.owner.host = [make_host('esx1', [self.ds1, self.ds2])]
+
+        with placement.place(self.vcenter, resource_pool) as (datastore, host):
+            during = placement.inflight('vcenter1', placement.DATASTORE, datastore.name)
+        after = placement.inflight('vcenter1', placement.DATASTORE, datastore.name)
+
+        self.assertEqual((during, after), (1, 0))
+
+    def test_inflight_since(self):
+        """``inflight`` can count only the deploys that started after a point in time"""
+        old = placement._reserve('vcenter1', placement.DATASTORE, 'ds1')
+        an_hour_ago = time.time() - 3600
+        os.utime(old, (an_hour_ago, an_hour_ago))
+        placement._reserve('vcenter1', placement.DATASTORE, 'ds1')
+
+        output = placement.inflight('vcenter1', placement.DATASTORE, 'ds1', since=time.time() - 60)
+
+        self.assertEqual(output, 1)
+
+    def test_state_per_server(self):
+        """The deploys on one vCenter server don't count against hardware with the same name on another"""
+        placement._reserve('vcenter1', placement.DATASTORE, 'ds1')
+
+        self.assertEqual(placement.inflight('vcenter2', placement.DATASTORE, 'ds1'), 0)
+
+    def test_place_asks_vcenter_unlocked(self):
+        """``place`` looks at the hardware in vCenter before taking the lock"""
+        resource_pool = MagicMock()
+        resource_pool.owner.host = [make_host('esx1', [self.ds1, self.ds2])]
+        asked = []
+        locked = []
+        real_candidates = placement._datastore_candidates
+
+        def candidates(vcenter):
+            asked.append(bool(locked))
+            return real_candidates(vcenter)
+
+        real_locked = placement._locked
+
+        @placement.contextmanager
+        def fake_locked(server):
+            locked.append(server)
+            with real_locked(server):
+                yield
+
+        with patch.object(placement, '_datastore_candidates', candidates):
+            with patch.object(placement, '_locked', fake_locked):
+                with placement.place(self.vcenter, resource_pool):
+                    pass
+
+        self.assertEqual(asked, [False])
+        self.assertEqual(locked, ['vcenter1'])
+
+    def test_record_latency(self):
+        """``record_latency`` keeps a moving average of deploy times"""
+        placement.record_latency('vcenter1', placement.HOST, 'esx1', 100)
+        placement.record_latency('vcenter1', placement.HOST, 'esx1', 200)
+
+        self.assertEqual(placement._latency('vcenter1', placement.HOST, 'esx1'), 130)
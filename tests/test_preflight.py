@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the preflight.py module
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import preflight
+
+
+class TestPreflight(unittest.TestCase):
+    """A set of test cases for preflight.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        preflight.clear()
+        preflight.lookup.clear()
+        self.state_dir = tempfile.mkdtemp()
+        self.image_file = '{}/Bind9.ova'.format(self.state_dir)
+        with open(self.image_file, 'wb') as the_file:
+            the_file.write(b'a' * 1024)
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        self.fake_const.VLAB_DNS_MIN_FREE_GB = 20
+        for module in (preflight, preflight.inventory, preflight.metrics, preflight.placement):
+            patcher = patch.object(module, 'const', self.fake_const)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        free_space = patch.object(preflight.placement, 'free_space', return_value={'ds1': 500 * preflight.GB})
+        self.fake_free_space = free_space.start()
+        self.addCleanup(free_space.stop)
+        self.network = MagicMock()
+        self.vcenter = MagicMock()
+        self.vcenter.networks = {'someLAN': self.network}
+        self.build_index = MagicMock()
+        self.build_index.return_value = {'names': {'dns1'}, 'ips': {'192.168.1.3': 'dns1'}}
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def check(self, machine_name='dns2', network='someLAN', static_ip='192.168.1.2'):
+        """Run the preflight checks with a valid create by default"""
+        return preflight.check(self.vcenter, 'alice', machine_name, self.image_file, network, static_ip, self.build_index)
+
+    def test_check(self):
+        """``check`` returns the network to connect the new VM to"""
+        self.assertTrue(self.check() is self.network)
+
+    def test_name_taken(self):
+        """``check`` rejects a name the user already has"""
+        with self.assertRaisesRegex(ValueError, 'A VM named dns1 already exists'):
+            self.check(machine_name='dns1')
+
+    def test_ip_taken(self):
+        """``check`` rejects a static IP another of the user's VMs has"""
+        with self.assertRaisesRegex(ValueError, 'Static IP 192.168.1.3 is already used by dns1'):
+            self.check(static_ip='192.168.1.3')
+
+    def test_no_network(self):
+        """``check`` rejects a network that doesn't exist"""
+        with self.assertRaisesRegex(ValueError, 'No such network named otherLAN'):
+            self.check(network='otherLAN')
+
+    def test_every_problem(self):
+        """``check`` reports every problem at once"""
+        with self.assertRaises(ValueError) as doh:
+            self.check(machine_name='dns1', network='otherLAN')
+
+        self.assertEqual(len(str(doh.exception).split('; ')), 2)
+
+    def test_no_image(self):
+        """``check`` rejects an image that doesn't exist"""
+        self.image_file = '{}/Nope.ova'.format(self.state_dir)
+
+        with self.assertRaisesRegex(ValueError, 'No such image Nope'):
+            self.check()
+
+    def test_no_room(self):
+        """``check`` rejects a create when no datastore has room for the image"""
+        self.fake_free_space.return_value = {'ds1': 20 * preflight.GB}
+
+        with self.assertRaisesRegex(ValueError, 'No datastore has 20.0 GB free'):
+            self.check()
+
+    def test_index_cached(self):
+        """``check`` reuses the index of the user's VMs"""
+        self.check()
+        self.check(machine_name='dns3')
+
+        self.assertEqual(self.build_index.call_count, 1)
+
+    def test_index_version(self):
+        """``check`` rebuilds the index when the user's inventory changes"""
+        self.check()
+        preflight.inventory.bump('alice')
+        self.check(machine_name='dns3')
+
+        self.assertEqual(self.build_index.call_count, 2)
+
+    def test_index_stale(self):
+        """``check`` doesn't reject a create because of a stale index"""
+        self.check()
+        # dns1 was deleted outside of this service
+        self.build_index.return_value = {'names': set(), 'ips': {}}
+
+        self.check(machine_name='dns1')
+
+        self.assertEqual(self.build_index.call_count, 2)
+
+    def test_capacity_cached(self):
+        """``check`` reuses how much space the datastores have free"""
+        self.check()
+        self.check(machine_name='dns3')
+
+        self.assertEqual(self.fake_free_space.call_count, 1)
+
+    @patch.object(preflight.placement, 'inflight')
+    @patch.object(preflight, 'image_size', return_value=5 * preflight.GB)
+    def test_capacity_inflight(self, fake_image_size, fake_inflight):
+        """``check`` counts the deploys placed since the space was checked against the cached space"""
+        self.fake_free_space.return_value = {'ds1': 35 * preflight.GB}
+        fake_inflight.return_value = 0
+        self.check()
+        fake_inflight.return_value = 3
+        self.fake_free_space.return_value = {'ds1': 24 * preflight.GB}
+
+        with self.assertRaisesRegex(ValueError, 'No datastore has 25.0 GB free'):
+            self.check(machine_name='dns3')
+        self.assertEqual(self.fake_free_space.call_count, 2)
+
+    @patch.object(preflight.placement, 'inflight', return_value=1)
+    @patch.object(preflight, 'image_size', return_value=5 * preflight.GB)
+    def test_capacity_inflight_since(self, fake_image_size, fake_inflight):
+        """``check`` only counts the deploys placed after the space was checked"""
+        self.check()
+
+        _, kwargs = fake_inflight.call_args
+        self.assertTrue(kwargs['since'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the profiling.py module
+"""
+import io
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import profiling
+
+
+class TestProfiled(unittest.TestCase):
+    """A set of test cases for the ``profiled`` function"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.profile_dir = tempfile.mkdtemp()
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_PROFILE = False
+        self.fake_const.VLAB_DNS_PROFILE_DIR = self.profile_dir
+        self.fake_const.VLAB_DNS_PROFILE_KEEP = 50
+        const_patcher = patch.object(profiling, 'const', self.fake_const)
+        install_patcher = patch.object(profiling, '_install')
+        const_patcher.start()
+        self.fake_install = install_patcher.start()
+        self.addCleanup(const_patcher.stop)
+        self.addCleanup(install_patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.profile_dir)
+
+    def test_off(self):
+        """``profiled`` measures nothing unless asked to"""
+        with profiling.profiled('dns.show', 'someId') as report:
+            pass
+
+        self.assertTrue(report is None)
+        self.assertFalse(self.fake_install.called)
+
+    def test_requested(self):
+        """``profiled`` saves the profile, and says where, when the client asks for one"""
+        with profiling.profiled('dns.show', 'someId', requested=True) as report:
+            sorted(range(1000))
+
+        self.assertEqual(report['path'], os.path.join(self.profile_dir, 'dns.show-someId.prof'))
+        self.assertTrue(os.path.isfile(report['path']))
+
+    def test_worker_setting(self):
+        """``profiled`` profiles every task when the worker is set to"""
+        self.fake_const.VLAB_DNS_PROFILE = True
+
+        with profiling.profiled('dns.show', 'someId') as report:
+            pass
+
+        self.assertTrue(report is not None)
+
+    def test_summary(self):
+        """``profiled`` summarizes the time, the vCenter calls and the most expensive functions"""
+        with profiling.profiled('dns.show', 'someId', requested=True) as report:
+            sorted(range(1000))
+
+        self.assertTrue(isinstance(report['wall-seconds'], float))
+        self.assertTrue(isinstance(report['cpu-seconds'], float))
+        self.assertEqual(report['soap']['calls'], 0)
+        self.assertTrue(report['top'])
+
+    def test_counts_soap(self):
+        """``profiled`` counts the SOAP calls the task makes"""
+        invoke = profiling._counting_invoke(MagicMock())
+        with profiling.profiled('dns.show', 'someId', requested=True) as report:
+            invoke(MagicMock(), MagicMock(), MagicMock(), [])
+
+        self.assertEqual(report['soap']['calls'], 1)
+
+    def test_error(self):
+        """``profiled`` still saves the profile when the task raises"""
+        with self.assertRaises(RuntimeError):
+            with profiling.profiled('dns.show', 'someId', requested=True) as report:
+                raise RuntimeError('testing')
+
+        self.assertTrue(os.path.isfile(report['path']))
+
+    def test_unwritable(self):
+        """``profiled`` doesn't fail the task when the profile can't be saved"""
+        self.fake_const.VLAB_DNS_PROFILE_DIR = os.path.join(self.profile_dir, 'file')
+        with open(self.fake_const.VLAB_DNS_PROFILE_DIR, 'w') as the_file:
+            the_file.write('not a directory')
+
+        with profiling.profiled('dns.show', 'someId', requested=True) as report:
+            pass
+
+        self.assertTrue(report['path'] is None)
+
+    def test_prune(self):
+        """``_prune`` keeps only the newest profiles"""
+        for number in range(3):
+            path = os.path.join(self.profile_dir, '{}.prof'.format(number))
+            with open(path, 'w') as the_file:
+                the_file.write('')
+            os.utime(path, (time.time() + number, time.time() + number))
+
+        profiling._prune(self.profile_dir, 2)
+
+        self.assertEqual(sorted(os.listdir(self.profile_dir)), ['1.prof', '2.prof'])
+
+
+class TestSoapHooks(unittest.TestCase):
+    """A set of test cases for counting the SOAP calls of a profiled task"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.soap = {'calls': 0, 'seconds': 0.0, 'sent-bytes': 0, 'received-bytes': 0, 'methods': {}}
+        profiling._ACTIVE.soap = self.soap
+
+    def tearDown(self):
+        """Runs after every test case"""
+        profiling._ACTIVE.soap = None
+
+    def test_invoke(self):
+        """The SOAP hooks count every call by the name of the method"""
+        invoke = profiling._counting_invoke(MagicMock())
+        info = MagicMock()
+        info.name = 'RetrieveContents'
+
+        invoke(MagicMock(), MagicMock(), info, [])
+        invoke(MagicMock(), MagicMock(), info, [])
+
+        self.assertEqual(self.soap['calls'], 2)
+        self.assertEqual(self.soap['methods']['RetrieveContents']['calls'], 2)
+
+    def test_invoke_not_profiled(self):
+        """The SOAP hooks count nothing for a task that isn't profiled"""
+        profiling._ACTIVE.soap = None
+        invoke = profiling._counting_invoke(MagicMock(return_value='someResult'))
+
+        output = invoke(MagicMock(), MagicMock(), MagicMock(), [])
+
+        self.assertEqual(output, 'someResult')
+        self.assertEqual(self.soap['calls'], 0)
+
+    def test_invoke_error(self):
+        """The SOAP hooks count the calls that fail"""
+        invoke = profiling._counting_invoke(MagicMock(side_effect=RuntimeError('testing')))
+
+        with self.assertRaises(RuntimeError):
+            invoke(MagicMock(), MagicMock(), MagicMock(), [])
+
+        self.assertEqual(self.soap['calls'], 1)
+
+    def test_serialize(self):
+        """The SOAP hooks count the bytes sent to vCenter"""
+        serialize = profiling._counting_serialize(MagicMock(return_value=b'<soap/>'))
+
+        serialize(MagicMock(), MagicMock(), MagicMock(), [])
+
+        self.assertEqual(self.soap['sent-bytes'], 7)
+
+    def test_deserialize(self):
+        """The SOAP hooks count the bytes read from vCenter"""
+        def fake_deserialize(self, response, result_type):
+            return response.read(4) + response.read()
+        deserialize = profiling._counting_deserialize(fake_deserialize)
+
+        output = deserialize(MagicMock(), io.BytesIO(b'<soap></soap>'), MagicMock())
+
+        self.assertEqual(output, b'<soap></soap>')
+        self.assertEqual(self.soap['received-bytes'], 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
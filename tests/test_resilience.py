@@ -0,0 +1,300 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the resilience.py module
+"""
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from pyVmomi import vim
+
+from vlab_dns_api.lib.worker import resilience
+
+
+class TestResilience(unittest.TestCase):
+    """A set of test cases for resilience.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        self.fake_const = MagicMock()
+        self.fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        self.fake_const.VLAB_DNS_RETRY_ATTEMPTS = 3
+        self.fake_const.VLAB_DNS_RETRY_BASE = 0.5
+        self.fake_const.VLAB_DNS_RETRY_CAP = 10
+        self.fake_const.VLAB_DNS_BREAKER_THRESHOLD = 2
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 30
+        for patcher in [patch.object(resilience, 'const', self.fake_const),
+                        patch.object(resilience.metrics, 'const', self.fake_const),
+                        patch.object(resilience.time, 'sleep')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_is_transient(self):
+        """``is_transient`` - a timeout might go away by trying again"""
+        self.assertTrue(resilience.is_transient(socket.timeout()))
+
+    def test_is_transient_fault(self):
+        """``is_transient`` - vCenter being busy might go away by trying again"""
+        self.assertTrue(resilience.is_transient(vim.fault.TaskInProgress()))
+
+    def test_is_transient_user_error(self):
+        """``is_transient`` - a ValueError never goes away by trying again"""
+        self.assertFalse(resilience.is_transient(ValueError('No such VM')))
+
+    def test_is_transient_permission(self):
+        """``is_transient`` - a lack of permission never goes away by trying again"""
+        self.assertFalse(resilience.is_transient(vim.fault.NoPermission()))
+
+    def test_backoff(self):
+        """``backoff`` never waits longer than the cap"""
+        waits = [resilience.backoff(20) for _ in range(100)]
+
+        self.assertTrue(max(waits) <= self.fake_const.VLAB_DNS_RETRY_CAP)
+
+    def test_backoff_grows(self):
+        """``backoff`` waits at most base * 2^attempt"""
+        waits = [resilience.backoff(1) for _ in range(100)]
+
+        self.assertTrue(max(waits) <= 1.0)
+
+    def test_call(self):
+        """``call`` returns what the function returns"""
+        output = resilience.call(lambda x: x + 1, 1)
+
+        self.assertEqual(output, 2)
+
+    def test_call_retries(self):
+        """``call`` retries transient errors"""
+        func = MagicMock()
+        func.side_effect = [ConnectionResetError(), 'woot']
+
+        output = resilience.call(func)
+
+        self.assertEqual(output, 'woot')
+        self.assertEqual(func.call_count, 2)
+
+    def test_call_gives_up(self):
+        """``call`` raises the error once every attempt has failed"""
+        self.fake_const.VLAB_DNS_BREAKER_THRESHOLD = 100
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+
+        with self.assertRaises(socket.timeout):
+            resilience.call(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_call_user_error(self):
+        """``call`` does not retry errors caused by the request"""
+        func = MagicMock()
+        func.side_effect = ValueError('No such VM')
+
+        with self.assertRaises(ValueError):
+            resilience.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_call_nested(self):
+        """``call`` does not retry nested calls, so attempts don't multiply"""
+        self.fake_const.VLAB_DNS_BREAKER_THRESHOLD = 100
+        inner = MagicMock()
+        inner.side_effect = socket.timeout()
+
+        with self.assertRaises(socket.timeout):
+            resilience.call(resilience.call, inner)
+        self.assertEqual(inner.call_count, 3)
+
+    def test_retrying(self):
+        """``retrying`` retries the decorated function"""
+        func = MagicMock()
+        func.side_effect = [socket.timeout(), 'woot']
+        func.__name__ = 'func'
+
+        output = resilience.retrying(func)()
+
+        self.assertEqual(output, 'woot')
+
+    def test_breaker_opens(self):
+        """``call`` opens the breaker once vCenter keeps failing, and stops retrying"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.OPEN)
+        self.assertEqual(func.call_count, 2)
+
+    def test_breaker_fast_fails(self):
+        """``call`` does not call vCenter while the breaker is open"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        func.reset_mock()
+
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        func.assert_not_called()
+
+    def test_breaker_half_open(self):
+        """``call`` lets a probe through once the cooldown has passed, and closes the breaker if it works"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 0
+        func.side_effect = None
+        func.return_value = 'woot'
+
+        output = resilience.call_on('vc1', func)
+
+        self.assertEqual(output, 'woot')
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.CLOSED)
+
+    def test_breaker_probe_fails(self):
+        """``call`` reopens the breaker when the probe fails"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 0
+        func.reset_mock()
+        opened_at = resilience.breaker_state('vc1')['opened_at']
+
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(func.call_count, 1)
+        self.assertTrue(resilience.breaker_state('vc1')['opened_at'] > opened_at)
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.OPEN)
+
+    def test_breaker_one_probe(self):
+        """``call`` only lets one probe through at a time"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 0
+        resilience._allow_call('vc1') # another worker is probing
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 30
+
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+
+    def test_breaker_metrics(self):
+        """Opening the breaker is recorded in the metrics"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+
+        output = resilience.metrics.snapshot()
+
+        self.assertEqual(output['gauges']['breaker.state.vc1'], resilience.OPEN)
+        self.assertEqual(output['counters']['breaker.opened'], 1)
+        self.assertEqual(output['counters']['vcenter.retries'], 1)
+
+    def test_breaker_per_vcenter(self):
+        """Every vCenter has its own breaker"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        func.side_effect = None
+        func.return_value = 'woot'
+
+        output = resilience.call_on('vc2', func)
+
+        self.assertEqual(output, 'woot')
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.OPEN)
+        self.assertEqual(resilience.breaker_state('vc2')['state'], resilience.CLOSED)
+
+    def test_breaker_nested(self):
+        """``call`` uses the breaker of the vCenter a nested ``call_on`` talks to"""
+        login = MagicMock()
+        login.side_effect = socket.timeout()
+        def task():
+            return resilience.call_on('vc1', login)
+
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call(task)
+        login.reset_mock()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call(task)
+
+        login.assert_not_called()
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.OPEN)
+
+    def test_breaker_unknown_vcenter(self):
+        """``call`` leaves the breakers alone when it never learns which vCenter it talks to"""
+        self.fake_const.VLAB_DNS_BREAKER_THRESHOLD = 1
+        func = MagicMock()
+        func.side_effect = [socket.timeout(), 'woot']
+
+        output = resilience.call(func)
+
+        self.assertEqual(output, 'woot')
+        self.assertFalse(os.path.exists(os.path.join(self.state_dir, 'breaker')))
+
+    def test_user_error_closes(self):
+        """A ValueError proves vCenter is answering, so the breaker doesn't count it"""
+        func = MagicMock()
+        func.side_effect = [socket.timeout(), ValueError('No such VM')]
+
+        with self.assertRaises(ValueError):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(resilience.breaker_state('vc1')['failures'], 0)
+
+    def test_fault_closes(self):
+        """A fault from vCenter, like NotFound, proves vCenter is answering"""
+        func = MagicMock()
+        func.side_effect = [socket.timeout(), vim.fault.NotFound()]
+
+        with self.assertRaises(vim.fault.NotFound):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(resilience.breaker_state('vc1')['failures'], 0)
+
+    def test_bug_unchanged(self):
+        """An error that isn't from vCenter doesn't change the breaker"""
+        func = MagicMock()
+        func.side_effect = [socket.timeout(), RuntimeError('bug')]
+
+        with self.assertRaises(RuntimeError):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(resilience.breaker_state('vc1')['failures'], 1)
+
+    def test_bug_keeps_probing(self):
+        """An error that isn't from vCenter doesn't close a half-open breaker"""
+        func = MagicMock()
+        func.side_effect = socket.timeout()
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call_on('vc1', func)
+        self.fake_const.VLAB_DNS_BREAKER_COOLDOWN = 0
+        func.side_effect = RuntimeError('bug')
+
+        with self.assertRaises(RuntimeError):
+            resilience.call_on('vc1', func)
+
+        self.assertEqual(resilience.breaker_state('vc1')['state'], resilience.HALF_OPEN)
+
+    def test_is_answer(self):
+        """``is_answer`` - a ValueError means vCenter answered"""
+        self.assertTrue(resilience.is_answer(ValueError('No such VM')))
+
+    def test_is_answer_transient(self):
+        """``is_answer`` - a transient fault doesn't mean vCenter answered"""
+        self.assertFalse(resilience.is_answer(vim.fault.TaskInProgress()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the result_store.py module
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from celery import Celery
+
+from vlab_dns_api.lib import result_store
+
+
+class TestBackend(unittest.TestCase):
+    """A set of test cases for the ``backend`` function"""
+
+    @patch.object(result_store, 'const')
+    def test_backend_sqlite(self, fake_const):
+        """``backend`` returns the path to SQLiteBackend when VLAB_DNS_RESULT_BACKEND is sqlite"""
+        fake_const.VLAB_DNS_RESULT_BACKEND = 'sqlite'
+
+        output = result_store.backend()
+        expected = 'vlab_dns_api.lib.result_store:SQLiteBackend'
+
+        self.assertEqual(output, expected)
+
+    @patch.object(result_store, 'const')
+    def test_backend_url(self, fake_const):
+        """``backend`` returns any other value as-is"""
+        fake_const.VLAB_DNS_RESULT_BACKEND = 'rpc://'
+
+        output = result_store.backend()
+        expected = 'rpc://'
+
+        self.assertEqual(output, expected)
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """A set of test cases for the SQLiteBackend object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        fake_const.VLAB_DNS_RESULT_BACKEND = 'sqlite'
+        fake_const.VLAB_DNS_RESULT_TTL = 60
+        fake_const.VLAB_DNS_RESULT_MAX = 3
+        patcher = patch.object(result_store, 'const', fake_const)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = Celery('test', backend=result_store.backend(), broker='memory://')
+        self.app.conf.result_expires = 60
+        self.backend = self.app.backend
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_celery(self):
+        """Celery loads SQLiteBackend by its path"""
+        self.assertTrue(isinstance(self.backend, result_store.SQLiteBackend))
+
+    def test_store_result(self):
+        """SQLiteBackend - a stored result can be read by another instance, like in another API process"""
+        self.backend.store_result('some-task-id', {'content': {}, 'error': None, 'params': {}}, 'SUCCESS')
+        other = Celery('test', backend=result_store.backend(), broker='memory://')
+
+        output = other.AsyncResult('some-task-id')
+
+        self.assertEqual(output.status, 'SUCCESS')
+        self.assertEqual(output.result, {'content': {}, 'error': None, 'params': {}})
+
+    def test_get_missing(self):
+        """SQLiteBackend - ``get`` returns None for an unknown key"""
+        self.assertTrue(self.backend.get(b'nope') is None)
+
+    def test_expired(self):
+        """SQLiteBackend - an expired result isn't returned"""
+        self.backend.set(b'key', 'value')
+        self.backend.expire(b'key', -1)
+
+        self.assertTrue(self.backend.get(b'key') is None)
+
+    def test_mget(self):
+        """SQLiteBackend - ``mget`` returns results in the order asked for"""
+        self.backend.set(b'a', '1')
+        self.backend.set(b'b', '2')
+
+        output = self.backend.mget([b'b', b'c', b'a'])
+        expected = ['2', None, '1']
+
+        self.assertEqual(output, expected)
+
+    def test_delete(self):
+        """SQLiteBackend - ``delete`` removes a result"""
+        self.backend.set(b'key', 'value')
+        self.backend.delete(b'key')
+
+        self.assertTrue(self.backend.get(b'key') is None)
+
+    def test_cleanup(self):
+        """SQLiteBackend - ``cleanup`` keeps only the newest VLAB_DNS_RESULT_MAX results"""
+        for key in (b'a', b'b', b'c', b'd'):
+            self.backend.set(key, 'value')
+        self.backend.expire(b'a', 10)
+
+        self.backend.cleanup()
+        output = self.backend.mget([b'a', b'b', b'c', b'd'])
+        expected = [None, 'value', 'value', 'value']
+
+        self.assertEqual(output, expected)
+
+    def test_set_prunes(self):
+        """SQLiteBackend - ``set`` prunes the database every so often"""
+        self.backend.PRUNE_EVERY = 1
+        for key in (b'a', b'b', b'c', b'd', b'e'):
+            self.backend.set(key, 'value')
+
+        with self.backend._connect() as conn:
+            output = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+        self.assertEqual(output, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the sessions.py module
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import sessions
+
+
+class TestSessions(unittest.TestCase):
+    """A set of test cases for sessions.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        sessions.clear()
+        self.login = MagicMock()
+
+    def tearDown(self):
+        """Runs after every test case"""
+        sessions.clear()
+
+    def test_get_shared(self):
+        """``get`` logs in once, and lends the same session to every task"""
+        with sessions.get('vc1', self.login) as first:
+            pass
+        with sessions.get('vc1', self.login) as second:
+            pass
+
+        self.assertTrue(first is second)
+        self.assertEqual(self.login.call_count, 1)
+
+    def test_get_no_logout(self):
+        """``get`` doesn't log out when the ``with`` block ends"""
+        with sessions.get('vc1', self.login):
+            pass
+
+        self.assertFalse(self.login.return_value.close.called)
+
+    def test_get_forgets_networks(self):
+        """``get`` doesn't lend a session that remembers the networks another task saw"""
+        with sessions.get('vc1', self.login) as vcenter:
+            vcenter._net_cache = {'someLAN': MagicMock()}
+        with sessions.get('vc1', self.login) as vcenter:
+            output = vcenter._net_cache
+
+        self.assertTrue(output is None)
+
+    def test_get_per_server(self):
+        """``get`` has a session for each vCenter"""
+        self.login.side_effect = [MagicMock(), MagicMock()]
+        with sessions.get('vc1', self.login) as first:
+            pass
+        with sessions.get('vc2', self.login) as second:
+            pass
+
+        self.assertFalse(first is second)
+
+    @patch.object(sessions.time, 'time')
+    def test_get_expired(self, fake_time):
+        """``get`` logs in again when a session that's due a check has expired"""
+        fake_time.return_value = 100
+        sessions.get('vc1', self.login)
+        self.login.return_value.content.sessionManager.currentSession = None
+        fake_time.return_value = 100 + sessions.const.VLAB_DNS_SESSION_CHECK
+
+        sessions.get('vc1', self.login)
+
+        self.assertEqual(self.login.call_count, 2)
+
+    @patch.object(sessions.time, 'time')
+    def test_get_checked(self, fake_time):
+        """``get`` keeps a session that's still logged in"""
+        fake_time.return_value = 100
+        sessions.get('vc1', self.login)
+        fake_time.return_value = 100 + sessions.const.VLAB_DNS_SESSION_CHECK
+
+        sessions.get('vc1', self.login)
+
+        self.assertEqual(self.login.call_count, 1)
+
+    def test_not_authenticated(self):
+        """A task that fails with NotAuthenticated throws the session away"""
+        with self.assertRaises(sessions.vim.fault.NotAuthenticated):
+            with sessions.get('vc1', self.login):
+                raise sessions.vim.fault.NotAuthenticated()
+
+        sessions.get('vc1', self.login)
+
+        self.assertEqual(self.login.call_count, 2)
+
+    def test_other_errors(self):
+        """A task that fails for another reason keeps the session"""
+        with self.assertRaises(ValueError):
+            with sessions.get('vc1', self.login):
+                raise ValueError('testing')
+
+        sessions.get('vc1', self.login)
+
+        self.assertEqual(self.login.call_count, 1)
+
+    def test_clear(self):
+        """``clear`` logs out of every session"""
+        sessions.get('vc1', self.login)
+
+        sessions.clear()
+
+        self.assertTrue(self.login.return_value.close.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the shards.py module
+"""
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import shards
+
+
+class TestShards(unittest.TestCase):
+    """A set of test cases for shards.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        const_patcher = patch.object(shards, 'const', fake_const)
+        endpoints_patcher = patch.object(shards, 'ENDPOINTS', shards.parse('vc1,vc2,vc3'))
+        const_patcher.start()
+        endpoints_patcher.start()
+        self.addCleanup(const_patcher.stop)
+        self.addCleanup(endpoints_patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_parse(self):
+        """``parse`` reads the servers and their weights, in order"""
+        output = shards.parse(' vc1.lab=2, vc2.lab ,')
+        expected = [('vc1.lab', 2.0), ('vc2.lab', 1.0)]
+
+        self.assertEqual(list(output.items()), expected)
+
+    def test_parse_bad_weight(self):
+        """``parse`` raises ValueError when a weight isn't more than zero"""
+        with self.assertRaises(ValueError):
+            shards.parse('vc1=0')
+
+    def test_parse_empty(self):
+        """``parse`` raises ValueError when no servers are defined"""
+        with self.assertRaises(ValueError):
+            shards.parse('')
+
+    def test_single(self):
+        """``for_user`` never searches, or records anything, when there's only one vCenter"""
+        find = MagicMock()
+        with patch.object(shards, 'ENDPOINTS', shards.parse('vc1')):
+            output = shards.for_user('bob', find)
+
+        self.assertEqual(output, 'vc1')
+        self.assertFalse(find.called)
+
+    def test_existing_user(self):
+        """``for_user`` finds which vCenter already has the user's VMs"""
+        output = shards.for_user('bob', lambda server: server == 'vc3')
+
+        self.assertEqual(output, 'vc3')
+
+    def test_pinned(self):
+        """``for_user`` only searches the first time a user is seen"""
+        shards.for_user('bob', lambda server: server == 'vc3')
+        find = MagicMock()
+
+        output = shards.for_user('bob', find)
+
+        self.assertEqual(output, 'vc3')
+        self.assertFalse(find.called)
+
+    def test_pinned_removed(self):
+        """``for_user`` places the user again when their vCenter is no longer defined"""
+        shards._pin('bob', 'vc9')
+
+        output = shards.for_user('bob')
+
+        self.assertEqual(output, shards.rendezvous('bob'))
+
+    def test_new_user(self):
+        """``for_user`` places a user found on no vCenter with ``rendezvous``"""
+        output = shards.for_user('bob', lambda server: False)
+
+        self.assertEqual(output, shards.rendezvous('bob'))
+
+    def test_search_failed(self):
+        """``for_user`` raises the error instead of placing a user when a vCenter can't be searched"""
+        def find(server):
+            if server == 'vc2':
+                raise RuntimeError('testing')
+            return False
+
+        with self.assertRaises(RuntimeError):
+            shards.for_user('bob', find)
+        self.assertIsNone(shards._read_pin('bob'))
+
+    def test_rendezvous_stable(self):
+        """``rendezvous`` only moves users to a newly added vCenter"""
+        users = ['user{}'.format(x) for x in range(300)]
+        before = {x: shards.rendezvous(x) for x in users}
+        more = shards.parse('vc1,vc2,vc3,vc4')
+
+        after = {x: shards.rendezvous(x, more) for x in users}
+        moved = {before[x] for x in users if before[x] != after[x]}
+        moved_to = {after[x] for x in users if before[x] != after[x]}
+
+        self.assertTrue(moved)
+        self.assertEqual(moved_to, {'vc4'})
+
+    def test_rendezvous_weighted(self):
+        """``rendezvous`` gives a vCenter new users in proportion to its weight"""
+        endpoints = shards.parse('vc1=3,vc2=1')
+
+        counts = Counter(shards.rendezvous('user{}'.format(x), endpoints) for x in range(2000))
+
+        self.assertAlmostEqual(counts['vc1'] / counts['vc2'], 3, delta=0.6)
+
+    def test_fan_out(self):
+        """``fan_out`` returns the results and errors of every vCenter"""
+        def func(server):
+            if server == 'vc2':
+                raise RuntimeError('testing')
+            return server.upper()
+
+        results, errors = shards.fan_out(func)
+
+        self.assertEqual(results, {'vc1': 'VC1', 'vc3': 'VC3'})
+        self.assertEqual(list(errors.keys()), ['vc2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the singleflight.py module
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+from unittest.mock import patch, MagicMock
+
+from vlab_dns_api.lib.worker import singleflight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """A set of test cases for singleflight.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.state_dir = tempfile.mkdtemp()
+        fake_const = MagicMock()
+        fake_const.VLAB_DNS_STATE_DIR = self.state_dir
+        for patcher in [patch.object(singleflight, 'const', fake_const),
+                        patch.object(singleflight.metrics, 'const', fake_const)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.state_dir)
+
+    def test_do(self):
+        """``do`` returns what the function returns"""
+        output = singleflight.do('key', lambda x: x + 1, 1)
+
+        self.assertEqual(output, 2)
+
+    def test_do_sequential(self):
+        """``do`` does not share a result with calls made after it finished"""
+        func = MagicMock()
+        func.return_value = {'some': 'data'}
+
+        singleflight.do('key', func)
+        singleflight.do('key', func)
+
+        self.assertEqual(func.call_count, 2)
+
+    def test_do_concurrent(self):
+        """``do`` shares one result between calls made at the same time"""
+        func = MagicMock()
+        func.return_value = {'some': 'data'}
+        leader_started = threading.Event()
+
+        def slow():
+            leader_started.set()
+            time.sleep(0.3)
+            return func()
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(singleflight.do('key', slow)))
+        leader.start()
+        leader_started.wait()
+        followers = [threading.Thread(target=lambda: results.append(singleflight.do('key', slow))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(results, [{'some': 'data'}] * 4)
+
+    def test_do_error(self):
+        """``do`` does not share errors"""
+        func = MagicMock()
+        func.side_effect = [RuntimeError('doh'), 'woot']
+
+        with self.assertRaises(RuntimeError):
+            singleflight.do('key', func)
+        output = singleflight.do('key', func)
+
+        self.assertEqual(output, 'woot')
+
+    def test_do_leader_fails(self):
+        """``do`` lets the waiting calls work at the same time when the leader fails"""
+        leader_started = threading.Event()
+        running = []
+        peak = []
+
+        def leader_func():
+            leader_started.set()
+            time.sleep(0.2)
+            raise RuntimeError('doh')
+
+        def follower_func():
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.1)
+            running.pop()
+            return 'woot'
+
+        results = []
+        leader = threading.Thread(target=lambda: self.assertRaises(RuntimeError, singleflight.do, 'key', leader_func))
+        leader.start()
+        leader_started.wait()
+        followers = [threading.Thread(target=lambda: results.append(singleflight.do('key', follower_func))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(results, ['woot'] * 3)
+        self.assertTrue(max(peak) > 1)
+
+    def test_do_tuple(self):
+        """``do`` shares a tuple as a tuple"""
+        leader_started = threading.Event()
+
+        def slow():
+            leader_started.set()
+            time.sleep(0.2)
+            return ([{'name': 'dnsBox'}], 1)
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(singleflight.do('key', slow)))
+        leader.start()
+        leader_started.wait()
+        results.append(singleflight.do('key', slow))
+        leader.join()
+
+        self.assertEqual(results, [([{'name': 'dnsBox'}], 1)] * 2)
+
+    def test_encode(self):
+        """``_encode`` and ``_decode`` keep the tuples within a result"""
+        value = {'a': (1, [2, (3,)]), 'b': [{'c': ()}]}
+
+        output = singleflight._decode(singleflight.ujson.loads(singleflight.ujson.dumps(singleflight._encode(value))))
+
+        self.assertEqual(output, value)
+
+    def test_sweep(self):
+        """Saved results are removed once they expire"""
+        singleflight._LAST_SWEEP = 0
+        singleflight.do('key', lambda: 'some user data')
+        result_file = singleflight._result_file('key')
+        self.assertTrue(os.path.exists(result_file))
+        expired = time.time() - singleflight.RESULT_TTL
+        os.utime(result_file, (expired, expired))
+        singleflight._LAST_SWEEP = 0
+
+        singleflight.do('other-key', lambda: 'more data')
+
+        self.assertFalse(os.path.exists(result_file))
+        self.assertTrue(os.path.exists('{}.lock'.format(result_file)))
+
+    def test_do_unserializable(self):
+        """``do`` still returns a result that cannot be shared"""
+        thing = object()
+
+        output = singleflight.do('key', lambda: thing)
+
+        self.assertTrue(output is thing)
+
+    def test_shared(self):
+        """``shared`` keys calls by their arguments"""
+        func = MagicMock()
+        func.__name__ = 'func'
+        func.__module__ = 'tests'
+        func.side_effect = lambda x: x
+
+        wrapped = singleflight.shared(func)
+
+        self.assertEqual(wrapped(1), 1)
+        self.assertEqual(wrapped(2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
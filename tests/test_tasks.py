@@ -10,18 +10,35 @@ from vlab_dns_api.lib.worker import tasks
 
 class TestTasks(unittest.TestCase):
     """A set of test cases for tasks.py"""
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_show_ok(self, fake_vmware):
+    def test_show_ok(self, fake_vmware, fake_inventory):
         """``show`` returns a dictionary when everything works as expected"""
         fake_vmware.show_dns.return_value = {'worked': True}
+        fake_inventory.etag.return_value = None
 
         output = tasks.show(username='bob', txn_id='myId')
         expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_show_value_error(self, fake_vmware):
+    def test_show_etag(self, fake_vmware, fake_inventory):
+        """``show`` returns the ETag of the listing, made from the inventory version before listing"""
+        fake_vmware.show_dns.return_value = {'worked': True}
+        fake_inventory.version.return_value = 'v1'
+        fake_inventory.etag.return_value = 'abc123'
+
+        output = tasks.show(username='bob', txn_id='myId')
+        the_args, _ = fake_inventory.etag.call_args
+
+        self.assertEqual(output['params']['etag'], 'abc123')
+        self.assertEqual(the_args, ('bob', 'v1', {'fields': None, 'page': None, 'per_page': None}))
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_show_value_error(self, fake_vmware, fake_inventory):
         """``show`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.show_dns.side_effect = [ValueError("testing")]
 
@@ -30,8 +47,58 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_show_page(self, fake_vmware, fake_inventory):
+        """``show`` returns the paging details in the params"""
+        fake_vmware.show_dns_page.return_value = ({'worked': True}, 30)
+        fake_inventory.etag.return_value = None
+
+        output = tasks.show(username='bob', txn_id='myId', fields=['state'], page=2, per_page=10)
+        expected = {'content' : {'worked': True},
+                    'error': None,
+                    'params': {'fields': ['state'], 'page': 2, 'per-page': 10, 'total': 30}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks.profiling, 'profiled')
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_show_profile(self, fake_vmware, fake_inventory, fake_profiled):
+        """``show`` puts the summary of the profile in the params"""
+        fake_vmware.show_dns.return_value = {'worked': True}
+        fake_profiled.return_value.__enter__.return_value = {'wall-seconds': 1.0, 'soap': {'calls': 3}, 'path': '/tmp/a.prof'}
+
+        output = tasks.show(username='bob', txn_id='myId', profile=True)
+        expected = {'wall-seconds': 1.0, 'soap': {'calls': 3}, 'path': '/tmp/a.prof'}
+
+        self.assertEqual(output['params']['profile'], expected)
+        self.assertTrue(fake_profiled.call_args[0][2])
+
+    @patch.object(tasks.profiling, 'profiled')
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_create_ok(self, fake_vmware):
+    def test_create_profile(self, fake_vmware, fake_inventory, fake_profiled):
+        """``create`` puts the summary of the profile in the params"""
+        fake_vmware.create_dns.return_value = {'worked': True}
+        fake_profiled.return_value.__enter__.return_value = {'wall-seconds': 1.0, 'soap': {'calls': 3}, 'path': '/tmp/a.prof'}
+
+        output = tasks.create(username='bob',
+                              machine_name='dnsBox',
+                              image='0.0.1',
+                              network='someLAN',
+                              static_ip='192.168.1.2',
+                              default_gateway='192.168.1.1',
+                              netmask='255.255.255.0',
+                              dns=['192.168.1.1'],
+                              txn_id='myId',
+                              profile=True)
+
+        self.assertEqual(output['params']['profile']['path'], '/tmp/a.prof')
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_create_ok(self, fake_vmware, fake_inventory):
         """``create`` returns a dictionary when everything works as expected"""
         fake_vmware.create_dns.return_value = {'worked': True}
 
@@ -48,8 +115,58 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_create_cancelled(self, fake_vmware, fake_inventory):
+        """``create`` reports the work a cancel avoided"""
+        fake_vmware.create_dns.side_effect = [tasks.cancel.Cancelled('deploying', {'percent': 10})]
+        fake_vmware.work_avoided.return_value = {'phases': ['deploying']}
+
+        output = tasks.create(username='bob',
+                              machine_name='dnsBox',
+                              image='0.0.1',
+                              network='someLAN',
+                              static_ip='192.168.1.2',
+                              default_gateway='192.168.1.1',
+                              netmask='255.255.255.0',
+                              dns=['192.168.1.1'],
+                              txn_id='myId')
+        expected = {'content' : {'cancelled': 'deploying', 'avoided': {'phases': ['deploying']}},
+                    'error': 'Task cancelled before deploying',
+                    'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'cancel')
+    def test_progress_reporter_cancelled(self, fake_cancel):
+        """``_progress_reporter`` checks if the task was cancelled before each phase"""
+        fake_cancel.check.side_effect = RuntimeError('cancelled')
+        fake_task = MagicMock()
+
+        with self.assertRaises(RuntimeError):
+            tasks._progress_reporter(fake_task)('deploying')
+        self.assertFalse(fake_task.update_state.called)
+
+    @patch.object(tasks, 'cancel')
+    def test_dns_cancel(self, fake_cancel):
+        """``dns_cancel`` records the cancel for the process running the task"""
+        tasks.dns_cancel(MagicMock(), task_id='asdf')
+
+        fake_cancel.request.assert_called_with('asdf')
+
+    def test_progress_reporter(self):
+        """``_progress_reporter`` publishes each phase as the state of the task"""
+        fake_task = MagicMock()
+
+        tasks._progress_reporter(fake_task)('deploying', percent=50)
+        the_kwargs = fake_task.update_state.call_args[1]
+        expected = {'state': 'PROGRESS', 'meta': {'phase': 'deploying', 'percent': 50}}
+
+        self.assertEqual(the_kwargs, expected)
+
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_create_value_error(self, fake_vmware):
+    def test_create_value_error(self, fake_vmware, fake_inventory):
         """``create`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.create_dns.side_effect = [ValueError("testing")]
 
@@ -66,8 +183,111 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_create_bumps_inventory(self, fake_vmware, fake_inventory):
+        """``create`` records that the user's inventory changed, even when the create fails"""
+        fake_vmware.create_dns.side_effect = [RuntimeError("testing")]
+
+        with self.assertRaises(RuntimeError):
+            tasks.create(username='bob',
+                         machine_name='dnsBox',
+                         image='0.0.1',
+                         network='someLAN',
+                         static_ip='192.168.1.2',
+                         default_gateway='192.168.1.1',
+                         netmask='255.255.255.0',
+                         dns=['192.168.1.1'],
+                         txn_id='myId')
+
+        fake_inventory.bump.assert_called_with('bob')
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_delete_bumps_inventory(self, fake_vmware, fake_inventory):
+        """``delete`` records that the user's inventory changed"""
+        tasks.delete(username='bob', machine_name='dnsBox', txn_id='myId')
+
+        fake_inventory.bump.assert_called_with('bob')
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_delete_async(self, fake_vmware, fake_inventory):
+        """``delete`` only marks the VM for deletion when async_delete is True"""
+        tasks.delete(username='bob', machine_name='dnsBox', txn_id='myId', async_delete=True)
+
+        self.assertTrue(fake_vmware.mark_dns_deleted.called)
+        self.assertFalse(fake_vmware.delete_dns.called)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_reset(self, fake_vmware, fake_inventory):
+        """``reset`` returns a dictionary when everything works as expected"""
+        fake_vmware.reset_dns.return_value = {'worked': True}
+
+        output = tasks.reset(username='bob', machine_name='dnsBox', txn_id='myId')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_reset_value_error(self, fake_vmware, fake_inventory):
+        """``reset`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.reset_dns.side_effect = [ValueError("testing")]
+
+        output = tasks.reset(username='bob', machine_name='dnsBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_modify_network(self, fake_vmware, fake_inventory):
+        """``modify_network`` returns a dictionary when everything works as expected"""
+        output = tasks.modify_network(username='bob', machine_name='dnsBox', new_network='bob_lab2', txn_id='myId')
+        expected = {'content' : {}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        fake_inventory.bump.assert_called_with('bob')
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_modify_network_value_error(self, fake_vmware, fake_inventory):
+        """``modify_network`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.update_network.side_effect = [ValueError("testing")]
+
+        output = tasks.modify_network(username='bob', machine_name='dnsBox', new_network='bob_lab2', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_modify_network_batch(self, fake_vmware, fake_inventory):
+        """``modify_network_batch`` sets the error when some of the VMs were not updated"""
+        fake_vmware.update_network_batch.return_value = {'updated': ['dns1'], 'failed': {'dns2': 'testing'}}
+
+        output = tasks.modify_network_batch(username='bob', changes={'dns1': 'bob_lab2', 'dns2': 'bob_lab2'}, txn_id='myId')
+        expected = {'content' : {'updated': ['dns1'], 'failed': {'dns2': 'testing'}},
+                    'error': 'Unable to change the network of: dns2',
+                    'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reap(self, fake_vmware):
+        """``reap`` returns what the reaper destroyed"""
+        fake_vmware.reap_dns.return_value = {'destroyed': ['bob-dnsBox-vm-1'], 'failed': {}}
+
+        output = tasks.reap()
+        expected = {'content' : {'destroyed': ['bob-dnsBox-vm-1'], 'failed': {}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_delete_ok(self, fake_vmware):
+    def test_delete_ok(self, fake_vmware, fake_inventory):
         """``delete`` returns a dictionary when everything works as expected"""
         fake_vmware.delete_dns.return_value = {'worked': True}
 
@@ -76,8 +296,9 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'inventory')
     @patch.object(tasks, 'vmware')
-    def test_delete_value_error(self, fake_vmware):
+    def test_delete_value_error(self, fake_vmware, fake_inventory):
         """``delete`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.delete_dns.side_effect = [ValueError("testing")]
 
@@ -97,5 +318,88 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
 
+    @patch.object(tasks.shards, 'ENDPOINTS', {'vc1': 1.0})
+    @patch.object(tasks, 'resilience')
+    @patch.object(tasks, 'metrics')
+    def test_worker_metrics(self, fake_metrics, fake_resilience):
+        """``worker_metrics`` returns the metrics and the state of the circuit breaker of every vCenter"""
+        fake_metrics.snapshot.return_value = {'counters': {}, 'gauges': {}}
+        fake_resilience.breaker_state.return_value = {'state': 'closed'}
+
+        output = tasks.worker_metrics(txn_id='myId')
+        expected = {'content' : {'counters': {}, 'gauges': {}, 'breaker': {'vc1': {'state': 'closed'}}},
+                    'error': None,
+                    'params' : {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_import_zone(self, fake_vmware, fake_inventory):
+        """``import_zone`` returns a dictionary when everything works as expected"""
+        fake_vmware.import_zone.return_value = {'zone': 'vlab.local', 'serial': 2020051700}
+
+        output = tasks.import_zone(username='bob',
+                                   machine_name='dnsBox',
+                                   zone='vlab.local',
+                                   records=[],
+                                   zone_file=None,
+                                   txn_id='myId')
+        expected = {'content' : {'zone': 'vlab.local', 'serial': 2020051700}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_import_zone_value_error(self, fake_vmware, fake_inventory):
+        """``import_zone`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.import_zone.side_effect = [ValueError("testing")]
+
+        output = tasks.import_zone(username='bob',
+                                   machine_name='dnsBox',
+                                   zone='vlab.local',
+                                   records=[],
+                                   zone_file=None,
+                                   txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_import_zone_bumps_inventory(self, fake_vmware, fake_inventory):
+        """``import_zone`` records that the user's inventory changed, even when the import fails"""
+        fake_vmware.import_zone.side_effect = [ValueError("testing")]
+
+        tasks.import_zone(username='bob',
+                          machine_name='dnsBox',
+                          zone='vlab.local',
+                          records=[],
+                          zone_file=None,
+                          txn_id='myId')
+
+        fake_inventory.bump.assert_called_with('bob')
+
+    @patch.object(tasks, 'vmware')
+    def test_export_zone(self, fake_vmware):
+        """``export_zone`` returns a dictionary when everything works as expected"""
+        fake_vmware.export_zone.return_value = {'zone': 'vlab.local', 'serial': 4, 'records': []}
+
+        output = tasks.export_zone(username='bob', machine_name='dnsBox', zone='vlab.local', txn_id='myId')
+        expected = {'content' : {'zone': 'vlab.local', 'serial': 4, 'records': []}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_export_zone_value_error(self, fake_vmware):
+        """``export_zone`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.export_zone.side_effect = [ValueError("testing")]
+
+        output = tasks.export_zone(username='bob', machine_name='dnsBox', zone='vlab.local', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+
 if __name__ == '__main__':
     unittest.main()
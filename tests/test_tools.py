@@ -0,0 +1,215 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the tools.py module
+"""
+import time
+import unittest
+from unittest.mock import patch, MagicMock, PropertyMock
+
+from pyVmomi import vim, vmodl
+
+from vlab_dns_api.lib.worker import tools
+
+
+class FakeCollector(object):
+    """Stands in for a property collector; reports every VM ready once ``expected`` are followed"""
+    def __init__(self, expected=1, error=None):
+        self.expected = expected
+        self.error = error
+        self.followed = []
+        self.sent = False
+        self.destroyed = False
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.followed.append(spec.objectSet[0].obj._moId)
+        return MagicMock()
+
+    def WaitForUpdatesEx(self, version, options):
+        if self.error is not None:
+            raise self.error
+        if not self.sent and len(self.followed) >= self.expected:
+            self.sent = True
+            return make_update(self.followed)
+        time.sleep(0.01)
+        return None
+
+    def DestroyPropertyCollector(self):
+        self.destroyed = True
+
+
+def make_update(moids):
+    """Build the changes vCenter sends when guest operations become possible"""
+    object_sets = []
+    for moid in moids:
+        change = MagicMock(op='assign', val=True)
+        change.name = 'guest.guestOperationsReady'
+        object_sets.append(MagicMock(obj=vim.VirtualMachine(moid), changeSet=[change]))
+    return MagicMock(version='1', filterSet=[MagicMock(objectSet=object_sets)])
+
+
+class TestTools(unittest.TestCase):
+    """A set of test cases for tools.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        tools._WATCHERS.clear()
+        patcher = patch.object(tools, 'metrics')
+        self.fake_metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        # The session of the task waiting on the VM
+        self.vcenter = MagicMock()
+        self.vcenter._conn._stub.host = 'vcenter1'
+        # The session the watcher logs into
+        self.watcher_vcenter = MagicMock()
+        login_patcher = patch.object(tools, '_login', return_value=self.watcher_vcenter)
+        self.fake_login = login_patcher.start()
+        self.addCleanup(login_patcher.stop)
+        linger_patcher = patch.object(tools, 'LINGER', 0)
+        linger_patcher.start()
+        self.addCleanup(linger_patcher.stop)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        for watcher in list(tools._WATCHERS.values()):
+            watcher.pending.clear()
+            watcher.thread.join(5)
+        tools._WATCHERS.clear()
+
+    def _use(self, collector):
+        self.watcher_vcenter.content.propertyCollector.CreatePropertyCollector.return_value = collector
+
+    def test_wait_until_ready(self):
+        """``wait_until_ready`` returns True once vCenter says guest operations are possible"""
+        self._use(FakeCollector())
+
+        output = tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+        self.assertTrue(output)
+
+    def test_wait_until_ready_observed(self):
+        """``wait_until_ready`` records how long VMware Tools took in a histogram"""
+        self._use(FakeCollector())
+
+        tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+        name, _ = self.fake_metrics.observe.call_args[0]
+
+        self.assertEqual(name, 'tools.seconds')
+
+    def test_wait_until_ready_timeout(self):
+        """``wait_until_ready`` returns False if VMware Tools isn't ready in time"""
+        self._use(FakeCollector(expected=2))
+
+        output = tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 0)
+
+        self.assertFalse(output)
+        self.fake_metrics.incr.assert_called_with('tools.timeouts')
+
+    def test_watcher_retires(self):
+        """The watcher stops, destroys its collector and logs out, once no VM is waiting"""
+        collector = FakeCollector()
+        self._use(collector)
+
+        tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+        for watcher in list(tools._WATCHERS.values()):
+            watcher.thread.join(5)
+
+        self.assertEqual(tools._WATCHERS, {})
+        self.assertTrue(collector.destroyed)
+        self.assertTrue(self.watcher_vcenter.close.called)
+
+    def test_watcher_lingers(self):
+        """The watcher is kept for a while after the last VM stops waiting on it"""
+        self._use(FakeCollector())
+
+        with patch.object(tools, 'LINGER', 60):
+            tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+            self.assertEqual(list(tools._WATCHERS.keys()), ['vcenter1'])
+
+    def test_watcher_shared(self):
+        """VMs waiting on the same vCenter server share one property collector, even from separate sessions"""
+        self._use(FakeCollector(expected=2))
+        results = []
+        sessions = []
+        for _ in range(2):
+            session = MagicMock()
+            session._conn._stub.host = 'vcenter1'
+            sessions.append(session)
+        waiters = [tools.threading.Thread(target=lambda session, moid: results.append(
+                   tools.wait_until_ready(session, vim.VirtualMachine(moid), 5)), args=x)
+                   for x in zip(sessions, ('vm-1', 'vm-2'))]
+        for waiter in waiters:
+            waiter.start()
+        for waiter in waiters:
+            waiter.join()
+
+        self.assertEqual(results, [True, True])
+        self.assertEqual(self.watcher_vcenter.content.propertyCollector.CreatePropertyCollector.call_count, 1)
+
+    def test_watcher_own_session(self):
+        """The watcher logs into a session of its own, so it outlives the session of the task"""
+        self._use(FakeCollector())
+
+        tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+        self.fake_login.assert_called_with('vcenter1')
+        self.assertFalse(self.vcenter.content.propertyCollector.CreatePropertyCollector.called)
+
+    @patch.object(tools, '_poll', return_value=True)
+    def test_no_collector(self, fake_poll):
+        """``wait_until_ready`` polls when a property collector can't be made"""
+        self.watcher_vcenter.content.propertyCollector.CreatePropertyCollector.side_effect = vmodl.fault.NotSupported()
+
+        output = tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+        self.assertTrue(output)
+        self.assertTrue(fake_poll.called)
+        self.assertTrue(self.watcher_vcenter.close.called)
+        self.fake_metrics.incr.assert_called_with('tools.polled')
+
+    @patch.object(tools, '_poll', return_value=True)
+    def test_no_login(self, fake_poll):
+        """``wait_until_ready`` polls when the watcher can't log in"""
+        self.fake_login.side_effect = OSError('testing')
+
+        output = tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+        self.assertTrue(output)
+        self.assertTrue(fake_poll.called)
+
+    @patch.object(tools, '_poll', return_value=True)
+    def test_watcher_error(self, fake_poll):
+        """``wait_until_ready`` polls when the watcher fails"""
+        self._use(FakeCollector(error=vim.fault.NotAuthenticated()))
+
+        output = tools.wait_until_ready(self.vcenter, vim.VirtualMachine('vm-1'), 5)
+
+        self.assertTrue(output)
+        self.assertTrue(fake_poll.called)
+
+    @patch.object(tools.random, 'uniform', side_effect=lambda low, high: high)
+    @patch.object(tools.time, 'sleep')
+    def test_poll_backoff(self, fake_sleep, fake_uniform):
+        """``_poll`` waits longer between every check, up to MAX_POLL"""
+        fake_vm = MagicMock()
+        type(fake_vm.guest).guestOperationsReady = PropertyMock(side_effect=[False] * 5 + [True])
+
+        output = tools._poll(fake_vm, time.time() + 600)
+        pauses = [x[0][0] for x in fake_sleep.call_args_list]
+
+        self.assertTrue(output)
+        self.assertEqual(pauses, [1, 2, 4, 8, 8])
+
+    @patch.object(tools.time, 'sleep')
+    def test_poll_timeout(self, fake_sleep):
+        """``_poll`` returns False if VMware Tools isn't ready in time"""
+        fake_vm = MagicMock()
+        fake_vm.guest.guestOperationsReady = False
+
+        output = tools._poll(fake_vm, time.time() - 1)
+
+        self.assertFalse(output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the validation module
+"""
+import ipaddress
+import unittest
+
+from vlab_dns_api.lib import validation
+from vlab_dns_api.lib.views.dns import DnsView
+
+
+class TestCompiled(unittest.TestCase):
+    """A set of test cases for the ``compiled`` function"""
+
+    def test_cached(self):
+        """``compiled`` only compiles a schema once"""
+        first = validation.compiled(DnsView.POST_SCHEMA)
+        second = validation.compiled(DnsView.POST_SCHEMA)
+
+        self.assertTrue(first is second)
+
+    def test_check_ok(self):
+        """``check`` returns an empty string for valid input"""
+        body = {'name': 'dns1', 'image': '1.0', 'network': 'lab', 'static-ip': '192.168.1.2'}
+
+        self.assertEqual(validation.check(body, DnsView.POST_SCHEMA), '')
+
+    def test_check_dns_items(self):
+        """``check`` rejects DNS servers that aren't IPv4 addresses"""
+        body = {'name': 'dns1', 'image': '1.0', 'network': 'lab', 'static-ip': '192.168.1.2', 'dns': ['8.8.8']}
+
+        error = validation.check(body, DnsView.POST_SCHEMA)
+
+        self.assertTrue(error.startswith('Input does not match schema'))
+
+    def test_check_dns_types(self):
+        """``check`` rejects DNS servers that aren't strings"""
+        body = {'name': 'dns1', 'image': '1.0', 'network': 'lab', 'static-ip': '192.168.1.2', 'dns': [8]}
+
+        error = validation.check(body, DnsView.POST_SCHEMA)
+
+        self.assertTrue(error.startswith('Input does not match schema'))
+
+
+class TestNetworkConfig(unittest.TestCase):
+    """A set of test cases for the ``network_config`` function"""
+
+    def test_ok(self):
+        """``network_config`` returns the parsed addresses of a valid config"""
+        config, error = validation.network_config('192.168.1.2', '192.168.1.1', '255.255.255.0')
+
+        self.assertEqual(error, '')
+        self.assertEqual(config['static-ip'], ipaddress.IPv4Address('192.168.1.2'))
+        self.assertEqual(config['network'], ipaddress.IPv4Network('192.168.1.0/24'))
+
+    def test_outside_network(self):
+        """``network_config`` rejects a static IP outside the network of the gateway"""
+        config, error = validation.network_config('10.1.1.2', '192.168.1.1', '255.255.255.0')
+
+        expected = 'Static IP 10.1.1.2 is not part of network 192.168.1.0/24. Adjust your netmask and/or default gateway.'
+
+        self.assertTrue(config is None)
+        self.assertEqual(error, expected)
+
+    def test_bad_gateway(self):
+        """``network_config`` rejects a gateway that isn't an IPv4 address"""
+        _, error = validation.network_config('192.168.1.2', '192.168.1', '255.255.255.0')
+
+        self.assertEqual(error, 'Default gateway 192.168.1 not part of subnet 255.255.255.0')
+
+    def test_bad_netmask(self):
+        """``network_config`` rejects a netmask that isn't contiguous"""
+        _, error = validation.network_config('192.168.1.2', '192.168.1.1', '255.0.255.0')
+
+        self.assertEqual(error, 'Default gateway 192.168.1.1 not part of subnet 255.0.255.0')
+
+    def test_bad_ip(self):
+        """``network_config`` rejects a static IP that isn't an IPv4 address"""
+        _, error = validation.network_config('192.168.1.300', '192.168.1.1', '255.255.255.0')
+
+        self.assertEqual(error, 'Static IP 192.168.1.300 is not a valid IPv4 address')
+
+    def test_big_network(self):
+        """``network_config`` doesn't enumerate the addresses of a big network"""
+        config, error = validation.network_config('10.200.1.2', '10.0.0.1', '255.0.0.0')
+
+        self.assertEqual(error, '')
+        self.assertEqual(str(config['netmask']), '255.0.0.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,15 +2,61 @@
 """
 A suite of tests for the functions in vmware.py
 """
+import time
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
 from vlab_dns_api.lib.worker import vmware
 
 
+class FakeOva(object):
+    """Stands in for an Ova; like the real one, ``deploy_progress`` is a property"""
+    def __init__(self, progress=0):
+        self._prog = progress
+
+    @property
+    def deploy_progress(self):
+        return self._prog
+
+    @property
+    def ovf(self):
+        return '<Envelope/>'
+
+    def deploy(self, deploy_spec, lease, host):
+        """Uploading fails once the lease is aborted"""
+        self.wait_for_abort(lease)
+        raise RuntimeError('upload failed because the lease was aborted')
+
+    def wait_for_abort(self, lease, timeout=2):
+        """Block like an upload does, until the lease is aborted"""
+        give_up = time.time() + timeout
+        while not lease.Abort.called:
+            if time.time() > give_up:
+                raise AssertionError('The lease was never aborted')
+            time.sleep(0.01)
+
+
 class TestVMware(unittest.TestCase):
     """A set of test cases for the vmware.py module"""
 
+    def setUp(self):
+        """Runs before every test case"""
+        vmware.lookup.clear()
+        vmware.preflight.clear()
+        # The preflight checks have their own tests
+        user_index = patch.object(vmware, '_user_index', return_value={'names': set(), 'ips': {}})
+        room_for = patch.object(vmware.preflight, '_room_for', return_value=[])
+        # So does waiting on VMware Tools
+        tools_ready = patch.object(vmware.tools, 'wait_until_ready', return_value=True)
+        self.fake_user_index = user_index.start()
+        room_for.start()
+        self.fake_tools_ready = tools_ready.start()
+        self.addCleanup(user_index.stop)
+        self.addCleanup(room_for.stop)
+        self.addCleanup(tools_ready.stop)
+
     @patch.object(vmware.virtual_machine, 'get_info')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
@@ -35,6 +81,75 @@ class TestVMware(unittest.TestCase):
                                                              'generation': 1}}}
         self.assertEqual(output, expected)
 
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_show_dns_page(self, fake_vCenter, fake_retrieve_properties, fake_get_info):
+        """``show_dns_page`` only returns the requested fields of the requested page"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        rows = []
+        for name in ('dns3', 'dns1', 'dns2'):
+            fake_vm = MagicMock()
+            fake_vm._moId = 'vm-{}'.format(name)
+            rows.append((fake_vm, {'name': name, 'config.annotation': meta, 'runtime.powerState': 'poweredOn'}))
+        rows.append((MagicMock(), {'name': 'other', 'config.annotation': None}))
+        fake_retrieve_properties.return_value = rows
+
+        output, total = vmware.show_dns_page(username='alice', fields=['state', 'moid'], page=2, per_page=2)
+        expected = {'dns3': {'state': 'poweredOn', 'moid': 'vm-dns3'}}
+
+        self.assertEqual(output, expected)
+        self.assertEqual(total, 3)
+        self.assertFalse(fake_get_info.called)
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_show_dns_page_fetches(self, fake_vCenter, fake_retrieve_properties, fake_get_info):
+        """``show_dns_page`` only asks vCenter for the properties it needs"""
+        fake_retrieve_properties.return_value = []
+
+        vmware.show_dns_page(username='alice', fields=['meta'])
+        the_paths = fake_retrieve_properties.call_args[0][2]
+        expected = ['name', 'config.annotation']
+
+        self.assertEqual(the_paths, expected)
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_show_dns_page_console(self, fake_vCenter, fake_retrieve_properties, fake_get_info):
+        """``show_dns_page`` only looks up the console of VMs on the page"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        fake_retrieve_properties.return_value = [(MagicMock(), {'name': 'dns1', 'config.annotation': meta}),
+                                                 (MagicMock(), {'name': 'dns2', 'config.annotation': meta})]
+        fake_get_info.return_value = {'console': 'https://foo', 'state': 'poweredOn'}
+
+        output, _ = vmware.show_dns_page(username='alice', fields=['console'], page=1, per_page=1)
+        expected = {'dns1': {'console': 'https://foo'}}
+
+        self.assertEqual(output, expected)
+        self.assertEqual(fake_get_info.call_count, 1)
+
+    @patch.object(vmware, 'vmodl')
+    def test_retrieve_properties(self, fake_vmodl):
+        """``_retrieve_properties`` yields the VM and a dictionary of its properties"""
+        fake_vcenter = MagicMock()
+        fake_vm = MagicMock()
+        fake_prop = MagicMock()
+        fake_prop.name = 'name'
+        fake_prop.val = 'dns1'
+        fake_result = MagicMock()
+        fake_result.obj = fake_vm
+        fake_result.propSet = [fake_prop]
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [fake_result]
+
+        output = list(vmware._retrieve_properties(fake_vcenter, MagicMock(), ['name']))
+        expected = [(fake_vm, {'name': 'dns1'})]
+
+        self.assertEqual(output, expected)
+        self.assertTrue(fake_vcenter.content.viewManager.CreateContainerView.return_value.Destroy.called)
+
     @patch.object(vmware.virtual_machine, 'get_info')
     @patch.object(vmware.virtual_machine, 'power')
     @patch.object(vmware, 'consume_task')
@@ -79,17 +194,294 @@ class TestVMware(unittest.TestCase):
         with self.assertRaises(ValueError):
             vmware.delete_dns(username='bob', machine_name='myOtherDnsBox', logger=fake_logger)
 
+    @patch.object(vmware, '_take_snapshot')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_snapshot(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config, fake_take_snapshot):
+        """``create_dns`` snapshots the VM once BIND is configured"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_dns(username='alice',
+                          machine_name='DnsBox',
+                          image='1.0.0',
+                          network='someLAN',
+                          static_ip='192.168.1.2',
+                          default_gateway='192.168.1.1',
+                          netmask='255.255.255.0',
+                          dns=['192.168.1.1'],
+                          logger=MagicMock())
+
+        fake_take_snapshot.assert_called_with(fake_vm, unittest.mock.ANY)
+
+    @patch.object(vmware, 'consume_task')
+    def test_take_snapshot(self, fake_consume_task):
+        """``_take_snapshot`` includes the memory, so a reset doesn't have to boot the VM"""
+        fake_vm = MagicMock()
+
+        vmware._take_snapshot(fake_vm, MagicMock())
+        the_kwargs = fake_vm.CreateSnapshot_Task.call_args[1]
+
+        self.assertEqual(the_kwargs['name'], vmware.SNAPSHOT_NAME)
+        self.assertTrue(the_kwargs['memory'])
+
+    @patch.object(vmware, 'consume_task')
+    def test_take_snapshot_error(self, fake_consume_task):
+        """``_take_snapshot`` does not fail the create when the snapshot fails"""
+        fake_consume_task.side_effect = RuntimeError('testing')
+        fake_logger = MagicMock()
+
+        vmware._take_snapshot(MagicMock(), fake_logger)
+
+        self.assertTrue(fake_logger.error.called)
+
+    def test_find_snapshot(self):
+        """``_find_snapshot`` searches the whole snapshot tree"""
+        child = MagicMock(childSnapshotList=[])
+        child.name = vmware.SNAPSHOT_NAME
+        root = MagicMock(childSnapshotList=[child])
+        root.name = 'other'
+        fake_vm = MagicMock()
+        fake_vm.snapshot.rootSnapshotList = [root]
+
+        self.assertTrue(vmware._find_snapshot(fake_vm, vmware.SNAPSHOT_NAME) is child.snapshot)
+
+    def test_find_snapshot_none(self):
+        """``_find_snapshot`` returns None when the VM has no snapshots"""
+        fake_vm = MagicMock()
+        fake_vm.snapshot = None
+
+        self.assertTrue(vmware._find_snapshot(fake_vm, vmware.SNAPSHOT_NAME) is None)
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, '_find_snapshot')
+    @patch.object(vmware, '_find_dns')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_reset_dns(self, fake_vCenter, fake_consume_task, fake_find_dns, fake_find_snapshot, fake_power, fake_get_info):
+        """``reset_dns`` reverts to the snapshot and makes sure the VM is on"""
+        fake_find_dns.return_value.name = 'DnsBox'
+        fake_get_info.return_value = {'worked': True}
+
+        output = vmware.reset_dns(username='bob', machine_name='DnsBox', logger=MagicMock())
+        expected = {'DnsBox': {'worked': True}}
+
+        self.assertEqual(output, expected)
+        self.assertTrue(fake_find_snapshot.return_value.RevertToSnapshot_Task.called)
+        fake_power.assert_called_with(fake_find_dns.return_value, state='on')
+
+    @patch.object(vmware, '_find_snapshot')
+    @patch.object(vmware, '_find_dns')
+    @patch.object(vmware, 'vCenter')
+    def test_reset_dns_no_snapshot(self, fake_vCenter, fake_find_dns, fake_find_snapshot):
+        """``reset_dns`` raises ValueError when there's no snapshot to revert to"""
+        fake_find_snapshot.return_value = None
+
+        with self.assertRaises(ValueError):
+            vmware.reset_dns(username='bob', machine_name='DnsBox', logger=MagicMock())
+
+    @patch.object(vmware, '_trash_folder')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_mark_dns_deleted(self, fake_vCenter, fake_consume_task, fake_trash_folder):
+        """``mark_dns_deleted`` renames the VM, flags it and moves it to the trash"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'DnsBox'
+        fake_vm._moId = 'vm-1'
+        fake_vm.config.annotation = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        fake_vm.runtime.powerState = 'poweredOn'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+
+        vmware.mark_dns_deleted(username='bob', machine_name='DnsBox', logger=MagicMock())
+        spec = fake_vm.ReconfigVM_Task.call_args[0][0]
+        meta = vmware.ujson.loads(spec.annotation)
+
+        self.assertEqual(spec.name, 'bob-DnsBox-vm-1')
+        self.assertEqual(meta['owner'], 'bob')
+        self.assertTrue('deleting' in meta)
+        fake_trash_folder.return_value.MoveIntoFolder_Task.assert_called_with([fake_vm])
+        self.assertTrue(fake_vm.PowerOffVM_Task.called)
+
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_mark_dns_deleted_not_found(self, fake_vCenter, fake_consume_task):
+        """``mark_dns_deleted`` raises ValueError when the user has no such Dns"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'DnsBox'
+        fake_vm.config.annotation = '{"component": "OneFS", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+
+        with self.assertRaises(ValueError):
+            vmware.mark_dns_deleted(username='bob', machine_name='DnsBox', logger=MagicMock())
+
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware, '_destroy')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_reap_dns(self, fake_vCenter, fake_retrieve_properties, fake_destroy, fake_sleep):
+        """``reap_dns`` destroys the VMs pending deletion, oldest first and in batches"""
+        rows = []
+        for idx in range(3):
+            meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1, "deleting": %s}' % (10 - idx)
+            rows.append((MagicMock(), {'name': 'dns{}'.format(idx), 'config.annotation': meta}))
+        rows.append((MagicMock(), {'name': 'notDeleted', 'config.annotation': None}))
+        fake_retrieve_properties.return_value = rows
+        fake_destroy.return_value.info.state = vmware.vim.TaskInfo.State.success
+
+        output = vmware.reap_dns(logger=MagicMock(), batch_size=2, concurrency=1)
+        expected = {'destroyed': ['dns2', 'dns1'], 'failed': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware, '_destroy')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_reap_dns_concurrency(self, fake_vCenter, fake_retrieve_properties, fake_destroy, fake_sleep):
+        """``reap_dns`` never has more than ``concurrency`` VMs being destroyed at once"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1, "deleting": 1}'
+        fake_retrieve_properties.return_value = [(MagicMock(), {'name': 'dns{}'.format(x), 'config.annotation': meta}) for x in range(5)]
+        in_flight = []
+        peak = []
+
+        class FakeTask(object):
+            """Finishes the second time its state is checked"""
+            def __init__(self):
+                self.checks = 0
+                in_flight.append(self)
+                peak.append(len(in_flight))
+
+            @property
+            def info(self):
+                self.checks += 1
+                if self.checks < 2:
+                    return MagicMock(state='running')
+                in_flight.remove(self)
+                return MagicMock(state='success')
+
+        fake_destroy.side_effect = lambda the_vm: FakeTask()
+
+        output = vmware.reap_dns(logger=MagicMock(), batch_size=10, concurrency=2)
+
+        self.assertEqual(len(output['destroyed']), 5)
+        self.assertEqual(max(peak), 2)
+
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware, '_destroy')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_reap_dns_failure(self, fake_vCenter, fake_retrieve_properties, fake_destroy, fake_sleep):
+        """``reap_dns`` reports the VMs it failed to destroy"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1, "deleting": 1}'
+        fake_retrieve_properties.return_value = [(MagicMock(), {'name': 'dns1', 'config.annotation': meta})]
+        fake_destroy.return_value.info.state = vmware.vim.TaskInfo.State.error
+        fake_destroy.return_value.info.error.msg = 'testing'
+
+        output = vmware.reap_dns(logger=MagicMock())
+        expected = {'destroyed': [], 'failed': {'dns1': 'testing'}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware, '_reap_shard')
+    def test_reap_dns_shards(self, fake_reap_shard):
+        """``reap_dns`` reaps every vCenter, and reports the ones it couldn't reach"""
+        def reap_shard(server, batch_size, concurrency):
+            if server == 'vc2':
+                raise RuntimeError('testing')
+            return {'destroyed': ['{}-dns'.format(server)], 'failed': {}}
+        fake_reap_shard.side_effect = reap_shard
+        logger = MagicMock()
+
+        with patch.object(vmware.shards, 'ENDPOINTS', vmware.shards.parse('vc1,vc2,vc3')):
+            output = vmware.reap_dns(logger=logger)
+        expected = {'destroyed': ['vc1-dns', 'vc3-dns'], 'failed': {}}
+
+        self.assertEqual(output, expected)
+        self.assertTrue(logger.error.called)
+
+    @patch.object(vmware, '_reap_shard')
+    def test_reap_dns_unreachable(self, fake_reap_shard):
+        """``reap_dns`` raises the error when no vCenter could be reaped"""
+        fake_reap_shard.side_effect = RuntimeError('testing')
+
+        with self.assertRaises(RuntimeError):
+            vmware.reap_dns(logger=MagicMock())
+
+    @patch.object(vmware.shards, 'for_user')
+    @patch.object(vmware, 'vCenter')
+    def test_connect_shard(self, fake_vCenter, fake_for_user):
+        """``_connect`` logs into the vCenter that holds the user's VMs"""
+        fake_for_user.return_value = 'vc2'
+
+        vmware._connect('bob')
+
+        self.assertEqual(fake_vCenter.call_args[1]['host'], 'vc2')
+
+    @patch.object(vmware.sessions, 'get')
+    @patch.object(vmware, 'vCenter')
+    def test_connect_shared(self, fake_vCenter, fake_get):
+        """``_connect_to`` shares sessions when ``VLAB_DNS_SHARE_SESSIONS`` is set"""
+        with patch.object(vmware, 'const', vmware.const._replace(VLAB_DNS_SHARE_SESSIONS=True)):
+            output = vmware._connect_to('vc1')
+
+        self.assertTrue(output is fake_get.return_value)
+        self.assertFalse(fake_vCenter.called)
+
+    @patch.object(vmware, 'vCenter')
+    def test_has_folder(self, fake_vCenter):
+        """``_has_folder`` returns False when the vCenter has no folder for the user"""
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.side_effect = ValueError('testing')
+
+        self.assertFalse(vmware._has_folder('bob', 'vc1'))
+
+    @patch.object(vmware, 'vCenter')
+    def test_reap_dns_no_trash(self, fake_vCenter):
+        """``reap_dns`` does nothing when the trash folder does not exist"""
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.side_effect = ValueError('testing')
+
+        output = vmware.reap_dns(logger=MagicMock())
+        expected = {'destroyed': [], 'failed': {}}
+
+        self.assertEqual(output, expected)
+
+    def test_trash_folder_create(self):
+        """``_trash_folder`` creates the trash folder when it does not exist"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.side_effect = ValueError('testing')
+        fake_user_folder = MagicMock()
+
+        output = vmware._trash_folder(fake_vcenter, fake_user_folder)
+
+        self.assertTrue(output is fake_user_folder.parent.CreateFolder.return_value)
+
+    @patch.object(vmware, '_finish_bind_config')
     @patch.object(vmware.virtual_machine, 'config_static_ip')
     @patch.object(vmware.virtual_machine, 'set_meta')
     @patch.object(vmware, 'Ova')
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, '_deploy')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
-    def test_create_dns(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip):
+    def test_create_dns(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config):
         """``create_dns`` returns a dictionary upon success"""
         fake_logger = MagicMock()
-        fake_deploy_from_ova.return_value.name = 'myDns'
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
         fake_get_info.return_value = {'worked': True}
         fake_Ova.return_value.networks = ['someLAN']
         fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
@@ -104,21 +496,192 @@ class TestVMware(unittest.TestCase):
                                        netmask='255.255.255.0',
                                        dns=['192.168.1.1'],
                                        logger=fake_logger)
-        expected = {'myDns': {'worked': True}}
+        expected = {'myDns': {'worked': True, 'ips': ['192.168.1.2']}}
 
         self.assertEqual(output, expected)
+        self.assertEqual(fake_Ova.return_value.close.call_count, 1)
+
+    @patch.object(vmware, '_report_timings')
+    @patch.object(vmware, '_take_snapshot')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_no_ip_wait(self, fake_vCenter, fake_deploy, fake_get_info, fake_Ova, fake_config_static_ip, fake_finish_bind_config, fake_take_snapshot, fake_report_timings):
+        """``create_dns`` doesn't wait on VMware Tools to report the IP it just configured"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_get_info.return_value = {'ips': []}
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        output = vmware.create_dns(username='alice',
+                                   machine_name='DnsBox',
+                                   image='1.0.0',
+                                   network='someLAN',
+                                   static_ip='192.168.1.2',
+                                   default_gateway='192.168.1.1',
+                                   netmask='255.255.255.0',
+                                   dns=['192.168.1.1'],
+                                   logger=MagicMock())
+        stages = fake_report_timings.call_args[0][0]
+
+        self.assertEqual(output['myDns']['ips'], ['192.168.1.2'])
+        self.assertFalse(fake_get_info.call_args[1].get('ensure_ip', False))
+        self.assertEqual(set(stages), {'open-image', 'login', 'preflight', 'deploy', 'waiting-for-tools',
+                                       'configuring-ip', 'configuring-bind', 'get-info', 'snapshotting'})
 
+    @patch.object(vmware, '_take_snapshot')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_stale_ip(self, fake_vCenter, fake_deploy, fake_get_info, fake_Ova, fake_config_static_ip, fake_finish_bind_config, fake_take_snapshot):
+        """``create_dns`` reports the static IP, not the address the VM booted with"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_get_info.return_value = {'ips': ['169.254.1.1']}
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        output = vmware.create_dns(username='alice',
+                                   machine_name='DnsBox',
+                                   image='1.0.0',
+                                   network='someLAN',
+                                   static_ip='192.168.1.2',
+                                   default_gateway='192.168.1.1',
+                                   netmask='255.255.255.0',
+                                   dns=['192.168.1.1'],
+                                   logger=MagicMock())
+
+        self.assertEqual(output['myDns']['ips'], ['192.168.1.2'])
+
+    @patch.object(vmware, '_take_snapshot')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_tools_timeout(self, fake_vCenter, fake_deploy, fake_get_info, fake_Ova, fake_config_static_ip, fake_finish_bind_config, fake_take_snapshot):
+        """``create_dns`` logs when VMware Tools isn't ready in time"""
+        self.fake_tools_ready.return_value = False
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_get_info.return_value = {'ips': []}
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+        fake_logger = MagicMock()
+
+        vmware.create_dns(username='alice',
+                          machine_name='DnsBox',
+                          image='1.0.0',
+                          network='someLAN',
+                          static_ip='192.168.1.2',
+                          default_gateway='192.168.1.1',
+                          netmask='255.255.255.0',
+                          dns=['192.168.1.1'],
+                          logger=fake_logger)
+
+        self.assertTrue(fake_logger.warning.called)
+
+    @patch.object(vmware.metrics, 'gauge')
+    def test_report_timings(self, fake_gauge):
+        """``_report_timings`` records how long the stages took, and how much of that overlapped"""
+        vmware._report_timings({'open-image': 2.0, 'login': 3.0}, 3.5, MagicMock())
+
+        expected = {'open-image': 2.0, 'login': 3.0, 'total': 3.5, 'overlapped': 1.5}
+
+        fake_gauge.assert_called_with('create.seconds', expected)
+
+    @patch.object(vmware, '_destroy')
+    @patch.object(vmware, '_finish_bind_config')
     @patch.object(vmware.virtual_machine, 'config_static_ip')
     @patch.object(vmware.virtual_machine, 'set_meta')
     @patch.object(vmware, 'Ova')
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, '_deploy')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
-    def test_create_dns_static_ip(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip):
+    def test_create_dns_cancelled(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config, fake_destroy):
+        """``create_dns`` destroys the new VM when the create is cancelled"""
+        fake_vm = MagicMock()
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+        fake_progress = MagicMock()
+        fake_progress.side_effect = [None, vmware.cancel.Cancelled('configuring-ip')]
+
+        with self.assertRaises(vmware.cancel.Cancelled):
+            vmware.create_dns(username='alice',
+                              machine_name='DnsBox',
+                              image='1.0.0',
+                              network='someLAN',
+                              static_ip='192.168.1.2',
+                              default_gateway='192.168.1.1',
+                              netmask='255.255.255.0',
+                              dns=['192.168.1.1'],
+                              logger=MagicMock(),
+                              progress=fake_progress)
+
+        fake_destroy.assert_called_with(fake_vm)
+        self.assertFalse(fake_config_static_ip.called)
+
+    @patch.object(vmware, '_take_snapshot')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_progress(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config, fake_take_snapshot):
+        """``create_dns`` reports each phase of the create"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+        fake_progress = MagicMock()
+
+        vmware.create_dns(username='alice',
+                          machine_name='DnsBox',
+                          image='1.0.0',
+                          network='someLAN',
+                          static_ip='192.168.1.2',
+                          default_gateway='192.168.1.1',
+                          netmask='255.255.255.0',
+                          dns=['192.168.1.1'],
+                          logger=MagicMock(),
+                          progress=fake_progress)
+        phases = [x[0][0] for x in fake_progress.call_args_list]
+        expected = ['preflight', 'waiting-for-tools', 'configuring-ip', 'configuring-bind', 'snapshotting']
+
+        self.assertEqual(phases, expected)
+        self.assertTrue(fake_deploy.call_args[0][-1] is fake_progress)
+
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_static_ip(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config):
         """``create_dns`` Sets a static IP"""
         fake_logger = MagicMock()
-        fake_deploy_from_ova.return_value.name = 'myDns'
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
         fake_get_info.return_value = {'worked': True}
         fake_Ova.return_value.networks = ['someLAN']
         fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
@@ -136,12 +699,336 @@ class TestVMware(unittest.TestCase):
 
         self.assertTrue(fake_config_static_ip.called)
 
+    @patch.object(vmware, '_configure_windows')
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_windows(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_config_static_ip, fake_finish_bind_config, fake_configure_windows):
+        """``create_dns`` configures a Windows image with one script, and skips the BIND config"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_get_info.return_value = {'worked': True}
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_dns(username='alice',
+                          machine_name='DnsBox',
+                          image='windows2019',
+                          network='someLAN',
+                          static_ip='192.168.1.2',
+                          default_gateway='192.168.1.1',
+                          netmask='255.255.255.0',
+                          dns=['192.168.1.1'],
+                          logger=MagicMock())
+
+        self.assertTrue(fake_configure_windows.called)
+        self.assertFalse(fake_config_static_ip.called)
+        self.assertFalse(fake_finish_bind_config.called)
+
+    @patch.object(vmware.metrics, 'gauge')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware, '_upload_file')
+    def test_configure_windows(self, fake_upload_file, fake_run_command, fake_download_file, fake_gauge):
+        """``_configure_windows`` runs one script, and reports how long each step took"""
+        fake_run_command.return_value.exitCode = 0
+        fake_download_file.return_value = '{"nic": {"ok": true, "seconds": 1.5}, "dns-client": {"ok": true, "seconds": 0.2}, "dns-server": {"ok": true, "seconds": 4}}'
+
+        vmware._configure_windows(MagicMock(), MagicMock(), '192.168.1.2', '192.168.1.1', '255.255.255.0',
+                                  ['192.168.1.1'], MagicMock())
+        reported = fake_gauge.call_args[0][1]
+
+        self.assertEqual(fake_run_command.call_count, 1)
+        self.assertEqual(fake_upload_file.call_args[0][3], vmware.windows.SCRIPT_PATH)
+        self.assertEqual(reported['dns-server'], 4)
+        self.assertIn('run', reported)
+
+    @patch.object(vmware.metrics, 'gauge')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware, '_upload_file')
+    def test_configure_windows_failed_step(self, fake_upload_file, fake_run_command, fake_download_file, fake_gauge):
+        """``_configure_windows`` raises ValueError with the error of the step that failed"""
+        fake_run_command.return_value.exitCode = 1
+        fake_download_file.return_value = '{"nic": {"ok": false, "seconds": 1, "error": "no adapter"}, "dns-client": {"ok": true, "seconds": 0.2}, "dns-server": {"ok": true, "seconds": 4}}'
+
+        with self.assertRaises(ValueError) as the_error:
+            vmware._configure_windows(MagicMock(), MagicMock(), '192.168.1.2', '192.168.1.1', '255.255.255.0',
+                                      ['192.168.1.1'], MagicMock())
+
+        self.assertIn('nic: no adapter', '{}'.format(the_error.exception))
+
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware, '_upload_file')
+    def test_configure_windows_no_report(self, fake_upload_file, fake_run_command, fake_download_file):
+        """``_configure_windows`` raises ValueError when the script didn't report back"""
+        fake_run_command.return_value.exitCode = 1
+        fake_download_file.side_effect = vmware.vim.fault.FileNotFound(msg='testing')
+
+        with self.assertRaises(ValueError):
+            vmware._configure_windows(MagicMock(), MagicMock(), '192.168.1.2', '192.168.1.1', '255.255.255.0',
+                                      ['192.168.1.1'], MagicMock())
+
+    @patch.object(vmware, '_finish_bind_config')
+    @patch.object(vmware.virtual_machine, 'config_static_ip')
+    @patch.object(vmware.virtual_machine, 'set_meta')
     @patch.object(vmware, 'Ova')
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, '_deploy')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
-    def test_create_dns_invalid_network(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_Ova):
+    def test_create_dns_placement(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova, fake_set_meta, fake_config_static_ip, fake_finish_bind_config):
+        """``create_dns`` creates the VM with its meta data, instead of reconfiguring it after"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_deploy.return_value = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+        fake_Ova.return_value.networks = ['someLAN']
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_dns(username='alice',
+                          machine_name='DnsBox',
+                          image='1.0.0',
+                          network='someLAN',
+                          static_ip='192.168.1.2',
+                          default_gateway='192.168.1.1',
+                          netmask='255.255.255.0',
+                          dns=['192.168.1.1'],
+                          logger=fake_logger)
+        meta = fake_deploy.call_args[1]['meta_data']
+
+        self.assertEqual(meta['component'], 'Dns')
+        self.assertFalse(fake_set_meta.called)
+
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, '_import')
+    @patch.object(vmware, 'placement')
+    def test_deploy(self, fake_placement, fake_import, fake_power):
+        """``_deploy`` uploads the OVA to the datastore and host picked by the placement engine"""
+        fake_datastore = MagicMock()
+        fake_datastore.name = 'ds1'
+        fake_host = MagicMock()
+        fake_host.name = 'esx1'
+        fake_placement.place.return_value.__enter__.return_value = (fake_datastore, fake_host)
+        fake_vm = MagicMock()
+        fake_import.return_value.info.entity = fake_vm
+        fake_vcenter = MagicMock()
+        fake_vcenter.ovf_manager.CreateImportSpec.return_value.error = []
+        fake_ova = MagicMock()
+
+        output = vmware._deploy(fake_vcenter, fake_ova, [], 'alice', 'DnsBox', MagicMock())
+        expected = (fake_vm, {'datastore': 'ds1', 'host': 'esx1'})
+
+        self.assertEqual(output, expected)
+        self.assertEqual(fake_vcenter.ovf_manager.CreateImportSpec.call_args[1]['datastore'], fake_datastore)
+        self.assertEqual(fake_import.call_args[0][3], fake_host)
+        self.assertEqual(fake_ova.deploy.call_args[0][2], 'esx1')
+        self.assertEqual(fake_placement.record_latency.call_count, 2)
+
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, '_import')
+    @patch.object(vmware, 'placement')
+    def test_deploy_spec_error(self, fake_placement, fake_import, fake_power):
+        """``_deploy`` raises ValueError when vCenter can't make an import spec for the OVA"""
+        fake_placement.place.return_value.__enter__.return_value = (MagicMock(), MagicMock())
+        fake_vcenter = MagicMock()
+        fake_vcenter.ovf_manager.CreateImportSpec.return_value.error = [MagicMock(msg='bad OVA')]
+
+        with self.assertRaises(ValueError):
+            vmware._deploy(fake_vcenter, MagicMock(), [], 'alice', 'DnsBox', MagicMock())
+
+        self.assertFalse(fake_import.called)
+
+    @patch.object(vmware.time, 'sleep')
+    def test_import(self, fake_sleep):
+        """``_import`` waits until the lease of the import is ready"""
+        fake_lease = MagicMock()
+        fake_lease.error = None
+        fake_lease.state = 'initializing'
+        fake_pool = MagicMock()
+        fake_pool.ImportVApp.return_value = fake_lease
+
+        def ready(seconds):
+            fake_lease.state = 'ready'
+        fake_sleep.side_effect = ready
+
+        output = vmware._import(fake_pool, MagicMock(), MagicMock(), MagicMock())
+
+        self.assertTrue(output is fake_lease)
+
+    @patch.object(vmware.time, 'sleep')
+    def test_import_error(self, fake_sleep):
+        """``_import`` raises ValueError when the import fails"""
+        fake_pool = MagicMock()
+        fake_pool.ImportVApp.return_value.error.msg = 'doh'
+
+        with self.assertRaises(ValueError):
+            vmware._import(fake_pool, MagicMock(), MagicMock(), MagicMock())
+
+    @patch.object(vmware.time, 'sleep')
+    def test_import_timeout(self, fake_sleep):
+        """``_import`` aborts an import that never becomes ready"""
+        fake_lease = MagicMock()
+        fake_lease.error = None
+        fake_lease.state = 'initializing'
+        fake_pool = MagicMock()
+        fake_pool.ImportVApp.return_value = fake_lease
+
+        with self.assertRaises(ValueError):
+            vmware._import(fake_pool, MagicMock(), MagicMock(), MagicMock(), timeout=3)
+
+        self.assertTrue(fake_lease.Abort.called)
+
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, '_import')
+    @patch.object(vmware, 'placement')
+    def test_deploy_meta(self, fake_placement, fake_import, fake_power):
+        """``_deploy`` records where the VM was deployed in the meta data of the import"""
+        fake_datastore = MagicMock()
+        fake_datastore.name = 'ds1'
+        fake_host = MagicMock()
+        fake_host.name = 'esx1'
+        fake_placement.place.return_value.__enter__.return_value = (fake_datastore, fake_host)
+        fake_vcenter = MagicMock()
+        spec = fake_vcenter.ovf_manager.CreateImportSpec.return_value
+        spec.error = []
+
+        vmware._deploy(fake_vcenter, MagicMock(), [], 'alice', 'DnsBox', MagicMock(), meta_data={'component': 'Dns'})
+        meta = vmware.ujson.loads(spec.importSpec.configSpec.annotation)
+
+        self.assertEqual(meta, {'component': 'Dns', 'placement': {'datastore': 'ds1', 'host': 'esx1'}})
+
+    @patch.object(vmware, 'DEPLOY_PROGRESS_INTERVAL', 0.01)
+    def test_deploy_progress(self):
+        """``_deploy_progress`` reports which disk is uploading while the OVA is deployed"""
+        fake_ova = FakeOva(progress=75)
+        disk1 = MagicMock()
+        disk1.size = 100
+        disk2 = MagicMock()
+        disk2.size = 100
+        fake_progress = MagicMock()
+
+        with vmware._deploy_progress(fake_ova, MagicMock(), [disk1, disk2], fake_progress):
+            time.sleep(0.1)
+        first_call = fake_progress.call_args_list[0]
+        last_call = fake_progress.call_args_list[-1]
+
+        self.assertEqual(first_call[1], {'disk': 1, 'disks': 2, 'percent': 0})
+        self.assertEqual(last_call[1], {'disk': 2, 'disks': 2, 'percent': 75})
+
+    @patch.object(vmware, 'DEPLOY_PROGRESS_INTERVAL', 0.01)
+    def test_deploy_progress_cancel(self):
+        """``_deploy_progress`` aborts the import when the create is cancelled during the upload"""
+        fake_ova = FakeOva(progress=40)
+        fake_lease = MagicMock()
+        # Made up front; a mock's attributes made by two threads at once can differ
+        fake_lease.Abort.return_value = None
+        fake_progress = MagicMock()
+        fake_progress.side_effect = [None, vmware.cancel.Cancelled('deploying', {'percent': 40})]
+
+        with self.assertRaises(vmware.cancel.Cancelled):
+            with vmware._deploy_progress(fake_ova, fake_lease, [], fake_progress):
+                fake_ova.wait_for_abort(fake_lease)
+                raise RuntimeError('upload failed because the lease was aborted')
+
+        self.assertTrue(fake_lease.Abort.called)
+
+    @patch.object(vmware, 'DEPLOY_PROGRESS_INTERVAL', 0.01)
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, '_import')
+    @patch.object(vmware, 'placement')
+    def test_deploy_cancel_during_upload(self, fake_placement, fake_import, fake_power):
+        """``_deploy`` aborts the lease when the create is cancelled while the OVA is uploading"""
+        fake_host = MagicMock()
+        fake_host.name = 'esx1'
+        fake_placement.place.return_value.__enter__.return_value = (MagicMock(), fake_host)
+        fake_vcenter = MagicMock()
+        fake_vcenter.ovf_manager.CreateImportSpec.return_value.error = []
+        fake_vcenter.ovf_manager.CreateImportSpec.return_value.fileItem = []
+        fake_lease = fake_import.return_value
+        # Made up front; a mock's attributes made by two threads at once can differ
+        fake_lease.Abort.return_value = None
+        fake_progress = MagicMock()
+        fake_progress.side_effect = [None, vmware.cancel.Cancelled('deploying', {'percent': 40})]
+
+        with self.assertRaises(vmware.cancel.Cancelled):
+            vmware._deploy(fake_vcenter, FakeOva(progress=40), [], 'alice', 'DnsBox', MagicMock(), fake_progress)
+
+        self.assertTrue(fake_lease.Abort.called)
+        self.assertEqual(fake_progress.call_args[1]['percent'], 40)
+        self.assertFalse(fake_power.called)
+
+    def test_deploy_progress_cancel_early(self):
+        """``_deploy_progress`` doesn't start the upload of a create that was already cancelled"""
+        fake_lease = MagicMock()
+        fake_progress = MagicMock()
+        fake_progress.side_effect = vmware.cancel.Cancelled('deploying')
+        uploaded = []
+
+        with self.assertRaises(vmware.cancel.Cancelled):
+            with vmware._deploy_progress(MagicMock(), fake_lease, [], fake_progress):
+                uploaded.append(True)
+
+        self.assertEqual(uploaded, [])
+        self.assertTrue(fake_lease.Abort.called)
+
+    def test_work_avoided(self):
+        """``work_avoided`` describes what a create cancelled during the upload didn't do"""
+        output = vmware.work_avoided('deploying', {'disk': 2, 'disks': 3, 'percent': 40})
+        expected = {'phases': list(vmware.CREATE_PHASES[1:]), 'upload-percent': 60, 'disks': 2}
+
+        self.assertEqual(output, expected)
+
+    def test_work_avoided_later(self):
+        """``work_avoided`` lists the phases a cancelled create skipped"""
+        output = vmware.work_avoided('configuring-bind', {})
+        expected = {'phases': ['configuring-bind', 'snapshotting']}
+
+        self.assertEqual(output, expected)
+
+    def test_current_disk(self):
+        """``_current_disk`` works out the disk being uploaded from the sizes of the disks"""
+        disk1 = MagicMock()
+        disk1.size = 300
+        disk2 = MagicMock()
+        disk2.size = 100
+
+        self.assertEqual(vmware._current_disk([disk1, disk2], 50), 1)
+        self.assertEqual(vmware._current_disk([disk1, disk2], 80), 2)
+        self.assertEqual(vmware._current_disk([disk1, disk2], 100), 2)
+
+    def test_wait_for_tools(self):
+        """``_wait_for_tools`` waits on the VM with the VMware Tools watcher"""
+        fake_vcenter = MagicMock()
+        fake_vm = MagicMock()
+        self.fake_tools_ready.return_value = False
+
+        output = vmware._wait_for_tools(fake_vcenter, fake_vm)
+
+        self.assertFalse(output)
+        self.fake_tools_ready.assert_called_with(fake_vcenter, fake_vm, vmware.TOOLS_TIMEOUT)
+
+    @patch.object(vmware, 'placement')
+    def test_deploy_bad_name(self, fake_placement):
+        """``_deploy`` raises ValueError when the machine name is not a valid hostname"""
+        fake_placement.place.return_value.__enter__.return_value = (MagicMock(), MagicMock())
+        with self.assertRaises(ValueError) as the_error:
+            vmware._deploy(MagicMock(), MagicMock(), [], 'alice', 'Dns_Box', MagicMock())
+
+        self.assertTrue(str(the_error.exception).startswith('Invalid machine name'))
+
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_invalid_network(self, fake_vCenter, fake_consume_task, fake_deploy, fake_get_info, fake_Ova):
         """``create_dns`` raises ValueError if supplied with a non-existing network"""
         fake_logger = MagicMock()
         fake_get_info.return_value = {'worked': True}
@@ -248,5 +1135,310 @@ class TestVMware(unittest.TestCase):
                                   new_network='dohNet')
 
 
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware, '_network_spec')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_update_network_batch(self, fake_vCenter, fake_retrieve_properties, fake_network_spec, fake_sleep):
+        """``update_network_batch`` starts every reconfig before waiting on any of them"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        started = []
+        def reconfig(spec):
+            started.append(spec)
+            return MagicMock(info=MagicMock(state='success'))
+        fake_vms = []
+        for idx in range(3):
+            fake_vm = MagicMock()
+            fake_vm.ReconfigVM_Task.side_effect = reconfig
+            fake_vms.append((fake_vm, {'name': 'dns{}'.format(idx), 'config.annotation': meta}))
+        fake_retrieve_properties.return_value = fake_vms
+        fake_vCenter.return_value.__enter__.return_value.networks = {'bob_lab2': MagicMock()}
+
+        output = vmware.update_network_batch(username='bob',
+                                             changes={'dns0': 'bob_lab2', 'dns1': 'bob_lab2', 'dns2': 'bob_lab2'},
+                                             logger=MagicMock())
+
+        self.assertEqual(sorted(output['updated']), ['dns0', 'dns1', 'dns2'])
+        self.assertEqual(len(started), 3)
+        self.assertFalse(fake_sleep.called)
+
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware, '_network_spec')
+    @patch.object(vmware, '_retrieve_properties')
+    @patch.object(vmware, 'vCenter')
+    def test_update_network_batch_errors(self, fake_vCenter, fake_retrieve_properties, fake_network_spec, fake_sleep):
+        """``update_network_batch`` reports missing VMs and networks without stopping the batch"""
+        meta = '{"component": "Dns", "created": 1, "version": "1.0", "configured": true, "generation": 1}'
+        fake_vm = MagicMock()
+        fake_vm.ReconfigVM_Task.return_value.info.state = 'success'
+        fake_retrieve_properties.return_value = [(fake_vm, {'name': 'dns0', 'config.annotation': meta}),
+                                                 (MagicMock(), {'name': 'dns1', 'config.annotation': meta})]
+        fake_vCenter.return_value.__enter__.return_value.networks = {'bob_lab2': MagicMock()}
+
+        output = vmware.update_network_batch(username='bob',
+                                             changes={'dns0': 'bob_lab2', 'dns1': 'bob_nope', 'dns9': 'bob_lab2'},
+                                             logger=MagicMock())
+        expected = {'updated': ['dns0'],
+                    'failed': {'dns1': 'No network named bob_nope found',
+                               'dns9': 'No VM named dns9 found'}}
+
+        self.assertEqual(output, expected)
+
+    def test_network_spec(self):
+        """``_network_spec`` connects the NIC to the new network"""
+        fake_nic = vmware.vim.vm.device.VirtualVmxnet3()
+        fake_nic.deviceInfo = vmware.vim.Description(label='Network adapter 1', summary='')
+        fake_network = MagicMock()
+        fake_network.key = 'dvportgroup-1'
+        fake_network.config.distributedVirtualSwitch.uuid = 'abc'
+
+        spec = vmware._network_spec([fake_nic], fake_network)
+
+        self.assertEqual(spec.deviceChange[0].device.backing.port.portgroupKey, 'dvportgroup-1')
+
+    def test_network_spec_no_nic(self):
+        """``_network_spec`` raises ValueError when the VM has no such NIC"""
+        with self.assertRaises(ValueError):
+            vmware._network_spec([], MagicMock())
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_import_zone(self, fake_vCenter, fake_get_info, fake_run_command, fake_download_file, fake_upload_file):
+        """``import_zone`` returns the zone name and new serial upon success"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component' : 'Dns'}}
+        fake_run_command.return_value.exitCode = 0
+        fake_download_file.side_effect = ['zone "vlab.local" { file "/var/named/vlab.local.db"; };',
+                                          '@ 60 IN SOA ns1 root 4 3600 1800 604800 86400\n@ 60 IN NS ns1\n']
+
+        output = vmware.import_zone(username='pat',
+                                    machine_name='myDns',
+                                    zone='vlab.local',
+                                    records=[{'name': 'www', 'type': 'A', 'value': '192.168.1.10'}],
+                                    zone_file=None,
+                                    logger=fake_logger)
+
+        self.assertEqual(output['zone'], 'vlab.local')
+        self.assertTrue(output['serial'] > 4)
+        self.assertEqual(fake_upload_file.call_count, 1)
+        self.assertEqual(fake_run_command.call_count, 1)
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_import_zone_no_zone(self, fake_vCenter, fake_get_info, fake_run_command, fake_download_file, fake_upload_file):
+        """``import_zone`` raises ValueError if the Dns instance doesn't serve the zone"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component' : 'Dns'}}
+        fake_download_file.return_value = 'zone "vlab.local" { file "/var/named/vlab.local.db"; };'
+
+        with self.assertRaises(ValueError):
+            vmware.import_zone(username='pat',
+                               machine_name='myDns',
+                               zone='some.other.zone',
+                               records=[],
+                               zone_file=None,
+                               logger=fake_logger)
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_import_zone_reload_fails(self, fake_vCenter, fake_get_info, fake_run_command, fake_download_file, fake_upload_file):
+        """``import_zone`` raises ValueError if BIND fails to reload the zone"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component' : 'Dns'}}
+        fake_run_command.return_value.exitCode = 1
+        fake_download_file.side_effect = ['zone "vlab.local" { file "/var/named/vlab.local.db"; };',
+                                          '@ 60 IN SOA ns1 root 4 3600 1800 604800 86400\n@ 60 IN NS ns1\n']
+
+        with self.assertRaises(ValueError):
+            vmware.import_zone(username='pat',
+                               machine_name='myDns',
+                               zone='vlab.local',
+                               records=[],
+                               zone_file=None,
+                               logger=fake_logger)
+
+    @patch.object(vmware.zones, 'axfr')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_export_zone(self, fake_vCenter, fake_get_info, fake_axfr):
+        """``export_zone`` transfers the zone from the IP of the Dns instance"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_vm.guest.ipAddress = '192.168.1.2'
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component' : 'Dns'}}
+
+        vmware.export_zone(username='pat', machine_name='myDns', zone='vlab.local.')
+
+        fake_axfr.assert_called_with('192.168.1.2', 'vlab.local')
+
+    @patch.object(vmware.zones, 'axfr')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_export_zone_no_ip(self, fake_vCenter, fake_get_info, fake_axfr):
+        """``export_zone`` raises ValueError if the Dns instance has no IP"""
+        fake_vm = MagicMock()
+        fake_vm.name = 'myDns'
+        fake_vm.guest.ipAddress = None
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component' : 'Dns'}}
+
+        with self.assertRaises(ValueError):
+            vmware.export_zone(username='pat', machine_name='myDns', zone='vlab.local')
+
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    def test_finish_bind_config(self, fake_run_command, fake_download_file, fake_upload_file):
+        """``_finish_bind_config`` sets the IP, bumps the serial and reloads only the Dns zones"""
+        fake_logger = MagicMock()
+        fake_run_command.return_value.exitCode = 0
+        fake_download_file.side_effect = ['zone "vlab.local" { file "vlab.local.db"; };\nzone "1.168.192.in-addr.arpa" { file "vlab.local.rev"; };',
+                                          '@ IN SOA ns1 root ( 4\t; serial\n 3600 1800 604800 86400 )\n@ IN NS ns1\nns1 IN A CHANGEME\n',
+                                          '@ IN SOA ns1.vlab.local. root.vlab.local. 4 3600 1800 604800 86400\n@ IN NS ns1.vlab.local.\n']
+
+        vmware._finish_bind_config(MagicMock(), MagicMock(), '192.168.1.2', fake_logger)
+        forward = fake_upload_file.call_args_list[0][0][2]
+        command = fake_run_command.call_args[1]['arguments']
+
+        self.assertTrue('ns1 IN A 192.168.1.2' in forward)
+        self.assertFalse(' 4\t' in forward)
+        self.assertTrue('rndc reload vlab.local' in command)
+        self.assertTrue('rndc reload 1.168.192.in-addr.arpa' in command)
+        self.assertEqual(fake_run_command.call_count, 1)
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    def test_finish_bind_config_reverse_origin(self, fake_run_command, fake_download_file, fake_upload_file):
+        """``_finish_bind_config`` bumps the serial of the reverse zone using its own origin"""
+        fake_run_command.return_value.exitCode = 0
+        fake_download_file.side_effect = ['zone "vlab.local" { file "vlab.local.db"; };\nzone "1.168.192.in-addr.arpa" { file "vlab.local.rev"; };',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\n',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\n']
+
+        with patch.object(vmware.zones, 'bump_serial', return_value=('', 5)) as fake_bump_serial:
+            vmware._finish_bind_config(MagicMock(), MagicMock(), '192.168.1.2', MagicMock())
+        origins = [x[0][1] for x in fake_bump_serial.call_args_list]
+
+        self.assertEqual(origins, ['vlab.local', '1.168.192.in-addr.arpa'])
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    def test_finish_bind_config_unknown_zone(self, fake_run_command, fake_download_file, fake_upload_file):
+        """``_finish_bind_config`` leaves the serial alone, and reloads every zone, when named.conf doesn't name the zone"""
+        fake_run_command.return_value.exitCode = 0
+        fake_download_file.side_effect = ['',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\nns1 IN A CHANGEME\n',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\n']
+
+        vmware._finish_bind_config(MagicMock(), MagicMock(), '192.168.1.2', MagicMock())
+        forward = fake_upload_file.call_args_list[0][0][2]
+        command = fake_run_command.call_args[1]['arguments']
+
+        self.assertTrue(' 4 ' in forward)
+        self.assertTrue('ns1 IN A 192.168.1.2' in forward)
+        self.assertTrue('rndc reload ||' in command)
+
+    @patch.object(vmware, '_upload_file')
+    @patch.object(vmware, '_download_file')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    def test_finish_bind_config_fails(self, fake_run_command, fake_download_file, fake_upload_file):
+        """``_finish_bind_config`` raises ValueError if BIND cannot load the zones"""
+        fake_logger = MagicMock()
+        fake_run_command.return_value.exitCode = 1
+        fake_download_file.side_effect = ['',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\n',
+                                          '@ IN SOA ns1 root 4 3600 1800 604800 86400\n']
+
+        with self.assertRaises(ValueError):
+            vmware._finish_bind_config(MagicMock(), MagicMock(), '192.168.1.2', fake_logger)
+
+    @patch.object(vmware, 'Ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_dns_exists(self, fake_vCenter, fake_Ova):
+        """``create_dns`` raises ValueError if the user already has a VM by that name"""
+        fake_logger = MagicMock()
+        self.fake_user_index.return_value = {'names': {'DnsBox'}, 'ips': {}}
+
+        with self.assertRaises(ValueError):
+            vmware.create_dns(username='alice',
+                              machine_name='DnsBox',
+                              image='1.0.0',
+                              network='someLAN',
+                              static_ip='192.168.1.2',
+                              default_gateway='192.168.1.1',
+                              netmask='255.255.255.0',
+                              dns=['192.168.1.1'],
+                              logger=fake_logger)
+
+        # The OVA is opened while logging into vCenter, so it's closed again
+        self.assertTrue(fake_Ova.return_value.close.called)
+
+    @patch.object(vmware, 'const')
+    def test_claim_create(self, fake_const):
+        """``_claim_create`` raises ValueError if the VM is already being created"""
+        fake_const.VLAB_DNS_STATE_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fake_const.VLAB_DNS_STATE_DIR)
+
+        with vmware._claim_create('alice', 'DnsBox'):
+            with self.assertRaises(ValueError):
+                with vmware._claim_create('alice', 'DnsBox'):
+                    pass
+
+    @patch.object(vmware, 'const')
+    def test_claim_create_released(self, fake_const):
+        """``_claim_create`` releases the claim once the create is done"""
+        fake_const.VLAB_DNS_STATE_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fake_const.VLAB_DNS_STATE_DIR)
+
+        with vmware._claim_create('alice', 'DnsBox'):
+            pass
+        with vmware._claim_create('alice', 'DnsBox'):
+            pass
+
+    @patch.object(vmware.time, 'time')
+    @patch.object(vmware, 'const')
+    def test_claim_create_stale(self, fake_const, fake_time):
+        """``_claim_create`` takes over a claim left behind by a dead worker"""
+        fake_const.VLAB_DNS_STATE_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fake_const.VLAB_DNS_STATE_DIR)
+        fake_time.return_value = 9999999999
+
+        with vmware._claim_create('alice', 'DnsBox'):
+            with vmware._claim_create('alice', 'DnsBox'):
+                pass
+
+
 if __name__ == '__main__':
     unittest.main()
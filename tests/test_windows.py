@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the windows.py module
+"""
+import unittest
+
+from vlab_dns_api.lib.worker import windows
+
+
+class TestBuildScript(unittest.TestCase):
+    """A set of test cases for ``build_script``"""
+
+    def test_build_script(self):
+        """``build_script`` puts the network config into every step"""
+        output = windows.build_script('192.168.1.2', '192.168.1.1', '255.255.255.0', ['192.168.1.1', '8.8.8.8'])
+
+        self.assertIn("-IPAddress '192.168.1.2' -PrefixLength 24 -DefaultGateway '192.168.1.1'", output)
+        self.assertIn("-ServerAddresses @('192.168.1.1', '8.8.8.8')", output)
+        self.assertIn("ListeningIPAddress = @('192.168.1.2')", output)
+        self.assertIn(windows.RESULT_PATH, output)
+
+    def test_build_script_bad_ip(self):
+        """``build_script`` raises ValueError instead of putting anything but an address in the script"""
+        with self.assertRaises(ValueError):
+            windows.build_script("1.2.3.4'; Remove-Item C:\\", '192.168.1.1', '255.255.255.0', ['192.168.1.1'])
+
+    def test_command_args(self):
+        """``command_args`` runs the uploaded script"""
+        self.assertIn(windows.SCRIPT_PATH, windows.command_args())
+
+
+class TestParseResult(unittest.TestCase):
+    """A set of test cases for ``parse_result``"""
+
+    def test_parse_result(self):
+        """``parse_result`` returns how long each step took"""
+        text = '\ufeff{"nic": {"ok": true, "seconds": 1.23456}, "dns-client": {"ok": true, "seconds": 0.2}, "dns-server": {"ok": true, "seconds": 4}}'
+
+        timings, errors = windows.parse_result(text)
+
+        self.assertEqual(timings, {'nic': 1.235, 'dns-client': 0.2, 'dns-server': 4.0})
+        self.assertEqual(errors, {})
+
+    def test_parse_result_errors(self):
+        """``parse_result`` returns the errors of the steps that failed, or never ran"""
+        text = '{"nic": {"ok": false, "seconds": 1, "error": "no adapter"}, "dns-client": {"ok": true, "seconds": 0.2}}'
+
+        _, errors = windows.parse_result(text)
+
+        self.assertEqual(errors, {'nic': 'no adapter', 'dns-server': 'Step did not run'})
+
+    def test_parse_result_garbage(self):
+        """``parse_result`` raises ValueError when the report isn't JSON"""
+        with self.assertRaises(ValueError):
+            windows.parse_result('not json')
+
+
+if __name__ == '__main__':
+    unittest.main()
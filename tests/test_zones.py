@@ -0,0 +1,195 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in zones.py
+"""
+import time
+import unittest
+from unittest.mock import patch
+
+from vlab_dns_api.lib.worker import zones
+
+ZONE = """$TTL 86400
+@   IN  SOA     ns1.vlab.local. root.vlab.local. (
+        4       ;Serial
+        3600        ;Refresh
+        1800        ;Retry
+        604800      ;Expire
+        86400       ;Minimum TTL
+)
+@       IN  NS          ns1.vlab.local.
+ns1     IN  A           192.168.1.2
+"""
+
+NAMED_CONF = """
+options {
+    directory "/var/named";
+};
+zone "vlab.local" IN {
+    type master;
+    allow-update { none; };
+    file "vlab.local.db";
+};
+zone "1.168.192.in-addr.arpa" IN { type master; file "/etc/vlab.local.rev"; };
+"""
+
+
+class TestZones(unittest.TestCase):
+    """A set of test cases for zones.py"""
+
+    def test_parse_zone(self):
+        """``parse_zone`` returns a zone object for valid zone data"""
+        zone = zones.parse_zone(ZONE, 'vlab.local')
+
+        self.assertEqual(zones.get_serial(zone), 4)
+
+    def test_parse_zone_invalid(self):
+        """``parse_zone`` raises ValueError for invalid zone data"""
+        with self.assertRaises(ValueError):
+            zones.parse_zone('this is not a zone', 'vlab.local')
+
+    def test_next_serial_date(self):
+        """``next_serial`` upgrades a counter based serial to a date based serial"""
+        now = time.mktime((2020, 5, 17, 12, 0, 0, 0, 0, 0))
+
+        output = zones.next_serial(4, now=now)
+        expected = 2020051700
+
+        self.assertEqual(output, expected)
+
+    def test_next_serial_increments(self):
+        """``next_serial`` always returns a value greater than the current serial"""
+        now = time.mktime((2020, 5, 17, 12, 0, 0, 0, 0, 0))
+
+        output = zones.next_serial(2020051709, now=now)
+        expected = 2020051710
+
+        self.assertEqual(output, expected)
+
+    def test_next_serial_wraps(self):
+        """``next_serial`` wraps per RFC 1982, skipping zero"""
+        output = zones.next_serial(2 ** 32 - 1)
+
+        self.assertEqual(output, 1)
+
+    def test_bump_serial(self):
+        """``bump_serial`` only changes the serial of the SOA record"""
+        text, serial = zones.bump_serial(ZONE, 'vlab.local')
+        expected = ZONE.replace('        4       ;Serial', '        {}       ;Serial'.format(serial))
+
+        self.assertEqual(text, expected)
+
+    def test_bump_serial_not_tab(self):
+        """``bump_serial`` leaves other tab-prefixed 4's alone"""
+        zone = '@ IN SOA ns1 root 4\t3600 1800 604800 86400\nhost4\tIN A 10.0.0.4\t\n'
+
+        text, serial = zones.bump_serial(zone, 'vlab.local')
+        expected = '@ IN SOA ns1 root {}\t3600 1800 604800 86400\nhost4\tIN A 10.0.0.4\t\n'.format(serial)
+
+        self.assertEqual(text, expected)
+
+    def test_render_records(self):
+        """``render_records`` converts the API record format into zone file lines"""
+        output = zones.render_records([{'name': 'www', 'type': 'a', 'value': '192.168.1.10'}])
+        expected = 'www 3600 IN A 192.168.1.10\n'
+
+        self.assertEqual(output, expected)
+
+    def test_render_records_bad_type(self):
+        """``render_records`` raises ValueError for unsupported record types"""
+        with self.assertRaises(ValueError):
+            zones.render_records([{'name': '@', 'type': 'SOA', 'value': 'doh'}])
+
+    def test_render_records_comment(self):
+        """``render_records`` raises ValueError when a value would start a comment"""
+        with self.assertRaises(ValueError):
+            zones.render_records([{'name': 'www', 'type': 'A', 'value': '192.168.1.10 ; doh'}])
+
+    def test_render_records_directive(self):
+        """``render_records`` raises ValueError when a name would be a directive"""
+        with self.assertRaises(ValueError):
+            zones.render_records([{'name': '$INCLUDE', 'type': 'A', 'value': '/etc/shadow'}])
+
+    def test_render_records_quoted(self):
+        """``render_records`` allows a ";" inside a quoted TXT value"""
+        output = zones.render_records([{'name': 'www', 'type': 'TXT', 'value': '"v=spf1 -all; ok"'}])
+        expected = 'www 3600 IN TXT "v=spf1 -all; ok"\n'
+
+        self.assertEqual(output, expected)
+
+    def test_render_records_malformed(self):
+        """``render_records`` raises ValueError when a record is missing a key"""
+        with self.assertRaises(ValueError):
+            zones.render_records([{'name': 'www', 'type': 'A'}])
+
+    def test_build_zone_file_records(self):
+        """``build_zone_file`` keeps the SOA and NS records, and bumps the serial"""
+        text, serial = zones.build_zone_file('vlab.local', ZONE, records=[{'name': 'www', 'type': 'A', 'value': '192.168.1.10'}])
+        new_zone = zones.parse_zone(text, 'vlab.local')
+
+        self.assertEqual(zones.get_serial(new_zone), serial)
+        self.assertTrue(serial > 4)
+        self.assertTrue(new_zone.get_rdataset('@', 'NS'))
+        self.assertTrue(new_zone.get_rdataset('www', 'A'))
+        self.assertFalse(new_zone.get_rdataset('ns1', 'A'))
+
+    def test_build_zone_file_zone_file(self):
+        """``build_zone_file`` uses a serial greater than both the current and supplied zone"""
+        supplied = ZONE.replace('4       ;Serial', '4000000000 ;Serial')
+
+        _, serial = zones.build_zone_file('vlab.local', ZONE, zone_file=supplied)
+
+        self.assertEqual(serial, 4000000001)
+
+    def test_build_zone_file_both(self):
+        """``build_zone_file`` raises ValueError if supplied records and a zone file"""
+        with self.assertRaises(ValueError):
+            zones.build_zone_file('vlab.local', ZONE, records=[], zone_file=ZONE)
+
+    def test_parse_apex_owner_inherited(self):
+        """``_parse_apex`` keeps the owner of NS records that inherit it from a skipped record"""
+        current = ZONE + 'sub     IN  A   192.168.1.3\n        IN  NS  ns1.sub\n'
+
+        zone = zones._parse_apex(current, 'vlab.local')
+
+        self.assertEqual(len(zone.get_rdataset('@', 'NS')), 1)
+        self.assertTrue(zone.get_rdataset('sub', 'NS'))
+        self.assertFalse(zone.get_rdataset('sub', 'A'))
+
+    def test_build_zone_file_no_soa(self):
+        """``build_zone_file`` raises ValueError if the current zone has no SOA record"""
+        with self.assertRaises(ValueError):
+            zones.build_zone_file('vlab.local', 'www IN A 192.168.1.10\n', records=[])
+
+    def test_zone_files(self):
+        """``zone_files`` maps zone names to the absolute path of the zone file"""
+        output = zones.zone_files(NAMED_CONF)
+        expected = {'vlab.local': '/var/named/vlab.local.db',
+                    '1.168.192.in-addr.arpa': '/etc/vlab.local.rev'}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(zones.dns.zone, 'from_xfr')
+    @patch.object(zones.dns.query, 'xfr')
+    def test_axfr(self, fake_xfr, fake_from_xfr):
+        """``axfr`` returns the serial and non-SOA records of the zone"""
+        fake_from_xfr.return_value = zones.parse_zone(ZONE, 'vlab.local')
+
+        output = zones.axfr('192.168.1.2', 'vlab.local')
+        expected = {'zone': 'vlab.local',
+                    'serial': 4,
+                    'records': [{'name': '@', 'type': 'NS', 'ttl': 86400, 'value': 'ns1'},
+                                {'name': 'ns1', 'type': 'A', 'ttl': 86400, 'value': '192.168.1.2'}]}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(zones.dns.query, 'xfr')
+    def test_axfr_error(self, fake_xfr):
+        """``axfr`` raises ValueError when the zone transfer fails"""
+        fake_xfr.side_effect = [ConnectionRefusedError('testing')]
+
+        with self.assertRaises(ValueError):
+            zones.axfr('192.168.1.2', 'vlab.local')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,12 @@
 from flask import Flask
 from celery import Celery
 
-from vlab_dns_api.lib import const
+from vlab_dns_api.lib import const, result_store
 from vlab_dns_api.lib.views import HealthView, DnsView
 
 app = Flask(__name__)
-app.celery_app = Celery('dns', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+app.celery_app = Celery('dns', backend=result_store.backend(), broker=const.VLAB_MESSAGE_BROKER)
+app.celery_app.conf.result_expires = const.VLAB_DNS_RESULT_TTL
 app.celery_app.conf.broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
 
 HealthView.register(app)
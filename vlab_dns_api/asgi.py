@@ -0,0 +1,16 @@
+# -*- coding: UTF-8 -*-
+"""
+The ASGI version of the API; run it with any ASGI server, like::
+
+    uvicorn vlab_dns_api.asgi:app
+"""
+from celery import Celery
+
+from vlab_dns_api.lib import const, result_store
+from vlab_dns_api.lib.asgi import DnsApp
+
+celery_app = Celery('dns', backend=result_store.backend(), broker=const.VLAB_MESSAGE_BROKER)
+celery_app.conf.result_expires = const.VLAB_DNS_RESULT_TTL
+celery_app.conf.broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
+
+app = DnsApp(celery_app)
@@ -0,0 +1,685 @@
+# -*- coding: UTF-8 -*-
+"""
+An asyncio (ASGI) implementation of the ``/api/2/inf/dns`` API.
+
+It serves the same routes, schemas and responses as ``DnsView``. A request
+that's waiting on the message broker or the auth server is just a coroutine,
+not a whole uwsgi worker, so a broker hiccup doesn't stop the API from
+answering everything else.
+
+Sending a task is done by a small pool of threads, because Celery (and kombu)
+can only publish by blocking. A send that takes longer than
+``VLAB_DNS_ASGI_PUBLISH_TIMEOUT`` seconds gets an HTTP 503, so requests don't
+pile up behind a slow broker. Looking up the state of a task, and checking the
+auth token with the ``requires`` decorator of ``vlab_api_common``, is done on
+the event loop's default thread pool.
+"""
+import re
+import asyncio
+import functools
+import pkg_resources
+from uuid import uuid4
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import ujson
+from flask import Flask
+from vlab_api_common import get_logger, requires
+from vlab_api_common.flask_common import v1_RESPONSE
+from vlab_inf_common.views import MachineView
+
+from vlab_dns_api.lib import const, inventory, idempotency, owners
+from vlab_dns_api.lib.validation import check, network_config
+from vlab_dns_api.lib.views.dns import DnsView, send_task, show_args, wants_profile, task_event, sse_event, EVENTS_POLL_INTERVAL, EVENTS_KEEPALIVE
+
+logger = get_logger(__name__, loglevel=const.VLAB_DNS_LOG_LEVEL)
+ROUTE_BASE = DnsView.route_base
+# Only gives the ``requires`` decorator a Flask request to read the auth token from
+_AUTH_APP = Flask(__name__)
+
+
+class Request(object):
+    """The parts of an HTTP request the handlers need
+
+    :param scope: The ASGI connection scope
+    :type scope: Dictionary
+
+    :param body: The content body of the request
+    :type body: Bytes
+    """
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'')
+        # Like Flask, a repeated query param uses the first value
+        self.args = {k: v[0] for k, v in parse_qs(self.query_string.decode('latin-1'), keep_blank_values=True).items()}
+        # Like the Flask app, a repeated header uses the last value
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.client_ip = (scope.get('client') or ('', 0))[0]
+        self.body = body
+
+    def json(self):
+        """Decode the content body
+
+        :Returns: Object, or None when the body isn't JSON
+        """
+        try:
+            return ujson.loads(self.body)
+        except ValueError:
+            return None
+
+
+class Response(object):
+    """An HTTP response
+
+    :param status: The HTTP status code
+    :type status: Integer
+
+    :param body: The content body, or an async generator of chunks for a stream
+    :type body: Bytes
+
+    :param headers: The HTTP headers
+    :type headers: List of Tuples
+    """
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or []
+
+    async def send(self, send):
+        """Write the response to the client
+
+        :Returns: None
+
+        :param send: The ASGI send callable
+        :type send: Function
+        """
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in self.headers]
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        if isinstance(self.body, bytes):
+            await send({'type': 'http.response.body', 'body': self.body})
+        else:
+            async for chunk in self.body:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+class Publisher(object):
+    """Sends Celery tasks without blocking the event loop
+
+    :param celery_app: Used to send the tasks
+    :type celery_app: celery.Celery
+
+    :param workers: How many tasks can be sent at the same time
+    :type workers: Integer
+
+    :param timeout: The most seconds to wait on the broker
+    :type timeout: Float
+    """
+    def __init__(self, celery_app, workers, timeout):
+        self.celery_app = celery_app
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='publisher')
+
+    async def send_task(self, username, name, args, kwargs=None, task_id=None, when_sent=None):
+        """Send a task to the workers, recording who sent it so only they can cancel it
+
+        A send that times out isn't stopped, so the task might still be sent.
+
+        :Returns: celery.result.AsyncResult
+
+        :Raises: asyncio.TimeoutError - when the broker is too slow
+
+        :param username: The user who sent the request
+        :type username: String
+
+        :param name: The name of the task, like "dns.show"
+        :type name: String
+
+        :param args: The positional arguments of the task
+        :type args: List
+
+        :param kwargs: The keyword arguments of the task
+        :type kwargs: Dictionary
+
+        :param task_id: Supply the id of the new task
+        :type task_id: String
+
+        :param when_sent: Called with the concurrent.futures.Future of the send once it's
+                          done, even when that's after this call timed out
+        :type when_sent: Function
+        """
+        sending = self._executor.submit(send_task, self.celery_app, username, name, args, kwargs=kwargs, task_id=task_id)
+        if when_sent is not None:
+            sending.add_done_callback(when_sent)
+        # Timing out cancels a send that's still queued, but not one that's started
+        return await asyncio.wait_for(asyncio.wrap_future(sending), self.timeout)
+
+    def close(self):
+        """Stop the threads that send tasks
+
+        :Returns: None
+        """
+        self._executor.shutdown(wait=False)
+
+
+class DnsApp(object):
+    """The ASGI application
+
+    :param celery_app: Used to send tasks, and look up their results
+    :type celery_app: celery.Celery
+
+    :param publishers: How many tasks can be sent at the same time. Default is ``VLAB_DNS_ASGI_PUBLISHERS``
+    :type publishers: Integer
+
+    :param publish_timeout: The most seconds to wait on the broker. Default is ``VLAB_DNS_ASGI_PUBLISH_TIMEOUT``
+    :type publish_timeout: Float
+    """
+    # (HTTP method, path under ROUTE_BASE, handler)
+    ROUTES = [('GET', '', 'show'),
+              ('POST', '', 'create'),
+              ('DELETE', '', 'delete'),
+              ('GET', '/image', 'image'),
+              ('GET', '/metrics', 'metrics'),
+              ('PUT', '/network', 'modify_network'),
+              ('PUT', '/network/batch', 'modify_network_batch'),
+              ('POST', '/reset', 'reset'),
+              ('POST', '/zone', 'zone_import'),
+              ('GET', '/zone', 'zone_export'),
+              ('GET', '/task', 'task'),
+              ('GET', '/task/<tid>', 'task'),
+              ('DELETE', '/task/<tid>', 'cancel'),
+              ('GET', '/task/<tid>/events', 'task_events')]
+
+    def __init__(self, celery_app, publishers=None, publish_timeout=None):
+        self.celery_app = celery_app
+        self.publisher = Publisher(celery_app,
+                                   publishers or const.VLAB_DNS_ASGI_PUBLISHERS,
+                                   publish_timeout or const.VLAB_DNS_ASGI_PUBLISH_TIMEOUT)
+        self._routes = []
+        for method, path, handler in self.ROUTES:
+            pattern = re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', path)
+            self._routes.append((method, re.compile('^{}{}/?$'.format(re.escape(ROUTE_BASE), pattern)), handler))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        elif scope['type'] != 'http':
+            return
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        request = Request(scope, body)
+        try:
+            response = await self.dispatch(request)
+        except asyncio.TimeoutError:
+            response = self._json(request, 503, {'error': 'Timed out sending the task to the message broker'})
+            response.headers.append(('Retry-After', '5'))
+        except Exception as doh:
+            logger.exception(doh)
+            response = self._json(request, 500, {'error': 'Internal server error'})
+        await response.send(send)
+
+    async def dispatch(self, request):
+        """Route a request to its handler
+
+        :Returns: Response
+
+        :param request: The HTTP request
+        :type request: Request
+        """
+        if request.path.rstrip('/') == '/api/1/inf/dns/healthcheck':
+            version = pkg_resources.get_distribution('vlab-dns-api').version
+            return Response(200, ujson.dumps({'version': version}).encode(), [('Content-Type', 'application/json')])
+        path_matched = False
+        for method, pattern, handler in self._routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            path_matched = True
+            if method == request.method:
+                break
+        else:
+            if path_matched:
+                return self._json(request, 405, {'error': 'Method not allowed'})
+            return self._json(request, 404, {'error': 'Not found'})
+        token, error = await self._authenticate(request)
+        if error:
+            return error
+        return await getattr(self, handler)(request, token, **match.groupdict())
+
+    async def show(self, request, token):
+        """Display the Dns instances you own"""
+        if 'describe' in request.args:
+            return self._describe(request, post=DnsView.POST_SCHEMA, delete=DnsView.DELETE_SCHEMA,
+                                  get=DnsView.GET_SCHEMA, get_args=DnsView.GET_ARGS_SCHEMA)
+        username = token['username']
+        resp_data = {'user' : username}
+        try:
+            show_kwargs = show_args(request.args)
+        except ValueError as doh:
+            resp_data['error'] = '{}'.format(doh)
+            return self._json(request, 400, resp_data)
+        if wants_profile(request.headers.get('x-profile')):
+            show_kwargs['profile'] = True
+        etag = inventory.etag(username, inventory.version(username), show_kwargs)
+        if etag and _etag_matches(request.headers.get('if-none-match', ''), etag) and not show_kwargs.get('profile'):
+            return Response(304, headers=[('ETag', '"{}"'.format(etag))])
+        task = await self.publisher.send_task(username, 'dns.show', [username, _txn_id(request)], kwargs=show_kwargs or None)
+        return self._accepted(request, username, task.id)
+
+    async def create(self, request, token):
+        """Create a Dns"""
+        body, error = self._validate(request, token, DnsView.POST_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        txn_id = _txn_id(request)
+        machine_name = body['name']
+        dns = body.get('dns', ['192.168.1.1'])
+        network = '{}_{}'.format(username, body['network'])
+        config, bad_network_config = network_config(body['static-ip'],
+                                                     body.get('default-gateway', '192.168.1.1'),
+                                                     body.get('netmask', '255.255.255.0'))
+        if bad_network_config:
+            return self._json(request, 400, {'user': username, 'error': bad_network_config})
+        # A client retrying after a timeout gets the original task, instead of
+        # deploying the same machine twice.
+        task_id = str(uuid4())
+        idempotency_key = request.headers.get('idempotency-key', txn_id)
+        if idempotency_key != 'noId':
+            existing = idempotency.claim(username, machine_name, idempotency_key, task_id)
+        else:
+            existing = task_id
+        if existing != task_id:
+            logger.info('Duplicate create of {} by {}; returning task {}'.format(machine_name, username, existing))
+            return self._accepted(request, username, existing)
+        create_kwargs = {'profile': True} if wants_profile(request.headers.get('x-profile')) else None
+
+        def when_sent(sending):
+            # A send that timed out might still create the VM, so the key is only
+            # let go (allowing the client to retry) once the send definitely failed
+            if sending.cancelled() or sending.exception() is not None:
+                idempotency.release(username, machine_name, idempotency_key, task_id)
+
+        task = await self.publisher.send_task(username, 'dns.create', [username,
+                                                                       machine_name,
+                                                                       body['image'],
+                                                                       network,
+                                                                       str(config['static-ip']),
+                                                                       str(config['default-gateway']),
+                                                                       str(config['netmask']),
+                                                                       dns,
+                                                                       txn_id],
+                                                        kwargs=create_kwargs,
+                                                        task_id=task_id,
+                                                        when_sent=when_sent if idempotency_key != 'noId' else None)
+        return self._accepted(request, username, task.id)
+
+    async def delete(self, request, token):
+        """Destroy a Dns"""
+        body, error = self._validate(request, token, DnsView.DELETE_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        delete_kwargs = {'async_delete': True} if body.get('async', False) else None
+        task = await self.publisher.send_task(username, 'dns.delete', [username, body['name'], _txn_id(request)], kwargs=delete_kwargs)
+        return self._accepted(request, username, task.id)
+
+    async def image(self, request, token):
+        """Show available versions of Dns that can be deployed"""
+        if 'describe' in request.args:
+            return self._describe(request, get=DnsView.IMAGES_SCHEMA)
+        task = await self.publisher.send_task(token['username'], 'dns.image', [_txn_id(request)])
+        return self._accepted(request, token['username'], task.id)
+
+    async def metrics(self, request, token):
+        """Show the retry, failure and circuit breaker metrics of the workers"""
+        if 'describe' in request.args:
+            return self._describe(request, get=DnsView.METRICS_SCHEMA)
+        task = await self.publisher.send_task(token['username'], 'dns.metrics', [_txn_id(request)])
+        return self._accepted(request, token['username'], task.id)
+
+    async def modify_network(self, request, token):
+        """Change the network a Dns instance is connected to"""
+        body, error = self._validate(request, token, MachineView.NETWORK_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        new_network = '{}_{}'.format(username, body['new_network'])
+        task = await self.publisher.send_task(username, 'dns.modify_network', [username, body['name'], new_network, _txn_id(request)])
+        return self._accepted(request, username, task.id)
+
+    async def modify_network_batch(self, request, token):
+        """Change the network of many Dns instances at once"""
+        body, error = self._validate(request, token, DnsView.NETWORK_BATCH_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        changes = {}
+        for change in body['changes']:
+            changes[change['name']] = '{}_{}'.format(username, change['new_network'])
+        task = await self.publisher.send_task(username, 'dns.modify_network_batch', [username, changes, _txn_id(request)])
+        return self._accepted(request, username, task.id)
+
+    async def reset(self, request, token):
+        """Revert a Dns instance to how it was right after it was created"""
+        body, error = self._validate(request, token, DnsView.RESET_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        task = await self.publisher.send_task(username, 'dns.reset', [username, body['name'], _txn_id(request)])
+        return self._accepted(request, username, task.id)
+
+    async def zone_import(self, request, token):
+        """Replace the records of a zone on a Dns instance"""
+        body, error = self._validate(request, token, DnsView.ZONE_IMPORT_SCHEMA)
+        if error:
+            return error
+        username = token['username']
+        task = await self.publisher.send_task(username, 'dns.import_zone', [username,
+                                                                            body['name'],
+                                                                            body.get('zone', 'vlab.local'),
+                                                                            body.get('records', None),
+                                                                            body.get('zone-file', None),
+                                                                            _txn_id(request)])
+        return self._accepted(request, username, task.id)
+
+    async def zone_export(self, request, token):
+        """Obtain every record of a zone on a Dns instance"""
+        if 'describe' in request.args:
+            return self._describe(request, get_args=DnsView.ZONE_EXPORT_ARGS, post=DnsView.ZONE_IMPORT_SCHEMA)
+        username = token['username']
+        machine_name = request.args.get('name', None)
+        if machine_name is None:
+            return self._json(request, 400, {'user': username, 'error': 'no name provided'})
+        zone = request.args.get('zone', 'vlab.local')
+        task = await self.publisher.send_task(username, 'dns.export_zone', [username, machine_name, zone, _txn_id(request)])
+        return self._accepted(request, username, task.id)
+
+    async def task(self, request, token, tid=None):
+        """Check the status of a task"""
+        if 'describe' in request.args:
+            return self._describe(request, get_args=MachineView.TASK_ARGS)
+        resp = {'user': token['username'], 'content' : {}}
+        if request.args.get('task-id', None) and tid:
+            resp['error'] = 'task-id supplied in URL and as param'
+            return self._json(request, 400, resp)
+        task_id = request.args.get('task-id', tid)
+        if task_id is None:
+            resp['error'] = "no task id provided"
+            return self._json(request, 400, resp)
+        status, result = await self._blocking(self._task_state, task_id)
+        resp['content']['status'] = status
+        if status == 'SUCCESS':
+            # Every task returns a dictionary with an "error" key
+            if result['error']:
+                resp.update(result)
+                resp['error'] = result['error']
+                return self._json(request, 400, resp)
+            return self._json(request, 200, result)
+        elif status == 'FAILURE':
+            return self._json(request, 500, resp)
+        return self._json(request, 202, resp)
+
+    async def cancel(self, request, token, tid):
+        """Cancel a task. A queued task never runs, and a running create stops at its next phase."""
+        # Saying the task exists would tell one user about another user's work
+        if await self._blocking(owners.owner, tid) != token['username']:
+            return self._json(request, 404, {'user': token['username'], 'error': 'No such task: {}'.format(tid)})
+        status, _ = await self._blocking(self._task_state, tid)
+        # Revoking only stops tasks that haven't started yet
+        await self._blocking(self.celery_app.control.revoke, tid)
+        await self._blocking(self.celery_app.control.broadcast, 'dns_cancel', arguments={'task_id': tid})
+        return self._accepted(request, token['username'], tid, content={'task-id': tid, 'status': status})
+
+    async def task_events(self, request, token, tid):
+        """Stream the progress of a task as Server-Sent Events, ending with its result"""
+        headers = [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache'), ('X-Accel-Buffering', 'no')]
+        return Response(200, self._task_events(tid, const.VLAB_DNS_EVENTS_TIMEOUT), headers)
+
+    async def _task_events(self, task_id, timeout):
+        """Generate the Server-Sent Events about a task's progress
+
+        :Returns: Async Generator
+
+        :param task_id: The task to report on
+        :type task_id: String
+
+        :param timeout: The most seconds to stream for
+        :type timeout: Integer
+        """
+        loop = asyncio.get_event_loop()
+        give_up_at = loop.time() + timeout
+        last_event = None
+        last_sent = loop.time()
+        while loop.time() < give_up_at:
+            event, finished = await self._blocking(lambda: task_event(self.celery_app.AsyncResult(task_id)))
+            if finished:
+                yield event
+                return
+            elif event != last_event:
+                yield event
+                last_event = event
+                last_sent = loop.time()
+            elif loop.time() - last_sent >= EVENTS_KEEPALIVE:
+                yield ': keepalive\n\n'
+                last_sent = loop.time()
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+        yield sse_event('timeout', {'status': 'TIMEOUT', 'error': 'Stopped streaming after {} seconds'.format(timeout)})
+
+    def _task_state(self, task_id):
+        """Look up the status and result of a task; this blocks
+
+        :Returns: Tuple (String, Object)
+
+        :param task_id: The task to look up
+        :type task_id: String
+        """
+        result = self.celery_app.AsyncResult(task_id)
+        status = result.status
+        if status == 'SUCCESS':
+            return status, result.result
+        return status, None
+
+    async def _authenticate(self, request):
+        """Decode the auth token, and check that it grants access to this API
+
+        :Returns: Tuple (Dictionary, Response) - The token, or the error response
+
+        :param request: The HTTP request
+        :type request: Request
+        """
+        result = await self._blocking(_check_token, request)
+        if isinstance(result, dict):
+            return result, None
+        # Otherwise, it's the error response of the decorator
+        if isinstance(result, tuple):
+            body, status = result
+            headers = []
+        else:
+            body, status = result.get_data(), result.status_code
+            headers = [(k, v) for k, v in result.headers if k == 'Link']
+        try:
+            data = ujson.loads(body)
+        except ValueError:
+            data = {'error': body.decode() if isinstance(body, bytes) else body}
+        return None, self._json(request, status, data, headers)
+
+    def _validate(self, request, token, schema):
+        """Check the content body of a request against a JSON schema
+
+        :Returns: Tuple (Dictionary, Response) - The body, or the error response
+
+        :param request: The HTTP request
+        :type request: Request
+
+        :param token: The decoded auth token
+        :type token: Dictionary
+
+        :param schema: The JSON schema the body must conform to
+        :type schema: Dictionary
+        """
+        resp = {'user' : token['username']}
+        body = request.json()
+        if body is None:
+            resp['error'] = 'No JSON content body sent in HTTP request'
+            return None, self._json(request, 400, resp)
+        error = check(body, schema)
+        if error:
+            resp['error'] = error
+            return None, self._json(request, 400, resp)
+        return body, None
+
+    def _describe(self, request, **schemas):
+        """Respond with the schemas of an end point, like the ``describe`` decorator
+
+        :Returns: Response
+
+        :param request: The HTTP request
+        :type request: Request
+        """
+        the_schema = {}
+        for method, schema in schemas.items():
+            if method.endswith('args'):
+                action = method.split('_')[0]
+                the_schema.setdefault(action, {'body' : {}, 'response' : v1_RESPONSE, 'args' : {}})
+                the_schema[action]['args'] = schema
+            else:
+                the_schema.setdefault(method, {'body' : {}, 'response' : v1_RESPONSE, 'args' : {}})
+                the_schema[method]['body'] = schema
+        return self._json(request, 200, {'content': the_schema})
+
+    def _accepted(self, request, username, task_id, headers=None, content=None):
+        """Respond with the id of the task that's doing the work
+
+        :Returns: Response
+
+        :param request: The HTTP request
+        :type request: Request
+
+        :param username: The user who sent the request
+        :type username: String
+
+        :param task_id: The id of the task
+        :type task_id: String
+
+        :param headers: Extra HTTP headers
+        :type headers: List
+
+        :param content: Override the content of the response
+        :type content: Dictionary
+        """
+        headers = list(headers or [])
+        headers.append(('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, ROUTE_BASE, task_id)))
+        return self._json(request, 202, {'user': username, 'content': content or {'task-id': task_id}}, headers)
+
+    def _json(self, request, status, data, headers=None):
+        """Make a JSON response that meets the API contract, like ``BaseView.after_request``
+
+        :Returns: Response
+
+        :param request: The HTTP request
+        :type request: Request
+
+        :param status: The HTTP status code
+        :type status: Integer
+
+        :param data: The body of the response
+        :type data: Dictionary
+
+        :param headers: Extra HTTP headers
+        :type headers: List
+        """
+        base = {'error' : None, 'content' : {}, 'params' : dict(request.args)}
+        data = dict(data)
+        data.pop('user', None)
+        base.update(data)
+        headers = list(headers or [])
+        headers.append(('Content-Type', 'application/json'))
+        headers.append(('Link', '<{0}{1}?describe=true>; rel=help'.format(const.VLAB_URL, ROUTE_BASE)))
+        return Response(status, ujson.dumps(base).encode(), headers)
+
+    async def _blocking(self, func, *args, **kwargs):
+        """Run a blocking function without blocking the event loop
+
+        :Returns: Object - whatever the function returns
+
+        :param func: The function to run
+        :type func: Function
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def _lifespan(self, receive, send):
+        """Handle the ASGI server starting up, and shutting down
+
+        :Returns: None
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.publisher.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+@requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+def _authorized(token, **kwargs):
+    """Obtain the auth token, once the ``requires`` decorator accepted it
+
+    :Returns: Dictionary
+    """
+    return token
+
+
+def _check_token(request):
+    """Decode and check the auth token, like the Flask app does; this blocks
+
+    :Returns: Dictionary, or the error response of the ``requires`` decorator
+
+    :param request: The HTTP request
+    :type request: Request
+    """
+    with _AUTH_APP.test_request_context(request.path, headers=request.headers,
+                                        environ_base={'REMOTE_ADDR': request.client_ip}):
+        return _authorized()
+
+
+def _etag_matches(if_none_match, etag):
+    """Check an If-None-Match header against an ETag, using weak comparison
+
+    :Returns: Boolean
+
+    :param if_none_match: The value of the If-None-Match header
+    :type if_none_match: String
+
+    :param etag: The current ETag, without quotes
+    :type etag: String
+    """
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def _txn_id(request):
+    """Obtain the id that tracks a request through the logs
+
+    :Returns: String
+
+    :param request: The HTTP request
+    :type request: Request
+    """
+    return request.headers.get('x-request-id', 'noId')
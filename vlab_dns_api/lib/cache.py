@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+"""
+A small, thread-safe, in-memory cache whose entries expire.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """A size bounded mapping where every entry expires after ``ttl`` seconds.
+
+    When the cache is full, the oldest entry is evicted to make room.
+
+    :param ttl: How many seconds an entry lives for
+    :type ttl: Integer
+
+    :param max_size: The most entries the cache will hold
+    :type max_size: Integer
+    """
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Obtain the value of an entry, if it exists and hasn't expired
+
+        :Returns: Object
+
+        :param key: The name of the entry
+        :type key: Hashable
+
+        :param default: What to return if there's no such entry
+        :type default: Object
+        """
+        with self._lock:
+            return self._get(key, default)
+
+    def set(self, key, value, ttl=None):
+        """Add or replace an entry
+
+        :Returns: None
+
+        :param key: The name of the entry
+        :type key: Hashable
+
+        :param value: The thing to cache
+        :type value: Object
+
+        :param ttl: Override the default number of seconds the entry lives for
+        :type ttl: Integer
+        """
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def setdefault(self, key, value, ttl=None):
+        """Atomically obtain an entry, or add it if it doesn't exist
+
+        :Returns: Object - the cached value
+
+        :param key: The name of the entry
+        :type key: Hashable
+
+        :param value: The thing to cache when there's no such entry
+        :type value: Object
+
+        :param ttl: Override the default number of seconds the entry lives for
+        :type ttl: Integer
+        """
+        with self._lock:
+            missing = object()
+            current = self._get(key, missing)
+            if current is missing:
+                self._set(key, value, ttl)
+                current = value
+            return current
+
+    def pop(self, key, default=None):
+        """Remove an entry
+
+        :Returns: Object - the value of the removed entry
+
+        :param key: The name of the entry
+        :type key: Hashable
+
+        :param default: What to return if there's no such entry
+        :type default: Object
+        """
+        with self._lock:
+            value = self._get(key, default)
+            self._data.pop(key, None)
+            return value
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key, default):
+        """Lookup an entry; must be called while holding the lock"""
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return default
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def _set(self, key, value, ttl):
+        """Store an entry; must be called while holding the lock"""
+        if ttl is None:
+            ttl = self.ttl
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + ttl, value)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
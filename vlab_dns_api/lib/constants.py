@@ -26,10 +26,48 @@ DEFINED = OrderedDict([
             ('VLAB_VERIFY_TOKEN', environ.get('VLAB_VERIFY_TOKEN', False)),
             ('VLAB_DNS_WINDOWS_ADMIN', environ.get('VLAB_DNS_WINDOWS_ADMIN', 'Administrator')),
             ('VLAB_DNS_WINDOWS_PW', environ.get('VLAB_DNS_WINDOWS_PW', 'ChangeMe')),
+            ('VLAB_DNS_WINDOWS_BATCHED', environ.get('VLAB_DNS_WINDOWS_BATCHED', 'true').lower() == 'true'),
             ('VLAB_DNS_BIND9_ADMIN', environ.get('VLAB_DNS_BIND9_ADMIN', 'root')),
             ('VLAB_DNS_BIND9_PW', environ.get('VLAB_DNS_BIND9_PW', 'ChangeMe')),
+            ('VLAB_DNS_STATE_DIR', environ.get('VLAB_DNS_STATE_DIR', '/tmp/vlab-dns')),
+            ('VLAB_DNS_IDEMPOTENCY_TTL', int(environ.get('VLAB_DNS_IDEMPOTENCY_TTL', 3600))),
+            ('VLAB_DNS_ETAGS', environ.get('VLAB_DNS_ETAGS', 'true').lower() == 'true'),
+            ('VLAB_DNS_ETAG_TTL', int(environ.get('VLAB_DNS_ETAG_TTL', 60))),
+            ('VLAB_DNS_DATASTORES', environ.get('VLAB_DNS_DATASTORES', environ.get('INF_VCENTER_DATASTORE', 'VM-Storage'))),
+            ('VLAB_DNS_MIN_FREE_GB', int(environ.get('VLAB_DNS_MIN_FREE_GB', 20))),
+            ('VLAB_DNS_TRASH_FOLDER', environ.get('VLAB_DNS_TRASH_FOLDER', 'dns-trash')),
+            ('VLAB_DNS_REAP_INTERVAL', int(environ.get('VLAB_DNS_REAP_INTERVAL', 60))),
+            ('VLAB_DNS_REAP_BATCH', int(environ.get('VLAB_DNS_REAP_BATCH', 20))),
+            ('VLAB_DNS_REAP_CONCURRENCY', int(environ.get('VLAB_DNS_REAP_CONCURRENCY', 4))),
+            ('VLAB_DNS_MOREF_TTL', int(environ.get('VLAB_DNS_MOREF_TTL', 300))),
+            ('VLAB_DNS_RETRY_ATTEMPTS', int(environ.get('VLAB_DNS_RETRY_ATTEMPTS', 4))),
+            ('VLAB_DNS_RETRY_BASE', float(environ.get('VLAB_DNS_RETRY_BASE', 0.5))),
+            ('VLAB_DNS_RETRY_CAP', float(environ.get('VLAB_DNS_RETRY_CAP', 10))),
+            ('VLAB_DNS_BREAKER_THRESHOLD', int(environ.get('VLAB_DNS_BREAKER_THRESHOLD', 5))),
+            ('VLAB_DNS_BREAKER_COOLDOWN', int(environ.get('VLAB_DNS_BREAKER_COOLDOWN', 30))),
+            ('VLAB_DNS_RESULT_BACKEND', environ.get('VLAB_DNS_RESULT_BACKEND', 'rpc://')),
+            ('VLAB_DNS_RESULT_TTL', int(environ.get('VLAB_DNS_RESULT_TTL', 3600))),
+            ('VLAB_DNS_RESULT_MAX', int(environ.get('VLAB_DNS_RESULT_MAX', 10000))),
+            ('VLAB_DNS_EVENTS_TIMEOUT', int(environ.get('VLAB_DNS_EVENTS_TIMEOUT', 1800))),
+            ('VLAB_DNS_ASGI_PUBLISHERS', int(environ.get('VLAB_DNS_ASGI_PUBLISHERS', 16))),
+            ('VLAB_DNS_ASGI_PUBLISH_TIMEOUT', float(environ.get('VLAB_DNS_ASGI_PUBLISH_TIMEOUT', 5))),
+            ('VLAB_DNS_PREFLIGHT_TTL', int(environ.get('VLAB_DNS_PREFLIGHT_TTL', 30))),
+            ('VLAB_DNS_SHARE_SESSIONS', environ.get('VLAB_DNS_SHARE_SESSIONS', '').lower() in ('1', 'true', 'yes')),
+            ('VLAB_DNS_SESSION_CHECK', int(environ.get('VLAB_DNS_SESSION_CHECK', 60))),
+            ('VLAB_DNS_VCENTERS', environ.get('VLAB_DNS_VCENTERS', environ.get('INF_VCENTER_SERVER', 'localhost'))),
+            ('VLAB_DNS_PROFILE', environ.get('VLAB_DNS_PROFILE', 'false').lower() == 'true'),
+            ('VLAB_DNS_PROFILE_DIR', environ.get('VLAB_DNS_PROFILE_DIR', '/tmp/vlab-dns-profiles')),
+            ('VLAB_DNS_PROFILE_KEEP', int(environ.get('VLAB_DNS_PROFILE_KEEP', 50))),
           ])
 
+# The properties of a Dns instance a listing can be limited to. The API and the
+# workers both depend on these names, so they can't be overridden.
+SHOW_FIELDS = ('state', 'console', 'ips', 'networks', 'moid', 'meta')
+
+# The name of a Dns instance becomes its hostname, so the API and the workers
+# only accept names that are valid hostnames.
+HOSTNAME_PATTERN = r'^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$'
+
 Constants = namedtuple('Constants', list(DEFINED.keys()))
 
 # The '*' expands the list, just liked passing a function *args
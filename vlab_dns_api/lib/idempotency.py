@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+"""
+Remembers which task a create started, so a client retrying the create (with
+the same idempotency key) gets the original task instead of a second VM.
+
+The keys are files in ``VLAB_DNS_STATE_DIR``, so every API process, and every
+API replica sharing that directory, sees them. A key expires after
+``VLAB_DNS_IDEMPOTENCY_TTL`` seconds; expired keys are swept up as new ones
+are claimed.
+"""
+import os
+import time
+import hashlib
+
+from vlab_dns_api.lib import const
+
+# When this process last swept up expired keys
+_LAST_SWEEP = 0
+
+
+def claim(username, machine_name, key, task_id):
+    """Record that a create is starting a task, unless the same create already did
+
+    A failure to record the key is not an error; the create just isn't
+    protected against being retried.
+
+    :Returns: String - the task-id of the create, which is ``task_id`` unless
+              the key was already claimed
+
+    :param username: The name of the user creating a Dns instance
+    :type username: String
+
+    :param machine_name: The name of the new Dns instance
+    :type machine_name: String
+
+    :param key: The idempotency key the client sent
+    :type key: String
+
+    :param task_id: The id of the task to start
+    :type task_id: String
+    """
+    key_file = _key_file(username, machine_name, key)
+    staged = '{}.{}'.format(key_file, task_id)
+    try:
+        os.makedirs(os.path.dirname(key_file), exist_ok=True)
+        _sweep(os.path.dirname(key_file))
+        with open(staged, 'w') as the_file:
+            the_file.write(task_id)
+        # Linking fails when the key exists, so only one process can claim it
+        for _ in range(2):
+            try:
+                os.link(staged, key_file)
+                return task_id
+            except FileExistsError:
+                owner = _owner(key_file)
+                if owner is not None:
+                    return owner
+    except OSError:
+        return task_id
+    finally:
+        try:
+            os.remove(staged)
+        except OSError:
+            pass
+    # Another create keeps claiming, and expiring, the same key
+    return task_id
+
+
+def release(username, machine_name, key, task_id):
+    """Forget a key, so the client can retry a create whose task never started
+
+    :Returns: None
+
+    :param username: The name of the user creating a Dns instance
+    :type username: String
+
+    :param machine_name: The name of the new Dns instance
+    :type machine_name: String
+
+    :param key: The idempotency key the client sent
+    :type key: String
+
+    :param task_id: The id of the task that didn't start
+    :type task_id: String
+    """
+    key_file = _key_file(username, machine_name, key)
+    if _owner(key_file) == task_id:
+        try:
+            os.remove(key_file)
+        except OSError:
+            pass
+
+
+def _owner(key_file):
+    """Read which task claimed a key, removing the key when it has expired
+
+    :Returns: String, or None when nobody holds the key
+
+    :param key_file: Where the key is stored
+    :type key_file: String
+    """
+    try:
+        with open(key_file) as the_file:
+            age = time.time() - os.fstat(the_file.fileno()).st_mtime
+            owner = the_file.read().strip()
+    except FileNotFoundError:
+        return None
+    if age < const.VLAB_DNS_IDEMPOTENCY_TTL:
+        return owner
+    try:
+        os.remove(key_file)
+    except FileNotFoundError:
+        # Another process expired it first
+        pass
+    return None
+
+
+def _sweep(key_dir):
+    """Remove the expired keys, at most once per ``VLAB_DNS_IDEMPOTENCY_TTL`` per process
+
+    :Returns: None
+
+    :param key_dir: Where the keys are stored
+    :type key_dir: String
+    """
+    global _LAST_SWEEP
+    now = time.time()
+    if now - _LAST_SWEEP < const.VLAB_DNS_IDEMPOTENCY_TTL:
+        return
+    _LAST_SWEEP = now
+    for entry in os.scandir(key_dir):
+        try:
+            if now - entry.stat().st_mtime >= const.VLAB_DNS_IDEMPOTENCY_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _key_file(username, machine_name, key):
+    """Where an idempotency key is stored
+
+    :Returns: String
+
+    :param username: The name of the user creating a Dns instance
+    :type username: String
+
+    :param machine_name: The name of the new Dns instance
+    :type machine_name: String
+
+    :param key: The idempotency key the client sent
+    :type key: String
+    """
+    # Hashing keeps odd characters in the key out of the file path
+    name = hashlib.sha1('{}/{}/{}'.format(username, machine_name, key).encode()).hexdigest()
+    return os.path.join(const.VLAB_DNS_STATE_DIR, 'idempotency', name)
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+"""
+Tracks when the Dns instances of a user change, so the API can tell a client
+that the listing it already has is current without asking vCenter.
+
+The workers bump a user's inventory version after every task that changes a
+Dns instance. The result of ``dns.show`` has the ETag of the listing, made from
+the version the listing was taken at; a client sends it back in If-None-Match,
+and the API answers 304 while the version hasn't moved. For this to work, the
+API and the workers must share the ``VLAB_DNS_STATE_DIR`` directory.
+
+Changes made outside of this service (like powering a VM off in vCenter) don't
+bump the version, so an ETag also expires every ``VLAB_DNS_ETAG_TTL`` seconds;
+a listing is never more than that out of date.
+"""
+import os
+import time
+import hashlib
+from uuid import uuid4
+
+import ujson
+
+from vlab_dns_api.lib import const
+
+
+def version(username):
+    """Obtain the current inventory version of a user
+
+    :Returns: String
+
+    :param username: The user who owns the Dns instances
+    :type username: String
+    """
+    try:
+        with open(_version_file(username)) as the_file:
+            return the_file.read().strip()
+    except OSError:
+        # Nothing has changed since the state dir was created
+        return '0'
+
+
+def bump(username):
+    """Record that the Dns instances of a user have changed.
+
+    A failure to record the change doesn't fail the task that made it.
+
+    :Returns: String - the new version, or None if it could not be recorded
+
+    :param username: The user who owns the Dns instances
+    :type username: String
+    """
+    new_version = uuid4().hex
+    version_file = _version_file(username)
+    staged = '{}.{}'.format(version_file, new_version)
+    try:
+        os.makedirs(os.path.dirname(version_file), exist_ok=True)
+        with open(staged, 'w') as the_file:
+            the_file.write(new_version)
+        # Atomic, so a reader never sees a partially written version
+        os.replace(staged, version_file)
+    except OSError:
+        return None
+    return new_version
+
+
+def etag(username, inventory_version, show_kwargs):
+    """Compute the ETag of a listing of a user's Dns instances.
+
+    The ETag changes with the inventory version, and every ``VLAB_DNS_ETAG_TTL``
+    seconds, so changes made outside of this service are seen eventually.
+
+    :Returns: String, or None when ETags are disabled
+
+    :param username: The user who owns the Dns instances
+    :type username: String
+
+    :param inventory_version: The inventory version the listing was taken at
+    :type inventory_version: String
+
+    :param show_kwargs: What the listing was limited to; the kwargs of the ``dns.show`` task
+    :type show_kwargs: Dictionary
+    """
+    if not const.VLAB_DNS_ETAGS:
+        return None
+    limits = ujson.dumps({x: show_kwargs.get(x, None) for x in ('fields', 'page', 'per_page')}, sort_keys=True)
+    # Every ETag made in the same window of time matches
+    window = int(time.time() // const.VLAB_DNS_ETAG_TTL)
+    return hashlib.sha1('{}/{}/{}/{}'.format(username, inventory_version, window, limits).encode()).hexdigest()
+
+
+def _version_file(username):
+    """Where the inventory version of a user is stored
+
+    :Returns: String
+
+    :param username: The user who owns the Dns instances
+    :type username: String
+    """
+    name = hashlib.sha1(username.encode()).hexdigest()
+    return os.path.join(const.VLAB_DNS_STATE_DIR, 'inventory', name)
@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+"""
+Remembers which user started a task, so only that user can cancel it.
+
+An owner is recorded before its task is sent, as a file in
+``VLAB_DNS_STATE_DIR``, so every API process, and every API replica sharing
+that directory, sees it. An owner is forgotten after ``OWNER_TTL`` seconds;
+old owners are swept up as new ones are recorded.
+"""
+import os
+import time
+import hashlib
+
+from vlab_dns_api.lib import const
+
+# A task that's been running for this long is past being cancelled
+OWNER_TTL = 86400
+
+# When this process last swept up old owners
+_LAST_SWEEP = 0
+
+
+def record(task_id, username):
+    """Record who started a task
+
+    A failure to record the owner is not an error; the task just can't be
+    cancelled.
+
+    :Returns: None
+
+    :param task_id: The id of the task about to be sent
+    :type task_id: String
+
+    :param username: The name of the user sending the task
+    :type username: String
+    """
+    owner_file = _owner_file(task_id)
+    try:
+        os.makedirs(os.path.dirname(owner_file), exist_ok=True)
+        _sweep(os.path.dirname(owner_file))
+        with open(owner_file, 'w') as the_file:
+            the_file.write(username)
+    except OSError:
+        pass
+
+
+def owner(task_id):
+    """Look up who started a task
+
+    :Returns: String, or None when the owner isn't known
+
+    :param task_id: The id of the task
+    :type task_id: String
+    """
+    try:
+        with open(_owner_file(task_id)) as the_file:
+            age = time.time() - os.fstat(the_file.fileno()).st_mtime
+            username = the_file.read().strip()
+    except OSError:
+        return None
+    if age < OWNER_TTL:
+        return username
+    return None
+
+
+def _sweep(owner_dir):
+    """Remove the old owners, at most once per ``OWNER_TTL`` per process
+
+    :Returns: None
+
+    :param owner_dir: Where the owners are stored
+    :type owner_dir: String
+    """
+    global _LAST_SWEEP
+    now = time.time()
+    if now - _LAST_SWEEP < OWNER_TTL:
+        return
+    _LAST_SWEEP = now
+    for entry in os.scandir(owner_dir):
+        try:
+            if now - entry.stat().st_mtime >= OWNER_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _owner_file(task_id):
+    """Where the owner of a task is stored
+
+    :Returns: String
+
+    :param task_id: The id of the task
+    :type task_id: String
+    """
+    # Hashing keeps odd characters in a task-id out of the file path
+    name = hashlib.sha1(task_id.encode()).hexdigest()
+    return os.path.join(const.VLAB_DNS_STATE_DIR, 'owners', name)
@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+"""
+Where the API and the workers keep the results of tasks.
+
+With the ``rpc://`` backend, a result can only be read by the API process that
+sent the task, and results nobody reads pile up in the broker. Setting
+``VLAB_DNS_RESULT_BACKEND`` to ``sqlite`` keeps results in a SQLite database in
+``VLAB_DNS_STATE_DIR`` instead, so any API process can answer a status poll.
+Results expire after ``VLAB_DNS_RESULT_TTL`` seconds, and only the newest
+``VLAB_DNS_RESULT_MAX`` results are kept. Any other value is used as a Celery
+result backend URL, like ``redis://dns-results:6379/0``.
+"""
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from celery.backends.base import KeyValueStoreBackend
+
+from vlab_dns_api.lib import const
+
+SQLITE = 'sqlite'
+
+
+def backend():
+    """Obtain the Celery result backend chosen by ``VLAB_DNS_RESULT_BACKEND``
+
+    :Returns: String
+    """
+    if const.VLAB_DNS_RESULT_BACKEND == SQLITE:
+        return '{}:{}'.format(__name__, SQLiteBackend.__name__)
+    return const.VLAB_DNS_RESULT_BACKEND
+
+
+class SQLiteBackend(KeyValueStoreBackend):
+    """A Celery result backend for when the API and the workers share a disk"""
+    # Pruning on every write would slow down every task
+    PRUNE_EVERY = 100
+
+    def __init__(self, *args, **kwargs):
+        super(SQLiteBackend, self).__init__(*args, **kwargs)
+        self.db_file = os.path.join(const.VLAB_DNS_STATE_DIR, 'results.db')
+        self.max_results = const.VLAB_DNS_RESULT_MAX
+        self._writes = 0
+        self._local = threading.local()
+
+    def get(self, key):
+        """Obtain a result, if it exists and hasn't expired"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM results WHERE key = ? AND expires > ?',
+                               (key, time.time())).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def mget(self, keys):
+        """Obtain many results"""
+        keys = list(keys)
+        with self._connect() as conn:
+            rows = conn.execute('SELECT key, value FROM results WHERE key IN ({}) AND expires > ?'.format(','.join('?' * len(keys))),
+                                keys + [time.time()]).fetchall()
+        found = dict(rows)
+        return [found.get(x) for x in keys]
+
+    def set(self, key, value):
+        """Store a result"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)',
+                         (key, value, time.time() + self._ttl()))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.cleanup()
+
+    def delete(self, key):
+        """Remove a result"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM results WHERE key = ?', (key,))
+
+    def expire(self, key, value):
+        """Change how many seconds a result lives for"""
+        with self._connect() as conn:
+            conn.execute('UPDATE results SET expires = ? WHERE key = ?', (time.time() + value, key))
+
+    def cleanup(self):
+        """Remove the expired results, and the oldest results when there are too many.
+
+        Celery beat also calls this once a day.
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM results WHERE expires <= ?', (time.time(),))
+            conn.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                         (self.max_results,))
+
+    def _ttl(self):
+        """How many seconds a new result lives for
+
+        :Returns: Float
+        """
+        if self.expires:
+            return self.expires
+        return const.VLAB_DNS_RESULT_TTL
+
+    @contextmanager
+    def _connect(self):
+        """Obtain a connection to the database, and commit what's done with it
+
+        :Returns: sqlite3.Connection
+        """
+        # A connection can't be shared across threads, or with a forked worker process
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB, expires REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_expires ON results (expires)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        with conn:
+            yield conn
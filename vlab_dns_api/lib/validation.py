@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+"""
+Checks the input to the API, without redoing work on every request.
+
+A JSON schema is compiled into a validator once, when the view is defined,
+instead of every time a request is checked. A network config is parsed into
+``ipaddress`` objects once; the same objects are used to check the config and
+to build the arguments of the task.
+"""
+import ipaddress
+from functools import wraps
+
+import ujson
+from flask import request
+from jsonschema import Draft4Validator, ValidationError, draft4_format_checker
+from vlab_api_common import get_logger
+
+from vlab_dns_api.lib import const
+
+logger = get_logger(__name__, loglevel=const.VLAB_DNS_LOG_LEVEL)
+_VALIDATORS = {}
+
+
+def compiled(schema):
+    """Obtain the validator of a JSON schema, compiling it the first time
+
+    :Returns: jsonschema.Draft4Validator
+
+    :param schema: The JSON schema
+    :type schema: Dictionary
+    """
+    # Schemas are class attributes that live as long as the process, so their id is stable
+    validator = _VALIDATORS.get(id(schema))
+    if validator is None:
+        Draft4Validator.check_schema(schema)
+        validator = Draft4Validator(schema, format_checker=draft4_format_checker)
+        _VALIDATORS[id(schema)] = validator
+    return validator
+
+
+def check(body, schema):
+    """Ensure some input conforms to a JSON schema
+
+    :Returns: String - an error message; an empty string means the input is OK
+
+    :param body: The input to check
+    :type body: Object
+
+    :param schema: The JSON schema the input must conform to
+    :type schema: Dictionary
+    """
+    try:
+        compiled(schema).validate(body)
+    except ValidationError as doh:
+        logger.error(doh)
+        return 'Input does not match schema.\nInput: {}\nSchema: {}'.format(body, schema)
+    return ''
+
+
+def validate_input(schema):
+    """Like ``vlab_api_common.validate_input``, but the schema is compiled once,
+    and the content body is decoded with ujson.
+
+    Passes the content body to the decorated function via the keyword ``body``.
+
+    :Returns: Function
+
+    :param schema: The JSON schema the content body must conform to
+    :type schema: Dictionary
+    """
+    # Compile now, while the view is being defined, instead of on a request
+    compiled(schema)
+    def real_decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            resp = {'user' : kwargs['token']['username']}
+            body = None
+            if request.is_json:
+                try:
+                    body = ujson.loads(request.get_data())
+                except ValueError:
+                    pass
+            if body is None:
+                resp['error'] = 'No JSON content body sent in HTTP request'
+                return ujson.dumps(resp), 400
+            error = check(body, schema)
+            if error:
+                resp['error'] = error
+                return ujson.dumps(resp), 400
+            kwargs['body'] = body
+            return func(*args, **kwargs)
+        return inner
+    return real_decorator
+
+
+def network_config(ip, gateway, netmask):
+    """Parse and check an IPv4 network config
+
+    The error messages match ``vlab_inf_common.input_validators.network_config_ok``.
+
+    :Returns: Tuple (Dictionary, String) - The parsed config, and an error message
+
+    :param ip: The static IP of the machine
+    :type ip: String
+
+    :param gateway: The default gateway of the subnet
+    :type gateway: String
+
+    :param netmask: The subnet mask of the network, i.e. 255.255.255.0
+    :type netmask: String
+    """
+    try:
+        # The default gateway must be within the subnet, so it defines the network
+        network = ipaddress.IPv4Network('{}/{}'.format(gateway, netmask), strict=False)
+        gateway = ipaddress.IPv4Address(gateway)
+    except ValueError:
+        return None, 'Default gateway {} not part of subnet {}'.format(gateway, netmask)
+    try:
+        ip = ipaddress.IPv4Address(ip)
+    except ValueError:
+        return None, 'Static IP {} is not a valid IPv4 address'.format(ip)
+    if ip not in network:
+        error = 'Static IP {} is not part of network {}. Adjust your netmask and/or default gateway.'.format(ip, network)
+        return None, error
+    return {'static-ip': ip, 'default-gateway': gateway, 'netmask': network.netmask, 'network': network}, ''
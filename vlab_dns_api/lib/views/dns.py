@@ -2,19 +2,27 @@
 """
 Defines the API for the DNS server service
 """
+import time
+from uuid import uuid4
+
 import ujson
 from flask import current_app
 from flask_classy import request, route, Response
 from vlab_inf_common.views import MachineView
 from vlab_inf_common.vmware import vCenter, vim
-from vlab_inf_common.input_validators import network_config_ok
-from vlab_api_common import describe, get_logger, requires, validate_input
+from vlab_api_common import describe, get_logger, requires
 
 
-from vlab_dns_api.lib import const
+from vlab_dns_api.lib import const, inventory, idempotency, owners
+from vlab_dns_api.lib.constants import SHOW_FIELDS, HOSTNAME_PATTERN
+from vlab_dns_api.lib.validation import validate_input, network_config
 
 
 logger = get_logger(__name__, loglevel=const.VLAB_DNS_LOG_LEVEL)
+# How often, in seconds, a progress stream checks on its task
+EVENTS_POLL_INTERVAL = 1
+# Proxies drop connections that are quiet for too long
+EVENTS_KEEPALIVE = 15
 
 
 class DnsView(MachineView):
@@ -27,7 +35,8 @@ class DnsView(MachineView):
                     "properties": {
                         "name": {
                             "description": "The name to give your DNS instance",
-                            "type": "string"
+                            "type": "string",
+                            "pattern": HOSTNAME_PATTERN
                         },
                         "image": {
                             "description": "The image/version of DNS to create",
@@ -54,6 +63,10 @@ class DnsView(MachineView):
                         "dns": {
                             "description": "The IPv4 address(es) of DNS servers for the host OS to use",
                             "type": "array",
+                            "items": {
+                                "type": "string",
+                                "format": "ipv4"
+                            },
                             "default": ["192.168.1.1"]
                         }
                     },
@@ -66,6 +79,11 @@ class DnsView(MachineView):
                         "name": {
                             "description": "The name of the Dns instance to destroy",
                             "type": "string"
+                        },
+                        "async": {
+                            "description": "Return once the Dns instance is out of service, and destroy it in the background",
+                            "type": "boolean",
+                            "default": False
                         }
                      },
                      "required": ["name"]
@@ -73,19 +91,151 @@ class DnsView(MachineView):
     GET_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
                   "description": "Display the Dns instances you own"
                  }
+    SHOW_FIELDS = SHOW_FIELDS
+    GET_ARGS_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                       "description": "Limit which Dns instances, and which of their properties are returned",
+                       "type": "object",
+                       "properties": {
+                            "fields": {
+                                "description": "Comma separated list of the properties to return",
+                                "type": "string",
+                                "pattern": "^({0})(,({0}))*$".format('|'.join(SHOW_FIELDS))
+                            },
+                            "page": {
+                                "description": "Which page of Dns instances to return, starting at 1",
+                                "type": "integer",
+                                "minimum": 1
+                            },
+                            "per-page": {
+                                "description": "How many Dns instances make up a page",
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": 500,
+                                "default": 25
+                            }
+                       }
+                      }
     IMAGES_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
                      "description": "View available versions of Dns that can be created"
                     }
+    METRICS_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                      "description": "View how the workers are getting along with vCenter"
+                     }
+    RESET_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                    "description": "Revert a Dns instance to how it was right after it was created",
+                    "type": "object",
+                    "properties": {
+                        "name": {
+                            "description": "The name of the Dns instance to reset",
+                            "type": "string"
+                        }
+                    },
+                    "required": ["name"]
+                   }
+    NETWORK_BATCH_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                            "description": "Change the network of many Dns instances at once",
+                            "type": "object",
+                            "properties": {
+                                "changes": {
+                                    "description": "The Dns instances to move, and the network to move each one to",
+                                    "type": "array",
+                                    "minItems": 1,
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "name": {
+                                                "description": "The name of the Dns instance",
+                                                "type": "string"
+                                            },
+                                            "new_network": {
+                                                "description": "The name of the network to connect the Dns instance to",
+                                                "type": "string"
+                                            }
+                                        },
+                                        "required": ["name", "new_network"]
+                                    }
+                                }
+                            },
+                            "required": ["changes"]
+                           }
+    ZONE_IMPORT_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                          "description": "Replace the records of a zone on a Dns instance",
+                          "type": "object",
+                          "properties": {
+                            "name": {
+                                "description": "The name of the Dns instance",
+                                "type": "string"
+                            },
+                            "zone": {
+                                "description": "The name of the zone to import the records into",
+                                "type": "string",
+                                "default": "vlab.local"
+                            },
+                            "records": {
+                                "description": "The records the zone should contain. The SOA and NS records of the zone are kept.",
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "name": {"type": "string"},
+                                        "type": {"type": "string"},
+                                        "value": {"type": "string"},
+                                        "ttl": {"type": "integer", "minimum": 0}
+                                    },
+                                    "required": ["name", "type", "value"]
+                                }
+                            },
+                            "zone-file": {
+                                "description": "The contents of a BIND zone file; replaces the whole zone",
+                                "type": "string"
+                            }
+                          },
+                          "required": ["name"],
+                          "oneOf": [{"required": ["records"]}, {"required": ["zone-file"]}]
+                         }
+    ZONE_EXPORT_ARGS = {"$schema": "http://json-schema.org/draft-04/schema#",
+                        "description": "Obtain every record of a zone on a Dns instance",
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "description": "The name of the Dns instance",
+                                "type": "string"
+                            },
+                            "zone": {
+                                "description": "The name of the zone to export",
+                                "type": "string",
+                                "default": "vlab.local"
+                            }
+                        },
+                        "required": ["name"]
+                       }
 
 
     @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
-    @describe(post=POST_SCHEMA, delete=DELETE_SCHEMA, get=GET_SCHEMA)
+    @describe(post=POST_SCHEMA, delete=DELETE_SCHEMA, get=GET_SCHEMA, get_args=GET_ARGS_SCHEMA)
     def get(self, *args, **kwargs):
         """Display the Dns instances you own"""
         username = kwargs['token']['username']
         resp_data = {'user' : username}
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
-        task = current_app.celery_app.send_task('dns.show', [username, txn_id])
+        try:
+            show_kwargs = show_args(request.args)
+        except ValueError as doh:
+            resp_data['error'] = '{}'.format(doh)
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 400
+            return resp
+        if wants_profile(request.headers.get('X-Profile')):
+            show_kwargs['profile'] = True
+        # A client sends the ETag from the result of its last listing, and gets a
+        # 304 instead of a new task while that listing is still current
+        etag = inventory.etag(username, inventory.version(username), show_kwargs)
+        if etag and request.if_none_match.contains_weak(etag) and not show_kwargs.get('profile'):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+        # Older workers don't accept the kwargs, so only send them when needed
+        task = send_task(current_app.celery_app, username, 'dns.show', [username, txn_id], kwargs=show_kwargs or None)
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
@@ -102,30 +252,51 @@ class DnsView(MachineView):
         body = kwargs['body']
         machine_name = body['name']
         image = body['image']
-        static_ip = body['static-ip']
-        default_gateway = body.get('default-gateway', '192.168.1.1')
-        netmask = body.get('netmask', '255.255.255.0')
         dns = body.get('dns', ['192.168.1.1'])
         network = '{}_{}'.format(username, body['network'])
-        bad_network_config = network_config_ok(static_ip, default_gateway, netmask)
+        config, bad_network_config = network_config(body['static-ip'],
+                                                     body.get('default-gateway', '192.168.1.1'),
+                                                     body.get('netmask', '255.255.255.0'))
         if bad_network_config:
             resp_data['error'] = bad_network_config
             resp = Response(ujson.dumps(resp_data))
             resp.status_code = 400
         else:
-            task = current_app.celery_app.send_task('dns.create', [username,
-                                                                   machine_name,
-                                                                   image,
-                                                                   network,
-                                                                   static_ip,
-                                                                   default_gateway,
-                                                                   netmask,
-                                                                   dns,
-                                                                   txn_id])
-            resp_data['content'] = {'task-id': task.id}
+            # A client retrying after a timeout gets the original task, instead of
+            # deploying the same machine twice.
+            task_id = str(uuid4())
+            idempotency_key = request.headers.get('Idempotency-Key', txn_id)
+            if idempotency_key != 'noId':
+                existing = idempotency.claim(username, machine_name, idempotency_key, task_id)
+            else:
+                existing = task_id
+            if existing != task_id:
+                task_id = existing
+                logger.info('Duplicate create of {} by {}; returning task {}'.format(machine_name, username, task_id))
+            else:
+                # Older workers don't accept the kwargs, so only send them when needed
+                create_kwargs = {'profile': True} if wants_profile(request.headers.get('X-Profile')) else None
+                try:
+                    task = send_task(current_app.celery_app, username, 'dns.create', [username,
+                                                                                      machine_name,
+                                                                                      image,
+                                                                                      network,
+                                                                                      str(config['static-ip']),
+                                                                                      str(config['default-gateway']),
+                                                                                      str(config['netmask']),
+                                                                                      dns,
+                                                                                      txn_id],
+                                                                       kwargs=create_kwargs,
+                                                                       task_id=task_id)
+                except Exception:
+                    # Let the client retry with the same key
+                    idempotency.release(username, machine_name, idempotency_key, task_id)
+                    raise
+                task_id = task.id
+            resp_data['content'] = {'task-id': task_id}
             resp = Response(ujson.dumps(resp_data))
             resp.status_code = 202
-            resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+            resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
         return resp
 
     @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
@@ -136,7 +307,12 @@ class DnsView(MachineView):
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
         machine_name = kwargs['body']['name']
-        task = current_app.celery_app.send_task('dns.delete', [username, machine_name, txn_id])
+        # Older workers don't accept the kwargs, so only send them when needed
+        if kwargs['body'].get('async', False):
+            delete_kwargs = {'async_delete': True}
+        else:
+            delete_kwargs = None
+        task = send_task(current_app.celery_app, username, 'dns.delete', [username, machine_name, txn_id], kwargs=delete_kwargs)
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
@@ -151,9 +327,298 @@ class DnsView(MachineView):
         username = kwargs['token']['username']
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
-        task = current_app.celery_app.send_task('dns.image', [txn_id])
+        task = send_task(current_app.celery_app, username, 'dns.image', [txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/task/<tid>/events', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    def task_events(self, *args, **kwargs):
+        """Stream the progress of a task as Server-Sent Events, ending with its result"""
+        celery_app = current_app.celery_app
+        stream = _task_events(celery_app, kwargs['tid'], const.VLAB_DNS_EVENTS_TIMEOUT)
+        resp = Response(stream, mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        resp.headers['X-Accel-Buffering'] = 'no'
+        return resp
+
+    @route('/task/<tid>', methods=["DELETE"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    def cancel(self, *args, **kwargs):
+        """Cancel a task. A queued task never runs, and a running create stops at
+        its next phase and destroys what it created. Poll the task to see the work avoided.
+        """
+        username = kwargs['token']['username']
+        task_id = kwargs['tid']
+        resp_data = {'user' : username}
+        # Saying the task exists would tell one user about another user's work
+        if owners.owner(task_id) != username:
+            resp_data['error'] = 'No such task: {}'.format(task_id)
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 404
+            return resp
+        celery_app = current_app.celery_app
+        status = celery_app.AsyncResult(task_id).status
+        # Revoking only stops tasks that haven't started yet
+        celery_app.control.revoke(task_id)
+        celery_app.control.broadcast('dns_cancel', arguments={'task_id': task_id})
+        resp_data['content'] = {'task-id': task_id, 'status': status}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    def after_request(self, name, response):
+        """Leave event streams alone; reading the body of a stream waits for it to end"""
+        if response.mimetype == 'text/event-stream':
+            return response
+        return super(DnsView, self).after_request(name, response)
+
+    @route('/metrics', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @describe(get=METRICS_SCHEMA)
+    def metrics(self, *args, **kwargs):
+        """Show the retry, failure and circuit breaker metrics of the workers"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        task = send_task(current_app.celery_app, username, 'dns.metrics', [txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/network', methods=["PUT"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=MachineView.NETWORK_SCHEMA)
+    @describe(put=MachineView.NETWORK_SCHEMA)
+    def modify_network(self, *args, **kwargs):
+        """Change the network a Dns instance is connected to"""
+        username = kwargs['token']['username']
+        machine_name = kwargs['body']['name']
+        new_network = '{}_{}'.format(username, kwargs['body']['new_network'])
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        task = send_task(current_app.celery_app, username, 'dns.modify_network', [username, machine_name, new_network, txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/network/batch', methods=["PUT"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=NETWORK_BATCH_SCHEMA)
+    def modify_network_batch(self, *args, **kwargs):
+        """Change the network of many Dns instances at once"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        changes = {}
+        for change in kwargs['body']['changes']:
+            changes[change['name']] = '{}_{}'.format(username, change['new_network'])
+        task = send_task(current_app.celery_app, username, 'dns.modify_network_batch', [username, changes, txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/reset', methods=["POST"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=RESET_SCHEMA)
+    def reset(self, *args, **kwargs):
+        """Revert a Dns instance to how it was right after it was created"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        machine_name = kwargs['body']['name']
+        task = send_task(current_app.celery_app, username, 'dns.reset', [username, machine_name, txn_id])
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
         resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
         return resp
+
+    @route('/zone', methods=["POST"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=ZONE_IMPORT_SCHEMA)
+    def zone_import(self, *args, **kwargs):
+        """Replace the records of a zone on a Dns instance"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        body = kwargs['body']
+        task = send_task(current_app.celery_app, username, 'dns.import_zone', [username,
+                                                                               body['name'],
+                                                                               body.get('zone', 'vlab.local'),
+                                                                               body.get('records', None),
+                                                                               body.get('zone-file', None),
+                                                                               txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/zone', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @describe(get_args=ZONE_EXPORT_ARGS, post=ZONE_IMPORT_SCHEMA)
+    def zone_export(self, *args, **kwargs):
+        """Obtain every record of a zone on a Dns instance"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        machine_name = request.args.get('name', None)
+        if machine_name is None:
+            resp_data['error'] = 'no name provided'
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 400
+            return resp
+        zone = request.args.get('zone', 'vlab.local')
+        task = send_task(current_app.celery_app, username, 'dns.export_zone', [username, machine_name, zone, txn_id])
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+
+def wants_profile(value):
+    """Decide if the ``X-Profile`` header of a request asks for the task to be profiled
+
+    :Returns: Boolean
+
+    :param value: The value of the header, or None when it wasn't sent
+    :type value: String
+    """
+    return (value or '').strip().lower() in ('1', 'true', 'yes')
+
+
+def show_args(args):
+    """Convert the query parameters of a GET into the kwargs for the ``dns.show`` task
+
+    :Returns: Dictionary
+
+    :Raises: ValueError - when a query parameter is not valid
+
+    :param args: The query parameters of the request
+    :type args: werkzeug.datastructures.MultiDict
+    """
+    show_kwargs = {}
+    fields = args.get('fields', None)
+    if fields is not None:
+        show_kwargs['fields'] = [x.strip() for x in fields.split(',') if x.strip()]
+        unknown = set(show_kwargs['fields']) - set(DnsView.SHOW_FIELDS)
+        if unknown or not show_kwargs['fields']:
+            error = 'Invalid fields: {}. Valid fields: {}'.format(fields, ', '.join(DnsView.SHOW_FIELDS))
+            raise ValueError(error)
+    if 'page' in args or 'per-page' in args:
+        try:
+            page = int(args.get('page', 1))
+            per_page = int(args.get('per-page', 25))
+        except ValueError:
+            raise ValueError('Params page and per-page must be integers')
+        if page < 1 or not (1 <= per_page <= 500):
+            raise ValueError('Param page must be at least 1, and per-page must be from 1 to 500')
+        show_kwargs['page'] = page
+        show_kwargs['per_page'] = per_page
+    return show_kwargs
+
+
+def send_task(celery_app, username, name, args, kwargs=None, task_id=None):
+    """Send a task, recording who sent it so only they can cancel it
+
+    :Returns: celery.result.AsyncResult
+
+    :param celery_app: Used to send the task
+    :type celery_app: celery.Celery
+
+    :param username: The user who sent the request
+    :type username: String
+
+    :param name: The name of the task, like "dns.show"
+    :type name: String
+
+    :param args: The positional arguments of the task
+    :type args: List
+
+    :param kwargs: The keyword arguments of the task
+    :type kwargs: Dictionary
+
+    :param task_id: Supply the id of the new task
+    :type task_id: String
+    """
+    task_id = task_id or str(uuid4())
+    # Recorded first, so the task can be cancelled as soon as it exists
+    owners.record(task_id, username)
+    return celery_app.send_task(name, args, kwargs=kwargs, task_id=task_id)
+
+
+def _task_events(celery_app, task_id, timeout):
+    """Generate the Server-Sent Events about a task's progress
+
+    :Returns: Generator
+
+    :param celery_app: Used to look up the state of the task
+    :type celery_app: celery.Celery
+
+    :param task_id: The task to report on
+    :type task_id: String
+
+    :param timeout: The most seconds to stream for
+    :type timeout: Integer
+    """
+    give_up_at = time.time() + timeout
+    last_event = None
+    last_sent = time.time()
+    while time.time() < give_up_at:
+        event, finished = task_event(celery_app.AsyncResult(task_id))
+        if finished:
+            yield event
+            return
+        elif event != last_event:
+            yield event
+            last_event = event
+            last_sent = time.time()
+        elif time.time() - last_sent >= EVENTS_KEEPALIVE:
+            yield ': keepalive\n\n'
+            last_sent = time.time()
+        time.sleep(EVENTS_POLL_INTERVAL)
+    yield sse_event('timeout', {'status': 'TIMEOUT', 'error': 'Stopped streaming after {} seconds'.format(timeout)})
+
+
+def task_event(result):
+    """Describe the state of a task as a Server-Sent Event
+
+    :Returns: Tuple (String, Boolean) - The event, and True when the task is done
+
+    :param result: The result of the task
+    :type result: celery.result.AsyncResult
+    """
+    status = result.status
+    if status == 'SUCCESS':
+        return sse_event('done', dict(result.result, status=status)), True
+    elif status in ('FAILURE', 'REVOKED'):
+        return sse_event('done', {'status': status, 'error': '{}'.format(result.result), 'content': {}}), True
+    details = result.info if isinstance(result.info, dict) else {}
+    return sse_event('progress', dict(details, status=status)), False
+
+
+def sse_event(name, data):
+    """Format a Server-Sent Event
+
+    :Returns: String
+
+    :param name: The type of event, like "progress"
+    :type name: String
+
+    :param data: The JSON body of the event
+    :type data: Dictionary
+    """
+    return 'event: {}\ndata: {}\n\n'.format(name, ujson.dumps(data))
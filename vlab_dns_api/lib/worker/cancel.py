@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+"""
+Lets the API stop a task that's already running.
+
+The API broadcasts the cancel to every worker, which records it as a file in
+``VLAB_DNS_STATE_DIR``. The process running the task checks for that file at
+each phase boundary, and raises ``Cancelled`` so the task can clean up after
+itself.
+"""
+import os
+import time
+
+from vlab_dns_api.lib import const
+
+# A task that's been cancelled for this long has certainly noticed
+CANCEL_TIMEOUT = 86400
+
+
+class Cancelled(ValueError):
+    """Raised at a phase boundary of a task that's been cancelled
+
+    :param phase: The phase the task was about to start
+    :type phase: String
+
+    :param details: The progress details of that phase
+    :type details: Dictionary
+    """
+    def __init__(self, phase, details=None):
+        super(Cancelled, self).__init__('Task cancelled before {}'.format(phase))
+        self.phase = phase
+        self.details = details or {}
+
+
+def request(task_id):
+    """Ask a running task to stop
+
+    :Returns: None
+
+    :param task_id: The task to cancel
+    :type task_id: String
+    """
+    cancel_dir = _cancel_dir()
+    open(os.path.join(cancel_dir, _safe(task_id)), 'w').close()
+    # A task that never ran never clears its cancel
+    cutoff = time.time() - CANCEL_TIMEOUT
+    for name in os.listdir(cancel_dir):
+        try:
+            if os.path.getmtime(os.path.join(cancel_dir, name)) < cutoff:
+                os.remove(os.path.join(cancel_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def requested(task_id):
+    """Check if a task has been asked to stop
+
+    :Returns: Boolean
+
+    :param task_id: The task to check
+    :type task_id: String
+    """
+    if not task_id:
+        return False
+    return os.path.exists(os.path.join(_cancel_dir(), _safe(task_id)))
+
+
+def check(task_id, phase, details=None):
+    """Stop a task if it's been asked to; call this at the start of each phase
+
+    :Returns: None
+
+    :Raises: Cancelled
+
+    :param task_id: The running task
+    :type task_id: String
+
+    :param phase: The phase about to start
+    :type phase: String
+
+    :param details: The progress details of the phase
+    :type details: Dictionary
+    """
+    if requested(task_id):
+        raise Cancelled(phase, details)
+
+
+def clear(task_id):
+    """Forget that a task was asked to stop, once it has
+
+    :Returns: None
+
+    :param task_id: The task
+    :type task_id: String
+    """
+    if not task_id:
+        return
+    try:
+        os.remove(os.path.join(_cancel_dir(), _safe(task_id)))
+    except FileNotFoundError:
+        pass
+
+
+def _safe(task_id):
+    """Keep odd characters in a task id out of the file path
+
+    :Returns: String
+
+    :param task_id: The task id
+    :type task_id: String
+    """
+    return 'task-{}'.format(''.join(x for x in task_id if x.isalnum() or x == '-'))
+
+
+def _cancel_dir():
+    """Where the cancels are recorded
+
+    :Returns: String
+    """
+    cancel_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'cancel')
+    os.makedirs(cancel_dir, exist_ok=True)
+    return cancel_dir
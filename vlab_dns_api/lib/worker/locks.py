@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+"""
+File locks that are safe to share between worker processes and threads, so they
+work with both the prefork and the threads pool.
+
+A ``flock`` only serializes separate open files, and threads of one process
+that open the same lock file would each need their own. So the threads of one
+process first queue on an in-process lock, and only the one at the front takes
+the file lock. The file lock is polled, backing off up to ``MAX_POLL`` seconds,
+while another process holds it.
+"""
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+
+# The longest to sleep between attempts to take a file lock
+MAX_POLL = 0.05
+
+# Maps the path of a lock file to [an in-process lock, how many callers want it]
+_LOCKS = {}
+_GUARD = threading.Lock()
+
+
+@contextmanager
+def held(path):
+    """Hold an exclusive lock; a lock is not reentrant
+
+    :Returns: None
+
+    :param path: The lock file, created if needed
+    :type path: String
+    """
+    with _registered(path) as in_process:
+        with in_process:
+            with open(path, 'w') as lock:
+                _flock(lock)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@contextmanager
+def attempt(path):
+    """Hold an exclusive lock, unless somebody already holds it; never waits
+
+    :Returns: Boolean - True when the lock is held by the ``with`` block
+
+    :param path: The lock file, created if needed
+    :type path: String
+    """
+    with _registered(path) as in_process:
+        if not in_process.acquire(blocking=False):
+            yield False
+            return
+        try:
+            with open(path, 'w') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    locked = False
+                else:
+                    locked = True
+                try:
+                    yield locked
+                finally:
+                    if locked:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+        finally:
+            in_process.release()
+
+
+@contextmanager
+def _registered(path):
+    """Obtain the in-process lock of a lock file, for as long as it's wanted
+
+    :Returns: threading.Lock
+
+    :param path: The lock file
+    :type path: String
+    """
+    with _GUARD:
+        entry = _LOCKS.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        yield entry[0]
+    finally:
+        with _GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                # Otherwise, every key ever locked would be kept around
+                _LOCKS.pop(path)
+
+
+def _flock(lock):
+    """Take the file lock, sleeping between attempts
+
+    :Returns: None
+
+    :param lock: The open lock file
+    :type lock: File
+    """
+    pause = 0.001
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(pause)
+            pause = min(pause * 2, MAX_POLL)
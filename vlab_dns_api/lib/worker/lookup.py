@@ -0,0 +1,184 @@
+# -*- coding: UTF-8 -*-
+"""
+Caches where commonly used objects live in vCenter.
+
+Finding an object by name means walking the inventory, but every task opens a
+new session to vCenter so the objects themselves can't be reused. Instead, the
+managed object reference (moref) is cached, and bound to the new session when
+it's needed. A cached moref is checked by reading the object's name, which
+costs a single call, and catches objects that have been deleted or renamed.
+Morefs are only unique within one vCenter, so each vCenter has its own entries.
+"""
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.cache import TTLCache
+
+FOLDER = 'folder'
+NETWORK = 'network'
+DATASTORE = 'datastore'
+DATASTORE_CLUSTER = 'datastore-cluster'
+RESOURCE_POOL = 'resource-pool'
+
+# Maps (vCenter, kind, name) to (vimtype, moid)
+_MOREFS = TTLCache(ttl=const.VLAB_DNS_MOREF_TTL)
+
+
+def folder(vcenter, name):
+    """Find a VM folder by name
+
+    :Returns: vim.Folder
+
+    :Raises: ValueError - when there's no such folder
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param name: The name of the folder, i.e. the username
+    :type name: String
+    """
+    return _lookup(vcenter, FOLDER, name, lambda: {name: vcenter.get_by_name(name=name, vimtype=vim.Folder)})
+
+
+def network(vcenter, name):
+    """Find a network by name
+
+    :Returns: vim.Network
+
+    :Raises: KeyError - when there's no such network
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param name: The name of the network
+    :type name: String
+    """
+    return _lookup(vcenter, NETWORK, name, lambda: vcenter.networks)
+
+
+def datastore(vcenter, name):
+    """Find a datastore by name
+
+    :Returns: vim.Datastore
+
+    :Raises: KeyError - when there's no such datastore
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param name: The name of the datastore
+    :type name: String
+    """
+    return _lookup(vcenter, DATASTORE, name, lambda: {x.name: x for x in vcenter.get_by_type(vim.Datastore)})
+
+
+def datastore_cluster(vcenter, name):
+    """Find a datastore cluster by name
+
+    :Returns: vim.StoragePod
+
+    :Raises: KeyError - when there's no such datastore cluster
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param name: The name of the datastore cluster
+    :type name: String
+    """
+    return _lookup(vcenter, DATASTORE_CLUSTER, name, lambda: vcenter.datastores)
+
+
+def resource_pool(vcenter, name):
+    """Find a resource pool by name
+
+    :Returns: vim.ResourcePool
+
+    :Raises: KeyError - when there's no such resource pool
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param name: The name of the resource pool, or compute cluster
+    :type name: String
+    """
+    # The pool of a compute cluster is found by the cluster's name, but is named "Resources"
+    return _lookup(vcenter, RESOURCE_POOL, name, lambda: vcenter.resource_pools, check_name=False)
+
+
+def endpoint(vcenter):
+    """Identify which vCenter server a session is logged into
+
+    :Returns: String
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    return vcenter._conn._stub.host
+
+
+def invalidate(vcenter, kind, name):
+    """Forget where an object lives
+
+    :Returns: None
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param kind: The category of object, like FOLDER
+    :type kind: String
+
+    :param name: The name of the object
+    :type name: String
+    """
+    _MOREFS.pop((endpoint(vcenter), kind, name))
+
+
+def clear():
+    """Forget where every object lives
+
+    :Returns: None
+    """
+    _MOREFS.clear()
+
+
+def _lookup(vcenter, kind, name, find, check_name=True):
+    """Bind a cached moref to the current session, or search vCenter for the object
+
+    :Returns: pyVmomi.VmomiSupport.ManagedObject
+
+    :Raises: KeyError - when there's no such object
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param kind: The category of object, like FOLDER
+    :type kind: String
+
+    :param name: The name of the object
+    :type name: String
+
+    :param find: Searches vCenter; returns a mapping of names to objects
+    :type find: Function
+
+    :param check_name: Set to False when the object isn't named what it's looked up by
+    :type check_name: Boolean
+    """
+    server = endpoint(vcenter)
+    cached = _MOREFS.get((server, kind, name))
+    if cached is not None:
+        vimtype, moid = cached
+        the_object = vimtype(moid, vcenter._conn._stub)
+        try:
+            # Reading any property proves the object still exists
+            if the_object.name == name or not check_name:
+                return the_object
+        except vmodl.fault.ManagedObjectNotFound:
+            pass
+        invalidate(vcenter, kind, name)
+    found = find()
+    # Searching often finds more than what's asked for, like every network
+    for found_name, the_object in found.items():
+        if isinstance(the_object, vim.ManagedEntity):
+            _MOREFS.set((server, kind, found_name), (type(the_object), the_object._moId))
+    return found[name]
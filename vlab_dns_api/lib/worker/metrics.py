@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+"""
+Counters, gauges and histograms about how the workers are getting along with vCenter.
+
+The values are kept in ``VLAB_DNS_STATE_DIR`` so every worker process (and
+every worker sharing that directory) adds to the same numbers. Only record
+things that happen occasionally, like a retry; every update locks and rewrites
+a file.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import ujson
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.worker import locks
+
+# The upper bounds, in seconds, of the buckets a duration is counted in
+SECONDS_BUCKETS = (1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+
+def incr(name, amount=1):
+    """Add to a counter
+
+    :Returns: None
+
+    :param name: The name of the counter, i.e. "vcenter.retries"
+    :type name: String
+
+    :param amount: How much to add
+    :type amount: Integer
+    """
+    with _update() as values:
+        values['counters'][name] = values['counters'].get(name, 0) + amount
+
+
+def gauge(name, value):
+    """Record the current value of something, like a state or a duration
+
+    :Returns: None
+
+    :param name: The name of the gauge, i.e. "breaker.state"
+    :type name: String
+
+    :param value: The current value
+    :type value: Object
+    """
+    with _update() as values:
+        values['gauges'][name] = value
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS):
+    """Count a measurement in a histogram, like how long something took
+
+    :Returns: None
+
+    :param name: The name of the histogram, i.e. "tools.seconds"
+    :type name: String
+
+    :param value: The measurement
+    :type value: Float
+
+    :param buckets: The upper bounds of the buckets, smallest first
+    :type buckets: Tuple
+    """
+    bucket = next(('{}'.format(x) for x in buckets if value <= x), '+Inf')
+    with _update() as values:
+        histogram = values['histograms'].setdefault(name, {'buckets': {}, 'count': 0, 'sum': 0, 'max': 0})
+        histogram['buckets'][bucket] = histogram['buckets'].get(bucket, 0) + 1
+        histogram['count'] += 1
+        histogram['sum'] = round(histogram['sum'] + value, 3)
+        histogram['max'] = max(histogram['max'], round(value, 3))
+
+
+def snapshot():
+    """Obtain every counter, gauge and histogram
+
+    :Returns: Dictionary
+    """
+    with _locked() as metrics_file:
+        values = _read(metrics_file)
+    values['time'] = time.time()
+    return values
+
+
+@contextmanager
+def _update():
+    """Read, modify and write the metrics while no other process can
+
+    :Returns: Dictionary
+    """
+    with _locked() as metrics_file:
+        values = _read(metrics_file)
+        yield values
+        staged = '{}.{}'.format(metrics_file, os.getpid())
+        with open(staged, 'w') as the_file:
+            the_file.write(ujson.dumps(values))
+        os.replace(staged, metrics_file)
+
+
+def _read(metrics_file):
+    """Load the metrics from disk
+
+    :Returns: Dictionary
+
+    :param metrics_file: Where the metrics are stored
+    :type metrics_file: String
+    """
+    try:
+        with open(metrics_file) as the_file:
+            values = ujson.loads(the_file.read())
+    except (OSError, ValueError):
+        values = {}
+    values.setdefault('counters', {})
+    values.setdefault('gauges', {})
+    values.setdefault('histograms', {})
+    return values
+
+
+@contextmanager
+def _locked():
+    """Serialize access to the metrics of every worker
+
+    :Returns: String - the path to the metrics file
+    """
+    metrics_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'metrics')
+    os.makedirs(metrics_dir, exist_ok=True)
+    with locks.held(os.path.join(metrics_dir, 'lock')):
+        yield os.path.join(metrics_dir, 'metrics.json')
@@ -0,0 +1,406 @@
+# -*- coding: UTF-8 -*-
+"""
+Picks the datastore and ESXi host a new Dns instance is deployed onto.
+
+Every candidate is scored by its free capacity, how many deploys are already
+using it, and how long recent deploys onto it took. The in-flight deploys and
+deploy times are tracked, per vCenter server, as files in ``VLAB_DNS_STATE_DIR``,
+so every worker sharing that directory spreads its deploys across the same hardware.
+"""
+import os
+import time
+import random
+import hashlib
+from uuid import uuid4
+from contextlib import contextmanager
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.worker import lookup, locks
+
+DATASTORE = 'datastore'
+HOST = 'host'
+# A deploy that takes this many seconds halves the score of the hardware it used
+LATENCY_REFERENCE = 120.0
+# How much the latest deploy time counts toward the average
+LATENCY_WEIGHT = 0.3
+# No deploy takes this long; a reservation this old was left behind by a dead worker
+RESERVATION_TIMEOUT = 7200
+GB = 1024 ** 3
+
+
+@contextmanager
+def place(vcenter, resource_pool):
+    """Choose where to deploy a new VM, and reserve that hardware until the deploy is done
+
+    :Returns: Tuple (vim.Datastore, vim.HostSystem)
+
+    :Raises: ValueError - when no datastore or host is usable
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param resource_pool: The resource pool the new VM will be part of
+    :type resource_pool: vim.ResourcePool
+    """
+    server = lookup.endpoint(vcenter)
+    # vCenter is asked about the hardware before taking the lock, so the lock
+    # is only held while reading the reservations and adding to them
+    datastores = _datastore_candidates(vcenter)
+    hosts = _host_candidates(resource_pool)
+    # Otherwise workers deploying at the same time would all see (and pick) the same idle hardware
+    with _locked(server):
+        datastore = _best(server, DATASTORE, datastores)
+        host = _best(server, HOST, _reaching(hosts, datastore))
+        reservations = [_reserve(server, DATASTORE, datastore.name), _reserve(server, HOST, host.name)]
+    try:
+        yield datastore, host
+    finally:
+        for reservation in reservations:
+            try:
+                os.remove(reservation)
+            except FileNotFoundError:
+                pass
+
+
+def choose_datastore(vcenter):
+    """Pick the best datastore from ``VLAB_DNS_DATASTORES``
+
+    :Returns: vim.Datastore
+
+    :Raises: ValueError - when no datastore is usable
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    return _best(lookup.endpoint(vcenter), DATASTORE, _datastore_candidates(vcenter))
+
+
+def choose_host(vcenter, resource_pool, datastore):
+    """Pick the best ESXi host that can run VMs in the resource pool, and can reach the datastore
+
+    :Returns: vim.HostSystem
+
+    :Raises: ValueError - when no host is usable
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param resource_pool: The resource pool the new VM will be part of
+    :type resource_pool: vim.ResourcePool
+
+    :param datastore: The datastore the new VM will be stored on
+    :type datastore: vim.Datastore
+    """
+    return _best(lookup.endpoint(vcenter), HOST, _reaching(_host_candidates(resource_pool), datastore))
+
+
+def free_space(vcenter):
+    """Find how much space each usable datastore has free
+
+    :Returns: Dictionary - maps the datastore name to the free bytes
+
+    :Raises: ValueError - when a datastore does not exist
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    return {x.name: x.summary.freeSpace for x in _datastores(vcenter) if _datastore_usable(x)}
+
+
+def record_latency(server, kind, name, seconds):
+    """Update the average deploy time of a datastore or host
+
+    :Returns: None
+
+    :param server: The vCenter server the datastore or host belongs to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param name: The name of the datastore or host
+    :type name: String
+
+    :param seconds: How long the deploy took
+    :type seconds: Float
+    """
+    latency_file = _state_file(server, kind, name, 'latency')
+    average = _latency(server, kind, name)
+    if average is None:
+        average = seconds
+    else:
+        average = (LATENCY_WEIGHT * seconds) + ((1 - LATENCY_WEIGHT) * average)
+    staged = '{}.{}'.format(latency_file, uuid4().hex)
+    try:
+        with open(staged, 'w') as the_file:
+            the_file.write('{}'.format(average))
+        os.replace(staged, latency_file)
+    except OSError:
+        # Scoring just gets a little less accurate
+        pass
+
+
+def inflight(server, kind, name, since=0):
+    """Count the deploys currently using a datastore or host
+
+    :Returns: Integer
+
+    :param server: The vCenter server the datastore or host belongs to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param name: The name of the datastore or host
+    :type name: String
+
+    :param since: Only count the deploys that started at, or after, this time. Default counts them all.
+    :type since: Float
+    """
+    reservation_dir = _state_file(server, kind, name, 'inflight')
+    count = 0
+    try:
+        reservations = os.listdir(reservation_dir)
+    except FileNotFoundError:
+        return count
+    now = time.time()
+    for reservation in reservations:
+        try:
+            started = os.path.getmtime(os.path.join(reservation_dir, reservation))
+        except FileNotFoundError:
+            continue
+        if now - started < RESERVATION_TIMEOUT and started >= since:
+            count += 1
+    return count
+
+
+def score(capacity, inflight, latency):
+    """Rank a datastore or host; bigger is better
+
+    :Returns: Float
+
+    :param capacity: How much free space/memory the hardware has, in GB
+    :type capacity: Float
+
+    :param inflight: How many deploys are currently using the hardware
+    :type inflight: Integer
+
+    :param latency: The average deploy time of the hardware, in seconds
+    :type latency: Float
+    """
+    return capacity / (1 + inflight) / (1 + (latency or 0) / LATENCY_REFERENCE)
+
+
+def _best(server, kind, candidates):
+    """Find the highest scoring datastore or host
+
+    :Returns: vim.Datastore or vim.HostSystem
+
+    :param server: The vCenter server the candidates belong to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param candidates: The usable datastores or hosts, and their free capacity in GB
+    :type candidates: List of Tuples
+    """
+    scored = []
+    for candidate, capacity in candidates:
+        the_score = score(capacity, inflight(server, kind, candidate.name), _latency(server, kind, candidate.name))
+        # The random number breaks ties, so identical hardware is used evenly
+        scored.append((the_score, random.random(), candidate))
+    return max(scored, key=lambda x: (x[0], x[1]))[2]
+
+
+def _datastore_candidates(vcenter):
+    """Find the usable datastores, and how much space each has free
+
+    :Returns: List of Tuples (vim.Datastore, Float)
+
+    :Raises: ValueError - when no datastore is usable
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    candidates = [(x, x.summary.freeSpace / GB) for x in _datastores(vcenter) if _datastore_usable(x)]
+    if not candidates:
+        raise ValueError('No datastore has {} GB free for a new VM'.format(const.VLAB_DNS_MIN_FREE_GB))
+    return candidates
+
+
+def _host_candidates(resource_pool):
+    """Find the hosts that can run VMs in a resource pool, how much RAM each has
+    free, and which datastores each can reach
+
+    :Returns: List of Tuples (vim.HostSystem, Float, List)
+
+    :param resource_pool: The resource pool the new VM will be part of
+    :type resource_pool: vim.ResourcePool
+    """
+    return [(x, _host_free_memory(x), x.datastore) for x in resource_pool.owner.host if _host_usable(x)]
+
+
+def _reaching(hosts, datastore):
+    """Narrow the usable hosts to those that can reach a datastore
+
+    :Returns: List of Tuples (vim.HostSystem, Float)
+
+    :Raises: ValueError - when no host can reach the datastore
+
+    :param hosts: The usable hosts; the output of ``_host_candidates``
+    :type hosts: List
+
+    :param datastore: The datastore the new VM will be stored on
+    :type datastore: vim.Datastore
+    """
+    candidates = [(host, memory) for host, memory, reachable in hosts if datastore in reachable]
+    if not candidates:
+        raise ValueError('No ESXi host is available to access datastore {}'.format(datastore.name))
+    return candidates
+
+
+def _datastores(vcenter):
+    """Find every datastore listed in ``VLAB_DNS_DATASTORES``
+
+    :Returns: List
+
+    :Raises: ValueError - when a datastore does not exist
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    found = []
+    for name in [x.strip() for x in const.VLAB_DNS_DATASTORES.split(',') if x.strip()]:
+        try:
+            found += lookup.datastore_cluster(vcenter, name).childEntity
+            continue
+        except KeyError:
+            pass
+        try:
+            found.append(lookup.datastore(vcenter, name))
+        except KeyError:
+            raise ValueError('No such datastore named {}'.format(name))
+    return found
+
+
+def _datastore_usable(datastore):
+    """Check that a new VM can be stored on a datastore
+
+    :Returns: Boolean
+
+    :param datastore: The datastore to check
+    :type datastore: vim.Datastore
+    """
+    summary = datastore.summary
+    if not summary.accessible or summary.maintenanceMode not in (None, 'normal'):
+        return False
+    return summary.freeSpace >= const.VLAB_DNS_MIN_FREE_GB * GB
+
+
+def _host_usable(host):
+    """Check that a new VM can run on a host
+
+    :Returns: Boolean
+
+    :param host: The ESXi host to check
+    :type host: vim.HostSystem
+    """
+    runtime = host.runtime
+    return not runtime.inMaintenanceMode and runtime.connectionState == 'connected'
+
+
+def _host_free_memory(host):
+    """Compute how much RAM a host has left, in GB
+
+    :Returns: Float
+
+    :param host: The ESXi host
+    :type host: vim.HostSystem
+    """
+    summary = host.summary
+    used = summary.quickStats.overallMemoryUsage or 0 # in MB
+    return max(summary.hardware.memorySize / GB - used / 1024, 0)
+
+
+def _latency(server, kind, name):
+    """Obtain the average deploy time of a datastore or host
+
+    :Returns: Float, or None if no deploy has been recorded
+
+    :param server: The vCenter server the datastore or host belongs to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param name: The name of the datastore or host
+    :type name: String
+    """
+    try:
+        with open(_state_file(server, kind, name, 'latency')) as the_file:
+            return float(the_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _reserve(server, kind, name):
+    """Record that a deploy is using a datastore or host
+
+    :Returns: String - the path of the reservation
+
+    :param server: The vCenter server the datastore or host belongs to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param name: The name of the datastore or host
+    :type name: String
+    """
+    reservation_dir = _state_file(server, kind, name, 'inflight')
+    os.makedirs(reservation_dir, exist_ok=True)
+    reservation = os.path.join(reservation_dir, uuid4().hex)
+    open(reservation, 'w').close()
+    return reservation
+
+
+@contextmanager
+def _locked(server):
+    """Serialize the placement decisions every worker makes on a vCenter server
+
+    :Returns: None
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    placement_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'placement')
+    os.makedirs(placement_dir, exist_ok=True)
+    the_hash = hashlib.sha1(server.encode()).hexdigest()
+    with locks.held(os.path.join(placement_dir, '{}.lock'.format(the_hash))):
+        yield
+
+
+def _state_file(server, kind, name, suffix):
+    """Where the placement state of a datastore or host is stored
+
+    :Returns: String
+
+    :param server: The vCenter server the datastore or host belongs to
+    :type server: String
+
+    :param kind: Either DATASTORE or HOST
+    :type kind: String
+
+    :param name: The name of the datastore or host
+    :type name: String
+
+    :param suffix: What kind of state, i.e. "latency"
+    :type suffix: String
+    """
+    # Hashing keeps odd characters in a name out of the file path. Different
+    # vCenter servers can have datastores and hosts with the same names
+    the_hash = hashlib.sha1('{}/{}/{}'.format(server, kind, name).encode()).hexdigest()
+    placement_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'placement')
+    os.makedirs(placement_dir, exist_ok=True)
+    return os.path.join(placement_dir, '{}.{}'.format(the_hash, suffix))
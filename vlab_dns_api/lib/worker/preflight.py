@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+"""
+Catches a create that's bound to fail before it uploads anything.
+
+The name, network, static IP and datastore space are checked before the OVA
+is opened, and before a datastore and host are reserved. The checks use
+indexes cached for ``VLAB_DNS_PREFLIGHT_TTL`` seconds, so they cost a few
+milliseconds instead of a walk of the user's inventory. A user's index is also
+thrown away when their inventory version changes.
+
+A cached index can only be out of date, so when it says a create would fail,
+the check is repeated with a fresh index before the create is rejected.
+"""
+import os
+import time
+
+from vlab_dns_api.lib import const, inventory
+from vlab_dns_api.lib.cache import TTLCache
+from vlab_dns_api.lib.worker import lookup, placement, metrics
+
+GB = placement.GB
+
+# Maps (username, inventory version) to the names and IPs of the user's VMs
+_INDEXES = TTLCache(ttl=const.VLAB_DNS_PREFLIGHT_TTL)
+# Maps a vCenter server to when its datastores were checked, and how many bytes each had free
+_CAPACITY = TTLCache(ttl=const.VLAB_DNS_PREFLIGHT_TTL)
+
+
+def check(vcenter, username, machine_name, image_file, network, static_ip, build_index):
+    """Make sure a new VM can be created, before doing any of the work
+
+    :Returns: vim.Network - the network to connect the new VM to
+
+    :Raises: ValueError - listing every problem found
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param username: The user creating the VM
+    :type username: String
+
+    :param machine_name: The name of the new VM
+    :type machine_name: String
+
+    :param image_file: The path to the OVA to deploy
+    :type image_file: String
+
+    :param network: The name of the network to connect the new VM to
+    :type network: String
+
+    :param static_ip: The IPv4 address to assign to the new VM
+    :type static_ip: String
+
+    :param build_index: Searches vCenter; returns the names and IPs of the user's VMs
+    :type build_index: Function
+    """
+    errors = _conflicts(username, machine_name, static_ip, build_index, fresh=False)
+    if errors:
+        errors = _conflicts(username, machine_name, static_ip, build_index, fresh=True)
+    try:
+        the_network = lookup.network(vcenter, network)
+    except KeyError:
+        the_network = None
+        errors.append('No such network named {}'.format(network))
+    errors += _room_for(vcenter, image_file)
+    if errors:
+        metrics.incr('preflight.rejected')
+        raise ValueError('; '.join(errors))
+    return the_network
+
+
+def clear():
+    """Forget every cached index
+
+    :Returns: None
+    """
+    _INDEXES.clear()
+    _CAPACITY.clear()
+
+
+def image_size(image_file):
+    """Find how much space an OVA needs on a datastore, at least
+
+    :Returns: Integer - in bytes
+
+    :Raises: ValueError - when there's no such image
+
+    :param image_file: The path to the OVA
+    :type image_file: String
+    """
+    try:
+        # Only reads the file's metadata
+        return os.path.getsize(image_file)
+    except OSError:
+        raise ValueError('No such image {}'.format(os.path.splitext(os.path.basename(image_file))[0]))
+
+
+def _conflicts(username, machine_name, static_ip, build_index, fresh):
+    """Find what about a new VM clashes with the VMs a user already has
+
+    :Returns: List - the problems found
+
+    :param username: The user creating the VM
+    :type username: String
+
+    :param machine_name: The name of the new VM
+    :type machine_name: String
+
+    :param static_ip: The IPv4 address to assign to the new VM
+    :type static_ip: String
+
+    :param build_index: Searches vCenter; returns the names and IPs of the user's VMs
+    :type build_index: Function
+
+    :param fresh: Set to True to ignore the cached index
+    :type fresh: Boolean
+    """
+    key = (username, inventory.version(username))
+    index = None if fresh else _INDEXES.get(key)
+    if index is None:
+        index = build_index()
+        _INDEXES.set(key, index)
+    errors = []
+    if machine_name in index['names']:
+        errors.append('A VM named {} already exists'.format(machine_name))
+    if static_ip in index['ips']:
+        errors.append('Static IP {} is already used by {}'.format(static_ip, index['ips'][static_ip]))
+    return errors
+
+
+def _room_for(vcenter, image_file):
+    """Check that some datastore has room for an image, and the free space every datastore must keep
+
+    :Returns: List - the problems found
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param image_file: The path to the OVA to deploy
+    :type image_file: String
+    """
+    try:
+        image = image_size(image_file)
+    except ValueError as doh:
+        return ['{}'.format(doh)]
+    needed = image + const.VLAB_DNS_MIN_FREE_GB * GB
+    server = lookup.endpoint(vcenter)
+    capacity = _CAPACITY.get(server)
+    if capacity is None or _most_free(server, capacity, image) < needed:
+        # Taken before asking vCenter, so a deploy placed meanwhile is counted against the space
+        checked_at = time.time()
+        capacity = (checked_at, placement.free_space(vcenter))
+        _CAPACITY.set(server, capacity)
+    if _most_free(server, capacity, image) < needed:
+        return ['No datastore has {:.1f} GB free for a new VM'.format(needed / GB)]
+    return []
+
+
+def _most_free(server, capacity, image):
+    """Find how much space the roomiest datastore has free, less the images of
+    the deploys placed on each datastore after its space was checked
+
+    :Returns: Integer - in bytes
+
+    :param server: The vCenter server the datastores belong to
+    :type server: String
+
+    :param capacity: When the datastores were checked, and how many bytes each had free
+    :type capacity: Tuple (Float, Dictionary)
+
+    :param image: The size of the image being deployed, in bytes
+    :type image: Integer
+    """
+    checked_at, free = capacity
+    return max((space - placement.inflight(server, placement.DATASTORE, name, since=checked_at) * image
+                for name, space in free.items()), default=0)
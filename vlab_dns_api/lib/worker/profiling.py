@@ -0,0 +1,240 @@
+# -*- coding: UTF-8 -*-
+"""
+Profiles a task on demand, to see where a slow one spent its time.
+
+A task is only profiled when the client asked for it with the ``X-Profile``
+header, or when the worker has ``VLAB_DNS_PROFILE`` set. A profiled task runs
+under cProfile, and every SOAP call it makes to vCenter is counted, with how
+long it took and how many bytes went each way. The profile is saved to
+``VLAB_DNS_PROFILE_DIR`` on the worker (read it with ``pstats`` or snakeviz),
+and a summary, saying where the file is, goes in the result of the task.
+
+Only the thread running the task is measured; work it hands to another thread
+shows up as the time spent waiting on that thread. Nothing is measured for a
+task that isn't profiled. The SOAP hooks are installed by the first profile a
+worker process runs, and from then on cost a thread-local lookup per call.
+"""
+import os
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+from pyVmomi import SoapAdapter
+
+from vlab_dns_api.lib import const
+
+# How many of the most expensive functions the summary lists
+TOP_FUNCTIONS = 15
+
+# The CPU time of the current thread; Python 3.6 only has the CPU time of the whole process
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+# The SOAP counters of the task profiled by the current thread
+_ACTIVE = threading.local()
+# Guards installing the SOAP hooks
+_GUARD = threading.Lock()
+_INSTALLED = False
+
+
+@contextmanager
+def profiled(task_name, task_id, requested=False):
+    """Profile the body of a task, when asked to
+
+    :Returns: Dictionary - the summary, filled in once the ``with`` block ends,
+              or None when the task isn't profiled
+
+    :param task_name: The name of the task, i.e. "dns.create"
+    :type task_name: String
+
+    :param task_id: The id of the running task
+    :type task_id: String
+
+    :param requested: Set to True when the client asked for a profile
+    :type requested: Boolean
+    """
+    if not (requested or const.VLAB_DNS_PROFILE):
+        yield None
+        return
+    _install()
+    summary = {}
+    soap = {'calls': 0, 'seconds': 0.0, 'sent-bytes': 0, 'received-bytes': 0, 'methods': {}}
+    profiler = cProfile.Profile()
+    wall_started, cpu_started = time.time(), _cpu_time()
+    _ACTIVE.soap = soap
+    profiler.enable()
+    try:
+        yield summary
+    finally:
+        profiler.disable()
+        _ACTIVE.soap = None
+        summary['wall-seconds'] = round(time.time() - wall_started, 3)
+        summary['cpu-seconds'] = round(_cpu_time() - cpu_started, 3)
+        soap['seconds'] = round(soap['seconds'], 3)
+        for method in soap['methods'].values():
+            method['seconds'] = round(method['seconds'], 3)
+        summary['soap'] = soap
+        summary['path'] = _save(profiler, task_name, task_id)
+        summary['top'] = _top(profiler)
+
+
+def _save(profiler, task_name, task_id):
+    """Write a profile where ``pstats`` can read it, keeping only the newest ones
+
+    :Returns: String - where the profile is, or None when it couldn't be written
+
+    :param profiler: The profile of the task
+    :type profiler: cProfile.Profile
+
+    :param task_name: The name of the task, i.e. "dns.create"
+    :type task_name: String
+
+    :param task_id: The id of the task
+    :type task_id: String
+    """
+    path = os.path.join(const.VLAB_DNS_PROFILE_DIR, '{}-{}.prof'.format(task_name, task_id))
+    try:
+        os.makedirs(const.VLAB_DNS_PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        _prune(const.VLAB_DNS_PROFILE_DIR, const.VLAB_DNS_PROFILE_KEEP)
+    except OSError:
+        # A full or read-only disk shouldn't fail the task; the summary still says a lot
+        return None
+    return path
+
+
+def _prune(profile_dir, keep):
+    """Delete all but the newest profiles
+
+    :Returns: None
+
+    :param profile_dir: Where the profiles are saved
+    :type profile_dir: String
+
+    :param keep: How many profiles to keep
+    :type keep: Integer
+    """
+    profiles = [x for x in os.scandir(profile_dir) if x.name.endswith('.prof')]
+    profiles.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+    for old in profiles[keep:]:
+        try:
+            os.remove(old.path)
+        except FileNotFoundError:
+            # Another worker sharing the directory pruned it first
+            pass
+
+
+def _top(profiler):
+    """List the functions the task spent the most time in, including what they called
+
+    :Returns: List
+
+    :param profiler: The profile of the task
+    :type profiler: cProfile.Profile
+    """
+    stats = pstats.Stats(profiler)
+    ranked = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)
+    top = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in ranked[:TOP_FUNCTIONS]:
+        top.append({'function': '{}:{}({})'.format(filename, line, function),
+                    'calls': calls,
+                    'seconds': round(own, 3),
+                    'cumulative-seconds': round(cumulative, 3)})
+    return top
+
+
+def _install():
+    """Hook the SOAP calls of pyVmomi, so a profiled task can count them
+
+    :Returns: None
+    """
+    global _INSTALLED
+    with _GUARD:
+        if _INSTALLED:
+            return
+        stub = SoapAdapter.SoapStubAdapter
+        stub.InvokeMethod = _counting_invoke(stub.InvokeMethod)
+        stub.SerializeRequest = _counting_serialize(stub.SerializeRequest)
+        deserializer = SoapAdapter.SoapResponseDeserializer
+        deserializer.Deserialize = _counting_deserialize(deserializer.Deserialize)
+        _INSTALLED = True
+
+
+def _counting_invoke(invoke):
+    """Count every SOAP call, and how long it took, by the name of the method
+
+    :Returns: Function
+
+    :param invoke: The original ``SoapStubAdapter.InvokeMethod``
+    :type invoke: Function
+    """
+    def InvokeMethod(self, mo, info, args, *more_args, **kwargs):
+        soap = getattr(_ACTIVE, 'soap', None)
+        if soap is None:
+            return invoke(self, mo, info, args, *more_args, **kwargs)
+        started = time.time()
+        try:
+            return invoke(self, mo, info, args, *more_args, **kwargs)
+        finally:
+            took = time.time() - started
+            method = soap['methods'].setdefault(info.name, {'calls': 0, 'seconds': 0.0})
+            method['calls'] += 1
+            method['seconds'] += took
+            soap['calls'] += 1
+            soap['seconds'] += took
+    return InvokeMethod
+
+
+def _counting_serialize(serialize):
+    """Count the bytes of every SOAP request
+
+    :Returns: Function
+
+    :param serialize: The original ``SoapStubAdapter.SerializeRequest``
+    :type serialize: Function
+    """
+    def SerializeRequest(self, *args, **kwargs):
+        request = serialize(self, *args, **kwargs)
+        soap = getattr(_ACTIVE, 'soap', None)
+        if soap is not None:
+            soap['sent-bytes'] += len(request)
+        return request
+    return SerializeRequest
+
+
+def _counting_deserialize(deserialize):
+    """Count the bytes of every SOAP response
+
+    :Returns: Function
+
+    :param deserialize: The original ``SoapResponseDeserializer.Deserialize``
+    :type deserialize: Function
+    """
+    def Deserialize(self, response, *args, **kwargs):
+        soap = getattr(_ACTIVE, 'soap', None)
+        if soap is not None:
+            if hasattr(response, 'read'):
+                response = _CountingReader(response, soap)
+            else:
+                soap['received-bytes'] += len(response)
+        return deserialize(self, response, *args, **kwargs)
+    return Deserialize
+
+
+class _CountingReader(object):
+    """Counts the bytes read from a SOAP response, as the XML parser reads them
+
+    :param response: The body of the response
+    :type response: http.client.HTTPResponse
+
+    :param soap: The SOAP counters of the profiled task
+    :type soap: Dictionary
+    """
+    def __init__(self, response, soap):
+        self.response = response
+        self.soap = soap
+
+    def read(self, *args):
+        data = self.response.read(*args)
+        self.soap['received-bytes'] += len(data)
+        return data
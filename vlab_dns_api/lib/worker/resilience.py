@@ -0,0 +1,337 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps the workers from making a bad day for vCenter worse.
+
+Calls that fail for a reason that might go away on its own (a dropped
+connection, a timeout, vCenter being busy) are retried with exponential
+backoff and jitter. Errors caused by the request itself, like a ``ValueError``,
+are never retried; they show vCenter is answering, so they count as a working
+call for the circuit breaker. Other errors don't count either way.
+
+When a vCenter keeps failing, its circuit breaker opens and tasks that need
+it fail fast with ``CircuitOpen`` instead of piling on. After
+``VLAB_DNS_BREAKER_COOLDOWN`` seconds a single call is let through to probe
+that vCenter; the breaker closes once that call works. Every vCenter has its
+own breaker, so one that's down doesn't fail the tasks of the users on the
+others. A call learns which vCenter it talks to when it logs in, via
+``call_on``. The breakers' state is kept in ``VLAB_DNS_STATE_DIR``, so it's
+shared by every worker process.
+"""
+import os
+import ssl
+import time
+import random
+import socket
+import hashlib
+import functools
+import threading
+import http.client
+from contextlib import contextmanager
+
+import ujson
+import requests
+from pyVmomi import vim, vmodl
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.worker import metrics, locks
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+TRANSIENT_ERRORS = (ConnectionError,
+                    TimeoutError,
+                    socket.timeout,
+                    ssl.SSLError,
+                    http.client.HTTPException,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    vmodl.fault.HostCommunication,
+                    vmodl.fault.SystemError,
+                    vim.fault.TaskInProgress,
+                    # A shared session timed out; the retry logs in again
+                    vim.fault.NotAuthenticated)
+
+_local = threading.local()
+
+
+class CircuitOpen(ValueError):
+    """Raised instead of calling vCenter while it's unhealthy"""
+    pass
+
+
+def is_transient(error):
+    """Decide if an error might go away by trying again
+
+    :Returns: Boolean
+
+    :param error: The exception raised by a call to vCenter
+    :type error: Exception
+    """
+    return isinstance(error, TRANSIENT_ERRORS) and not isinstance(error, ValueError)
+
+
+def is_answer(error):
+    """Decide if an error means vCenter answered, and rejected the request
+
+    :Returns: Boolean
+
+    :param error: The exception raised by a call to vCenter
+    :type error: Exception
+    """
+    if isinstance(error, CircuitOpen):
+        # Raised without calling vCenter
+        return False
+    return isinstance(error, (ValueError, vmodl.MethodFault)) and not is_transient(error)
+
+
+def backoff(attempt):
+    """Compute how long to wait before the next attempt, using "full jitter"
+    so the workers don't all retry at the same moment.
+
+    :Returns: Float
+
+    :param attempt: How many attempts have failed so far, minus one
+    :type attempt: Integer
+    """
+    return random.uniform(0, min(const.VLAB_DNS_RETRY_CAP, const.VLAB_DNS_RETRY_BASE * (2 ** attempt)))
+
+
+def call(func, *args, **kwargs):
+    """Call a function that talks to vCenter, retrying transient errors.
+
+    Nested calls are not retried on their own; the outermost call retries
+    the whole thing, so the number of attempts doesn't multiply. The breakers
+    of the vCenters the function talks to (via ``call_on``) are checked, and
+    updated with how the call went.
+
+    :Returns: Object - whatever the function returns
+
+    :Raises: CircuitOpen - when vCenter is unhealthy
+
+    :param func: The function to call
+    :type func: Function
+    """
+    return call_on(None, func, *args, **kwargs)
+
+
+def call_on(server, func, *args, **kwargs):
+    """Like ``call``, for a function that talks to a specific vCenter, like logging into it
+
+    Nested in another call, the outer call is told it talks to that vCenter.
+
+    :Returns: Object - whatever the function returns
+
+    :Raises: CircuitOpen - when the vCenter is unhealthy
+
+    :param server: The vCenter server the function talks to, or None if that's not known
+    :type server: String
+
+    :param func: The function to call
+    :type func: Function
+    """
+    if getattr(_local, 'active', False):
+        if server is not None:
+            _talking_to(server)
+        return func(*args, **kwargs)
+    _local.active = True
+    try:
+        return _call(server, func, args, kwargs)
+    finally:
+        _local.active = False
+
+
+def retrying(func):
+    """Decorator for functions that are safe to run more than once, like a read
+
+    :Returns: Function
+
+    :param func: The function to wrap
+    :type func: Function
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        return call(func, *args, **kwargs)
+    return inner
+
+
+def breaker_state(server):
+    """Obtain the state of the circuit breaker of a vCenter
+
+    :Returns: Dictionary
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    with _breaker(server) as state:
+        return dict(state)
+
+
+def _call(server, func, args, kwargs):
+    """Implements the retry loop of ``call_on``
+
+    :Returns: Object - whatever the function returns
+
+    :param server: The vCenter server the function talks to, or None if that's not known
+    :type server: String
+
+    :param func: The function to call
+    :type func: Function
+
+    :param args: The positional arguments for the function
+    :type args: Tuple
+
+    :param kwargs: The keyword arguments for the function
+    :type kwargs: Dictionary
+    """
+    attempts = max(const.VLAB_DNS_RETRY_ATTEMPTS, 1)
+    for attempt in range(attempts):
+        # The vCenters this attempt talked to
+        _local.servers = []
+        try:
+            if server is not None:
+                _talking_to(server)
+            result = func(*args, **kwargs)
+        except Exception as doh:
+            if not is_transient(doh):
+                if is_answer(doh):
+                    # vCenter answered; the problem is with the request
+                    for talked_to in _local.servers:
+                        _record_success(talked_to)
+                # Any other error, like a bug in the worker, says nothing about vCenter
+                raise
+            metrics.incr('vcenter.failures')
+            if [x for x in _local.servers if _record_failure(x)]:
+                # No sense waiting on a retry that'd be rejected
+                raise CircuitOpen('vCenter is unavailable: {}'.format(doh)) from doh
+            elif attempt + 1 >= attempts:
+                raise
+            metrics.incr('vcenter.retries')
+            time.sleep(backoff(attempt))
+        else:
+            for talked_to in _local.servers:
+                _record_success(talked_to)
+            return result
+
+
+def _talking_to(server):
+    """Note that the current attempt talks to a vCenter, once its breaker allows it
+
+    :Returns: None
+
+    :Raises: CircuitOpen - when the vCenter is unhealthy
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    if server not in _local.servers:
+        _allow_call(server)
+        _local.servers.append(server)
+
+
+def _allow_call(server):
+    """Check the circuit breaker before calling a vCenter
+
+    :Returns: None
+
+    :Raises: CircuitOpen - when the vCenter is unhealthy
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    now = time.time()
+    with _breaker(server) as state:
+        if state['state'] == CLOSED:
+            return
+        cooldown = const.VLAB_DNS_BREAKER_COOLDOWN
+        if state['state'] == OPEN and now - state['opened_at'] >= cooldown:
+            # This call gets to find out if vCenter is healthy again
+            _transition(server, state, HALF_OPEN)
+            state['probe_at'] = now
+            return
+        elif state['state'] == HALF_OPEN and now - state['probe_at'] >= cooldown:
+            # The last probe never reported back
+            state['probe_at'] = now
+            return
+        retry_in = max(int(cooldown - (now - state.get('probe_at', state['opened_at']))), 1)
+    metrics.incr('breaker.rejected')
+    raise CircuitOpen('vCenter {} is unavailable; try again in {} seconds'.format(server, retry_in))
+
+
+def _record_failure(server):
+    """Count a failed call, and open the breaker if the vCenter is unhealthy
+
+    :Returns: Boolean - True when the breaker is open
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    with _breaker(server) as state:
+        state['failures'] += 1
+        if state['state'] == HALF_OPEN or state['failures'] >= const.VLAB_DNS_BREAKER_THRESHOLD:
+            if state['state'] != OPEN:
+                metrics.incr('breaker.opened')
+            _transition(server, state, OPEN)
+            state['opened_at'] = time.time()
+        return state['state'] == OPEN
+
+
+def _record_success(server):
+    """Close the breaker after a call that worked
+
+    :Returns: None
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    with _breaker(server) as state:
+        state['failures'] = 0
+        _transition(server, state, CLOSED)
+
+
+def _transition(server, state, new_state):
+    """Change the state of the breaker, and report it in the metrics
+
+    :Returns: None
+
+    :param server: The vCenter server the breaker is for
+    :type server: String
+
+    :param state: The state of the breaker
+    :type state: Dictionary
+
+    :param new_state: What to change the state to
+    :type new_state: String
+    """
+    if state['state'] != new_state:
+        state['state'] = new_state
+        metrics.gauge('breaker.state.{}'.format(server), new_state)
+
+
+@contextmanager
+def _breaker(server):
+    """Read, and if needed update, the state of a vCenter's breaker while no other process can
+
+    :Returns: Dictionary
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    breaker_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'breaker')
+    os.makedirs(breaker_dir, exist_ok=True)
+    # Hashing keeps odd characters in the server name out of the file path
+    the_hash = hashlib.sha1(server.encode()).hexdigest()
+    state_file = os.path.join(breaker_dir, '{}.json'.format(the_hash))
+    with locks.held(os.path.join(breaker_dir, '{}.lock'.format(the_hash))):
+        try:
+            with open(state_file) as the_file:
+                state = ujson.loads(the_file.read())
+        except (OSError, ValueError):
+            state = {'state': CLOSED, 'failures': 0, 'opened_at': 0}
+        original = dict(state)
+        yield state
+        # Most calls work, so only write when something changed
+        if state != original:
+            staged = '{}.{}'.format(state_file, os.getpid())
+            with open(staged, 'w') as the_file:
+                the_file.write(ujson.dumps(state))
+            os.replace(staged, state_file)
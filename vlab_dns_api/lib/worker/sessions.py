@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+"""
+Lets every task a worker process runs share one session per vCenter.
+
+Logging into vCenter takes several round trips, and every session costs
+memory in the worker and in vCenter. When ``VLAB_DNS_SHARE_SESSIONS`` is set,
+a worker running many tasks at once (i.e. with the threads pool)
+logs in once per vCenter, and its tasks share that session. pyVmomi keeps a
+pool of HTTP connections per session, so the tasks don't take turns calling
+vCenter.
+
+An idle session eventually times out, so a session is checked (one call) when
+it hasn't been checked for ``VLAB_DNS_SESSION_CHECK`` seconds. A task that
+fails with ``NotAuthenticated`` throws the session away, and its retry logs in
+again. What the session caches about vCenter, like its networks, is forgotten
+every time a task borrows it.
+"""
+import time
+import threading
+
+from pyVmomi import vim
+
+from vlab_dns_api.lib import const
+
+# Maps the vCenter server to [the vCenter object, when the session was last checked]
+_SESSIONS = {}
+_GUARD = threading.Lock()
+
+
+class Shared(object):
+    """Lends a shared session to a ``with`` block, without logging out at the end
+
+    :param server: The vCenter server
+    :type server: String
+
+    :param vcenter: The logged in vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    def __init__(self, server, vcenter):
+        self.server = server
+        self.vcenter = vcenter
+
+    def __enter__(self):
+        # vCenter.networks is cached for the life of the session, which would
+        # hide networks created (or deleted) since the session was first used
+        self.vcenter._net_cache = None
+        return self.vcenter
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and issubclass(exc_type, vim.fault.NotAuthenticated):
+            discard(self.server, self.vcenter)
+        return False
+
+
+def get(server, login):
+    """Obtain the shared session to a vCenter, logging in if there isn't one
+
+    :Returns: Shared
+
+    :param server: The vCenter server
+    :type server: String
+
+    :param login: Logs into the vCenter; returns a vCenter object
+    :type login: Function
+    """
+    with _GUARD:
+        entry = _SESSIONS.get(server)
+    if entry is not None and time.time() - entry[1] >= const.VLAB_DNS_SESSION_CHECK:
+        if _expired(entry[0]):
+            discard(server, entry[0])
+            entry = None
+        else:
+            entry[1] = time.time()
+    if entry is None:
+        vcenter = login()
+        with _GUARD:
+            entry = _SESSIONS.setdefault(server, [vcenter, time.time()])
+        if entry[0] is not vcenter:
+            # Another task logged in at the same time, and won
+            vcenter.close()
+    return Shared(server, entry[0])
+
+
+def discard(server, vcenter):
+    """Stop sharing a session that no longer works
+
+    :Returns: None
+
+    :param server: The vCenter server
+    :type server: String
+
+    :param vcenter: The vCenter object of the session
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    with _GUARD:
+        # A task that logged in again already replaced the session
+        if server in _SESSIONS and _SESSIONS[server][0] is vcenter:
+            _SESSIONS.pop(server)
+
+
+def clear():
+    """Log out of, and forget, every shared session
+
+    :Returns: None
+    """
+    with _GUARD:
+        entries = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for vcenter, _ in entries:
+        try:
+            vcenter.close()
+        except Exception:
+            # It's being thrown away anyway
+            pass
+
+
+def _expired(vcenter):
+    """Check if vCenter has ended a session
+
+    :Returns: Boolean
+
+    :param vcenter: The vCenter object of the session
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    try:
+        return vcenter.content.sessionManager.currentSession is None
+    except vim.fault.NotAuthenticated:
+        return True
@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+"""
+Spreads users across the vCenter servers in ``VLAB_DNS_VCENTERS``.
+
+Every VM of a user lives on one vCenter, their shard. A user is pinned to
+their shard the first time they're seen, with a file in ``VLAB_DNS_STATE_DIR``,
+so changing the list of vCenters never moves a user away from their VMs.
+
+A user seen for the first time is looked for on every vCenter, which catches
+users that already had VMs before sharding was turned on. A user found on none
+of them is new, and is placed with weighted rendezvous hashing; a vCenter with
+twice the weight gets twice the new users. Adding a vCenter only takes new
+users from the others, and removing one only moves the users that were on it.
+"""
+import os
+import math
+import hashlib
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from vlab_dns_api.lib import const
+
+
+def parse(value):
+    """Read a list of vCenter servers, like ``vcenter1.lab=2,vcenter2.lab``
+
+    :Returns: collections.OrderedDict - maps the server to its weight
+
+    :Raises: ValueError - when a weight isn't a positive number
+
+    :param value: The comma separated servers; a weight defaults to 1
+    :type value: String
+    """
+    endpoints = OrderedDict()
+    for entry in value.split(','):
+        host, _, weight = entry.strip().partition('=')
+        if not host:
+            continue
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError('The weight of vCenter {} must be more than 0'.format(host))
+        endpoints[host] = weight
+    if not endpoints:
+        raise ValueError('No vCenter servers defined')
+    return endpoints
+
+
+ENDPOINTS = parse(const.VLAB_DNS_VCENTERS)
+
+
+def for_user(username, find=None):
+    """Pick the vCenter that holds a user's VMs
+
+    :Returns: String - the vCenter server
+
+    :Raises: Exception - whatever ``find`` raised, when a vCenter couldn't be searched
+
+    :param username: The name of the user
+    :type username: String
+
+    :param find: Called with a vCenter server; returns True when the user has VMs on it
+    :type find: Function
+    """
+    if len(ENDPOINTS) == 1:
+        return next(iter(ENDPOINTS))
+    pinned = _read_pin(username)
+    if pinned in ENDPOINTS:
+        return pinned
+    if find is not None:
+        found, errors = fan_out(find)
+        homes = [host for host in ENDPOINTS if found.get(host)]
+        if homes:
+            return _pin(username, homes[0])
+        elif errors:
+            # Picking a shard now could hide the user's VMs on the one that's down
+            raise next(iter(errors.values()))
+    return _pin(username, rendezvous(username))
+
+
+def rendezvous(username, endpoints=None):
+    """Choose a vCenter for a new user, weighted by each vCenter's capacity
+
+    :Returns: String - the vCenter server
+
+    :param username: The name of the user
+    :type username: String
+
+    :param endpoints: Maps the vCenter server to its weight. Default is ``ENDPOINTS``
+    :type endpoints: Dictionary
+    """
+    endpoints = endpoints or ENDPOINTS
+    def score(host):
+        digest = hashlib.sha1('{}/{}'.format(username, host).encode()).digest()
+        # A number between 0 and 1 (exclusive) that's the same every time
+        spot = (int.from_bytes(digest[:8], 'big') + 1) / (2 ** 64 + 2)
+        return -endpoints[host] / math.log(spot)
+    return max(endpoints, key=score)
+
+
+def fan_out(func, hosts=None):
+    """Call a function for every vCenter at the same time
+
+    :Returns: Tuple (Dictionary, Dictionary) - maps the vCenter to what the function
+              returned, and maps the vCenter to the exception the function raised
+
+    :param func: Called with a vCenter server
+    :type func: Function
+
+    :param hosts: The vCenter servers to call the function for. Default is ``ENDPOINTS``
+    :type hosts: List
+    """
+    hosts = list(hosts or ENDPOINTS)
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        futures = {host: pool.submit(func, host) for host in hosts}
+    for host, future in futures.items():
+        try:
+            results[host] = future.result()
+        except Exception as doh:
+            errors[host] = doh
+    return results, errors
+
+
+def _pin_file(username):
+    """The file recording a user's shard
+
+    :Returns: String
+
+    :param username: The name of the user
+    :type username: String
+    """
+    pin_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'shards')
+    os.makedirs(pin_dir, exist_ok=True)
+    # Hashing keeps odd characters in a username out of the file path
+    return os.path.join(pin_dir, hashlib.sha1(username.encode()).hexdigest())
+
+
+def _read_pin(username):
+    """Look up which vCenter a user was pinned to
+
+    :Returns: String, or None when the user hasn't been pinned
+
+    :param username: The name of the user
+    :type username: String
+    """
+    try:
+        with open(_pin_file(username)) as the_file:
+            return the_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _pin(username, host):
+    """Record which vCenter a user lives on
+
+    :Returns: String - the vCenter server
+
+    :param username: The name of the user
+    :type username: String
+
+    :param host: The vCenter server
+    :type host: String
+    """
+    pin_file = _pin_file(username)
+    # Not locked, so every writer needs a file of its own
+    staged = '{}.{}'.format(pin_file, uuid4().hex)
+    with open(staged, 'w') as the_file:
+        the_file.write(host)
+    os.replace(staged, pin_file)
+    return host
@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+"""
+Lets identical calls that happen at the same time share one result.
+
+The first caller (the leader) holds a lock while it does the work, and saves
+the result in ``VLAB_DNS_STATE_DIR``. Identical calls made while the leader is
+busy wait for that lock to be let go, then use the saved result instead of
+repeating the work. If the leader fails, the calls that waited all do the work
+themselves, at the same time. The lock is a file lock, so calls are shared by
+every worker process, and every thread within a worker.
+
+Saved results hold user data, so they're removed once they're ``RESULT_TTL``
+seconds old; by then, every call that waited on them has read them.
+"""
+import os
+import time
+import hashlib
+import functools
+
+import ujson
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.worker import metrics, locks
+
+# How long, in seconds, a saved result is kept for the calls that waited on it
+RESULT_TTL = 60
+# Marks a tuple in a saved result; JSON would otherwise turn it into a list
+TUPLE_KEY = '__tuple__'
+
+# When this process last swept up expired results
+_LAST_SWEEP = 0
+
+
+def do(key, func, *args, **kwargs):
+    """Call a function, unless an identical call is already in flight
+
+    :Returns: Object - whatever the function returns
+
+    :param key: Identifies calls that can share a result
+    :type key: String
+
+    :param func: The function to call
+    :type func: Function
+    """
+    started = time.time()
+    result_file = _result_file(key)
+    lock_file = '{}.lock'.format(result_file)
+    with locks.attempt(lock_file) as leading:
+        if leading:
+            value = func(*args, **kwargs)
+            _write(result_file, value)
+            return value
+    # Once the leader lets go of the lock, its result is saved, or it failed
+    with locks.held(lock_file):
+        pass
+    shared = _read(result_file)
+    # Only a result finished after this call was made is fresh enough
+    if shared is not None and shared['finished'] >= started:
+        metrics.incr('singleflight.shared')
+        return _decode(shared['value'])
+    return func(*args, **kwargs)
+
+
+def shared(func):
+    """Decorator that lets identical calls to a function share one result
+
+    :Returns: Function
+
+    :param func: The function to wrap; the arguments must be JSON serializable
+    :type func: Function
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        key = '{}.{}:{}'.format(func.__module__, func.__name__, ujson.dumps([args, kwargs], sort_keys=True))
+        return do(key, func, *args, **kwargs)
+    return inner
+
+
+def _read(result_file):
+    """Load a saved result
+
+    :Returns: Dictionary, or None if there's no usable result
+
+    :param result_file: Where the result is saved
+    :type result_file: String
+    """
+    try:
+        with open(result_file) as the_file:
+            return ujson.loads(the_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write(result_file, value):
+    """Save a result for the calls waiting on it
+
+    :Returns: None
+
+    :param result_file: Where to save the result
+    :type result_file: String
+
+    :param value: The result
+    :type value: Object
+    """
+    staged = '{}.{}'.format(result_file, os.getpid())
+    try:
+        _sweep(os.path.dirname(result_file))
+        with open(staged, 'w') as the_file:
+            the_file.write(ujson.dumps({'finished': time.time(), 'value': _encode(value)}))
+        os.replace(staged, result_file)
+    except (OSError, TypeError, OverflowError):
+        # The waiting calls will just do the work themselves
+        pass
+
+
+def _encode(value):
+    """Tag the tuples in a result, so they're still tuples once loaded
+
+    :Returns: Object
+
+    :param value: The result
+    :type value: Object
+    """
+    if isinstance(value, tuple):
+        return {TUPLE_KEY: [_encode(x) for x in value]}
+    elif isinstance(value, list):
+        return [_encode(x) for x in value]
+    elif isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value):
+    """Undo ``_encode``
+
+    :Returns: Object
+
+    :param value: A loaded result
+    :type value: Object
+    """
+    if isinstance(value, list):
+        return [_decode(x) for x in value]
+    elif isinstance(value, dict):
+        if list(value.keys()) == [TUPLE_KEY]:
+            return tuple(_decode(x) for x in value[TUPLE_KEY])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def _sweep(flight_dir):
+    """Remove the expired results, at most once per ``RESULT_TTL`` per process
+
+    :Returns: None
+
+    :param flight_dir: Where the results are saved
+    :type flight_dir: String
+    """
+    global _LAST_SWEEP
+    now = time.time()
+    if now - _LAST_SWEEP < RESULT_TTL:
+        return
+    _LAST_SWEEP = now
+    for entry in os.scandir(flight_dir):
+        # The lock files are kept; removing one that's held would break the lock
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            if now - entry.stat().st_mtime >= RESULT_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _result_file(key):
+    """Where the result of a call is saved
+
+    :Returns: String
+
+    :param key: Identifies calls that can share a result
+    :type key: String
+    """
+    # Hashing keeps odd characters in a key out of the file path
+    the_hash = hashlib.sha1(key.encode()).hexdigest()
+    flight_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'singleflight')
+    os.makedirs(flight_dir, exist_ok=True)
+    return os.path.join(flight_dir, '{}.json'.format(the_hash))
@@ -3,16 +3,26 @@
 Entry point logic for available backend worker tasks
 """
 from celery import Celery
+from celery.worker.control import control_command
 from vlab_api_common import get_task_logger
 
-from vlab_dns_api.lib import const
-from vlab_dns_api.lib.worker import vmware
+from vlab_dns_api.lib import const, inventory, result_store
+from vlab_dns_api.lib.worker import vmware, metrics, resilience, cancel, profiling, shards
 
-app = Celery('dns', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+# The state of a task that's reporting its progress
+PROGRESS = 'PROGRESS'
+
+app = Celery('dns', backend=result_store.backend(), broker=const.VLAB_MESSAGE_BROKER)
+app.conf.result_expires = const.VLAB_DNS_RESULT_TTL
+# Requires running "celery beat" alongside the workers
+app.conf.beat_schedule = {'dns-reap': {'task': 'dns.reap',
+                                       'schedule': const.VLAB_DNS_REAP_INTERVAL,
+                                       # A backlog of reaps is pointless; the next one picks up the slack
+                                       'options': {'expires': const.VLAB_DNS_REAP_INTERVAL}}}
 
 
 @app.task(name='dns.show', bind=True)
-def show(self, username, txn_id):
+def show(self, username, txn_id, fields=None, page=None, per_page=None, profile=False):
     """Obtain basic information about Dns
 
     :Returns: Dictionary
@@ -22,23 +32,47 @@ def show(self, username, txn_id):
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param fields: Only return these properties of each Dns instance
+    :type fields: List
+
+    :param page: Only return this page of Dns instances, starting at 1
+    :type page: Integer
+
+    :param per_page: How many Dns instances make up a page
+    :type per_page: Integer
+
+    :param profile: Set to True to profile the task, and report where the profile is saved
+    :type profile: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
-    try:
-        info = vmware.show_dns(username)
-    except ValueError as doh:
-        logger.error('Task failed: {}'.format(doh))
-        resp['error'] = '{}'.format(doh)
-    else:
-        logger.info('Task complete')
-        resp['content'] = info
+    # Read first, so a change made while listing leaves the listing with a stale ETag
+    inventory_version = inventory.version(username)
+    with profiling.profiled(self.name, self.request.id, profile) as report:
+        try:
+            if fields is None and page is None:
+                info = vmware.show_dns(username)
+            else:
+                info, total = vmware.show_dns_page(username, fields, page, per_page)
+                resp['params'] = {'fields': fields, 'page': page, 'per-page': per_page, 'total': total}
+        except ValueError as doh:
+            logger.error('Task failed: {}'.format(doh))
+            resp['error'] = '{}'.format(doh)
+        else:
+            logger.info('Task complete')
+            resp['content'] = info
+            etag = inventory.etag(username, inventory_version, {'fields': fields, 'page': page, 'per_page': per_page})
+            if etag:
+                # Sent back in If-None-Match, the API can say the listing is still current
+                resp['params']['etag'] = etag
+    _add_profile(resp, report, logger)
     return resp
 
 
 @app.task(name='dns.create', bind=True)
-def create(self, username, machine_name, image, network, static_ip, default_gateway, netmask, dns, txn_id):
+def create(self, username, machine_name, image, network, static_ip, default_gateway, netmask, dns, txn_id, profile=False):
     """Deploy a new instance of Dns
 
     :Returns: Dictionary
@@ -69,21 +103,35 @@ def create(self, username, machine_name, image, network, static_ip, default_gate
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param profile: Set to True to profile the task, and report where the profile is saved
+    :type profile: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
-    try:
-        resp['content'] = vmware.create_dns(username, machine_name, image, network, static_ip, default_gateway, netmask, dns, logger)
-    except ValueError as doh:
-        logger.error('Task failed: {}'.format(doh))
-        resp['error'] = '{}'.format(doh)
+    with profiling.profiled(self.name, self.request.id, profile) as report:
+        try:
+            resp['content'] = vmware.create_dns(username, machine_name, image, network, static_ip, default_gateway, netmask, dns, logger,
+                                                progress=_progress_reporter(self))
+        except cancel.Cancelled as doh:
+            logger.info('Task cancelled before {}'.format(doh.phase))
+            resp['error'] = '{}'.format(doh)
+            resp['content'] = {'cancelled': doh.phase, 'avoided': vmware.work_avoided(doh.phase, doh.details)}
+        except ValueError as doh:
+            logger.error('Task failed: {}'.format(doh))
+            resp['error'] = '{}'.format(doh)
+        finally:
+            # Even a failed attempt might have changed the user's inventory
+            inventory.bump(username)
+            cancel.clear(self.request.id)
+    _add_profile(resp, report, logger)
     logger.info('Task complete')
     return resp
 
 
 @app.task(name='dns.delete', bind=True)
-def delete(self, username, machine_name, txn_id):
+def delete(self, username, machine_name, txn_id, async_delete=False):
     """Destroy an instance of Dns
 
     :Returns: Dictionary
@@ -96,12 +144,75 @@ def delete(self, username, machine_name, txn_id):
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param async_delete: Set to True to return once the VM is out of service, and
+                         leave destroying it to the ``dns.reap`` task.
+    :type async_delete: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        vmware.delete_dns(username, machine_name, logger)
+        if async_delete:
+            vmware.mark_dns_deleted(username, machine_name, logger)
+        else:
+            vmware.delete_dns(username, machine_name, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        # Even a failed attempt might have changed the user's inventory
+        inventory.bump(username)
+    return resp
+
+
+@app.task(name='dns.reset', bind=True)
+def reset(self, username, machine_name, txn_id):
+    """Revert an instance of Dns to how it was right after it was created
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants to reset an instance of Dns
+    :type username: String
+
+    :param machine_name: The name of the instance of Dns
+    :type machine_name: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.reset_dns(username, machine_name, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        # The power state of the VM might have changed
+        inventory.bump(username)
+    return resp
+
+
+@app.task(name='dns.reap', bind=True)
+def reap(self, txn_id='reaper'):
+    """Destroy the instances of Dns that are pending deletion
+
+    :Returns: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.reap_dns(logger)
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
@@ -125,3 +236,218 @@ def image(self, txn_id):
     resp['content'] = {'image': vmware.list_images()}
     logger.info('Task complete')
     return resp
+
+
+@app.task(name='dns.metrics', bind=True)
+def worker_metrics(self, txn_id):
+    """Obtain the counters and gauges about how the workers are getting along with vCenter,
+    and the circuit breaker of every vCenter
+
+    :Returns: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    resp['content'] = metrics.snapshot()
+    resp['content']['breaker'] = {x: resilience.breaker_state(x) for x in shards.ENDPOINTS}
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='dns.modify_network', bind=True)
+def modify_network(self, username, machine_name, new_network, txn_id):
+    """Change the network an instance of Dns is connected to
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the instance of Dns
+    :type username: String
+
+    :param machine_name: The name of the instance of Dns
+    :type machine_name: String
+
+    :param new_network: The name of the network to connect the instance of Dns to
+    :type new_network: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        vmware.update_network(username, machine_name, new_network)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        inventory.bump(username)
+    return resp
+
+
+@app.task(name='dns.modify_network_batch', bind=True)
+def modify_network_batch(self, username, changes, txn_id):
+    """Change the network of many instances of Dns at the same time
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the instances of Dns
+    :type username: String
+
+    :param changes: Maps the name of an instance of Dns to the name of its new network
+    :type changes: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.update_network_batch(username, changes, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        if resp['content']['failed']:
+            resp['error'] = 'Unable to change the network of: {}'.format(', '.join(sorted(resp['content']['failed'].keys())))
+            logger.error('Task failed: {}'.format(resp['error']))
+        else:
+            logger.info('Task complete')
+    finally:
+        inventory.bump(username)
+    return resp
+
+
+@app.task(name='dns.import_zone', bind=True)
+def import_zone(self, username, machine_name, zone, records, zone_file, txn_id):
+    """Replace the records of a zone served by an instance of Dns
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the instance of Dns
+    :type username: String
+
+    :param machine_name: The name of the instance of Dns
+    :type machine_name: String
+
+    :param zone: The name of the zone, i.e. vlab.local
+    :type zone: String
+
+    :param records: The records the zone should contain, or None when supplying a zone file
+    :type records: List
+
+    :param zone_file: The contents of a zone file to load, or None when supplying records
+    :type zone_file: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.import_zone(username, machine_name, zone, records, zone_file, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        # Like every other change to an instance, it makes cached listings stale
+        inventory.bump(username)
+    return resp
+
+
+@app.task(name='dns.export_zone', bind=True)
+def export_zone(self, username, machine_name, zone, txn_id):
+    """Obtain every record of a zone served by an instance of Dns
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the instance of Dns
+    :type username: String
+
+    :param machine_name: The name of the instance of Dns
+    :type machine_name: String
+
+    :param zone: The name of the zone, i.e. vlab.local
+    :type zone: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DNS_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.export_zone(username, machine_name, zone)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@control_command(args=[('task_id', str)], signature='<task_id>')
+def dns_cancel(state, task_id):
+    """Record that a task was cancelled.
+
+    This is a remote control command, not a task, so every worker runs it as
+    soon as the API broadcasts it, even when every pool process is busy.
+
+    :Returns: Dictionary
+
+    :param state: The state of the worker
+    :type state: celery.worker.control.Panel
+
+    :param task_id: The task to cancel
+    :type task_id: String
+    """
+    cancel.request(task_id)
+    return {'ok': 'cancelling {}'.format(task_id)}
+
+
+def _progress_reporter(task):
+    """Make a function that publishes the progress of a task as the task's state,
+    which the API streams to clients. The function raises ``Cancelled`` once the
+    task has been cancelled.
+
+    :Returns: Function
+
+    :param task: The running task
+    :type task: celery.app.task.Task
+    """
+    def progress(phase, **details):
+        cancel.check(task.request.id, phase, details)
+        details['phase'] = phase
+        task.update_state(state=PROGRESS, meta=details)
+    return progress
+
+
+def _add_profile(resp, report, logger):
+    """Put the summary of a profiled task in its result
+
+    :Returns: None
+
+    :param resp: The result of the task
+    :type resp: Dictionary
+
+    :param report: The summary of the profile, or None when the task wasn't profiled
+    :type report: Dictionary
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    if report is None:
+        return
+    resp['params']['profile'] = report
+    logger.info('Profiled in {} seconds with {} vCenter calls; saved to {}'.format(report['wall-seconds'],
+                                                                                  report['soap']['calls'],
+                                                                                  report['path']))
@@ -0,0 +1,278 @@
+# -*- coding: UTF-8 -*-
+"""
+Waits for VMware Tools to be ready in a new VM, without polling vCenter.
+
+Guest operations (like configuring the IP) only work once VMware Tools is
+running. Instead of reading the guest info of the VM every second, a watcher
+has vCenter's property collector send it the changes to ``guest.toolsRunningStatus``,
+``guest.guestOperationsReady`` and ``guest.ipAddress``. One watcher per vCenter
+server, with a single outstanding ``WaitForUpdatesEx`` call, serves every VM the
+worker process is waiting on; a worker running many creates at once makes no
+more calls for having more of them. A watcher logs in with a session of its
+own, so it works the same whether or not the tasks share sessions, and outlives
+the sessions of the tasks using it. A watcher stops, and logs out, once no VM
+has waited on it for ``LINGER`` seconds.
+
+When the property collector can't be used, the wait falls back to polling,
+and backs off the longer the VM takes. Every time-to-ready is counted in the
+``tools.seconds`` histogram.
+"""
+import time
+import random
+import threading
+
+from pyVmomi import vim, vmodl
+from vlab_inf_common.vmware import vCenter
+
+from vlab_dns_api.lib import const
+from vlab_dns_api.lib.worker import metrics, lookup
+
+PATHS = ('guest.toolsRunningStatus', 'guest.guestOperationsReady', 'guest.ipAddress')
+# The longest one WaitForUpdatesEx call blocks, so a watcher notices when nothing is waiting
+WAIT_SECONDS = 5
+# How long, in seconds, a watcher is kept once no VM is waiting on it
+LINGER = 60
+# The shortest and longest pause between checks when polling
+MIN_POLL = 1
+MAX_POLL = 8
+
+# Maps a vCenter server to the watcher serving it
+_WATCHERS = {}
+# Guards _WATCHERS, and which VMs every watcher is following
+_GUARD = threading.Lock()
+
+
+class Pending(object):
+    """A VM waiting on VMware Tools
+
+    :param moid: The managed object id of the VM
+    :type moid: String
+    """
+    def __init__(self, moid):
+        self.moid = moid
+        self.ready = threading.Event()
+        self.guest = {}
+        self.the_filter = None
+
+
+class Watcher(object):
+    """Follows the guest state of VMs on one vCenter server, with one property collector
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    def __init__(self, server):
+        self.server = server
+        self.vcenter = _login(server)
+        try:
+            self.collector = self.vcenter.content.propertyCollector.CreatePropertyCollector()
+        except Exception:
+            self.vcenter.close()
+            raise
+        self.pending = {}
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def follow(self, the_vm, waiting):
+        """Have vCenter send the changes to the guest state of a VM
+
+        :Returns: None
+
+        :param the_vm: The VM to follow
+        :type the_vm: vim.VirtualMachine
+
+        :param waiting: The record of the VM waiting
+        :type waiting: Pending
+        """
+        spec = vmodl.query.PropertyCollector.FilterSpec()
+        spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=the_vm)]
+        spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=list(PATHS))]
+        waiting.the_filter = self.collector.CreateFilter(spec, partialUpdates=True)
+
+    def close(self):
+        """Destroy the property collector, and log out
+
+        :Returns: None
+        """
+        try:
+            self.collector.DestroyPropertyCollector()
+        except Exception:
+            # The session is gone, which takes the collector with it
+            pass
+        try:
+            self.vcenter.close()
+        except Exception:
+            pass
+
+    def _run(self):
+        """Hand out the changes vCenter sends, until no VM has waited for ``LINGER`` seconds
+
+        :Returns: None
+        """
+        version = ''
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=WAIT_SECONDS)
+        idle_since = time.time()
+        try:
+            while True:
+                with _GUARD:
+                    if self.pending:
+                        idle_since = time.time()
+                    elif time.time() - idle_since >= LINGER:
+                        self._retire()
+                        break
+                update = self.collector.WaitForUpdatesEx(version, options)
+                if update is not None:
+                    version = update.version
+                    self._apply(update)
+        except Exception as doh:
+            # The VMs waiting fall back to polling
+            with _GUARD:
+                self.error = doh
+                self._retire()
+                everyone = list(self.pending.values())
+            for waiting in everyone:
+                waiting.ready.set()
+        self.close()
+
+    def _retire(self):
+        """Stop new VMs from waiting on this watcher; call while holding ``_GUARD``
+
+        :Returns: None
+        """
+        if _WATCHERS.get(self.server) is self:
+            _WATCHERS.pop(self.server)
+
+    def _apply(self, update):
+        """Record the changes to the guest state of the VMs, and wake the ones that are ready
+
+        :Returns: None
+
+        :param update: The changes vCenter sent
+        :type update: vmodl.query.PropertyCollector.UpdateSet
+        """
+        for filter_set in update.filterSet or []:
+            for object_set in filter_set.objectSet or []:
+                with _GUARD:
+                    waiting = self.pending.get(object_set.obj._moId)
+                if waiting is None:
+                    continue
+                for change in object_set.changeSet or []:
+                    waiting.guest[change.name] = None if change.op == 'remove' else change.val
+                if waiting.guest.get('guest.guestOperationsReady'):
+                    waiting.ready.set()
+
+
+def wait_until_ready(vcenter, the_vm, timeout):
+    """Block until guest operations are possible on a VM
+
+    :Returns: Boolean - False if VMware Tools isn't ready within the timeout
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The VM to wait on
+    :type the_vm: vim.VirtualMachine
+
+    :param timeout: The most seconds to wait
+    :type timeout: Integer
+    """
+    started = time.time()
+    give_up_at = started + timeout
+    ready = _watch(vcenter, the_vm, give_up_at)
+    if ready is None:
+        metrics.incr('tools.polled')
+        ready = _poll(the_vm, give_up_at)
+    if ready:
+        metrics.observe('tools.seconds', time.time() - started)
+    else:
+        metrics.incr('tools.timeouts')
+    return ready
+
+
+def _watch(vcenter, the_vm, give_up_at):
+    """Wait on a VM with the watcher of its vCenter server
+
+    :Returns: Boolean, or None when the watcher couldn't be used
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The VM to wait on
+    :type the_vm: vim.VirtualMachine
+
+    :param give_up_at: When to stop waiting, in epoch seconds
+    :type give_up_at: Float
+    """
+    server = lookup.endpoint(vcenter)
+    waiting = Pending(the_vm._moId)
+    with _GUARD:
+        watcher = _WATCHERS.get(server)
+        if watcher is not None:
+            # Following the VM before the lock is let go keeps the watcher from stopping
+            watcher.pending[waiting.moid] = waiting
+    if watcher is None:
+        # Logging in takes a few round trips, so it's done without holding the lock
+        try:
+            new_watcher = Watcher(server)
+        except (vmodl.MethodFault, OSError):
+            return None
+        with _GUARD:
+            watcher = _WATCHERS.setdefault(server, new_watcher)
+            watcher.pending[waiting.moid] = waiting
+        if watcher is new_watcher:
+            watcher.thread.start()
+        else:
+            # Another task made a watcher at the same time, and won
+            new_watcher.close()
+    try:
+        watcher.follow(the_vm, waiting)
+        waiting.ready.wait(max(give_up_at - time.time(), 0))
+    except vmodl.MethodFault:
+        return None
+    finally:
+        with _GUARD:
+            watcher.pending.pop(waiting.moid, None)
+        if waiting.the_filter is not None:
+            try:
+                waiting.the_filter.DestroyPropertyFilter()
+            except Exception:
+                # The watcher, or its session, is already gone
+                pass
+    if waiting.guest.get('guest.guestOperationsReady'):
+        return True
+    elif watcher.error is not None:
+        return None
+    return False
+
+
+def _login(server):
+    """Log the watcher of a vCenter server into a session of its own
+
+    :Returns: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    return vCenter(host=server, user=const.INF_VCENTER_USER, password=const.INF_VCENTER_PASSWORD)
+
+
+def _poll(the_vm, give_up_at):
+    """Check on a VM until it's ready, waiting longer between checks as time goes on
+
+    :Returns: Boolean - False if VMware Tools isn't ready in time
+
+    :param the_vm: The VM to wait on
+    :type the_vm: vim.VirtualMachine
+
+    :param give_up_at: When to stop waiting, in epoch seconds
+    :type give_up_at: Float
+    """
+    pause = MIN_POLL
+    while not the_vm.guest.guestOperationsReady:
+        remaining = give_up_at - time.time()
+        if remaining <= 0:
+            return False
+        # Jitter keeps many creates from checking at the same moment
+        time.sleep(min(random.uniform(pause / 2, pause), remaining))
+        pause = min(pause * 2, MAX_POLL)
+    return True
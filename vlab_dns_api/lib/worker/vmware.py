@@ -1,13 +1,48 @@
 # -*- coding: UTF-8 -*-
 """Business logic for backend worker tasks"""
+import re
 import time
 import random
+import hashlib
+import functools
+import threading
 import os.path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import ujson
+import requests
+from pyVmomi import vmodl
 from vlab_inf_common.vmware import vCenter, Ova, vim, virtual_machine, consume_task
 
 from vlab_dns_api.lib import const
+from vlab_dns_api.lib.constants import SHOW_FIELDS, HOSTNAME_PATTERN
+from vlab_dns_api.lib.worker import zones, lookup, placement, resilience, singleflight, cancel, preflight, metrics, shards, sessions, windows, tools
+
+NAMED_CONF = '/etc/named.conf'
+FORWARD_ZONE_FILE = '/var/named/vlab.local.db'
+REVERSE_ZONE_FILE = '/var/named/vlab.local.rev'
+# No deploy takes this long; a claim this old was left behind by a dead worker
+CREATE_CLAIM_TIMEOUT = 7200
+DEFAULT_PAGE_SIZE = 25
+# The longest a batch of network changes may take
+NETWORK_TIMEOUT = 300
+# The name of the snapshot ``reset_dns`` reverts to
+SNAPSHOT_NAME = 'configured'
+# The longest the reaper waits on a batch of VMs to be destroyed
+REAP_TIMEOUT = 1800
+# How often, in seconds, the progress of uploading an OVA is reported
+DEPLOY_PROGRESS_INTERVAL = 5
+# The longest to wait on vCenter to be ready for the disks of a new VM
+LEASE_TIMEOUT = 300
+# The longest to wait on VMware Tools after powering on a new VM
+TOOLS_TIMEOUT = 600
+# The phases of ``create_dns``, in order
+CREATE_PHASES = ('preflight', 'deploying', 'powering-on', 'waiting-for-tools', 'configuring-ip', 'configuring-bind', 'snapshotting')
 
 
+@singleflight.shared
+@resilience.retrying
 def show_dns(username):
     """Obtain basic information about Dns
 
@@ -17,9 +52,8 @@ def show_dns(username):
     :type username: String
     """
     info = {}
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
         dns_vms = {}
         for vm in folder.childEntity:
             info = virtual_machine.get_info(vcenter, vm, username)
@@ -28,6 +62,65 @@ def show_dns(username):
     return dns_vms
 
 
+@singleflight.shared
+@resilience.retrying
+def show_dns_page(username, fields=None, page=None, per_page=None):
+    """Obtain select information about some of a user's Dns instances.
+
+    Only the properties needed for the requested fields are fetched from vCenter,
+    and the (comparatively expensive) console and network lookups are only done
+    for the VMs on the requested page.
+
+    :Returns: Tuple (Dictionary, Integer) - The Dns instances, and the total number
+              of Dns instances the user owns
+
+    :param username: The user requesting info about their Dns
+    :type username: String
+
+    :param fields: The names of the properties to return. Default is all of them.
+    :type fields: List
+
+    :param page: Which page of Dns instances to return, starting at 1. Default is all of them.
+    :type page: Integer
+
+    :param per_page: How many Dns instances make up a page
+    :type per_page: Integer
+    """
+    if fields is None:
+        fields = SHOW_FIELDS
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
+        paths = ['name', 'config.annotation']
+        if 'state' in fields:
+            paths.append('runtime.powerState')
+        if 'ips' in fields:
+            paths.append('guest.net')
+        found = []
+        for the_vm, props in _retrieve_properties(vcenter, folder, paths):
+            meta = _parse_meta(props.get('config.annotation', None))
+            if meta['component'] == 'Dns':
+                found.append((props['name'], the_vm, props, meta))
+        found.sort(key=lambda x: x[0])
+        total = len(found)
+        if page is not None:
+            per_page = per_page or DEFAULT_PAGE_SIZE
+            start = (page - 1) * per_page
+            found = found[start:start + per_page]
+        dns_vms = {}
+        for name, the_vm, props, meta in found:
+            if 'console' in fields or 'networks' in fields:
+                # Both require several calls to vCenter anyway
+                info = virtual_machine.get_info(vcenter, the_vm, username)
+            else:
+                info = {'meta': meta, 'moid': the_vm._moId}
+                if 'state' in fields:
+                    info['state'] = props.get('runtime.powerState', None)
+                if 'ips' in fields:
+                    info['ips'] = _guest_ips(props.get('guest.net', []))
+            dns_vms[name] = {k: v for k, v in info.items() if k in fields}
+    return dns_vms, total
+
+
 def delete_dns(username, machine_name, logger):
     """Unregister and destroy a user's Dns
 
@@ -42,9 +135,8 @@ def delete_dns(username, machine_name, logger):
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
         for entity in folder.childEntity:
             if entity.name == machine_name:
                 info = virtual_machine.get_info(vcenter, entity, username)
@@ -59,7 +151,150 @@ def delete_dns(username, machine_name, logger):
             raise ValueError('No {} named {} found'.format('dns', machine_name))
 
 
-def create_dns(username, machine_name, image, network, static_ip, default_gateway, netmask, dns, logger):
+def mark_dns_deleted(username, machine_name, logger):
+    """Take a user's Dns out of service, and leave destroying it to ``reap_dns``.
+
+    The VM is renamed (so the user can reuse the name right away), flagged in its
+    meta data and moved to the ``VLAB_DNS_TRASH_FOLDER``. Powering it off is
+    started, but not waited on.
+
+    :Returns: None
+
+    :Raises: ValueError - when the user has no Dns by that name
+
+    :param username: The user who wants to delete their Dns
+    :type username: String
+
+    :param machine_name: The name of the VM to delete
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
+        for entity in folder.childEntity:
+            if entity.name == machine_name:
+                meta = _parse_meta(entity.config.annotation if entity.config else None)
+                if meta['component'] == 'Dns':
+                    break
+        else:
+            raise ValueError('No {} named {} found'.format('dns', machine_name))
+        trash = _trash_folder(vcenter, folder)
+        meta['deleting'] = time.time()
+        meta['owner'] = username
+        # Renaming and updating the meta data in one reconfig saves a round trip
+        spec = vim.vm.ConfigSpec()
+        spec.name = '{}-{}-{}'.format(username, machine_name, entity._moId)
+        spec.annotation = ujson.dumps(meta)
+        logger.debug('marking VM for deletion')
+        consume_task(entity.ReconfigVM_Task(spec))
+        consume_task(trash.MoveIntoFolder_Task([entity]))
+        if entity.runtime.powerState == vim.VirtualMachinePowerState.poweredOn:
+            # The reaper powers it off if this fails
+            entity.PowerOffVM_Task()
+
+
+def reap_dns(logger, batch_size=None, concurrency=None):
+    """Destroy the Dns instances that are pending deletion, on every vCenter at the same time
+
+    :Returns: Dictionary
+
+    :Raises: Exception - when no vCenter could be reaped
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param batch_size: The most VMs to destroy in one go, per vCenter. Default is ``VLAB_DNS_REAP_BATCH``
+    :type batch_size: Integer
+
+    :param concurrency: The most VMs to destroy at the same time, per vCenter. Default is ``VLAB_DNS_REAP_CONCURRENCY``
+    :type concurrency: Integer
+    """
+    batch_size = batch_size or const.VLAB_DNS_REAP_BATCH
+    concurrency = concurrency or const.VLAB_DNS_REAP_CONCURRENCY
+    reaped = {'destroyed': [], 'failed': {}}
+    found, errors = shards.fan_out(functools.partial(_reap_shard, batch_size=batch_size, concurrency=concurrency))
+    if errors and not found:
+        raise next(iter(errors.values()))
+    for server, error in errors.items():
+        logger.error('Unable to reap the VMs on {}: {}'.format(server, error))
+    for result in found.values():
+        reaped['destroyed'] += result['destroyed']
+        reaped['failed'].update(result['failed'])
+    for name, error in reaped['failed'].items():
+        logger.error('Failed to destroy {}: {}'.format(name, error))
+    return reaped
+
+
+def _reap_shard(server, batch_size, concurrency):
+    """Destroy the Dns instances that are pending deletion on one vCenter
+
+    :Returns: Dictionary
+
+    :param server: The vCenter server
+    :type server: String
+
+    :param batch_size: The most VMs to destroy in one go
+    :type batch_size: Integer
+
+    :param concurrency: The most VMs to destroy at the same time
+    :type concurrency: Integer
+    """
+    reaped = {'destroyed': [], 'failed': {}}
+    with _connect_to(server) as vcenter:
+        try:
+            trash = lookup.folder(vcenter, const.VLAB_DNS_TRASH_FOLDER)
+        except ValueError:
+            # Nothing has been deleted yet
+            return reaped
+        pending = []
+        for the_vm, props in _retrieve_properties(vcenter, trash, ['name', 'config.annotation']):
+            meta = _parse_meta(props.get('config.annotation', None))
+            if meta['component'] == 'Dns' and 'deleting' in meta:
+                pending.append((meta['deleting'], props['name'], the_vm))
+        # Oldest first, so a VM can't get stuck behind newer ones
+        jobs = [(x[1], functools.partial(_destroy, x[2])) for x in sorted(pending, key=lambda x: x[0])[:batch_size]]
+        reaped['destroyed'], reaped['failed'] = _run_tasks(jobs, concurrency, REAP_TIMEOUT)
+    return reaped
+
+
+def _destroy(the_vm):
+    """Start destroying a VM
+
+    :Returns: vim.Task
+
+    :param the_vm: The VM to destroy
+    :type the_vm: vim.VirtualMachine
+    """
+    if the_vm.runtime.powerState != vim.VirtualMachinePowerState.poweredOff:
+        consume_task(the_vm.PowerOffVM_Task())
+    return the_vm.Destroy_Task()
+
+
+def _trash_folder(vcenter, user_folder):
+    """Find the folder that holds the VMs pending deletion, creating it if needed
+
+    :Returns: vim.Folder
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param user_folder: The folder of the user deleting a VM
+    :type user_folder: vim.Folder
+    """
+    try:
+        return lookup.folder(vcenter, const.VLAB_DNS_TRASH_FOLDER)
+    except ValueError:
+        pass
+    try:
+        return user_folder.parent.CreateFolder(const.VLAB_DNS_TRASH_FOLDER)
+    except vim.fault.DuplicateName:
+        # Another worker created it first
+        return lookup.folder(vcenter, const.VLAB_DNS_TRASH_FOLDER)
+
+
+def create_dns(username, machine_name, image, network, static_ip, default_gateway, netmask, dns, logger, progress=None):
     """Deploy a new instance of Dns
 
     :Returns: Dictionary
@@ -90,50 +325,674 @@ def create_dns(username, machine_name, image, network, static_ip, default_gatewa
 
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
+
+    :param progress: Called with the name of each phase of the create, and its details.
+                     Raising ``Cancelled`` stops the create, and destroys what was created.
+    :type progress: Function
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER,
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        image_name = convert_name(image)
-        logger.info(image_name)
-        ova = Ova(os.path.join(const.VLAB_DNS_IMAGES_DIR, image_name))
+    progress = progress or _ignore_progress
+    timings = {}
+    started = time.time()
+    image_file = os.path.join(const.VLAB_DNS_IMAGES_DIR, convert_name(image))
+    logger.info(image_file)
+    meta_data = {'component' : "Dns",
+                 'created' : time.time(),
+                 'version' : image,
+                 'configured' : False,
+                 'generation' : 1}
+    with _claim_create(username, machine_name), \
+         ThreadPoolExecutor(max_workers=1) as background:
+        # Parsing the OVA doesn't need vCenter, so it's done while logging in
+        opening = background.submit(_timed, timings, 'open-image', Ova, image_file)
         try:
-            network_map = vim.OvfManager.NetworkMapping()
-            network_map.name = ova.networks[0]
-            try:
-                network_map.network = vcenter.networks[network]
-            except KeyError:
-                raise ValueError('No such network named {}'.format(network))
-            the_vm = virtual_machine.deploy_from_ova(vcenter, ova, [network_map],
-                                                     username, machine_name, logger)
+            with _stage(timings, 'login'):
+                session = _connect(username)
+            with session as vcenter:
+                with _stage(timings, 'preflight'):
+                    folder = lookup.folder(vcenter, username)
+                    progress('preflight')
+                    # Reject a create that's bound to fail before it takes up a datastore and host
+                    the_network = preflight.check(vcenter, username, machine_name, image_file, network, static_ip,
+                                                  functools.partial(_user_index, vcenter, folder))
+                ova = opening.result()
+                network_map = vim.OvfManager.NetworkMapping()
+                network_map.name = ova.networks[0]
+                network_map.network = the_network
+                with _stage(timings, 'deploy'):
+                    the_vm, _ = _deploy(vcenter, ova, [network_map], username, machine_name, logger, progress,
+                                        meta_data=meta_data)
+                info = _configure(vcenter, the_vm, username, image, static_ip, default_gateway, netmask, dns,
+                                  logger, progress, background, timings)
         finally:
-            ova.close()
+            _close_image(opening)
+    _report_timings(timings, time.time() - started, logger)
+    return {the_vm.name: info}
+
+
+def _configure(vcenter, the_vm, username, image, static_ip, default_gateway, netmask, dns, logger, progress, background, timings):
+    """Set up the OS and BIND on a new Dns instance, then snapshot it
+
+    :Returns: Dictionary - the info about the new VM
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The new VM, powered on
+    :type the_vm: vim.VirtualMachine
+
+    :param username: The name of the user who owns the new VM
+    :type username: String
+
+    :param image: The image/version of Dns that was deployed
+    :type image: String
+
+    :param static_ip: The IPv4 address to assign to the VM
+    :type static_ip: String
+
+    :param default_gateway: The IPv4 address of the network gateway
+    :type default_gateway: String
+
+    :param netmask: The subnet mask of the network, i.e. 255.255.255.0
+    :type netmask: String
+
+    :param dns: A list of DNS servers to use.
+    :type dns: List
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param progress: Called with the name of each phase of the create, and its details
+    :type progress: Function
 
-        meta_data = {'component' : "Dns",
-                     'created' : time.time(),
-                     'version' : image,
-                     'configured' : False,
-                     'generation' : 1}
-        virtual_machine.set_meta(the_vm, meta_data)
+    :param background: Runs the steps that can overlap the snapshot
+    :type background: concurrent.futures.Executor
 
+    :param timings: Where to record how long each stage took
+    :type timings: Dictionary
+    """
+    try:
         if image.lower().startswith('windows'):
             vm_user, vm_password, the_os = const.VLAB_DNS_WINDOWS_ADMIN, const.VLAB_DNS_WINDOWS_PW, 'windows'
         else:
             vm_user, vm_password, the_os = const.VLAB_DNS_BIND9_ADMIN, const.VLAB_DNS_BIND9_PW, 'centos8'
-        virtual_machine.config_static_ip(vcenter,
-                                         the_vm,
-                                         static_ip,
-                                         default_gateway,
-                                         netmask,
-                                         dns,
-                                         vm_user,
-                                         vm_password,
-                                         logger,
-                                         os=the_os)
+        progress('waiting-for-tools')
+        with _stage(timings, 'waiting-for-tools'):
+            if not _wait_for_tools(vcenter, the_vm):
+                # Configuring the IP waits on VMware Tools too, and reports the error
+                logger.warning('VMware Tools not ready after {} seconds'.format(TOOLS_TIMEOUT))
+        progress('configuring-ip', ip=static_ip)
+        with _stage(timings, 'configuring-ip'):
+            if the_os == 'windows' and const.VLAB_DNS_WINDOWS_BATCHED:
+                _configure_windows(vcenter, the_vm, static_ip, default_gateway, netmask, dns, logger)
+            else:
+                virtual_machine.config_static_ip(vcenter,
+                                                 the_vm,
+                                                 static_ip,
+                                                 default_gateway,
+                                                 netmask,
+                                                 dns,
+                                                 vm_user,
+                                                 vm_password,
+                                                 logger,
+                                                 os=the_os)
         if the_os == 'centos8':
-            _finish_bind_config(vcenter, the_vm, static_ip, logger)
+            progress('configuring-bind')
+            with _stage(timings, 'configuring-bind'):
+                _finish_bind_config(vcenter, the_vm, static_ip, logger)
+        progress('snapshotting')
+    except cancel.Cancelled:
+        _destroy_partial(the_vm, logger)
+        raise
+    # The IP was just configured, so there's no need to wait on VMware Tools to report it
+    getting_info = background.submit(_timed, timings, 'get-info', virtual_machine.get_info, vcenter, the_vm, username)
+    _timed(timings, 'snapshotting', _take_snapshot, the_vm, logger)
+    info = getting_info.result()
+    # VMware Tools can still be reporting the address the VM booted with
+    info['ips'] = [static_ip]
+    return info
+
+
+def _configure_windows(vcenter, the_vm, static_ip, default_gateway, netmask, dns, logger):
+    """Configure the NIC, DNS client and DNS server role of a Windows Dns with one guest process.
+
+    How long each step took is logged, and set as the ``windows.config.seconds`` gauge.
+
+    :Returns: None
+
+    :Raises: ValueError - when any step fails
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The new VM, with VMware Tools running
+    :type the_vm: vim.VirtualMachine
+
+    :param static_ip: The IPv4 address to assign to the VM
+    :type static_ip: String
+
+    :param default_gateway: The IPv4 address of the network gateway
+    :type default_gateway: String
+
+    :param netmask: The subnet mask of the network, i.e. 255.255.255.0
+    :type netmask: String
+
+    :param dns: A list of DNS servers to use.
+    :type dns: List
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    user, password = const.VLAB_DNS_WINDOWS_ADMIN, const.VLAB_DNS_WINDOWS_PW
+    timings = {}
+    logger.info('Configuring the network and DNS server role of Windows')
+    with _stage(timings, 'upload'):
+        _upload_file(vcenter, the_vm, windows.build_script(static_ip, default_gateway, netmask, dns),
+                     windows.SCRIPT_PATH, user, password)
+    with _stage(timings, 'run'):
+        result = virtual_machine.run_command(vcenter, the_vm, windows.POWERSHELL, arguments=windows.command_args(),
+                                             user=user, password=password)
+    try:
+        with _stage(timings, 'report'):
+            steps, errors = windows.parse_result(_download_file(vcenter, the_vm, windows.RESULT_PATH, user, password))
+    except (ValueError, vmodl.MethodFault, requests.exceptions.HTTPError) as doh:
+        error = '{}'.format(getattr(doh, 'msg', None) or doh)
+        raise ValueError('Failed to configure Windows (exit code {}): {}'.format(result.exitCode, error))
+    timings.update(steps)
+    logger.info('Configured Windows: {}'.format(', '.join('{}={}'.format(k, v) for k, v in timings.items())))
+    metrics.gauge('windows.config.seconds', timings)
+    if errors or result.exitCode:
+        details = '; '.join('{}: {}'.format(k, v) for k, v in errors.items()) or 'exit code {}'.format(result.exitCode)
+        # A ValueError is reported to the user in the result of the task
+        raise ValueError('Failed to configure Windows: {}'.format(details))
+
+
+@contextmanager
+def _stage(timings, name):
+    """Record how long a stage of a create takes
+
+    :Returns: None
+
+    :param timings: Maps the name of a stage to its duration
+    :type timings: Dictionary
+
+    :param name: The name of the stage
+    :type name: String
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.time() - start, 3)
+
+
+def _timed(timings, name, func, *args, **kwargs):
+    """Call a function, and record how long it took as a stage of a create
+
+    :Returns: Object - whatever the function returns
+
+    :param timings: Maps the name of a stage to its duration
+    :type timings: Dictionary
+
+    :param name: The name of the stage
+    :type name: String
+
+    :param func: The function to call
+    :type func: Function
+    """
+    with _stage(timings, name):
+        return func(*args, **kwargs)
+
+
+def _close_image(opening):
+    """Close an OVA that was opened in the background, once it's open
+
+    :Returns: None
+
+    :param opening: The result of opening the OVA
+    :type opening: concurrent.futures.Future
+    """
+    try:
+        opening.result().close()
+    except Exception:
+        # Opening it failed; the create has already failed for that, or an earlier reason
+        pass
+
+
+def _report_timings(timings, elapsed, logger):
+    """Log how long each stage of a create took, and how much the overlapping stages saved
+
+    :Returns: None
+
+    :param timings: Maps the name of a stage to its duration
+    :type timings: Dictionary
+
+    :param elapsed: How long the whole create took, in seconds
+    :type elapsed: Float
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    overlapped = max(sum(timings.values()) - elapsed, 0)
+    stages = ', '.join('{}={}'.format(k, v) for k, v in timings.items())
+    logger.info('Created in {:.1f} seconds ({:.1f} seconds overlapped): {}'.format(elapsed, overlapped, stages))
+    metrics.gauge('create.seconds', dict(timings, total=round(elapsed, 3), overlapped=round(overlapped, 3)))
+
+
+def _deploy(vcenter, ova, network_map, username, machine_name, logger, progress=None, meta_data=None):
+    """Upload an OVA onto the datastore and ESXi host picked by the placement engine,
+    then power on the new VM.
+
+    :Returns: Tuple (vim.VirtualMachine, Dictionary) - The new VM, and where it was deployed
+
+    :Raises: ValueError - when the VM cannot be deployed
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param ova: The Ova object
+    :type ova: vlab_inf_common.vmware.ova.Ova
+
+    :param network_map: The mapping of networks defined in the OVA with what's
+                        available in vCenter.
+    :type network_map: List of vim.OvfManager.NetworkMapping
+
+    :param username: The name of the user deploying a new VM
+    :type username: String
+
+    :param machine_name: The unique name to give the new VM
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param progress: Called with the name of each phase of the deploy, and its details
+    :type progress: Function
+
+    :param meta_data: The meta data of the new VM; where it's deployed is added as "placement"
+    :type meta_data: Dictionary
+    """
+    if not re.match(HOSTNAME_PATTERN, machine_name):
+        error = 'Invalid machine name. Names can only contain characters a-z, A-Z, 0-9, periods (".") and dashes ("-"). Supplied: {}'.format(machine_name)
+        raise ValueError(error)
+    progress = progress or _ignore_progress
+    folder = lookup.folder(vcenter, username)
+    try:
+        resource_pool = lookup.resource_pool(vcenter, const.INF_VCENTER_RESORUCE_POOL)
+    except KeyError:
+        raise ValueError('No such resource pool named {}'.format(const.INF_VCENTER_RESORUCE_POOL))
+    spec_params = vim.OvfManager.CreateImportSpecParams(entityName=machine_name,
+                                                        diskProvisioning='thin',
+                                                        networkMapping=network_map)
+    with placement.place(vcenter, resource_pool) as (datastore, host):
+        logger.info('Deploying onto datastore {} via host {}'.format(datastore.name, host.name))
+        placed_on = {'datastore': datastore.name, 'host': host.name}
+        spec = vcenter.ovf_manager.CreateImportSpec(ovfDescriptor=ova.ovf,
+                                                    resourcePool=resource_pool,
+                                                    datastore=datastore,
+                                                    cisp=spec_params)
+        if spec.error:
+            raise ValueError(spec.error[0].msg)
+        if meta_data is not None:
+            # Created with its meta data, the VM doesn't need reconfiguring after the upload
+            spec.importSpec.configSpec.annotation = ujson.dumps(dict(meta_data, placement=placed_on))
+        lease = _import(resource_pool, spec.importSpec, folder, host)
+        the_vm = lease.info.entity
+        start = time.time()
+        try:
+            with _deploy_progress(ova, lease, spec.fileItem, progress):
+                ova.deploy(spec, lease, host.name)
+        finally:
+            elapsed = time.time() - start
+    logger.debug('OVA deployed in {} seconds'.format(int(elapsed)))
+    server = lookup.endpoint(vcenter)
+    placement.record_latency(server, placement.DATASTORE, datastore.name, elapsed)
+    placement.record_latency(server, placement.HOST, host.name, elapsed)
+    logger.debug("Powering on {}'s new VM {}".format(username, machine_name))
+    try:
+        progress('powering-on')
+    except cancel.Cancelled:
+        _destroy_partial(the_vm, logger)
+        raise
+    virtual_machine.power(the_vm, state='on')
+    return the_vm, placed_on
+
+
+def _import(resource_pool, import_spec, folder, host, timeout=LEASE_TIMEOUT):
+    """Start importing a new VM, and wait until its disks can be uploaded
+
+    :Returns: vim.HttpNfcLease
+
+    :Raises: ValueError - when vCenter can't import the VM
+
+    :param resource_pool: The resource pool the new VM will be part of
+    :type resource_pool: vim.ResourcePool
+
+    :param import_spec: The configuration of the new VM
+    :type import_spec: vim.ImportSpec
+
+    :param folder: The folder to store the new VM in
+    :type folder: vim.Folder
+
+    :param host: The ESXi host to upload the disks to
+    :type host: vim.HostSystem
+
+    :param timeout: The most seconds to wait on the lease
+    :type timeout: Integer
+    """
+    lease = resource_pool.ImportVApp(import_spec, folder=folder, host=host)
+    for _ in range(timeout):
+        if lease.error:
+            raise ValueError(lease.error.msg)
+        elif lease.state == 'ready':
+            return lease
+        time.sleep(1)
+    _abort_lease(lease)
+    raise ValueError('Deploy lease not usable after {} seconds'.format(timeout))
+
+
+@contextmanager
+def _deploy_progress(ova, lease, file_items, progress):
+    """Report how far along uploading the disks of an OVA is, until the upload is done.
+
+    When the report raises ``Cancelled``, the import is aborted.
+
+    :Returns: None
+
+    :Raises: Cancelled
+
+    :param ova: The Ova object being deployed
+    :type ova: vlab_inf_common.vmware.ova.Ova
+
+    :param lease: The lease of the import
+    :type lease: vim.HttpNfcLease
+
+    :param file_items: The disks being uploaded
+    :type file_items: List of vim.OvfManager.FileItem
+
+    :param progress: Called with the disk being uploaded, and the overall percent done
+    :type progress: Function
+    """
+    done = threading.Event()
+    cancelled = []
+
+    def report(percent):
+        try:
+            progress('deploying', disk=_current_disk(file_items, percent), disks=len(file_items), percent=percent)
+        except cancel.Cancelled as doh:
+            cancelled.append(doh)
+            _abort_lease(lease)
+            return False
+        return True
+
+    def keep_reporting():
+        while not done.wait(DEPLOY_PROGRESS_INTERVAL):
+            if not report(ova.deploy_progress or 0):
+                break
+
+    if not report(0):
+        raise cancelled[0]
+    # Ova.deploy blocks until every disk is uploaded, so the reporting is done by another thread
+    reporter = threading.Thread(target=keep_reporting, daemon=True)
+    reporter.start()
+    try:
+        yield
+    except Exception:
+        # Aborting the lease makes the upload fail; that's expected
+        if not cancelled:
+            raise
+    finally:
+        done.set()
+        reporter.join()
+    if cancelled:
+        raise cancelled[0]
+
+
+def _abort_lease(lease):
+    """Stop an import; vCenter throws away the partially imported VM
+
+    :Returns: None
+
+    :param lease: The lease of the import
+    :type lease: vim.HttpNfcLease
+    """
+    try:
+        lease.Abort()
+    except vmodl.MethodFault:
+        # The lease already finished, or failed
+        pass
+
+
+def _destroy_partial(the_vm, logger):
+    """Destroy the VM of a cancelled create
+
+    :Returns: None
+
+    :param the_vm: The partially created VM
+    :type the_vm: vim.VirtualMachine
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    logger.info('Create cancelled; destroying {}'.format(the_vm.name))
+    consume_task(_destroy(the_vm))
+
+
+def work_avoided(phase, details):
+    """Describe the work a cancelled create didn't have to do
+
+    :Returns: Dictionary
+
+    :param phase: The phase the create was about to start
+    :type phase: String
 
-        info = virtual_machine.get_info(vcenter, the_vm, username, ensure_ip=True)
-        return  {the_vm.name: info}
+    :param details: The progress details of that phase
+    :type details: Dictionary
+    """
+    if phase in CREATE_PHASES:
+        skipped = list(CREATE_PHASES[CREATE_PHASES.index(phase):])
+    else:
+        skipped = []
+    avoided = {'phases': skipped}
+    if phase == 'deploying':
+        avoided['upload-percent'] = 100 - details.get('percent', 0)
+        avoided['disks'] = max(details.get('disks', 0) - details.get('disk', 1) + 1, 0)
+    return avoided
+
+
+def _current_disk(file_items, percent):
+    """Work out which disk is being uploaded, from how much of the OVA has been uploaded
+
+    :Returns: Integer - starting at 1
+
+    :param file_items: The disks being uploaded
+    :type file_items: List of vim.OvfManager.FileItem
+
+    :param percent: How much of the OVA has been uploaded
+    :type percent: Integer
+    """
+    sizes = [x.size or 0 for x in file_items]
+    remaining = sum(sizes) * percent / 100.0
+    for number, size in enumerate(sizes, 1):
+        remaining -= size
+        if remaining < 0:
+            return number
+    return max(len(sizes), 1)
+
+
+def _wait_for_tools(vcenter, the_vm, timeout=TOOLS_TIMEOUT):
+    """Block until guest operations are possible on a new VM
+
+    :Returns: Boolean - False if VMware Tools isn't ready within the timeout
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The pyVmomi Virtual machine object
+    :type the_vm: vim.VirtualMachine
+
+    :param timeout: The most seconds to wait
+    :type timeout: Integer
+    """
+    return tools.wait_until_ready(vcenter, the_vm, timeout)
+
+
+def _ignore_progress(phase, **details):
+    """The default for functions that report their progress
+
+    :Returns: None
+
+    :param phase: The name of the phase
+    :type phase: String
+    """
+    pass
+
+
+def reset_dns(username, machine_name, logger):
+    """Revert a user's Dns to how it was right after it was created
+
+    :Returns: Dictionary
+
+    :Raises: ValueError - when the Dns has no snapshot to revert to
+
+    :param username: The user who owns the Dns
+    :type username: String
+
+    :param machine_name: The name of the Dns to reset
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    with _connect(username) as vcenter:
+        the_vm = _find_dns(vcenter, username, machine_name)
+        snapshot = _find_snapshot(the_vm, SNAPSHOT_NAME)
+        if snapshot is None:
+            error = 'No snapshot to reset {} to; delete and recreate it instead'.format(machine_name)
+            raise ValueError(error)
+        logger.info('Reverting to snapshot {}'.format(SNAPSHOT_NAME))
+        consume_task(snapshot.RevertToSnapshot_Task())
+        # Only a snapshot without the memory state leaves the VM powered off
+        virtual_machine.power(the_vm, state='on')
+        info = virtual_machine.get_info(vcenter, the_vm, username)
+    return {the_vm.name: info}
+
+
+def _take_snapshot(the_vm, logger):
+    """Snapshot a newly configured Dns, so it can be reset later.
+
+    The memory of the VM is included; reverting to the snapshot then doesn't
+    need to boot the OS. Failing to snapshot only means the Dns can't be reset.
+
+    :Returns: None
+
+    :param the_vm: The newly configured Dns
+    :type the_vm: vim.VirtualMachine
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    logger.info('Taking snapshot {}'.format(SNAPSHOT_NAME))
+    try:
+        consume_task(the_vm.CreateSnapshot_Task(name=SNAPSHOT_NAME,
+                                                description='State after the Dns server was configured',
+                                                memory=True,
+                                                quiesce=False))
+    except RuntimeError as doh:
+        logger.error('Unable to take snapshot: {}'.format(doh))
+
+
+def _find_snapshot(the_vm, name):
+    """Search the snapshot tree of a VM for a snapshot by name
+
+    :Returns: vim.vm.Snapshot, or None when there's no such snapshot
+
+    :param the_vm: The VM with the snapshot
+    :type the_vm: vim.VirtualMachine
+
+    :param name: The name of the snapshot
+    :type name: String
+    """
+    if the_vm.snapshot is None:
+        return None
+    pending = list(the_vm.snapshot.rootSnapshotList)
+    while pending:
+        tree = pending.pop()
+        if tree.name == name:
+            return tree.snapshot
+        pending += tree.childSnapshotList
+    return None
+
+
+def import_zone(username, machine_name, zone, records, zone_file, logger):
+    """Replace the records of a zone served by a BIND based Dns instance.
+
+    The whole zone is uploaded in a single file transfer, and only that zone is
+    reloaded by BIND.
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the Dns instance
+    :type username: String
+
+    :param machine_name: The name of the Dns instance
+    :type machine_name: String
+
+    :param zone: The name of the zone to import records into, i.e. vlab.local
+    :type zone: String
+
+    :param records: The records the zone should contain. Supply None when using ``zone_file``.
+    :type records: List
+
+    :param zone_file: The contents of a zone file to load. Supply None when using ``records``.
+    :type zone_file: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    user, password = const.VLAB_DNS_BIND9_ADMIN, const.VLAB_DNS_BIND9_PW
+    with _connect(username) as vcenter:
+        the_vm = _find_dns(vcenter, username, machine_name)
+        zone = zone.rstrip('.').lower()
+        try:
+            zone_path = zones.zone_files(_download_file(vcenter, the_vm, NAMED_CONF, user, password))[zone]
+        except KeyError:
+            raise ValueError('Dns instance {} does not serve a zone named {}'.format(machine_name, zone))
+        current = _download_file(vcenter, the_vm, zone_path, user, password)
+        new_zone, serial = zones.build_zone_file(zone, current, records=records, zone_file=zone_file)
+        staged = '/tmp/{}.import'.format(os.path.basename(zone_path))
+        logger.info('Uploading zone {} with serial {}'.format(zone, serial))
+        _upload_file(vcenter, the_vm, new_zone, staged, user, password)
+        # named-checkzone keeps a bad import from replacing the zone that's being served,
+        # and cp keeps the ownership and SELinux context of the existing zone file
+        args = "-c '/usr/sbin/named-checkzone -q {2} {0} && /bin/cp -f {0} {1} && /usr/sbin/rndc reload {2}; rc=$?; /bin/rm -f {0}; exit $rc'".format(staged, zone_path, zone)
+        logger.info('Reloading zone {}'.format(zone))
+        result = virtual_machine.run_command(vcenter, the_vm, '/bin/bash', arguments=args, user=user, password=password)
+        if result.exitCode:
+            raise ValueError('BIND rejected the new records for zone {}'.format(zone))
+    return {'zone': zone, 'serial': serial}
+
+
+@resilience.retrying
+def export_zone(username, machine_name, zone):
+    """Obtain every record of a zone via a zone transfer (AXFR) from the Dns instance
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the Dns instance
+    :type username: String
+
+    :param machine_name: The name of the Dns instance
+    :type machine_name: String
+
+    :param zone: The name of the zone to export, i.e. vlab.local
+    :type zone: String
+    """
+    with _connect(username) as vcenter:
+        the_vm = _find_dns(vcenter, username, machine_name)
+        server = the_vm.guest.ipAddress
+    if not server:
+        raise ValueError('Dns instance {} has no IP address'.format(machine_name))
+    return zones.axfr(server, zone.rstrip('.').lower())
 
 
 def list_images():
@@ -174,9 +1033,8 @@ def update_network(username, machine_name, new_network):
     :param new_network: The name of the new network to connect the VM to
     :type new_network: String
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
         for entity in folder.childEntity:
             if entity.name == machine_name:
                 info = virtual_machine.get_info(vcenter, entity, username)
@@ -188,19 +1046,332 @@ def update_network(username, machine_name, new_network):
             raise ValueError(error)
 
         try:
-            network = vcenter.networks[new_network]
+            network = lookup.network(vcenter, new_network)
         except KeyError:
-            error = 'No VM named {} found'.format(machine_name)
+            error = 'No network named {} found'.format(new_network)
             raise ValueError(error)
         else:
             virtual_machine.change_network(the_vm, network)
 
 
+def update_network_batch(username, changes, logger):
+    """Move many of a user's Dns instances to new networks at the same time
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the virtual machines
+    :type username: String
+
+    :param changes: Maps the name of a Dns instance to the name of its new network
+    :type changes: Dictionary
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    results = {'updated': [], 'failed': {}}
+    with _connect(username) as vcenter:
+        folder = lookup.folder(vcenter, username)
+        networks = {}
+        for new_network in set(changes.values()):
+            try:
+                networks[new_network] = lookup.network(vcenter, new_network)
+            except KeyError:
+                pass
+        found = {}
+        for the_vm, props in _retrieve_properties(vcenter, folder, ['name', 'config.annotation', 'config.hardware.device']):
+            if props['name'] in changes and _parse_meta(props.get('config.annotation', None))['component'] == 'Dns':
+                found[props['name']] = (the_vm, props.get('config.hardware.device', []))
+        jobs = []
+        for machine_name, new_network in sorted(changes.items()):
+            if machine_name not in found:
+                results['failed'][machine_name] = 'No VM named {} found'.format(machine_name)
+            elif new_network not in networks:
+                results['failed'][machine_name] = 'No network named {} found'.format(new_network)
+            else:
+                the_vm, devices = found[machine_name]
+                try:
+                    spec = _network_spec(devices, networks[new_network])
+                except ValueError as doh:
+                    results['failed'][machine_name] = '{}'.format(doh)
+                else:
+                    jobs.append((machine_name, functools.partial(the_vm.ReconfigVM_Task, spec)))
+        logger.info('Changing the network of {} VMs'.format(len(jobs)))
+        results['updated'], failed = _run_tasks(jobs, timeout=NETWORK_TIMEOUT)
+        results['failed'].update(failed)
+    return results
+
+
+def _network_spec(devices, network, adapter_label='Network adapter 1'):
+    """Create the config to connect a NIC of a VM to a different network
+
+    :Returns: vim.vm.ConfigSpec
+
+    :Raises: ValueError - when the VM has no such NIC
+
+    :param devices: The virtual hardware of the VM
+    :type devices: List
+
+    :param network: The new network the VM should be connected to
+    :type network: vim.dvs.DistributedVirtualPortgroup
+
+    :param adapter_label: The name of the virtual NIC to connect to the network
+    :type adapter_label: String
+    """
+    nics = [x for x in devices if x.deviceInfo.label == adapter_label]
+    if not nics:
+        raise ValueError('VM has no network adapter named {}'.format(adapter_label))
+    nicspec = vim.vm.device.VirtualDeviceSpec()
+    nicspec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+    nicspec.device = nics[0]
+    nicspec.device.wakeOnLanEnabled = True
+    port_connection = vim.dvs.PortConnection()
+    port_connection.portgroupKey = network.key
+    port_connection.switchUuid = network.config.distributedVirtualSwitch.uuid
+    nicspec.device.backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo()
+    nicspec.device.backing.port = port_connection
+    nicspec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
+    nicspec.device.connectable.startConnected = True
+    nicspec.device.connectable.allowGuestControl = True
+    nicspec.device.connectable.connected = True
+    return vim.vm.ConfigSpec(deviceChange=[nicspec])
+
+
+def _run_tasks(jobs, concurrency=None, timeout=REAP_TIMEOUT):
+    """Run many vCenter tasks, and wait for all of them to finish
+
+    :Returns: Tuple (List, Dictionary) - The names of the jobs that worked, and
+              the error of every job that failed
+
+    :param jobs: Pairs of a name, and a function that starts a vim.Task
+    :type jobs: List
+
+    :param concurrency: The most tasks to run at the same time. Default is all of them
+    :type concurrency: Integer
+
+    :param timeout: How many seconds to wait on all the tasks to finish
+    :type timeout: Integer
+    """
+    concurrency = concurrency or len(jobs)
+    pending = list(reversed(jobs))
+    running = {}
+    succeeded = []
+    failed = {}
+    deadline = time.time() + timeout
+    while pending or running:
+        while pending and len(running) < concurrency:
+            name, start = pending.pop()
+            try:
+                running[name] = start()
+            except (vmodl.MethodFault, RuntimeError) as doh:
+                failed[name] = '{}'.format(getattr(doh, 'msg', doh))
+        for name, task in list(running.items()):
+            info = task.info
+            if info.state == vim.TaskInfo.State.success:
+                succeeded.append(name)
+            elif info.state == vim.TaskInfo.State.error:
+                failed[name] = '{}'.format(info.error.msg)
+            elif time.time() > deadline:
+                failed[name] = 'Timed out after {} seconds'.format(timeout)
+            else:
+                continue
+            running.pop(name)
+        if running:
+            time.sleep(1)
+    return succeeded, failed
+
+
+def _connect(username):
+    """Log into the vCenter that holds a user's VMs, retrying if vCenter is having a bad moment
+
+    :Returns: vlab_inf_common.vmware.vcenter.vCenter
+
+    :Raises: CircuitOpen - when vCenter is unhealthy
+
+    :param username: The user whose VMs are worked on
+    :type username: String
+    """
+    return _connect_to(shards.for_user(username, functools.partial(_has_folder, username)))
+
+
+def _connect_to(server):
+    """Log into a specific vCenter, retrying if vCenter is having a bad moment.
+
+    With ``VLAB_DNS_SHARE_SESSIONS`` set, the session is shared with the other
+    tasks of the worker process, and leaving the ``with`` block doesn't log out.
+
+    :Returns: vlab_inf_common.vmware.vcenter.vCenter, or sessions.Shared
+
+    :Raises: CircuitOpen - when vCenter is unhealthy
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    login = functools.partial(vCenter, host=server, user=const.INF_VCENTER_USER, password=const.INF_VCENTER_PASSWORD)
+    if const.VLAB_DNS_SHARE_SESSIONS:
+        # Reusing a session doesn't log in, but the breaker of the vCenter still applies
+        return resilience.call_on(server, sessions.get, server, login)
+    return resilience.call_on(server, login)
+
+
+def _has_folder(username, server):
+    """Check if a vCenter has a folder for a user's VMs
+
+    :Returns: Boolean
+
+    :param username: The name of the user
+    :type username: String
+
+    :param server: The vCenter server
+    :type server: String
+    """
+    with _connect_to(server) as vcenter:
+        try:
+            lookup.folder(vcenter, username)
+        except ValueError:
+            return False
+    return True
+
+
+@contextmanager
+def _claim_create(username, machine_name):
+    """Keep the workers from deploying the same VM more than once at a time.
+
+    The claim is a file in ``VLAB_DNS_STATE_DIR``, so it works across all the
+    worker processes on a host. A VM that already exists in vCenter is caught by
+    checking the user's folder.
+
+    :Returns: None
+
+    :Raises: ValueError - when the VM is already being created
+
+    :param username: The name of the user who wants to create a new Dns
+    :type username: String
+
+    :param machine_name: The name of the new instance of Dns
+    :type machine_name: String
+    """
+    claim_dir = os.path.join(const.VLAB_DNS_STATE_DIR, 'creating')
+    os.makedirs(claim_dir, exist_ok=True)
+    # Hashing keeps odd characters in a machine name out of the file path
+    key = '{}/{}'.format(username, machine_name).encode()
+    claim = os.path.join(claim_dir, hashlib.sha1(key).hexdigest())
+    try:
+        os.close(os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            age = time.time() - os.path.getmtime(claim)
+        except FileNotFoundError:
+            # The other create just finished
+            age = CREATE_CLAIM_TIMEOUT
+        if age < CREATE_CLAIM_TIMEOUT:
+            raise ValueError('A {} named {} is already being created'.format('dns', machine_name))
+        open(claim, 'w').close()
+    try:
+        yield
+    finally:
+        try:
+            os.remove(claim)
+        except FileNotFoundError:
+            pass
+
+
+def _find_dns(vcenter, username, machine_name):
+    """Locate a user's Dns instance by name
+
+    :Returns: vim.VirtualMachine
+
+    :Raises: ValueError - when the user has no Dns instance by that name
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param username: The name of the user who owns the Dns instance
+    :type username: String
+
+    :param machine_name: The name of the Dns instance
+    :type machine_name: String
+    """
+    folder = lookup.folder(vcenter, username)
+    for entity in folder.childEntity:
+        if entity.name == machine_name:
+            info = virtual_machine.get_info(vcenter, entity, username)
+            if info['meta']['component'] == 'Dns':
+                return entity
+    raise ValueError('No {} named {} found'.format('dns', machine_name))
+
+
+@resilience.retrying
+def _download_file(vcenter, the_vm, path, user, password):
+    """Read the contents of a file within a virtual machine
+
+    :Returns: String
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The pyVmomi Virtual machine object
+    :type the_vm: vim.VirtualMachine
+
+    :param path: The absolute path to the file within the VM
+    :type path: String
+
+    :param user: The username of the account to authenticate with inside the VM
+    :type user: String
+
+    :param password: The password of the given user
+    :type password: String
+    """
+    creds = vim.vm.guest.NamePasswordAuthentication(username=user, password=password)
+    file_manager = vcenter.content.guestOperationsManager.fileManager
+    transfer = file_manager.InitiateFileTransferFromGuest(vm=the_vm, auth=creds, guestFilePath=path)
+    resp = requests.get(transfer.url, verify=False)
+    resp.raise_for_status()
+    return resp.text
+
+
+def _upload_file(vcenter, the_vm, contents, path, user, password):
+    """Write a file within a virtual machine, replacing the file if it exists
+
+    :Returns: None
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param the_vm: The pyVmomi Virtual machine object
+    :type the_vm: vim.VirtualMachine
+
+    :param contents: The data to write to the file
+    :type contents: String
+
+    :param path: The absolute path to the file within the VM
+    :type path: String
+
+    :param user: The username of the account to authenticate with inside the VM
+    :type user: String
+
+    :param password: The password of the given user
+    :type password: String
+    """
+    data = contents.encode()
+    creds = vim.vm.guest.NamePasswordAuthentication(username=user, password=password)
+    file_manager = vcenter.content.guestOperationsManager.fileManager
+    url = file_manager.InitiateFileTransferToGuest(vm=the_vm,
+                                                   auth=creds,
+                                                   guestFilePath=path,
+                                                   fileAttributes=vim.vm.guest.FileManager.FileAttributes(),
+                                                   fileSize=len(data),
+                                                   overwrite=True)
+    resp = requests.put(url, data=data, verify=False)
+    resp.raise_for_status()
+
+
 def _finish_bind_config(vcenter, the_vm, static_ip, logger):
     """The records for Bind need to be adjust for the user's specific hostname and IP
 
     :Returns: None
 
+    :Raises: ValueError - when BIND cannot load the zones
+
     :param vcenter: The vCenter object
     :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
 
@@ -213,24 +1384,120 @@ def _finish_bind_config(vcenter, the_vm, static_ip, logger):
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
     """
-    sed = '/usr/bin/sed'
-    args = "-i 's/{}/{}/g' {}"
-    forward_zone_file = '/var/named/vlab.local.db'
-    reverse_zone_file = '/var/named/vlab.local.rev'
-
-    forward_args1 = args.format('CHANGEME', static_ip, forward_zone_file)
-    forward_args2 = args.format('4\t', '5\t', forward_zone_file) # change the serial value
-    reverse_args1 = args.format('CHANGEME', static_ip, reverse_zone_file)
-    reverse_args2 = args.format('4\t', '5\t', reverse_zone_file) # change the serial value
-
-    systemctl = '/usr/bin/systemctl'
-    restart = 'restart named'
-
-    logger.info("Adjusting the Forward Lookup records for BIND")
-    virtual_machine.run_command(vcenter, the_vm, sed, arguments=forward_args1, user=const.VLAB_DNS_BIND9_ADMIN, password=const.VLAB_DNS_BIND9_PW)
-    virtual_machine.run_command(vcenter, the_vm, sed, arguments=forward_args2, user=const.VLAB_DNS_BIND9_ADMIN, password=const.VLAB_DNS_BIND9_PW)
-    logger.info("Adjusting the Reverse Lookup records for BIND")
-    virtual_machine.run_command(vcenter, the_vm, sed, arguments=reverse_args1, user=const.VLAB_DNS_BIND9_ADMIN, password=const.VLAB_DNS_BIND9_PW)
-    virtual_machine.run_command(vcenter, the_vm, sed, arguments=reverse_args2, user=const.VLAB_DNS_BIND9_ADMIN, password=const.VLAB_DNS_BIND9_PW)
-    logger.info("Restarting named service")
-    virtual_machine.run_command(vcenter, the_vm, systemctl, arguments=restart, user=const.VLAB_DNS_BIND9_ADMIN, password=const.VLAB_DNS_BIND9_PW)
+    user, password = const.VLAB_DNS_BIND9_ADMIN, const.VLAB_DNS_BIND9_PW
+    zone_names = {path: zone for zone, path in zones.zone_files(_download_file(vcenter, the_vm, NAMED_CONF, user, password)).items()}
+    commands = []
+    reloads = []
+    for zone_path in (FORWARD_ZONE_FILE, REVERSE_ZONE_FILE):
+        # Without knowing the zone name, BIND has to reload every zone
+        zone = zone_names.get(zone_path, None)
+        logger.info("Adjusting the records in {} for BIND".format(zone_path))
+        records = _download_file(vcenter, the_vm, zone_path, user, password).replace('CHANGEME', static_ip)
+        if zone is None:
+            # The serial can't be found without the zone's origin, and reloading
+            # every zone picks up the new records without a new serial
+            logger.debug('No zone in {} uses {}; leaving its serial alone'.format(NAMED_CONF, zone_path))
+        else:
+            records, serial = zones.bump_serial(records, zone)
+            logger.debug('Serial of {} is now {}'.format(zone_path, serial))
+        staged = '/tmp/{}'.format(os.path.basename(zone_path))
+        _upload_file(vcenter, the_vm, records, staged, user, password)
+        # cp keeps the ownership and SELinux context of the existing zone file
+        commands.append('/bin/cp -f {0} {1} && /bin/rm -f {0}'.format(staged, zone_path))
+        reloads.append('/usr/sbin/rndc reload {}'.format(zone or '').strip())
+    # Only fall back to restarting named when it isn't running to accept a reload
+    args = "-c '{} && ({} || /usr/bin/systemctl restart named)'".format(' && '.join(commands),
+                                                                         ' && '.join(sorted(set(reloads))))
+    logger.info("Reloading the BIND zones")
+    result = virtual_machine.run_command(vcenter, the_vm, '/bin/bash', arguments=args, user=user, password=password)
+    if result.exitCode:
+        # A ValueError is reported to the user in the result of the task
+        raise ValueError('Failed to load the zones for BIND')
+
+
+def _retrieve_properties(vcenter, folder, paths):
+    """Fetch only some properties of every VM in a folder, in a single round trip.
+
+    Reading a property off of a pyVmomi object is a call to vCenter, so reading
+    a handful of properties for every VM adds up quickly.
+
+    :Returns: Generator of Tuples (vim.VirtualMachine, Dictionary)
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param folder: The folder that contains the VMs
+    :type folder: vim.Folder
+
+    :param paths: The properties to fetch, i.e. "runtime.powerState"
+    :type paths: List
+    """
+    view = vcenter.content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], False)
+    try:
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                path='view',
+                                                                skip=False,
+                                                                type=vim.view.ContainerView)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=paths)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+        results = vcenter.content.propertyCollector.RetrieveContents([filter_spec])
+    finally:
+        view.Destroy()
+    for result in results:
+        yield result.obj, {prop.name: prop.val for prop in result.propSet}
+
+
+def _user_index(vcenter, folder):
+    """Find the names and IPs of every VM a user has, in a single round trip
+
+    :Returns: Dictionary - the set of "names", and the "ips" mapped to the VM using them
+
+    :param vcenter: The vCenter object
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param folder: The user's folder
+    :type folder: vim.Folder
+    """
+    index = {'names': set(), 'ips': {}}
+    for _, props in _retrieve_properties(vcenter, folder, ['name', 'guest.net']):
+        index['names'].add(props['name'])
+        for ip in _guest_ips(props.get('guest.net', [])):
+            index['ips'][ip] = props['name']
+    return index
+
+
+def _parse_meta(annotation):
+    """Convert the notes of a VM into the meta data vLab stores there
+
+    :Returns: Dictionary
+
+    :param annotation: The notes of the VM
+    :type annotation: String
+    """
+    try:
+        return ujson.loads(annotation)
+    except (ValueError, TypeError):
+        # ValueError -> VM created, but notes not updated
+        # TypeError  -> VM failed to be created or is being deployed; notes are None
+        return {'component': 'Unknown',
+                'created': 0,
+                'version': "Unknown",
+                'generation': 0,
+                'configured': False
+                }
+
+
+def _guest_ips(nics):
+    """Obtain the IPs assigned to the NICs of a VM
+
+    :Returns: List
+
+    :param nics: The guest.net property of a VM
+    :type nics: List
+    """
+    ips = []
+    for nic in nics:
+        ips += nic.ipAddress
+    # No point is showing the IPv6 link local addrs if a firewall wont forward them
+    return [x for x in ips if not x.startswith('fe80::')]
@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+"""
+Logic for configuring a Windows Dns instance with a single guest operation.
+
+Setting the IP, the DNS client and the DNS server role one ``netsh`` at a time
+costs a process launch (each with its own authentication and polling) per
+setting. Instead, one PowerShell script does every step, timing each one, and
+writes what happened to a JSON file. Nothing in here talks to vCenter.
+"""
+import ipaddress
+
+import ujson
+
+# Where the script, and what it reports, are put inside the VM
+SCRIPT_PATH = 'C:\\Windows\\Temp\\vlab-dns-config.ps1'
+RESULT_PATH = 'C:\\Windows\\Temp\\vlab-dns-config.json'
+POWERSHELL = 'C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe'
+ADAPTER = 'Ethernet0'
+# The steps of the script, in the order they run
+STEPS = ('nic', 'dns-client', 'dns-server')
+
+_TEMPLATE = r"""$ErrorActionPreference = 'Stop'
+$result = [ordered]@{{}}
+$failed = $false
+function Step($name, $block) {{
+    $watch = [Diagnostics.Stopwatch]::StartNew()
+    try {{
+        & $block
+        $result[$name] = [ordered]@{{ok = $true; seconds = $watch.Elapsed.TotalSeconds}}
+    }} catch {{
+        $result[$name] = [ordered]@{{ok = $false; seconds = $watch.Elapsed.TotalSeconds; error = "$($_.Exception.Message)"}}
+        $script:failed = $true
+    }}
+}}
+Step 'nic' {{
+    Get-NetIPAddress -InterfaceAlias '{adapter}' -AddressFamily IPv4 -ErrorAction SilentlyContinue | Remove-NetIPAddress -Confirm:$false
+    Get-NetRoute -InterfaceAlias '{adapter}' -DestinationPrefix '0.0.0.0/0' -ErrorAction SilentlyContinue | Remove-NetRoute -Confirm:$false
+    New-NetIPAddress -InterfaceAlias '{adapter}' -IPAddress '{static_ip}' -PrefixLength {prefix_length} -DefaultGateway '{default_gateway}' | Out-Null
+}}
+Step 'dns-client' {{
+    Set-DnsClientServerAddress -InterfaceAlias '{adapter}' -ServerAddresses @({dns})
+}}
+Step 'dns-server' {{
+    if (-not (Get-WindowsFeature -Name DNS).Installed) {{
+        Install-WindowsFeature -Name DNS -IncludeManagementTools | Out-Null
+    }}
+    $settings = Get-DnsServerSetting -All
+    $settings.ListeningIPAddress = @('{static_ip}')
+    Set-DnsServerSetting -InputObject $settings
+    Restart-Service -Name DNS
+}}
+$result | ConvertTo-Json | Set-Content -Path '{result_path}' -Encoding ASCII
+Remove-Item -Path $PSCommandPath -Force
+if ($failed) {{ exit 1 }}
+"""
+
+
+def build_script(static_ip, default_gateway, netmask, dns):
+    """Write the PowerShell that configures the NIC, DNS client and DNS server role
+
+    :Returns: String
+
+    :Raises: ValueError - when an address isn't a valid IPv4 address
+
+    :param static_ip: The IPv4 address to assign to the VM
+    :type static_ip: String
+
+    :param default_gateway: The IPv4 address of the network gateway
+    :type default_gateway: String
+
+    :param netmask: The subnet mask of the network, i.e. 255.255.255.0
+    :type netmask: String
+
+    :param dns: A list of DNS servers to use
+    :type dns: List
+    """
+    # Parsing keeps anything but an address out of the script
+    static_ip = ipaddress.IPv4Address(static_ip)
+    default_gateway = ipaddress.IPv4Address(default_gateway)
+    prefix_length = ipaddress.IPv4Network('0.0.0.0/{}'.format(netmask)).prefixlen
+    servers = ', '.join("'{}'".format(ipaddress.IPv4Address(x)) for x in dns)
+    return _TEMPLATE.format(adapter=ADAPTER,
+                            static_ip=static_ip,
+                            prefix_length=prefix_length,
+                            default_gateway=default_gateway,
+                            dns=servers,
+                            result_path=RESULT_PATH)
+
+
+def command_args():
+    """The arguments for PowerShell to run the script
+
+    :Returns: String
+    """
+    return '-NoProfile -NonInteractive -ExecutionPolicy Bypass -File "{}"'.format(SCRIPT_PATH)
+
+
+def parse_result(text):
+    """Read what the script reported
+
+    :Returns: Tuple (Dictionary, Dictionary) - maps each step to how many seconds it
+              took, and maps each step that failed to its error
+
+    :Raises: ValueError - when the report can't be read
+
+    :param text: The JSON the script wrote
+    :type text: String
+    """
+    try:
+        # PowerShell writes a byte order mark on some versions
+        report = ujson.loads(text.lstrip('\ufeff'))
+    except ValueError:
+        raise ValueError('Unable to read the result of configuring Windows: {!r}'.format(text[:200]))
+    timings, errors = {}, {}
+    for step in STEPS:
+        outcome = report.get(step)
+        if outcome is None:
+            errors[step] = 'Step did not run'
+            continue
+        timings[step] = round(float(outcome.get('seconds', 0)), 3)
+        if not outcome.get('ok'):
+            errors[step] = outcome.get('error') or 'Unknown error'
+    return timings, errors
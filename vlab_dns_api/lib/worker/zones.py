@@ -0,0 +1,379 @@
+# -*- coding: UTF-8 -*-
+"""
+Logic for building, validating and transferring BIND zone data.
+
+Nothing in here talks to vCenter; the functions only deal with the text of zone
+files and the DNS protocol, which keeps them cheap to test and benchmark.
+"""
+import re
+import time
+import os.path
+
+import dns.name
+import dns.zone
+import dns.query
+import dns.rdataset
+import dns.rdatatype
+import dns.exception
+
+
+# The SOA record is owned by the import logic (so the serial is always correct),
+# which is why it's not in this list.
+SUPPORTED_TYPES = ('A', 'AAAA', 'CNAME', 'MX', 'NS', 'PTR', 'SRV', 'TXT')
+DEFAULT_TTL = 3600
+# RFC 1982 - serial numbers are unsigned 32 bit integers
+MAX_SERIAL = 2 ** 32
+# A double quoted string in a zone file, like the value of a TXT record
+QUOTED = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+def parse_zone(text, origin, check_origin=True):
+    """Convert the text of a zone file into a zone object
+
+    :Returns: dns.zone.Zone
+
+    :Raises: ValueError - when the zone file is not valid
+
+    :param text: The contents of a zone file
+    :type text: String
+
+    :param origin: The name of the zone, i.e. vlab.local
+    :type origin: String
+
+    :param check_origin: Set to False to allow a zone without SOA and NS records
+    :type check_origin: Boolean
+    """
+    try:
+        return dns.zone.from_text(text, origin=_fqdn(origin), relativize=True, check_origin=check_origin)
+    except dns.exception.DNSException as doh:
+        error = 'Invalid zone data for {}: {}'.format(origin, doh)
+        raise ValueError(error)
+
+
+def get_serial(zone):
+    """Obtain the serial number from the SOA record of a zone
+
+    :Returns: Integer
+
+    :Raises: ValueError - when the zone has no SOA record
+
+    :param zone: The zone to inspect
+    :type zone: dns.zone.Zone
+    """
+    soa = zone.get_rdataset('@', dns.rdatatype.SOA)
+    if not soa:
+        raise ValueError('Zone {} has no SOA record'.format(zone.origin))
+    return soa[0].serial
+
+
+def next_serial(current, now=None):
+    """Compute the SOA serial that must follow the current one.
+
+    Uses the common YYYYMMDDnn convention, but will always return a value greater
+    than the current serial; a zone that was using a plain counter keeps on working.
+
+    :Returns: Integer
+
+    :param current: The serial number currently being served
+    :type current: Integer
+
+    :param now: Optionally supply the epoch time to base the serial on. Default is "now"
+    :type now: Float
+    """
+    today = int(time.strftime('%Y%m%d', time.gmtime(now))) * 100
+    serial = max(current + 1, today)
+    # The serial wraps per RFC 1982; zero is avoided because some tools treat it as "unset"
+    return serial % MAX_SERIAL or 1
+
+
+def render_records(records):
+    """Convert a list of records (in the API's JSON format) into zone file lines
+
+    :Returns: String
+
+    :Raises: ValueError - when a record is malformed
+
+    :param records: The records to render; dictionaries with "name", "type",
+                    "value" and an optional "ttl" key.
+    :type records: List
+    """
+    lines = []
+    for idx, record in enumerate(records):
+        try:
+            name = record['name']
+            rtype = record['type'].upper()
+            value = record['value']
+            ttl = int(record.get('ttl', DEFAULT_TTL))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError('Record {} is malformed: {}'.format(idx, record))
+        if rtype not in SUPPORTED_TYPES:
+            error = 'Record {} has unsupported type {}. Supported: {}'.format(idx, rtype, ', '.join(SUPPORTED_TYPES))
+            raise ValueError(error)
+        if '\n' in name or '\n' in value:
+            raise ValueError('Record {} contains a newline'.format(idx))
+        # A ";" starts a comment and a "$" starts a directive, so either could
+        # change what the rest of the zone file means. A quoted TXT value can
+        # hold a ";" safely.
+        if ';' in name or '$' in name or ';' in QUOTED.sub('', value):
+            raise ValueError('Record {} contains a ";" or "$"'.format(idx))
+        lines.append('{} {} IN {} {}'.format(name, ttl, rtype, value))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def build_zone_file(origin, current_text, records=None, zone_file=None):
+    """Create the new contents of a zone file, with a correctly bumped SOA serial.
+
+    When supplied with ``records`` the SOA and NS records of the current zone
+    are kept, and every other record is replaced. When supplied with ``zone_file``
+    the whole zone is replaced.
+
+    Records are only checked for the mistakes that would break the zone file
+    syntax; run ``named-checkzone`` against the output before loading it.
+
+    :Returns: Tuple (String, Integer) - The zone file, and its serial number
+
+    :Raises: ValueError - when the new zone data is not valid
+
+    :param origin: The name of the zone, i.e. vlab.local
+    :type origin: String
+
+    :param current_text: The contents of the zone file that's currently being served
+    :type current_text: String
+
+    :param records: The records the zone should contain
+    :type records: List
+
+    :param zone_file: The contents of a zone file to load
+    :type zone_file: String
+    """
+    if (records is None) == (zone_file is None):
+        raise ValueError('Supply either records or a zone file')
+    # Only the SOA and NS records are needed from the current zone; parsing
+    # every record of a large zone just to read the serial is a waste.
+    current = _parse_apex(current_text, origin)
+    if zone_file is None:
+        serial = next_serial(get_serial(current))
+        _set_serial(current, serial)
+        text = '$ORIGIN {}\n{}{}'.format(_fqdn(origin), _zone_header(current), render_records(records))
+    else:
+        new_zone = parse_zone(zone_file, origin)
+        serial = next_serial(max(get_serial(current), get_serial(new_zone)))
+        _set_serial(new_zone, serial)
+        text = '$ORIGIN {}\n{}\n'.format(_fqdn(origin), new_zone.to_text())
+    return text, serial
+
+
+def bump_serial(text, origin):
+    """Increment the SOA serial within the text of a zone file.
+
+    Unlike ``build_zone_file``, the rest of the file (comments, formatting and
+    all) is left untouched.
+
+    :Returns: Tuple (String, Integer) - The zone file, and its new serial number
+
+    :Raises: ValueError - when the zone has no SOA record
+
+    :param text: The contents of the zone file
+    :type text: String
+
+    :param origin: The name of the zone, i.e. vlab.local
+    :type origin: String
+    """
+    current = get_serial(_parse_apex(text, origin))
+    serial = next_serial(current)
+    # The serial is the first number after the MNAME and RNAME of the SOA record,
+    # and there might be a parenthesis and comments in between
+    soa = re.compile(r'(\bSOA\s+\S+\s+\S+\s*(?:\(\s*)?(?:;[^\n]*\n\s*)*)(\d+)', re.IGNORECASE)
+    found = soa.search(text)
+    if not found or int(found.group(2)) != current:
+        raise ValueError('Unable to locate the serial of the SOA record for zone {}'.format(origin))
+    new_text = '{}{}{}'.format(text[:found.start(2)], serial, text[found.end(2):])
+    return new_text, serial
+
+
+def _set_serial(zone, serial):
+    """Replace the serial number in the SOA record of a zone
+
+    :Returns: None
+
+    :param zone: The zone to update
+    :type zone: dns.zone.Zone
+
+    :param serial: The new serial number
+    :type serial: Integer
+    """
+    soa = zone.get_rdataset('@', dns.rdatatype.SOA)
+    new_soa = dns.rdataset.from_rdata(soa.ttl, soa[0].replace(serial=serial))
+    zone.replace_rdataset('@', new_soa)
+
+
+def _parse_apex(text, origin):
+    """Parse only the directives, SOA and NS records of a zone file
+
+    :Returns: dns.zone.Zone
+
+    :Raises: ValueError - when the zone has no valid SOA record
+
+    :param text: The contents of a zone file
+    :type text: String
+
+    :param origin: The name of the zone, i.e. vlab.local
+    :type origin: String
+    """
+    kept = []
+    owner = '@'
+    for line in _logical_lines(text):
+        tokens = line.split(';', 1)[0].replace('(', ' ').replace(')', ' ').split()
+        if not tokens:
+            continue
+        elif tokens[0].startswith('$'):
+            kept.append(line)
+            continue
+        explicit_owner = not line[0].isspace()
+        if explicit_owner:
+            owner = tokens[0]
+        if _record_type(tokens, explicit_owner) in ('SOA', 'NS'):
+            # Lines without an owner inherit it from the previous record, which
+            # might be one of the records being skipped.
+            kept.append(line if explicit_owner else '{}{}'.format(owner, line))
+    zone = parse_zone('\n'.join(kept) + '\n', origin, check_origin=False)
+    get_serial(zone)
+    return zone
+
+
+def _logical_lines(text):
+    """Join the lines of a zone file that are grouped with parentheses
+
+    :Returns: Generator
+
+    :param text: The contents of a zone file
+    :type text: String
+    """
+    pending = []
+    depth = 0
+    for line in text.splitlines():
+        content = line.split(';', 1)[0]
+        depth += content.count('(') - content.count(')')
+        pending.append(content)
+        if depth <= 0:
+            yield ' '.join(pending)
+            pending = []
+            depth = 0
+    if pending:
+        yield ' '.join(pending)
+
+
+def _record_type(tokens, explicit_owner):
+    """Find the type of a record within the tokens of a zone file line
+
+    :Returns: String
+
+    :param tokens: The whitespace separated parts of the line
+    :type tokens: List
+
+    :param explicit_owner: Set to True if the first token is the owner name
+    :type explicit_owner: Boolean
+    """
+    if explicit_owner:
+        tokens = tokens[1:]
+    for token in tokens:
+        token = token.upper()
+        # Skip the optional TTL and class of the record
+        if token[0].isdigit() or token in ('IN', 'CH', 'HS'):
+            continue
+        return token
+    return ''
+
+
+def _zone_header(zone):
+    """Render the SOA and NS records of a zone, so the records of a zone can be
+    replaced without losing the zone's identity.
+
+    :Returns: String
+
+    :param zone: The zone currently being served
+    :type zone: dns.zone.Zone
+    """
+    lines = []
+    apex = dns.name.empty
+    for rtype in (dns.rdatatype.SOA, dns.rdatatype.NS):
+        rdataset = zone.get_rdataset(apex, rtype)
+        if rdataset:
+            lines.append(rdataset.to_text(apex))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def zone_files(named_conf, directory='/var/named'):
+    """Map the zones defined in a named.conf to the files that hold their records
+
+    :Returns: Dictionary
+
+    :param named_conf: The contents of the BIND config file
+    :type named_conf: String
+
+    :param directory: The working directory of BIND, used for relative file paths
+                      when named.conf doesn't define one.
+    :type directory: String
+    """
+    found = re.search(r'directory\s+"([^"]+)"\s*;', named_conf)
+    if found:
+        directory = found.group(1)
+    mapping = {}
+    for stanza in re.finditer(r'zone\s+"([^"]+)"[^{;]*\{', named_conf):
+        # Zone stanzas can contain nested blocks, like "allow-update { none; };"
+        depth, end = 1, stanza.end()
+        while depth and end < len(named_conf):
+            depth += {'{': 1, '}': -1}.get(named_conf[end], 0)
+            end += 1
+        body = named_conf[stanza.end():end]
+        zone_file = re.search(r'file\s+"([^"]+)"\s*;', body)
+        if zone_file:
+            mapping[stanza.group(1).rstrip('.').lower()] = os.path.join(directory, zone_file.group(1))
+    return mapping
+
+
+def axfr(server, origin, timeout=30):
+    """Obtain every record of a zone via a zone transfer
+
+    :Returns: Dictionary
+
+    :Raises: ValueError - when the transfer fails
+
+    :param server: The IP of the DNS server to transfer the zone from
+    :type server: String
+
+    :param origin: The name of the zone to transfer, i.e. vlab.local
+    :type origin: String
+
+    :param timeout: How many seconds the whole transfer may take
+    :type timeout: Integer
+    """
+    try:
+        zone = dns.zone.from_xfr(dns.query.xfr(server, _fqdn(origin), lifetime=timeout))
+    except (dns.exception.DNSException, OSError) as doh:
+        error = 'Unable to transfer zone {} from {}: {}'.format(origin, server, doh)
+        raise ValueError(error)
+    records = []
+    for name, node in sorted(zone.nodes.items()):
+        for rdataset in node:
+            if rdataset.rdtype == dns.rdatatype.SOA:
+                continue
+            for rdata in rdataset:
+                records.append({'name': name.to_text(),
+                                'type': dns.rdatatype.to_text(rdataset.rdtype),
+                                'ttl': rdataset.ttl,
+                                'value': rdata.to_text()})
+    return {'zone': origin, 'serial': get_serial(zone), 'records': records}
+
+
+def _fqdn(origin):
+    """Ensure a zone name is fully qualified
+
+    :Returns: String
+
+    :param origin: The name of the zone
+    :type origin: String
+    """
+    return '{}.'.format(origin.rstrip('.'))